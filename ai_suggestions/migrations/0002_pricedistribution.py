@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_suggestions', '0001_initial'),
+        ('services', '0006_alter_serviceimage_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceDistribution',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('region_cell', models.CharField(blank=True, default='', help_text='Latitude/longitude grid cell; empty for the whole market', max_length=32)),
+                ('sample_size', models.PositiveIntegerField()),
+                ('quantiles', models.JSONField()),
+                ('computed_at', models.DateTimeField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_distributions', to='services.servicecategory')),
+                ('subcategory', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='price_distributions', to='services.servicesubcategory')),
+            ],
+            options={
+                'verbose_name': 'Price Distribution',
+                'verbose_name_plural': 'Price Distributions',
+                'indexes': [models.Index(fields=['category', 'subcategory', 'currency', 'region_cell'], name='price_distribution_bucket_idx')],
+            },
+        ),
+    ]
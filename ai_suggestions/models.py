@@ -1,7 +1,7 @@
 from django.db import models
 from django.conf import settings
 import uuid
-from services.models import Service, ServiceCategory
+from services.models import Service, ServiceCategory, ServiceSubCategory
 from django.utils import timezone
 from bids.models import Bid
 from decimal import Decimal
@@ -98,3 +98,30 @@ class AIFeedbackLog(models.Model):
     def __str__(self):
         return f"{self.interaction_type} by {self.user.username} on {self.created_at.strftime('%Y-%m-%d')}"
 
+
+class PriceDistribution(models.Model):
+    """
+    Precomputed price quantiles for one market bucket.
+    
+    A bucket is a category, optionally narrowed to a subcategory and a region
+    cell, in one currency. Rebuilt periodically by ai_suggestions.pricing from
+    accepted bids, completed bookings and listed hourly rates; quantiles holds
+    the 0th, 5th, ..., 100th percentiles.
+    """
+    category = models.ForeignKey(ServiceCategory, on_delete=models.CASCADE, related_name='price_distributions')
+    subcategory = models.ForeignKey(ServiceSubCategory, on_delete=models.CASCADE, related_name='price_distributions', null=True, blank=True)
+    currency = models.CharField(max_length=3)
+    region_cell = models.CharField(max_length=32, blank=True, default='', help_text="Latitude/longitude grid cell; empty for the whole market")
+    sample_size = models.PositiveIntegerField()
+    quantiles = models.JSONField()
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        verbose_name = 'Price Distribution'
+        verbose_name_plural = 'Price Distributions'
+        indexes = [
+            models.Index(fields=['category', 'subcategory', 'currency', 'region_cell'], name='price_distribution_bucket_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.category} / {self.subcategory or 'all'} / {self.currency} / {self.region_cell or 'all'} (n={self.sample_size})"
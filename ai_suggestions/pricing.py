@@ -0,0 +1,242 @@
+"""
+Market price statistics for bids and smart pricing.
+
+``rebuild_price_distributions`` (run periodically by celery beat) gathers
+prices from accepted bids, completed bookings and active services' hourly
+rates over the last ``PRICING_LOOKBACK_DAYS`` and reduces every bucket to a
+21-point quantile sketch (every 5th percentile) stored as a
+``PriceDistribution`` row and in the cache. A bucket is
+``(category, subcategory, currency, region cell)``, where the subcategory and
+the cell may be empty to cover the whole category or market; each price
+counts towards all the buckets it belongs to.
+
+``get_price_quote`` answers from the cache with one ``get_many`` over a
+service's candidate buckets, most specific first, so quoting never touches
+the price history itself.
+"""
+import logging
+import math
+import statistics
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from bids.models import Bid
+from bookings.models import Booking
+from services.models import Service
+
+from .models import PriceDistribution
+
+logger = logging.getLogger(__name__)
+
+# Percentiles kept per bucket: 0, 5, ..., 100
+SKETCH_POINTS = 21
+
+
+def get_lookback_days():
+    return getattr(settings, 'PRICING_LOOKBACK_DAYS', 365)
+
+
+def get_min_samples():
+    return getattr(settings, 'PRICING_MIN_SAMPLES', 5)
+
+
+def get_region_cell_degrees():
+    return getattr(settings, 'PRICING_REGION_CELL_DEGREES', 0.5)
+
+
+def get_cache_timeout():
+    return getattr(settings, 'PRICING_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def region_cell(latitude, longitude):
+    """Grid cell holding a coordinate, or '' when it is unknown"""
+    if latitude is None or longitude is None:
+        return ''
+    size = get_region_cell_degrees()
+    return f"{math.floor(float(latitude) / size)}:{math.floor(float(longitude) / size)}"
+
+
+def bucket_cache_key(category_id, subcategory_id, currency, cell):
+    return f"pricing:{category_id}:{subcategory_id or '-'}:{currency}:{cell or '-'}"
+
+
+def build_sketch(prices):
+    """The 0th, 5th, ..., 100th percentiles of ``prices`` with linear interpolation"""
+    prices = sorted(prices)
+    if len(prices) == 1:
+        return prices * SKETCH_POINTS
+    inner = statistics.quantiles(prices, n=SKETCH_POINTS - 1, method='inclusive')
+    return [prices[0], *inner, prices[-1]]
+
+
+def sketch_percentile(quantiles, percentile):
+    """Read any percentile back out of a sketch by interpolating between its points"""
+    position = percentile / 100 * (len(quantiles) - 1)
+    lower = math.floor(position)
+    upper = min(lower + 1, len(quantiles) - 1)
+    return quantiles[lower] + (quantiles[upper] - quantiles[lower]) * (position - lower)
+
+
+def collect_prices(since):
+    """
+    Every recent price sample with the buckets it falls into.
+
+    Returns:
+        dict: ``{(category_id, subcategory_id, currency, cell): [price, ...]}``
+    """
+    subcategories = defaultdict(list)
+    for service_id, subcategory_id in Service.subcategories.through.objects.values_list(
+        'service_id', 'servicesubcategory_id'
+    ).iterator():
+        subcategories[service_id].append(subcategory_id)
+
+    samples = [
+        Bid.objects.filter(status__in=['accepted', 'completed'], created_at__gte=since).values_list(
+            'amount', 'currency', 'service__category_id', 'service_id', 'service__latitude', 'service__longitude'
+        ),
+        Booking.objects.filter(status='completed', created_at__gte=since).values_list(
+            'amount', 'service__currency', 'service__category_id', 'service_id',
+            Coalesce('latitude', 'service__latitude'), Coalesce('longitude', 'service__longitude'),
+        ),
+        Service.objects.filter(status='active', hourly_rate__gt=0).values_list(
+            'hourly_rate', 'currency', 'category_id', 'id', 'latitude', 'longitude'
+        ),
+    ]
+
+    buckets = defaultdict(list)
+    for queryset in samples:
+        for amount, currency, category_id, service_id, latitude, longitude in queryset.iterator():
+            if amount is None or amount <= 0:
+                continue
+            price = float(amount)
+            cells = {'', region_cell(latitude, longitude)}
+            for subcategory_id in [None, *subcategories.get(service_id, [])]:
+                for cell in cells:
+                    buckets[(category_id, subcategory_id, currency, cell)].append(price)
+    return buckets
+
+
+def rebuild_price_distributions():
+    """
+    Recompute every bucket's sketch and replace the stored ones.
+
+    Returns:
+        int: Number of buckets with enough samples to be stored
+    """
+    now = timezone.now()
+    buckets = collect_prices(now - timedelta(days=get_lookback_days()))
+    min_samples = get_min_samples()
+
+    distributions = [
+        PriceDistribution(
+            category_id=category_id,
+            subcategory_id=subcategory_id,
+            currency=currency,
+            region_cell=cell,
+            sample_size=len(prices),
+            quantiles=build_sketch(prices),
+            computed_at=now,
+        )
+        for (category_id, subcategory_id, currency, cell), prices in buckets.items()
+        if len(prices) >= min_samples
+    ]
+    with transaction.atomic():
+        PriceDistribution.objects.all().delete()
+        PriceDistribution.objects.bulk_create(distributions, batch_size=1000)
+
+    # Buckets that dropped out are overwritten with the miss marker
+    stale = {
+        bucket_cache_key(*key): False
+        for key, prices in buckets.items()
+        if len(prices) < min_samples
+    }
+    cache.set_many(
+        {**stale, **{_distribution_cache_key(d): _cache_payload(d) for d in distributions}},
+        timeout=get_cache_timeout(),
+    )
+    logger.info(f"💹 Rebuilt {len(distributions)} price distributions from {len(buckets)} buckets")
+    return len(distributions)
+
+
+def _distribution_cache_key(distribution):
+    return bucket_cache_key(
+        distribution.category_id, distribution.subcategory_id, distribution.currency, distribution.region_cell
+    )
+
+
+def _cache_payload(distribution):
+    return {
+        'quantiles': distribution.quantiles,
+        'sample_size': distribution.sample_size,
+        'subcategory_id': str(distribution.subcategory_id) if distribution.subcategory_id else None,
+        'region_cell': distribution.region_cell,
+        'computed_at': distribution.computed_at.isoformat(),
+    }
+
+
+def candidate_buckets(service, subcategory_ids=None):
+    """A service's buckets from most to least specific"""
+    if subcategory_ids is None:
+        subcategory_ids = list(service.subcategories.values_list('id', flat=True))
+    cell = region_cell(service.latitude, service.longitude)
+    cells = [cell, ''] if cell else ['']
+    return [
+        (service.category_id, subcategory_id, service.currency, c)
+        for subcategory_id in [*subcategory_ids, None]
+        for c in cells
+    ]
+
+
+def get_price_quote(service, subcategory_ids=None):
+    """
+    Market percentiles for ``service`` from its most specific populated bucket.
+
+    Returns:
+        dict: ``p25``, ``p50``, ``p75``, ``sample_size`` and the bucket used,
+        or None when no bucket has enough history
+    """
+    buckets = {bucket_cache_key(*bucket): bucket for bucket in candidate_buckets(service, subcategory_ids)}
+    keys = list(buckets)
+    cached = cache.get_many(keys)
+
+    missing = {key: bucket for key, bucket in buckets.items() if key not in cached}
+    if missing:
+        # Cold cache: load the missing buckets once and remember misses too
+        cached.update(_load_buckets(missing))
+
+    for key in keys:
+        payload = cached.get(key)
+        if payload:
+            quantiles = payload['quantiles']
+            return {
+                'p25': round(sketch_percentile(quantiles, 25), 2),
+                'p50': round(sketch_percentile(quantiles, 50), 2),
+                'p75': round(sketch_percentile(quantiles, 75), 2),
+                'sample_size': payload['sample_size'],
+                'currency': service.currency,
+                'subcategory_id': payload['subcategory_id'],
+                'region_cell': payload['region_cell'],
+                'computed_at': payload['computed_at'],
+            }
+    return None
+
+
+def _load_buckets(buckets):
+    """Cache payloads for ``{cache key: bucket}``, False for empty buckets"""
+    query = Q()
+    for category_id, subcategory_id, currency, cell in buckets.values():
+        query |= Q(category_id=category_id, subcategory_id=subcategory_id, currency=currency, region_cell=cell)
+    found = {
+        _distribution_cache_key(distribution): _cache_payload(distribution)
+        for distribution in PriceDistribution.objects.filter(query)
+    }
+    loaded = {key: found.get(key, False) for key in buckets}
+    cache.set_many(loaded, timeout=get_cache_timeout())
+    return loaded
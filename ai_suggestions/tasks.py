@@ -0,0 +1,12 @@
+"""
+Background jobs for AI suggestions.
+"""
+from celery import shared_task
+
+from .pricing import rebuild_price_distributions
+
+
+@shared_task(name='ai_suggestions.rebuild_price_distributions', ignore_result=True)
+def rebuild_price_distributions_task():
+    """Recompute market price quantiles from recent bids, bookings and rates"""
+    return rebuild_price_distributions()
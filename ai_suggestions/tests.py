@@ -1,3 +1,77 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from services.models import Service, ServiceCategory, ServiceSubCategory
+
+from .models import PriceDistribution
+from .pricing import build_sketch, get_price_quote, rebuild_price_distributions, sketch_percentile
+
+User = get_user_model()
+
+
+class PricingEngineTestCase(APITestCase):
+    """Test cases for precomputed market price distributions"""
+
+    def setUp(self):
+        cache.clear()
+        self.provider = User.objects.create_user(username='pricingprovider', email='pricingprovider@test.com', user_type='provider')
+        self.category = ServiceCategory.objects.create(name='Plumbing', description='Pipes')
+        self.subcategory = ServiceSubCategory.objects.create(category=self.category, name='Leaks', description='Leaks')
+        # Ten active listings in Bangalore priced 100, 200, ..., 1000
+        for i in range(1, 11):
+            service = Service.objects.create(
+                provider=self.provider, name=f'Plumber {i}', description='Fixes leaks', category=self.category,
+                hourly_rate=Decimal(i * 100), currency='INR', location='Bangalore',
+                latitude=Decimal('12.97'), longitude=Decimal('77.59'), status='active',
+            )
+            service.subcategories.add(self.subcategory)
+        self.service = service
+        self.client.force_authenticate(user=self.provider)
+
+    def test_sketch_matches_linear_percentiles(self):
+        """Sketch points interpolate like numpy.percentile's default method"""
+        sketch = build_sketch([float(i * 100) for i in range(1, 11)])
+        self.assertEqual(len(sketch), 21)
+        self.assertEqual(sketch[0], 100)
+        self.assertEqual(sketch[-1], 1000)
+        self.assertAlmostEqual(sketch_percentile(sketch, 25), 325)
+        self.assertAlmostEqual(sketch_percentile(sketch, 50), 550)
+
+    def test_quote_served_from_cache(self):
+        """After a rebuild, quotes come from the most specific bucket without reading distributions"""
+        self.assertEqual(rebuild_price_distributions(), 4)
+
+        with self.assertNumQueries(0):
+            quote = get_price_quote(self.service, subcategory_ids=[self.subcategory.id])
+        self.assertEqual((quote['p25'], quote['p50'], quote['p75']), (325, 550, 775))
+        self.assertEqual(quote['sample_size'], 10)
+        self.assertEqual(quote['subcategory_id'], str(self.subcategory.id))
+        self.assertTrue(quote['region_cell'])
+
+    def test_cold_cache_falls_back_to_stored_distributions(self):
+        """A cleared cache is refilled from the stored rows"""
+        rebuild_price_distributions()
+        cache.clear()
+        quote = get_price_quote(self.service)
+        self.assertEqual(quote['p50'], 550)
+        self.assertEqual(PriceDistribution.objects.filter(category=self.category).count(), 4)
+
+    def test_smart_price_endpoint(self):
+        """smart_price answers with market quartiles and falls back to the listed rate"""
+        url = reverse('bid-smart-price')
+        response = self.client.get(url, {'service_id': str(self.service.id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['sample_size'], 0)
+        self.assertEqual(response.data['optimal_price'], 1000)
+
+        rebuild_price_distributions()
+        response = self.client.get(url, {'service_id': str(self.service.id)})
+        self.assertEqual(
+            (response.data['min_price'], response.data['optimal_price'], response.data['max_price']), (325, 550, 775)
+        )
+        self.assertEqual(response.data['sample_size'], 10)
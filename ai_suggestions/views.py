@@ -16,10 +16,9 @@ from .serializers import (
     BidMessageSuggestionSerializer
 )
 from .services import OpenRouterAIService
+from .pricing import get_price_quote
 from services.models import Service
-from bids.models import Bid
 from decimal import Decimal
-import statistics
 import random
 
 
@@ -225,31 +224,34 @@ class AISuggestionViewSet(viewsets.ModelViewSet):
             # Get the service
             service = Service.objects.get(id=service_id)
             
-            # Find similar bids in this category for price analysis
-            similar_bids = Bid.objects.filter(
-                service__category=service.category,
-                status='accepted'
-            ).order_by('-created_at')[:20]
-            
-            # Calculate suggested amount based on similar accepted bids
-            if similar_bids.exists():
-                # Use statistical analysis to suggest an amount
-                bid_amounts = [bid.amount for bid in similar_bids]
-                suggested_amount = statistics.median(bid_amounts)
+            # Precomputed market quantiles instead of scanning recent bids
+            quote = get_price_quote(service)
+            if quote:
+                suggested_amount = Decimal(str(quote['p50']))
+                rationale = f"Median of {quote['sample_size']} recent prices for similar services."
             else:
-                # If no similar bids, use service price as a baseline
+                # If there is no market history, use service price as a baseline
                 suggested_amount = Decimal(service.price * Decimal('0.8'))  # 80% of the service price as a starting point
+                rationale = "Not enough market history yet; based on the service's listed rate."
+            market = {
+                "p25": quote['p25'] if quote else None,
+                "p50": quote['p50'] if quote else None,
+                "p75": quote['p75'] if quote else None,
+                "sample_size": quote['sample_size'] if quote else 0,
+            }
             
             # Create and save the suggestion
             suggestion = AISuggestion.objects.create(
                 user=request.user,
+                service=service,
                 suggestion_type='bid_amount',
                 title=f"Suggested bid for {service.title}",
                 content={
                     "service_id": str(service.id),
                     "service_title": service.title,
                     "suggested_amount": float(suggested_amount),
-                    "rationale": "Based on analysis of similar accepted bids in this category."
+                    "market": market,
+                    "rationale": rationale
                 },
                 suggested_amount=suggested_amount
             )
@@ -258,7 +260,8 @@ class AISuggestionViewSet(viewsets.ModelViewSet):
             return Response({
                 "suggestion_id": suggestion.id,
                 "suggested_amount": suggested_amount,
-                "rationale": "Based on analysis of similar accepted bids in this category.",
+                "market": market,
+                "rationale": rationale,
                 "service": {
                     "id": service.id,
                     "title": service.title
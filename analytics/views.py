@@ -1,6 +1,6 @@
 from django.shortcuts import render
 from django.db.models import Count, Sum, F, Q, Avg, Value, DecimalField
-from django.db.models.functions import Coalesce
+from django.db.models.functions import Coalesce, TruncDate
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
@@ -14,7 +14,7 @@ from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
 
 from services.models import Service, ServiceCategory
 from bookings.models import Booking
-from payments.models import Payment
+from payments.models import LedgerEntry, Payment, ProviderBalance
 from bids.models import Bid
 from .serializers import (
     OverviewStatsSerializer,
@@ -169,7 +169,12 @@ class AnalyticsOverviewView(APIView):
         return Response(serializer.data)
 
 class EarningsAnalyticsView(APIView):
-    """API endpoint for getting provider earnings analytics"""
+    """
+    API endpoint for getting provider earnings analytics.
+    
+    Totals come from the providers' ledger balances; windows, the timeline
+    and the category split are grouped queries over the earnings ledger.
+    """
     permission_classes = [permissions.IsAuthenticated, IsAdminUser]
     
     def get(self, request, format=None):
@@ -178,19 +183,25 @@ class EarningsAnalyticsView(APIView):
         thirty_days_ago = now - timedelta(days=30)
         seven_days_ago = now - timedelta(days=7)
         
-        # Calculate overall earnings (based on completed payments to providers)
-        earnings_stats = Payment.objects.filter(
-            status='completed',
-            payment_type='provider_payout'
-        ).aggregate(
-            total_earnings=Sum('amount'),
-            earnings_last_30_days=Sum('amount', filter=Q(created_at__gte=thirty_days_ago)),
-            earnings_last_7_days=Sum('amount', filter=Q(created_at__gte=seven_days_ago))
+        # Overall earnings and commission from the running balances
+        balance_stats = ProviderBalance.objects.aggregate(
+            total_earnings=Sum('total_earnings'),
+            platform_commission_total=Sum('platform_fees')
         )
+        total_earnings = balance_stats.get('total_earnings') or 0
+        platform_commission_total = balance_stats.get('platform_commission_total') or 0
         
-        total_earnings = earnings_stats.get('total_earnings') or 0
-        earnings_last_30_days = earnings_stats.get('earnings_last_30_days') or 0
-        earnings_last_7_days = earnings_stats.get('earnings_last_7_days') or 0
+        # Payments to providers net of refunds
+        earnings_entries = LedgerEntry.objects.filter(
+            account='provider_available',
+            kind__in=['payment', 'refund']
+        )
+        window_stats = earnings_entries.filter(created_at__gte=thirty_days_ago).aggregate(
+            earnings_last_30_days=Sum('amount'),
+            earnings_last_7_days=Sum('amount', filter=Q(created_at__gte=seven_days_ago))
+        )
+        earnings_last_30_days = window_stats.get('earnings_last_30_days') or 0
+        earnings_last_7_days = window_stats.get('earnings_last_7_days') or 0
         
         # Provider statistics
         total_providers = User.objects.filter(user_type='provider').count()
@@ -203,74 +214,53 @@ class EarningsAnalyticsView(APIView):
         avg_provider_earnings = total_earnings / total_providers if total_providers > 0 else 0
         
         # Get earnings by category
-        earnings_by_category = ServiceCategory.objects.annotate(
-            total_earnings=Sum('services__bookings__payment__amount',
-                              filter=Q(services__bookings__payment__payment_type='provider_payout',
-                                       services__bookings__payment__status='completed'))
+        category_totals = earnings_entries.filter(
+            payment__isnull=False
         ).values(
-            'id', 'name', 'total_earnings'
+            'payment__booking__service__category_id',
+            'payment__booking__service__category__name'
+        ).annotate(
+            total_earnings=Sum('amount')
         ).order_by('-total_earnings')[:10]
-        
-        # Clean up None values in earnings_by_category
-        for category in earnings_by_category:
-            if category['total_earnings'] is None:
-                category['total_earnings'] = 0
-        
-        # Create earnings timeline (last 30 days)
+        earnings_by_category = [
+            {
+                'id': category['payment__booking__service__category_id'],
+                'name': category['payment__booking__service__category__name'],
+                'total_earnings': category['total_earnings']
+            }
+            for category in category_totals
+        ]
+        
+        # Create earnings timeline (last 30 days) from one grouped query
+        daily_earnings = dict(earnings_entries.filter(
+            created_at__gte=(now - timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0),
+            created_at__lt=now.replace(hour=0, minute=0, second=0, microsecond=0)
+        ).annotate(
+            day=TruncDate('created_at')
+        ).values('day').annotate(
+            amount=Sum('amount')
+        ).values_list('day', 'amount'))
         earnings_timeline = []
         for i in range(30, 0, -1):
-            day = now - timedelta(days=i)
-            day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day.replace(hour=23, minute=59, second=59, microsecond=999999)
-            
-            daily_earnings = Payment.objects.filter(
-                payment_type='provider_payout',
-                status='completed',
-                created_at__range=(day_start, day_end)
-            ).aggregate(amount=Sum('amount')).get('amount') or 0
-            
+            day = (now - timedelta(days=i)).date()
             earnings_timeline.append({
-                'date': day_start.date().isoformat(),
-                'earnings': daily_earnings
+                'date': day.isoformat(),
+                'earnings': daily_earnings.get(day) or 0
             })
         
         # Get top earning providers
-        top_providers = User.objects.filter(
-            user_type='provider'
-        ).annotate(
-            total_earned=Sum('provider_bookings__payment__amount',
-                           filter=Q(provider_bookings__payment__payment_type='provider_payout',
-                                    provider_bookings__payment__status='completed'))
+        top_providers = list(ProviderBalance.objects.filter(
+            provider__user_type='provider'
         ).values(
-            'id', 'username', 'first_name', 'last_name', 'total_earned'
-        ).order_by('-total_earned')[:10]
-        
-        # Clean up None values in top_providers
-        for provider in top_providers:
-            if provider['total_earned'] is None:
-                provider['total_earned'] = 0
-        
-        # Calculate commission statistics
-        platform_commission_stats = Payment.objects.filter(
-            payment_type='platform_fee',
-            status='completed'
-        ).aggregate(
-            platform_commission_total=Sum('amount')
-        )
+            id=F('provider_id'),
+            username=F('provider__username'),
+            first_name=F('provider__first_name'),
+            last_name=F('provider__last_name'),
+            total_earned=F('total_earnings')
+        ).order_by('-total_earned')[:10])
         
-        platform_commission_total = platform_commission_stats.get('platform_commission_total') or 0
-        
-        # Calculate average commission rate
-        total_transactions = Payment.objects.filter(
-            status='completed'
-        ).count()
-        
-        avg_commission_rate = Payment.objects.filter(
-            payment_type='platform_fee',
-            status='completed'
-        ).aggregate(
-            avg_rate=Avg('commission_rate')
-        ).get('avg_rate') or 0
+        # Platform fees as a share of provider earnings
+        avg_commission_rate = float(platform_commission_total) / float(total_earnings) * 100 if total_earnings else 0
         
         # Prepare and return the serialized data
         earnings_data = {
@@ -286,6 +276,9 @@ class EarningsAnalyticsView(APIView):
             'platform_commission_total': platform_commission_total,
             'avg_commission_rate': avg_commission_rate
         }
+        
+        serializer = EarningsAnalyticsSerializer(earnings_data)
+        return Response(serializer.data)
 
 class AdminUserViewSet(viewsets.ModelViewSet):
     """API endpoint for listing, creating, updating, and deleting users (admin only)"""
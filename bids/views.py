@@ -3,7 +3,6 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q
-from django.utils import timezone
 from .models import Bid
 from .serializers import (
     BidListSerializer,
@@ -14,7 +13,10 @@ from .serializers import (
 )
 from .permissions import IsProvider, IsBidOwner, IsBidParticipant, IsBidCustomer
 from bookings.serializers import BookingCreateFromBidSerializer
+from django.core.exceptions import ValidationError
 from ai_suggestions.models import AISuggestion
+from ai_suggestions.pricing import get_price_quote
+from services.models import Service
 
 class BidViewSet(viewsets.ModelViewSet):
     """
@@ -128,11 +130,8 @@ class BidViewSet(viewsets.ModelViewSet):
         data = request.data.copy()
         data['bid_id'] = str(bid.id)
         
-        # If booking_date not provided, set it to a reasonable future date
-        if 'booking_date' not in data:
-            # Set to current time + estimated delivery days
-            data['booking_date'] = timezone.now() + timezone.timedelta(days=1)
-            
+        # booking_date, start_time and end_time default to the bid's proposed slot;
+        # the serializer refuses slots that overlap the provider's other bookings
         serializer = BookingCreateFromBidSerializer(
             data=data,
             context={'request': request}
@@ -186,24 +185,41 @@ class BidViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # This is a placeholder for actual AI pricing logic
-        # In a real implementation, you would:  
-        # 1. Check if there's a cached suggestion for this service
-        # 2. If not, generate a new suggestion using your AI model
-        # 3. Store the suggestion in AISuggestion model
-        # 4. Return the suggested price
+        try:
+            service = Service.objects.get(id=service_id)
+        except (Service.DoesNotExist, ValidationError):
+            return Response(
+                {"error": "Service not found."},
+                status=status.HTTP_404_NOT_FOUND
+            )
         
-        # For this example, we'll generate a mock suggestion
-        suggestion = {
-            "min_price": 25.00,
-            "max_price": 75.00,
-            "optimal_price": 50.00,
-            "rationale": "Based on market rates for similar services and estimated effort required."
-        }
+        # Precomputed market quantiles for the service's category, subcategory and area
+        quote = get_price_quote(service)
+        if quote:
+            suggestion = {
+                "min_price": quote['p25'],
+                "max_price": quote['p75'],
+                "optimal_price": quote['p50'],
+                "currency": quote['currency'],
+                "sample_size": quote['sample_size'],
+                "rationale": f"Interquartile range of {quote['sample_size']} recent prices for similar services."
+            }
+        else:
+            # No market history yet: bracket the provider's own listed rate
+            rate = float(service.hourly_rate)
+            suggestion = {
+                "min_price": round(rate * 0.8, 2),
+                "max_price": round(rate * 1.2, 2),
+                "optimal_price": rate,
+                "currency": service.currency,
+                "sample_size": 0,
+                "rationale": "Not enough market history yet; based on the service's listed rate."
+            }
         
         # Save this suggestion in the AISuggestion model for future reference
-        ai_suggestion = AISuggestion.objects.create(
+        AISuggestion.objects.create(
             user=request.user,
+            service=service,
             suggestion_type='pricing',
             title=f"Price suggestion for service {service_id}",
             content={
@@ -0,0 +1,204 @@
+"""
+Per-user ICS subscription feeds.
+
+Each user can have one ``CalendarFeed`` holding a rendered VEVENT per booking
+they are the customer or provider of. Saving or deleting a booking re-renders
+just that booking's event in the (at most two) affected feeds once the
+transaction commits, then reassembles the document and its ETag. The result
+is also kept in the cache under the feed token, so a calendar client polling
+every few minutes costs one cache read and, usually, a 304.
+
+Feeds are built in full once, when first requested, from bookings since
+``CALENDAR_FEED_PAST_DAYS`` ago.
+"""
+import hashlib
+import logging
+import secrets
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Booking, CalendarFeed
+
+logger = logging.getLogger(__name__)
+
+# Booking status -> iCalendar VEVENT STATUS
+EVENT_STATUS = {
+    'pending': 'TENTATIVE',
+    'cancelled': 'CANCELLED',
+}
+
+
+def get_past_days():
+    return getattr(settings, 'CALENDAR_FEED_PAST_DAYS', 90)
+
+
+def get_cache_timeout():
+    return getattr(settings, 'CALENDAR_FEED_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def feed_cache_key(token):
+    return f"calendar_feed:{token}"
+
+
+def escape_text(value):
+    """Escape a TEXT value (RFC 5545 section 3.3.11)"""
+    return (
+        str(value or '')
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Fold a content line at 75 octets without splitting a character"""
+    parts, current, size = [], '', 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        # Continuation lines start with a space, which counts towards the limit
+        if size + width > (75 if not parts else 74):
+            parts.append(current)
+            current, size = '', 0
+        current += char
+        size += width
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+
+def format_utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def local_datetime(day, clock):
+    return timezone.make_aware(datetime.combine(day, clock))
+
+
+def render_event(booking):
+    """One booking as a VEVENT"""
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:booking-{booking.id}@prbal',
+        f'DTSTAMP:{format_utc(booking.updated_at)}',
+        f'LAST-MODIFIED:{format_utc(booking.updated_at)}',
+        f'DTSTART:{format_utc(local_datetime(booking.booking_date, booking.start_time))}',
+        f'DTEND:{format_utc(local_datetime(booking.booking_date, booking.end_time))}',
+        f'SEQUENCE:{booking.rescheduled_count}',
+        f'STATUS:{EVENT_STATUS.get(booking.status, "CONFIRMED")}',
+        f'SUMMARY:{escape_text(booking.service.name)}',
+    ]
+    location = booking.address or booking.service.location
+    if location:
+        lines.append(f'LOCATION:{escape_text(location)}')
+    if booking.requirements:
+        lines.append(f'DESCRIPTION:{escape_text(booking.requirements)}')
+    lines.append('END:VEVENT')
+    return '\r\n'.join(fold(line) for line in lines)
+
+
+def assemble(events):
+    """The full VCALENDAR document for ``{booking_id: vevent}``"""
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Prbal//Bookings//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        'X-WR-CALNAME:Prbal bookings',
+        *(events[key] for key in sorted(events)),
+        'END:VCALENDAR',
+    ]
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def _store(feed, events):
+    """Save ``events`` as the feed's new document and refresh the cached copy"""
+    feed.events = events
+    feed.content = assemble(events)
+    feed.etag = hashlib.sha256(feed.content.encode('utf-8')).hexdigest()[:32]
+    feed.last_modified = timezone.now()
+    feed.save(update_fields=['events', 'content', 'etag', 'last_modified'])
+    cache.set(feed_cache_key(feed.token), _payload(feed), get_cache_timeout())
+
+
+def _payload(feed):
+    return {'content': feed.content, 'etag': feed.etag, 'last_modified': feed.last_modified}
+
+
+def feed_bookings(user_id):
+    since = timezone.localdate() - timedelta(days=get_past_days())
+    return Booking.objects.filter(
+        Q(customer_id=user_id) | Q(provider_id=user_id), booking_date__gte=since
+    ).select_related('service')
+
+
+def rebuild_feed(feed):
+    """Render every booking in the feed's window from scratch"""
+    events = {str(booking.id): render_event(booking) for booking in feed_bookings(feed.user_id)}
+    _store(feed, events)
+    logger.debug(f"📅 Built calendar feed for user {feed.user_id} with {len(events)} events")
+
+
+def get_or_create_feed(user):
+    """The user's feed, built on first use"""
+    feed, created = CalendarFeed.objects.get_or_create(
+        user=user, defaults={'token': secrets.token_urlsafe(32)}
+    )
+    if created:
+        rebuild_feed(feed)
+    return feed
+
+
+def reset_feed_token(user):
+    """Give the feed a new secret URL; the old one stops working immediately"""
+    feed = get_or_create_feed(user)
+    cache.delete(feed_cache_key(feed.token))
+    feed.token = secrets.token_urlsafe(32)
+    feed.save(update_fields=['token'])
+    cache.set(feed_cache_key(feed.token), _payload(feed), get_cache_timeout())
+    return feed
+
+
+def get_feed_payload(token):
+    """``{'content', 'etag', 'last_modified'}`` for a feed token, or None"""
+    key = feed_cache_key(token)
+    payload = cache.get(key)
+    if payload is None:
+        feed = CalendarFeed.objects.filter(token=token).first()
+        if feed is None:
+            return None
+        payload = _payload(feed)
+        cache.set(key, payload, get_cache_timeout())
+    return payload
+
+
+def update_booking_in_feeds(booking_id, user_ids):
+    """Re-render one booking in its participants' feeds"""
+    with transaction.atomic():
+        feeds = list(CalendarFeed.objects.select_for_update().filter(user_id__in=user_ids))
+        if not feeds:
+            # Most users never subscribe
+            return
+        booking = Booking.objects.select_related('service').filter(pk=booking_id).first()
+        if booking is None:
+            return
+        event = render_event(booking)
+        for feed in feeds:
+            if feed.events.get(str(booking.id)) != event:
+                _store(feed, {**feed.events, str(booking.id): event})
+
+
+def remove_booking_from_feeds(booking_id, user_ids):
+    """Drop a deleted booking from its former participants' feeds"""
+    with transaction.atomic():
+        for feed in CalendarFeed.objects.select_for_update().filter(user_id__in=user_ids):
+            if str(booking_id) in feed.events:
+                events = dict(feed.events)
+                del events[str(booking_id)]
+                _store(feed, events)
@@ -0,0 +1,64 @@
+"""
+Model fields for credentials stored by the bookings app.
+"""
+import base64
+import hashlib
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+
+def get_encryption_keys():
+    """
+    Fernet keys for stored credentials, newest first.
+
+    ``FIELD_ENCRYPTION_KEYS`` lists them; rotating means prepending a new key
+    and keeping the old ones until every row was re-saved. Without it a key
+    is derived from ``SECRET_KEY``.
+    """
+    keys = getattr(settings, 'FIELD_ENCRYPTION_KEYS', None)
+    if keys:
+        return list(keys)
+    digest = hashlib.sha256(f"prbal.encrypted-field:{settings.SECRET_KEY}".encode()).digest()
+    return [base64.urlsafe_b64encode(digest)]
+
+
+def get_fernet():
+    return MultiFernet([Fernet(key) for key in get_encryption_keys()])
+
+
+class EncryptedTextField(models.TextField):
+    """
+    TextField whose value is Fernet-encrypted at rest.
+
+    The database only ever holds ciphertext, and the field is not editable, so
+    admin and model forms never show it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', False)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if kwargs.get('editable') is False:
+            del kwargs['editable']
+        return name, path, args, kwargs
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None or value == '':
+            return value
+        return get_fernet().encrypt(value.encode('utf-8')).decode('ascii')
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or value == '':
+            return value
+        try:
+            return get_fernet().decrypt(value).decode('utf-8')
+        except InvalidToken:
+            raise ImproperlyConfigured(
+                f"Cannot decrypt {self.model.__name__}.{self.name}; check FIELD_ENCRYPTION_KEYS"
+            )
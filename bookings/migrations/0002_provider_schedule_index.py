@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bids', '0001_initial'),
+        ('bookings', '0001_initial'),
+        ('services', '0006_alter_serviceimage_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'confirmed', 'in_progress'])), fields=['provider', 'booking_date', 'start_time', 'end_time'], name='booking_provider_schedule_idx'),
+        ),
+    ]
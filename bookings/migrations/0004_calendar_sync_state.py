@@ -0,0 +1,56 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_calendarfeed'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarConnection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('google', 'Google Calendar'), ('microsoft', 'Microsoft Outlook'), ('apple', 'Apple Calendar')], max_length=20)),
+                ('auth_token', models.TextField()),
+                ('calendar_id', models.CharField(blank=True, max_length=255)),
+                ('create_reminder', models.BooleanField(default=True)),
+                ('reminder_minutes', models.PositiveIntegerField(default=30)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_connections', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Calendar Connection',
+                'verbose_name_plural': 'Calendar Connections',
+                'unique_together': {('user', 'provider')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CalendarSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(blank=True, help_text='Event ID in the external calendar', max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('syncing', 'Syncing'), ('synced', 'Synced'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_sync_states', to='bookings.booking')),
+                ('connection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_states', to='bookings.calendarconnection')),
+            ],
+            options={
+                'verbose_name': 'Calendar Sync State',
+                'verbose_name_plural': 'Calendar Sync States',
+                'indexes': [models.Index(condition=models.Q(('status__in', ['pending', 'syncing'])), fields=['next_attempt_at'], name='calendar_sync_due_idx')],
+                'unique_together': {('connection', 'booking')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:13
+
+import bookings.fields
+from django.db import migrations
+
+
+def encrypt_existing_tokens(apps, schema_editor):
+    # Rows written before encryption hold plaintext; read them past the field
+    CalendarConnection = apps.get_model('bookings', 'CalendarConnection')
+    table = schema_editor.quote_name(CalendarConnection._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT id, auth_token FROM {table}")
+        rows = cursor.fetchall()
+    for pk, token in rows:
+        CalendarConnection.objects.filter(pk=pk).update(auth_token=token)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_calendar_sync_state'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='calendarconnection',
+            name='auth_token',
+            field=bookings.fields.EncryptedTextField(help_text='OAuth token, encrypted at rest'),
+        ),
+        migrations.RunPython(encrypt_existing_tokens, migrations.RunPython.noop),
+    ]
@@ -3,6 +3,12 @@ from django.conf import settings
 import uuid
 from services.models import Service
 from bids.models import Bid
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .fields import EncryptedTextField
 
 # Create your models here.
 class Booking(models.Model):
@@ -77,6 +83,14 @@ class Booking(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Booking'
         verbose_name_plural = 'Bookings'
+        indexes = [
+            # Provider schedule: overlap checks and free-slot lookups
+            models.Index(
+                fields=['provider', 'booking_date', 'start_time', 'end_time'],
+                condition=models.Q(status__in=['pending', 'confirmed', 'in_progress']),
+                name='booking_provider_schedule_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Booking #{self.id} - {self.service.title}"
@@ -152,3 +166,125 @@ class Booking(models.Model):
             self.save(update_fields=['rating', 'review', 'updated_at'])
             return True
         return False
+
+
+class CalendarFeed(models.Model):
+    """
+    A user's ICS subscription feed of their bookings.
+    
+    ``events`` keeps one rendered VEVENT per booking so a changed booking only
+    re-renders itself; ``content`` is the assembled document served to
+    calendar clients, with ``etag`` and ``last_modified`` for conditional GETs.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='calendar_feed')
+    token = models.CharField(max_length=64, unique=True, help_text="Secret part of the subscription URL")
+    events = models.JSONField(default=dict)
+    content = models.TextField(blank=True)
+    etag = models.CharField(max_length=64, blank=True)
+    last_modified = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Calendar Feed'
+        verbose_name_plural = 'Calendar Feeds'
+    
+    def __str__(self):
+        return f"Calendar feed for {self.user}"
+
+
+class CalendarConnection(models.Model):
+    """
+    A user's link to an external calendar that bookings are pushed to.
+    
+    Holds the credentials the background sync worker uses, so pushing never
+    happens inside the request that asked for it.
+    """
+    PROVIDER_CHOICES = (
+        ('google', 'Google Calendar'),
+        ('microsoft', 'Microsoft Outlook'),
+        ('apple', 'Apple Calendar'),
+    )
+    
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='calendar_connections')
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
+    auth_token = EncryptedTextField(help_text="OAuth token, encrypted at rest")
+    calendar_id = models.CharField(max_length=255, blank=True)
+    create_reminder = models.BooleanField(default=True)
+    reminder_minutes = models.PositiveIntegerField(default=30)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Calendar Connection'
+        verbose_name_plural = 'Calendar Connections'
+        unique_together = ('user', 'provider')
+    
+    def __str__(self):
+        return f"{self.get_provider_display()} for {self.user}"
+
+
+class CalendarSyncState(models.Model):
+    """
+    Where one booking stands in one connected calendar.
+    
+    Rows are ``pending`` until the worker claims them (``syncing``, leased
+    until ``next_attempt_at``), then end up ``synced`` or, after permanent
+    errors or too many attempts, ``failed``. Any change to the booking puts
+    its rows back to ``pending``.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('syncing', 'Syncing'),
+        ('synced', 'Synced'),
+        ('failed', 'Failed'),
+    )
+    
+    connection = models.ForeignKey(CalendarConnection, on_delete=models.CASCADE, related_name='sync_states')
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='calendar_sync_states')
+    event_id = models.CharField(max_length=255, blank=True, help_text="Event ID in the external calendar")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Calendar Sync State'
+        verbose_name_plural = 'Calendar Sync States'
+        unique_together = ('connection', 'booking')
+        indexes = [
+            # Worker queue: due pending rows and expired leases
+            models.Index(
+                fields=['next_attempt_at'],
+                condition=models.Q(status__in=['pending', 'syncing']),
+                name='calendar_sync_due_idx',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"Booking {self.booking_id} in {self.connection} ({self.status})"
+
+
+@receiver(post_save, sender=Booking)
+def update_calendar_feeds_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .calendar_feed import update_booking_in_feeds
+    booking_id, user_ids = instance.pk, [instance.customer_id, instance.provider_id]
+    transaction.on_commit(lambda: update_booking_in_feeds(booking_id, user_ids))
+
+
+@receiver(post_delete, sender=Booking)
+def update_calendar_feeds_on_delete(sender, instance, **kwargs):
+    from .calendar_feed import remove_booking_from_feeds
+    booking_id, user_ids = instance.pk, [instance.customer_id, instance.provider_id]
+    transaction.on_commit(lambda: remove_booking_from_feeds(booking_id, user_ids))
+
+
+@receiver(post_save, sender=Booking)
+def queue_calendar_sync_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .sync import mark_booking_changed
+    booking_id = instance.pk
+    transaction.on_commit(lambda: mark_booking_changed(booking_id))
@@ -0,0 +1,152 @@
+"""
+Provider schedules: overlap detection, slot reservation and free slots.
+
+A provider is busy wherever they have a booking in ``BLOCKING_STATUSES`` on
+that date between ``start_time`` and ``end_time``. Conflicts are found with a
+single query on the (provider, booking_date, start_time, end_time) index.
+
+``reserve_slot`` locks the provider's user row before checking, so two
+requests booking, accepting or rescheduling into the same provider's day
+queue up behind each other and the second one sees the first one's booking
+instead of double-booking.
+
+Availability comes from ``Service.availability``, a mapping of weekday name
+to ``"HH:MM-HH:MM"``, a list of such ranges, or ``"Closed"``. Services that
+don't publish availability use ``BOOKING_DEFAULT_AVAILABILITY``.
+"""
+import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .models import Booking
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Bookings that occupy the provider's time
+BLOCKING_STATUSES = ('pending', 'confirmed', 'in_progress')
+
+WEEKDAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def get_default_availability():
+    return getattr(settings, 'BOOKING_DEFAULT_AVAILABILITY', '09:00-18:00')
+
+
+def get_default_duration():
+    return timedelta(minutes=getattr(settings, 'BOOKING_DEFAULT_DURATION_MINUTES', 60))
+
+
+class ScheduleConflict(Exception):
+    """Raised when a slot overlaps bookings the provider already has."""
+
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f"Provider is already booked at this time ({len(conflicts)} overlapping bookings)")
+
+
+def find_conflicts(provider_id, booking_date, start_time, end_time, exclude_id=None):
+    """Blocking bookings of ``provider_id`` that overlap the given slot"""
+    conflicts = Booking.objects.filter(
+        provider_id=provider_id,
+        booking_date=booking_date,
+        status__in=BLOCKING_STATUSES,
+        start_time__lt=end_time,
+        end_time__gt=start_time,
+    )
+    if exclude_id is not None:
+        conflicts = conflicts.exclude(pk=exclude_id)
+    return list(conflicts.values('id', 'start_time', 'end_time', 'status'))
+
+
+def reserve_slot(provider_id, booking_date, start_time, end_time, exclude_id=None):
+    """
+    Make sure the slot is free and keep it that way until the transaction ends.
+
+    Must be called inside ``transaction.atomic()`` before the booking is saved.
+
+    Raises:
+        ScheduleConflict: If the provider is busy for any part of the slot
+    """
+    # The provider row is the per-provider lock every writer goes through
+    list(User.objects.select_for_update().filter(pk=provider_id).values_list('pk', flat=True))
+    conflicts = find_conflicts(provider_id, booking_date, start_time, end_time, exclude_id)
+    if conflicts:
+        logger.info(f"📅 Rejected overlapping booking for provider {provider_id} on {booking_date} {start_time}-{end_time}")
+        raise ScheduleConflict(conflicts)
+
+
+def parse_time_range(value):
+    """``"09:00-17:00"`` as ``(time(9), time(17))``, or None when it isn't one"""
+    try:
+        start, end = (time.fromisoformat(part.strip()) for part in value.split('-'))
+    except (AttributeError, ValueError):
+        return None
+    return (start, end) if start < end else None
+
+
+def availability_windows(availability, day):
+    """The sorted working windows ``availability`` gives for ``day``"""
+    if not availability or not isinstance(availability, dict):
+        availability = {weekday: get_default_availability() for weekday in WEEKDAYS}
+    ranges = availability.get(WEEKDAYS[day.weekday()]) or []
+    if isinstance(ranges, str):
+        ranges = [ranges]
+    return sorted(window for window in map(parse_time_range, ranges) if window)
+
+
+def subtract_busy(windows, busy):
+    """Cut sorted ``busy`` intervals out of sorted ``windows``"""
+    free = []
+    for start, end in windows:
+        cursor = start
+        for busy_start, busy_end in busy:
+            if busy_end <= cursor or busy_start >= end:
+                continue
+            if busy_start > cursor:
+                free.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            free.append((cursor, end))
+    return free
+
+
+def free_slots(service, start_date, days=1, duration=None):
+    """
+    Free intervals in ``service``'s availability for each day of a range.
+
+    All of the provider's bookings count, whichever service they are for.
+
+    Args:
+        service: Service whose availability and provider to use
+        start_date: First day
+        days: Number of days
+        duration: Only keep intervals at least this long (timedelta)
+
+    Returns:
+        dict: ``{date: [(start_time, end_time), ...]}``
+    """
+    end_date = start_date + timedelta(days=days - 1)
+    busy = {}
+    for booking_date, start_time, end_time in Booking.objects.filter(
+        provider_id=service.provider_id,
+        booking_date__range=(start_date, end_date),
+        status__in=BLOCKING_STATUSES,
+    ).order_by('booking_date', 'start_time').values_list('booking_date', 'start_time', 'end_time'):
+        busy.setdefault(booking_date, []).append((start_time, end_time))
+
+    slots = {}
+    for offset in range(days):
+        day = start_date + timedelta(days=offset)
+        free = subtract_busy(availability_windows(service.availability, day), busy.get(day, []))
+        if duration:
+            free = [
+                (start, end) for start, end in free
+                if datetime.combine(day, end) - datetime.combine(day, start) >= duration
+            ]
+        slots[day] = free
+    return slots
@@ -5,12 +5,38 @@ from services.models import Service
 from users.serializers import PublicUserProfileSerializer
 from services.serializers import ServiceDetailSerializer
 from datetime import datetime
+from django.db import transaction
+from django.utils import timezone
+from .schedule import ScheduleConflict, get_default_duration, reserve_slot
 """
 Serializers for calendar integration functionality.
 """
 from rest_framework import serializers
 from .models import Booking
 from .sync import CALENDAR_PROVIDERS
+
+
+def validate_slot(data):
+    """A booking has to end after it starts, on the same day"""
+    if data['end_time'] <= data['start_time']:
+        raise serializers.ValidationError({'end_time': "End time must be after start time."})
+    return data
+
+
+def reserve_or_fail(provider_id, data, exclude_id=None):
+    """reserve_slot, reported as a validation error on conflict"""
+    try:
+        reserve_slot(provider_id, data['booking_date'], data['start_time'], data['end_time'], exclude_id=exclude_id)
+    except ScheduleConflict as e:
+        raise serializers.ValidationError({
+            'non_field_errors': [str(e)],
+            'conflicts': [
+                {'id': str(c['id']), 'start_time': c['start_time'], 'end_time': c['end_time']}
+                for c in e.conflicts
+            ],
+        })
+
+
 class BookingListSerializer(serializers.ModelSerializer):
     """Serializer for listing bookings with minimal details"""
     service_title = serializers.CharField(source='service.title', read_only=True)
@@ -56,9 +82,14 @@ class BookingCreateFromBidSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = [
-            'id', 'bid_id', 'booking_date', 'requirements'
+            'id', 'bid_id', 'booking_date', 'start_time', 'end_time', 'requirements'
         ]
         read_only_fields = ['id']
+        extra_kwargs = {
+            'booking_date': {'required': False},
+            'start_time': {'required': False},
+            'end_time': {'required': False},
+        }
     
     def validate_bid_id(self, value):
         """Ensure the bid exists and is still pending"""
@@ -70,25 +101,43 @@ class BookingCreateFromBidSerializer(serializers.ModelSerializer):
         except Bid.DoesNotExist:
             raise serializers.ValidationError("Bid not found.")
     
+    def validate(self, data):
+        """Default the slot to the bid's proposed time and check its shape"""
+        bid = Bid.objects.get(id=data['bid_id'])
+        scheduled = timezone.localtime(bid.scheduled_date_time)
+        data.setdefault('booking_date', scheduled.date())
+        data.setdefault('start_time', scheduled.time().replace(second=0, microsecond=0))
+        if 'end_time' not in data:
+            data['end_time'] = (datetime.combine(data['booking_date'], data['start_time']) + get_default_duration()).time()
+        return validate_slot(data)
+    
     def create(self, validated_data):
         bid_id = validated_data.pop('bid_id')
-        bid = Bid.objects.get(id=bid_id)
         
-        # Create booking from bid data
-        booking = Booking.objects.create(
-            service=bid.service,
-            customer=self.context['request'].user,  # Customer accepts the bid
-            provider=bid.provider,
-            bid=bid,
-            booking_date=validated_data.get('booking_date'),
-            amount=bid.amount,
-            requirements=validated_data.get('requirements', ''),
-            status='pending'
-        )
-        
-        # Update bid status
-        bid.status = 'accepted'
-        bid.save()
+        with transaction.atomic():
+            # Locking the bid makes concurrent accepts of it queue up
+            bid = Bid.objects.select_for_update().get(id=bid_id)
+            if bid.status != 'pending':
+                raise serializers.ValidationError({'bid_id': f"This bid is already {bid.status}."})
+            reserve_or_fail(bid.service_provider_id, validated_data)
+            
+            # Create booking from bid data
+            booking = Booking.objects.create(
+                service=bid.service,
+                customer=self.context['request'].user,  # Customer accepts the bid
+                provider=bid.provider,
+                bid=bid,
+                booking_date=validated_data['booking_date'],
+                start_time=validated_data['start_time'],
+                end_time=validated_data['end_time'],
+                amount=bid.amount,
+                requirements=validated_data.get('requirements', ''),
+                status='pending'
+            )
+            
+            # Update bid status
+            bid.status = 'accepted'
+            bid.save()
         
         return booking
 
@@ -98,7 +147,7 @@ class BookingCreateDirectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = [
-            'id', 'service', 'booking_date', 'amount',
+            'id', 'service', 'booking_date', 'start_time', 'end_time', 'amount',
             'requirements', 'notes'
         ]
         read_only_fields = ['id']
@@ -109,19 +158,26 @@ class BookingCreateDirectSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("This service is not active or does not exist.")
         return value
     
+    def validate(self, data):
+        return validate_slot(data)
+    
     def create(self, validated_data):
         # Create booking directly
         service = validated_data.get('service')
-        booking = Booking.objects.create(
-            service=service,
-            customer=self.context['request'].user,  # Customer creates the booking
-            provider=service.provider,
-            booking_date=validated_data.get('booking_date'),
-            amount=validated_data.get('amount'),
-            requirements=validated_data.get('requirements', ''),
-            notes=validated_data.get('notes', ''),
-            status='pending'
-        )
+        with transaction.atomic():
+            reserve_or_fail(service.provider_id, validated_data)
+            booking = Booking.objects.create(
+                service=service,
+                customer=self.context['request'].user,  # Customer creates the booking
+                provider=service.provider,
+                booking_date=validated_data.get('booking_date'),
+                start_time=validated_data.get('start_time'),
+                end_time=validated_data.get('end_time'),
+                amount=validated_data.get('amount'),
+                requirements=validated_data.get('requirements', ''),
+                notes=validated_data.get('notes', ''),
+                status='pending'
+            )
         
         return booking
 
@@ -191,12 +247,16 @@ class BookingRescheduleSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Booking
-        fields = ['id', 'booking_date', 'rescheduled_reason']
+        fields = ['id', 'booking_date', 'start_time', 'end_time', 'rescheduled_reason']
         read_only_fields = ['id']
+        extra_kwargs = {
+            'start_time': {'required': False},
+            'end_time': {'required': False},
+        }
     
     def validate_booking_date(self, value):
-        """Ensure the new booking date is in the future"""
-        if value <= datetime.now():
+        """Ensure the new booking date is not in the past"""
+        if value < timezone.localdate():
             raise serializers.ValidationError("New booking date must be in the future.")
             
         return value
@@ -209,25 +269,35 @@ class BookingRescheduleSerializer(serializers.ModelSerializer):
         # Ensure reason is provided
         if not data.get('rescheduled_reason'):
             raise serializers.ValidationError("Please provide a reason for rescheduling.")
-            
-        return data
+        
+        # Keep the current times unless new ones are given
+        data.setdefault('start_time', self.instance.start_time)
+        data.setdefault('end_time', self.instance.end_time)
+        return validate_slot(data)
     
     def update(self, instance, validated_data):
-        # Store original booking date if this is the first reschedule
-        if not instance.is_rescheduled:
-            instance.original_booking_date = instance.booking_date
+        with transaction.atomic():
+            reserve_or_fail(instance.provider_id, validated_data, exclude_id=instance.pk)
             
-        # Update booking
-        instance.booking_date = validated_data.get('booking_date')
-        instance.rescheduled_reason = validated_data.get('rescheduled_reason')
-        instance.is_rescheduled = True
-        instance.rescheduled_count += 1
-        
-        # If booking was cancelled due to reschedule, update the status back to confirmed/pending
-        if instance.status == 'cancelled' and instance.cancellation_reason == 'rescheduled':
-            instance.status = 'confirmed' if instance.status == 'cancelled' else instance.status
+            # Store original booking date if this is the first reschedule
+            if not instance.is_rescheduled:
+                instance.original_booking_date = timezone.make_aware(
+                    datetime.combine(instance.booking_date, instance.start_time)
+                )
+                
+            # Update booking
+            instance.booking_date = validated_data.get('booking_date')
+            instance.start_time = validated_data['start_time']
+            instance.end_time = validated_data['end_time']
+            instance.rescheduled_reason = validated_data.get('rescheduled_reason')
+            instance.is_rescheduled = True
+            instance.rescheduled_count += 1
             
-        instance.save()
+            # If booking was cancelled due to reschedule, update the status back to confirmed/pending
+            if instance.status == 'cancelled' and instance.cancellation_reason == 'rescheduled':
+                instance.status = 'confirmed' if instance.status == 'cancelled' else instance.status
+                
+            instance.save()
         return instance
 
 
@@ -235,7 +305,9 @@ class CalendarSyncSerializer(serializers.Serializer):
     """
     Serializer for calendar synchronization requests.
     """
-    booking_id = serializers.UUIDField(required=True)
+    booking_id = serializers.UUIDField(required=False)
+    # Several bookings are pushed in one background job instead
+    booking_ids = serializers.ListField(child=serializers.UUIDField(), required=False, allow_empty=False, max_length=500)
     provider = serializers.CharField(required=True)
     auth_token = serializers.CharField(required=True, write_only=True)
     calendar_id = serializers.CharField(required=False)
@@ -267,14 +339,8 @@ class CalendarSyncSerializer(serializers.Serializer):
             
         except Booking.DoesNotExist:
             raise serializers.ValidationError("Booking not found.")
-
-class CalendarEventResponseSerializer(serializers.Serializer):
-    """
-    Serializer for calendar event response data.
-    """
-    success = serializers.BooleanField()
-    provider = serializers.CharField()
-    event_id = serializers.CharField()
-    booking_id = serializers.UUIDField()
-    sync_time = serializers.DateTimeField()
-    error = serializers.CharField(required=False)
+    
+    def validate(self, data):
+        if ('booking_id' in data) == ('booking_ids' in data):
+            raise serializers.ValidationError("Provide either booking_id or booking_ids.")
+        return data
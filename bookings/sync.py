@@ -1,174 +1,369 @@
 """
 Calendar synchronization module for the bookings app.
-Provides functionality to sync bookings with external calendar services.
+
+Bookings are pushed to external calendars by a background worker rather than
+inside the request that asks for it. Connecting a calendar stores a
+``CalendarConnection`` and marks the chosen bookings ``pending`` in
+``CalendarSyncState``; saving a booking marks its rows ``pending`` again.
+
+``run_calendar_sync`` (the ``bookings.sync_calendars`` task) claims a batch of
+due rows with ``SKIP LOCKED``, groups them per connection (user and
+provider), and pushes them on a bounded thread pool sharing one HTTP session
+per provider so connections are reused. Results are written back with a few
+bulk updates. Network errors, 429s and 5xx responses are retried with
+exponential backoff up to ``CALENDAR_SYNC_MAX_ATTEMPTS``; other errors fail
+the row. Rows whose booking changed while in flight stay ``pending``.
 """
 import logging
-from datetime import datetime, timedelta
-from django.utils import timezone
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
-from django.contrib.auth import get_user_model
-from .models import Booking
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .calendar_feed import assemble, local_datetime, render_event
+from .models import Booking, CalendarConnection, CalendarSyncState
 
-User = get_user_model()
 logger = logging.getLogger(__name__)
 
 # Supported calendar providers
-CALENDAR_PROVIDERS = {
-    'google': 'Google Calendar',
-    'microsoft': 'Microsoft Outlook',
-    'apple': 'Apple Calendar',
+CALENDAR_PROVIDERS = dict(CalendarConnection.PROVIDER_CHOICES)
+
+DEFAULT_API_URLS = {
+    'google': 'https://www.googleapis.com/calendar/v3',
+    'microsoft': 'https://graph.microsoft.com/v1.0',
+    'apple': 'https://caldav.icloud.com',
 }
 
+# Push outcomes
+SYNCED = 'synced'
+RETRY = 'retry'
+FAILED = 'failed'
+
+
+def get_api_urls():
+    return {**DEFAULT_API_URLS, **getattr(settings, 'CALENDAR_SYNC_API_URLS', {})}
+
+
+def get_concurrency():
+    return getattr(settings, 'CALENDAR_SYNC_CONCURRENCY', 4)
+
+
+def get_batch_size():
+    return getattr(settings, 'CALENDAR_SYNC_BATCH_SIZE', 200)
+
+
+def get_max_attempts():
+    return getattr(settings, 'CALENDAR_SYNC_MAX_ATTEMPTS', 6)
+
+
+def get_request_timeout():
+    return getattr(settings, 'CALENDAR_SYNC_TIMEOUT', 10)
+
+
+def get_lease():
+    return timedelta(seconds=getattr(settings, 'CALENDAR_SYNC_LEASE_SECONDS', 300))
+
+
+def get_retry_delay(attempts):
+    """Backoff before attempt ``attempts + 1``: base * 2^(attempts - 1), capped"""
+    base = getattr(settings, 'CALENDAR_SYNC_RETRY_BASE_SECONDS', 30)
+    cap = getattr(settings, 'CALENDAR_SYNC_RETRY_MAX_SECONDS', 60 * 60)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), cap))
+
+
 class CalendarSyncError(Exception):
     """Exception raised for errors in the calendar synchronization process."""
     pass
 
-class CalendarSyncManager:
+
+def schedule_sync(countdown=0):
+    """Queue a worker run once the current transaction commits"""
+    from .tasks import sync_calendars
+    transaction.on_commit(lambda: sync_calendars.apply_async(countdown=countdown))
+
+
+def connect_calendar(user, provider, credentials):
+    """Create or refresh the user's connection to ``provider``"""
+    if provider not in CALENDAR_PROVIDERS:
+        raise CalendarSyncError(f"Unsupported calendar provider: {provider}")
+    connection, _ = CalendarConnection.objects.update_or_create(
+        user=user,
+        provider=provider,
+        defaults={
+            'auth_token': credentials['auth_token'],
+            'calendar_id': credentials.get('calendar_id') or '',
+            'create_reminder': credentials.get('create_reminder', True),
+            'reminder_minutes': credentials.get('reminder_minutes', 30),
+        },
+    )
+    return connection
+
+
+def queue_bookings(connection, booking_ids):
     """
-    Manages synchronization between bookings and external calendar services.
-    Provides functionality for creating, updating and deleting calendar events.
+    Mark bookings the connection's user takes part in as pending.
+
+    Returns:
+        int: Number of bookings queued
     """
-    
-    def __init__(self, user_id=None):
-        self.user_id = user_id
-        
-    def sync_booking_to_calendar(self, booking_id, provider, credentials):
-        """
-        Synchronizes a booking to the specified calendar provider.
-        
-        Args:
-            booking_id: UUID of the booking to sync
-            provider: Calendar provider (google, microsoft, apple)
-            credentials: Dict containing authentication credentials for the provider
-            
-        Returns:
-            dict: Result of the sync operation with status and details
-        """
-        try:
-            booking = Booking.objects.get(id=booking_id)
-            
-            # Check if user is authorized to sync this booking
-            if self.user_id and booking.customer.id != self.user_id and booking.provider.id != self.user_id:
-                raise CalendarSyncError("User not authorized to sync this booking")
-            
-            # Validate provider
-            if provider not in CALENDAR_PROVIDERS:
-                raise CalendarSyncError(f"Unsupported calendar provider: {provider}")
-            
-            # Call the appropriate provider-specific sync method
-            if provider == 'google':
-                return self._sync_to_google_calendar(booking, credentials)
-            elif provider == 'microsoft':
-                return self._sync_to_microsoft_calendar(booking, credentials)
-            elif provider == 'apple':
-                return self._sync_to_apple_calendar(booking, credentials)
-            
-        except Booking.DoesNotExist:
-            logger.error(f"Booking not found: {booking_id}")
-            raise CalendarSyncError(f"Booking not found: {booking_id}")
-        except Exception as e:
-            logger.exception(f"Calendar sync error: {str(e)}")
-            raise CalendarSyncError(f"Calendar sync error: {str(e)}")
-    
-    def _sync_to_google_calendar(self, booking, credentials):
-        """
-        Synchronizes a booking to Google Calendar.
-        
-        Note: Actual implementation would use the Google Calendar API.
-        This is a simplified version for demonstration purposes.
-        """
-        # In a real implementation, this would use the Google Calendar API client
-        # to create or update a calendar event
-        
-        logger.info(f"Syncing booking {booking.id} to Google Calendar")
-        
-        # Mock event creation - in production this would make API calls
-        event_details = {
-            'summary': f"Service Booking: {booking.service.title}",
-            'location': booking.service.location,
-            'description': booking.requirements or '',
-            'start': {
-                'dateTime': booking.booking_date.isoformat(),
-                'timeZone': settings.TIME_ZONE,
-            },
-            'end': {
-                'dateTime': (booking.booking_date + timedelta(hours=1)).isoformat(),
-                'timeZone': settings.TIME_ZONE,
-            },
-            'attendees': [
-                {'email': booking.customer.email},
-                {'email': booking.provider.email},
-            ],
-            'reminders': {
-                'useDefault': False,
-                'overrides': [
-                    {'method': 'email', 'minutes': 24 * 60},
-                    {'method': 'popup', 'minutes': 30},
-                ],
-            },
-        }
-        
-        # Simulate a successful response
-        mock_event_id = f"google_event_{booking.id}_{int(timezone.now().timestamp())}"
-        
-        # Update the booking with the calendar event ID
-        booking.calendar_event_id = mock_event_id
-        booking.save(update_fields=['calendar_event_id', 'updated_at'])
-        
-        return {
-            'success': True,
-            'provider': 'google',
-            'event_id': mock_event_id,
-            'booking_id': str(booking.id),
-            'sync_time': timezone.now().isoformat(),
-        }
-    
-    def _sync_to_microsoft_calendar(self, booking, credentials):
-        """
-        Synchronizes a booking to Microsoft Outlook Calendar.
-        
-        Note: Actual implementation would use the Microsoft Graph API.
-        This is a simplified version for demonstration purposes.
-        """
-        # Mock implementation similar to Google Calendar
-        logger.info(f"Syncing booking {booking.id} to Microsoft Calendar")
-        
-        # Simulate a successful response
-        mock_event_id = f"microsoft_event_{booking.id}_{int(timezone.now().timestamp())}"
-        
-        # Update the booking with the calendar event ID
-        booking.calendar_event_id = mock_event_id
-        booking.save(update_fields=['calendar_event_id', 'updated_at'])
-        
-        return {
-            'success': True,
-            'provider': 'microsoft',
-            'event_id': mock_event_id,
-            'booking_id': str(booking.id),
-            'sync_time': timezone.now().isoformat(),
-        }
-    
-    def _sync_to_apple_calendar(self, booking, credentials):
-        """
-        Synchronizes a booking to Apple Calendar.
-        
-        Note: Actual implementation would use the Apple Calendar API.
-        This is a simplified version for demonstration purposes.
-        """
-        # Mock implementation similar to Google Calendar
-        logger.info(f"Syncing booking {booking.id} to Apple Calendar")
-        
-        # Simulate a successful response
-        mock_event_id = f"apple_event_{booking.id}_{int(timezone.now().timestamp())}"
-        
-        # Update the booking with the calendar event ID
-        booking.calendar_event_id = mock_event_id
-        booking.save(update_fields=['calendar_event_id', 'updated_at'])
-        
+    user_id = connection.user_id
+    found = list(
+        Booking.objects.filter(id__in=booking_ids)
+        .filter(Q(customer_id=user_id) | Q(provider_id=user_id))
+        .values_list('id', flat=True)
+    )
+    if not found:
+        return 0
+    now = timezone.now()
+    CalendarSyncState.objects.bulk_create(
+        [
+            CalendarSyncState(connection=connection, booking_id=booking_id, status='pending', next_attempt_at=now)
+            for booking_id in found
+        ],
+        update_conflicts=True,
+        unique_fields=['connection', 'booking'],
+        update_fields=['status', 'next_attempt_at', 'attempts', 'last_error'],
+    )
+    schedule_sync()
+    return len(found)
+
+
+def mark_booking_changed(booking_id):
+    """Re-push a changed booking to every calendar it is in"""
+    updated = CalendarSyncState.objects.filter(booking_id=booking_id).update(
+        status='pending', next_attempt_at=timezone.now(), attempts=0, last_error=''
+    )
+    if updated:
+        schedule_sync()
+
+
+def claim_due_states(batch_size=None):
+    """Lease up to ``batch_size`` due rows to this worker"""
+    now = timezone.now()
+    with transaction.atomic():
+        states = list(
+            CalendarSyncState.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(status__in=['pending', 'syncing'], next_attempt_at__lte=now)
+            .select_related('connection', 'booking__service')
+            .order_by('next_attempt_at')[:batch_size or get_batch_size()]
+        )
+        CalendarSyncState.objects.filter(pk__in=[state.pk for state in states]).update(
+            status='syncing', next_attempt_at=now + get_lease()
+        )
+    return states
+
+
+def event_body(connection, booking):
+    """Provider JSON for a booking (Google and Microsoft)"""
+    start = local_datetime(booking.booking_date, booking.start_time).isoformat()
+    end = local_datetime(booking.booking_date, booking.end_time).isoformat()
+    location = booking.address or booking.service.location or ''
+    if connection.provider == 'microsoft':
         return {
-            'success': True,
-            'provider': 'apple',
-            'event_id': mock_event_id,
-            'booking_id': str(booking.id),
-            'sync_time': timezone.now().isoformat(),
+            'subject': f"Service Booking: {booking.service.name}",
+            'body': {'contentType': 'text', 'content': booking.requirements or ''},
+            'start': {'dateTime': start, 'timeZone': settings.TIME_ZONE},
+            'end': {'dateTime': end, 'timeZone': settings.TIME_ZONE},
+            'location': {'displayName': location},
+            'isReminderOn': connection.create_reminder,
+            'reminderMinutesBeforeStart': connection.reminder_minutes,
+            'transactionId': str(booking.id),
         }
+    reminders = [{'method': 'popup', 'minutes': connection.reminder_minutes}] if connection.create_reminder else []
+    return {
+        'summary': f"Service Booking: {booking.service.name}",
+        'location': location,
+        'description': booking.requirements or '',
+        'start': {'dateTime': start, 'timeZone': settings.TIME_ZONE},
+        'end': {'dateTime': end, 'timeZone': settings.TIME_ZONE},
+        'status': 'tentative' if booking.status == 'pending' else 'confirmed',
+        'reminders': {'useDefault': False, 'overrides': reminders},
+    }
+
+
+def build_push(state):
+    """
+    The HTTP request that brings ``state``'s calendar up to date.
+
+    Built on the worker's own thread so the pool threads never touch the
+    database. Returns None when there is nothing to do, which is the case for
+    cancelled bookings that never made it into the calendar.
+    """
+    connection, booking = state.connection, state.booking
+    base = get_api_urls()[connection.provider].rstrip('/')
+    calendar_id = quote(connection.calendar_id, safe='')
+    event_id = quote(state.event_id, safe='')
+    cancelled = booking.status == 'cancelled'
+    if cancelled and not state.event_id:
+        return None
+
+    push = {
+        'state_id': state.pk,
+        'provider': connection.provider,
+        'headers': {'Authorization': f"Bearer {connection.auth_token}"},
+        'event_id': state.event_id,
+        'json': None,
+        'data': None,
+    }
+    if connection.provider == 'apple':
+        # CalDAV: the event is a resource named after the booking
+        uid = f"booking-{booking.id}"
+        push['url'] = f"{base}/{calendar_id or 'calendars'}/{uid}.ics"
+        push['event_id'] = uid
+        if cancelled:
+            push['method'] = 'DELETE'
+        else:
+            push['method'] = 'PUT'
+            push['data'] = assemble({str(booking.id): render_event(booking)}).encode('utf-8')
+            push['headers']['Content-Type'] = 'text/calendar; charset=utf-8'
+        return push
+
+    if connection.provider == 'google':
+        events_url = f"{base}/calendars/{calendar_id or 'primary'}/events"
+        update_method = 'PUT'
+    else:
+        events_url = f"{base}/me/calendars/{calendar_id}/events" if calendar_id else f"{base}/me/events"
+        update_method = 'PATCH'
+    if cancelled:
+        push.update(method='DELETE', url=f"{events_url}/{event_id}")
+    elif state.event_id:
+        push.update(method=update_method, url=f"{events_url}/{event_id}", json=event_body(connection, booking))
+    else:
+        push.update(method='POST', url=events_url, json=event_body(connection, booking))
+    return push
+
+
+def send_push(session, push):
+    """Perform one push; runs on a pool thread"""
+    result = {'state_id': push['state_id'], 'event_id': push['event_id'], 'error': ''}
+    try:
+        response = session.request(
+            push['method'], push['url'], headers=push['headers'],
+            json=push['json'], data=push['data'], timeout=get_request_timeout(),
+        )
+    except requests.RequestException as e:
+        return {**result, 'outcome': RETRY, 'error': str(e)}
+
+    if response.ok:
+        if push['method'] == 'DELETE':
+            result['event_id'] = ''
+        elif push['method'] == 'POST':
+            try:
+                result['event_id'] = response.json()['id']
+            except (ValueError, KeyError, TypeError):
+                # Retrying could create the event twice; leave it for a look
+                return {**result, 'outcome': FAILED, 'error': f"Unreadable response: {response.text[:500]}"}
+        return {**result, 'outcome': SYNCED}
+    if response.status_code in (404, 410):
+        if push['method'] == 'DELETE':
+            return {**result, 'outcome': SYNCED, 'event_id': ''}
+        if push['provider'] != 'apple':
+            # Removed on the other side: create it again next time
+            return {**result, 'outcome': RETRY, 'event_id': '', 'error': f"Event {push['event_id']} no longer exists"}
+    error = f"{response.status_code} {response.text[:500]}"
+    if response.status_code == 429 or response.status_code >= 500:
+        return {**result, 'outcome': RETRY, 'error': error}
+    return {**result, 'outcome': FAILED, 'error': error}
+
+
+def _session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=get_concurrency())
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def push_states(states):
+    """Push claimed rows concurrently, one keep-alive session per provider"""
+    groups = defaultdict(list)
+    results = []
+    for state in states:
+        push = build_push(state)
+        if push is None:
+            results.append({'state_id': state.pk, 'event_id': '', 'error': '', 'outcome': SYNCED})
+        else:
+            groups[state.connection_id].append(push)
+
+    sessions = {}
+    try:
+        with ThreadPoolExecutor(max_workers=get_concurrency()) as executor:
+            futures = []
+            for connection_id, pushes in groups.items():
+                logger.debug(f"📅 Pushing {len(pushes)} bookings for calendar connection {connection_id}")
+                for push in pushes:
+                    if push['provider'] not in sessions:
+                        sessions[push['provider']] = _session()
+                    futures.append(executor.submit(send_push, sessions[push['provider']], push))
+            results.extend(future.result() for future in futures)
+    finally:
+        for session in sessions.values():
+            session.close()
+    return results
+
+
+def record_results(states, results):
+    """
+    Store push results with a handful of bulk queries.
+
+    Status changes only apply to rows still ``syncing``, so a booking edited
+    while its push was in flight is pushed again.
+    """
+    now = timezone.now()
+    by_id = {state.pk: state for state in states}
+    synced, failed, retry = [], [], defaultdict(list)
+    for result in results:
+        state = by_id[result['state_id']]
+        state.event_id = result['event_id']
+        state.last_error = result['error']
+        if result['outcome'] == SYNCED:
+            state.attempts = 0
+            synced.append(state.pk)
+            continue
+        state.attempts += 1
+        if result['outcome'] == RETRY and state.attempts < get_max_attempts():
+            retry[state.attempts].append(state.pk)
+        else:
+            failed.append(state.pk)
+            logger.warning(f"📅 Giving up on booking {state.booking_id} for {state.connection}: {state.last_error}")
+
+    with transaction.atomic():
+        CalendarSyncState.objects.bulk_update(list(by_id.values()), ['event_id', 'last_error', 'attempts'])
+        in_flight = CalendarSyncState.objects.filter(status='syncing')
+        in_flight.filter(pk__in=synced).update(status='synced', synced_at=now)
+        in_flight.filter(pk__in=failed).update(status='failed')
+        for attempts, ids in retry.items():
+            in_flight.filter(pk__in=ids).update(status='pending', next_attempt_at=now + get_retry_delay(attempts))
+    return {'synced': len(synced), 'failed': len(failed), 'retrying': sum(map(len, retry.values()))}
+
+
+def run_calendar_sync(batch_size=None):
+    """
+    Push one batch of due changes and schedule the next run.
+
+    Returns:
+        dict: Counts of synced, failed and retrying rows
+    """
+    batch_size = batch_size or get_batch_size()
+    states = claim_due_states(batch_size)
+    if not states:
+        return {'synced': 0, 'failed': 0, 'retrying': 0}
+
+    counts = record_results(states, push_states(states))
+    logger.info(
+        f"📅 Calendar sync: {counts['synced']} synced, {counts['retrying']} retrying, {counts['failed']} failed"
+    )
+    if len(states) == batch_size:
+        schedule_sync()
+    elif counts['retrying']:
+        next_due = CalendarSyncState.objects.filter(status='pending').order_by('next_attempt_at').first()
+        if next_due:
+            schedule_sync(countdown=max((next_due.next_attempt_at - timezone.now()).total_seconds(), 0))
+    return counts
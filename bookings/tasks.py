@@ -0,0 +1,16 @@
+"""
+Background jobs for bookings.
+"""
+import logging
+
+from celery import shared_task
+
+from .sync import run_calendar_sync
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='bookings.sync_calendars', ignore_result=True)
+def sync_calendars():
+    """Push pending booking changes to connected external calendars"""
+    return run_calendar_sync()
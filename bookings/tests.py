@@ -1,3 +1,322 @@
-from django.test import TestCase
+import json
+import threading
+from datetime import time, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase
+
+from services.models import Service, ServiceCategory
+
+from .calendar_feed import fold
+from .models import Booking, CalendarConnection, CalendarSyncState
+from .serializers import BookingCreateDirectSerializer
+from .schedule import find_conflicts, subtract_busy
+from .sync import queue_bookings, run_calendar_sync
+
+User = get_user_model()
+
+
+class BookingFixtureMixin:
+    """Shared fixtures: an active service with weekday availability and one booking"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='schedcustomer', email='schedcustomer@test.com', user_type='customer')
+        self.provider = User.objects.create_user(username='schedprovider', email='schedprovider@test.com', user_type='provider')
+        category = ServiceCategory.objects.create(name='Cleaning', description='Cleaning')
+        self.day = timezone.localdate() + timedelta(days=7)
+        self.service = Service.objects.create(
+            provider=self.provider, name='Deep clean', description='Whole flat', category=category,
+            hourly_rate=Decimal('500'), location='Pune', status='active',
+            availability={self.day.strftime('%A').lower(): ['09:00-12:00', '13:00-17:00']},
+        )
+        self.booking = Booking.objects.create(
+            service=self.service, customer=self.customer, provider=self.provider,
+            booking_date=self.day, start_time=time(10), end_time=time(11), amount=Decimal('500'),
+        )
+        self.client.force_authenticate(user=self.customer)
+
+
+class ProviderScheduleTestCase(BookingFixtureMixin, APITestCase):
+    """Test cases for double-booking prevention and free slots"""
+
+    def book(self, start, end):
+        serializer = BookingCreateDirectSerializer(data={
+            'service': str(self.service.id), 'booking_date': self.day.isoformat(),
+            'start_time': start, 'end_time': end, 'amount': '500.00',
+        }, context={'request': SimpleNamespace(user=self.customer)})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_overlapping_booking_rejected(self):
+        """A slot touching an existing booking is refused, an adjacent one is fine"""
+        with self.assertRaises(ValidationError) as raised:
+            self.book('10:30', '11:30')
+        self.assertEqual(raised.exception.detail['conflicts'][0]['id'], str(self.booking.id))
+
+        self.assertEqual(self.book('11:00', '12:00').start_time, time(11))
+        with self.assertRaises(ValidationError):
+            self.book('12:00', '11:00')
+
+    def test_cancelled_bookings_free_their_slot(self):
+        """Only pending, confirmed and in-progress bookings block"""
+        Booking.objects.filter(pk=self.booking.pk).update(status='cancelled')
+        self.assertEqual(find_conflicts(self.provider.id, self.day, time(10), time(11)), [])
+
+    def test_reschedule_checks_conflicts(self):
+        """Moving a booking onto another one fails; moving it in place does not conflict with itself"""
+        other = Booking.objects.create(
+            service=self.service, customer=self.customer, provider=self.provider,
+            booking_date=self.day, start_time=time(14), end_time=time(15), amount=Decimal('500'),
+        )
+        url = reverse('booking-reschedule', args=[other.id])
+        data = {'booking_date': self.day.isoformat(), 'start_time': '10:00', 'end_time': '11:00', 'rescheduled_reason': 'Earlier'}
+        self.assertEqual(self.client.patch(url, data, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+
+        data.update(start_time='14:30', end_time='15:30')
+        self.assertEqual(self.client.patch(url, data, format='json').status_code, status.HTTP_200_OK)
+        other.refresh_from_db()
+        self.assertEqual(other.start_time, time(14, 30))
+
+    def test_free_slots_combine_availability_and_bookings(self):
+        """Free time is the published windows minus existing bookings"""
+        response = self.client.get(reverse('booking-free-slots'), {
+            'service': str(self.service.id), 'date': self.day.isoformat(), 'days': 2, 'duration': 90,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first, second = response.data['days']
+        self.assertEqual(
+            [(slot['start_time'], slot['end_time']) for slot in first['slots']],
+            [(time(13), time(17))],
+        )
+        # Not a working day in this service's availability
+        self.assertEqual(second['slots'], [])
+
+    def test_subtract_busy(self):
+        """Busy intervals split, trim and remove windows"""
+        windows = [(time(9), time(12)), (time(13), time(17))]
+        busy = [(time(8), time(9, 30)), (time(10), time(11)), (time(16), time(18))]
+        self.assertEqual(
+            subtract_busy(windows, busy),
+            [(time(9, 30), time(10)), (time(11), time(12)), (time(13), time(16))],
+        )
+
+
+class CalendarFeedTestCase(BookingFixtureMixin, APITestCase):
+    """Test cases for ICS subscription feeds"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        response = self.client.get(reverse('booking-calendar-feed'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.url = response.data['url']
+        self.client.force_authenticate(user=None)
+
+    def test_feed_lists_bookings(self):
+        """The feed is an ICS document with one event per booking"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        content = response.content.decode()
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertIn(f'UID:booking-{self.booking.id}@prbal', content)
+        self.assertIn('STATUS:TENTATIVE', content)
+        self.assertIn('SUMMARY:Deep clean', content)
+
+    def test_unchanged_feed_is_not_modified_without_queries(self):
+        """Polling with the ETag gets a 304 straight from the cache"""
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_booking_changes_update_feed_incrementally(self):
+        """Saving or deleting a booking re-renders just that event"""
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.confirm()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('STATUS:CONFIRMED', response.content.decode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.delete()
+        self.assertNotIn('BEGIN:VEVENT', self.client.get(self.url).content.decode())
+
+    def test_reset_token_revokes_old_url(self):
+        """A new secret invalidates the previous subscription URL"""
+        self.client.force_authenticate(user=self.customer)
+        new_url = self.client.post(reverse('booking-calendar-feed')).data['url']
+        self.client.force_authenticate(user=None)
+        self.assertNotEqual(new_url, self.url)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(new_url).status_code, status.HTTP_200_OK)
+
+    def test_long_lines_are_folded(self):
+        """Content lines stay within 75 octets"""
+        self.assertEqual(fold('x' * 80), 'x' * 75 + '\r\n ' + 'x' * 5)
+
+
+class FakeCalendarHandler(BaseHTTPRequestHandler):
+    """Answers every request like a calendar API, failing with queued status codes first"""
+    protocol_version = 'HTTP/1.1'
+
+    def handle_request(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        server = self.server
+        with server.lock:
+            server.requests.append({
+                'method': self.command,
+                'path': self.path,
+                'authorization': self.headers.get('Authorization'),
+                'body': json.loads(body) if body and self.headers.get('Content-Type') == 'application/json' else body,
+                'client': self.client_address,
+            })
+            status_code = server.failures.pop(0) if server.failures else 200
+            payload = json.dumps({'id': f"event-{len(server.requests)}"}).encode()
+            if isinstance(status_code, tuple):
+                status_code, payload = status_code
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+    def log_message(self, *args):
+        pass
+
+
+class CalendarSyncWorkerTestCase(BookingFixtureMixin, APITestCase):
+    """Test cases for the background calendar sync worker against a local fake calendar API"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCalendarHandler)
+        cls.server.daemon_threads = True
+        cls.server.lock = threading.Lock()
+        cls.server.requests, cls.server.failures = [], []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.server.requests.clear()
+        self.server.failures.clear()
+        base = f"http://127.0.0.1:{self.server.server_port}"
+        overrides = self.settings(CALENDAR_SYNC_API_URLS={'google': base, 'microsoft': base, 'apple': base})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def connect(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('calendar-sync'), {
+                'booking_id': str(self.booking.id), 'provider': 'google', 'auth_token': 'token', **data,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return response
+
+    def test_sync_request_is_queued_and_pushed(self):
+        """The request only queues; the worker creates the event and records its ID"""
+        self.assertEqual(self.connect().data['queued'], 1)
+
+        [request] = self.server.requests
+        self.assertEqual((request['method'], request['path']), ('POST', '/calendars/primary/events'))
+        self.assertEqual(request['authorization'], 'Bearer token')
+        self.assertEqual(request['body']['summary'], 'Service Booking: Deep clean')
+        state = CalendarSyncState.objects.get(booking=self.booking)
+        self.assertEqual((state.status, state.event_id), ('synced', 'event-1'))
+
+    def test_auth_token_encrypted_at_rest(self):
+        """Only ciphertext reaches the database"""
+        self.connect(auth_token='secret-oauth-token')
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT auth_token FROM {CalendarConnection._meta.db_table}")
+            [(raw,)] = cursor.fetchall()
+        self.assertNotIn('secret-oauth-token', raw)
+        self.assertEqual(CalendarConnection.objects.get().auth_token, 'secret-oauth-token')
+        self.assertEqual(self.server.requests[0]['authorization'], 'Bearer secret-oauth-token')
+
+    def test_unreadable_response_fails_row(self):
+        """A 2xx that isn't JSON fails its row instead of the whole batch"""
+        self.server.failures.append((200, b'<html>Maintenance</html>'))
+        self.connect()
+        state = CalendarSyncState.objects.get(booking=self.booking)
+        self.assertEqual(state.status, 'failed')
+        self.assertTrue(state.last_error.startswith('Unreadable response'))
+
+    def test_booking_changes_are_pushed(self):
+        """Saving a synced booking updates its event; cancelling it deletes the event"""
+        self.connect(provider='microsoft')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.confirm()
+        self.assertEqual(
+            [(r['method'], r['path']) for r in self.server.requests],
+            [('POST', '/me/events'), ('PATCH', '/me/events/event-1')],
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.status = 'cancelled'
+            self.booking.save()
+        self.assertEqual(self.server.requests[-1]['method'], 'DELETE')
+        state = CalendarSyncState.objects.get(booking=self.booking)
+        self.assertEqual((state.status, state.event_id), ('synced', ''))
+
+    def test_transient_errors_retry_with_backoff(self):
+        """A 503 leaves the row pending until its backoff has passed"""
+        self.server.failures.append(503)
+        self.connect()
+        state = CalendarSyncState.objects.get(booking=self.booking)
+        self.assertEqual((state.status, state.attempts), ('pending', 1))
+        self.assertGreater(state.next_attempt_at, timezone.now())
+        self.assertTrue(state.last_error.startswith('503'))
+
+        self.assertEqual(run_calendar_sync()['synced'], 0)
+        self.assertEqual(len(self.server.requests), 1)
+
+        CalendarSyncState.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(run_calendar_sync()['synced'], 1)
+        state.refresh_from_db()
+        self.assertEqual((state.status, state.attempts, state.event_id), ('synced', 0, 'event-2'))
+
+    def test_permanent_errors_fail(self):
+        """Rejected credentials are not retried"""
+        self.server.failures.append(401)
+        self.connect()
+        state = CalendarSyncState.objects.get(booking=self.booking)
+        self.assertEqual((state.status, state.attempts), ('failed', 1))
+
+    def test_batch_pushed_concurrently_over_reused_connections(self):
+        """A batch costs a fixed number of queries and at most CALENDAR_SYNC_CONCURRENCY connections"""
+        bookings = [self.booking] + [
+            Booking.objects.create(
+                service=self.service, customer=self.customer, provider=self.provider,
+                booking_date=self.day + timedelta(days=offset), start_time=time(10), end_time=time(11),
+                amount=Decimal('500'),
+            )
+            for offset in range(1, 8)
+        ]
+        connection = CalendarConnection.objects.create(user=self.customer, provider='google', auth_token='token')
+        self.assertEqual(queue_bookings(connection, [booking.id for booking in bookings]), 8)
+
+        with self.settings(CALENDAR_SYNC_CONCURRENCY=2), self.assertNumQueries(8):
+            self.assertEqual(run_calendar_sync()['synced'], 8)
+        self.assertEqual(len(self.server.requests), 8)
+        self.assertLessEqual(len({r['client'] for r in self.server.requests}), 2)
+        self.assertEqual(CalendarSyncState.objects.filter(status='synced').count(), 8)
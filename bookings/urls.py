@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import BookingViewSet
-from .views import CalendarSyncView
+from .views import CalendarSyncView, calendar_feed_ics
 
 router = DefaultRouter()
 router.register(r'', BookingViewSet)
@@ -9,5 +9,7 @@ router.register(r'', BookingViewSet)
 urlpatterns = [
     # POST endpoint for calendar sync
     path('', CalendarSyncView.as_view(), name='calendar-sync'),
+    # ICS subscription feed; the token is the credential
+    path('calendar/<str:token>.ics', calendar_feed_ics, name='calendar-feed-ics'),
     path('', include(router.urls)),
 ]
@@ -1,9 +1,18 @@
+from datetime import date, timedelta
+
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db.models import Q
+from django.http import Http404, HttpResponse
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
 from django.db import transaction
 from .models import Booking
 from .serializers import (
@@ -11,10 +20,16 @@ from .serializers import (
     BookingDetailSerializer,
     BookingCreateDirectSerializer,
     BookingStatusUpdateSerializer,
-    BookingRescheduleSerializer
+    BookingRescheduleSerializer,
+    CalendarSyncSerializer,
 )
 from .permissions import IsBookingParticipant, CanChangeBookingStatus
+from .calendar_feed import get_feed_payload, get_or_create_feed, reset_feed_token
+from .schedule import free_slots
+from .sync import CalendarSyncError, connect_calendar, queue_bookings
 from notifications.utils import send_notification
+from payments.idempotency import idempotent
+from services.models import Service
 """
 Views for calendar integration functionality.
 """
@@ -22,9 +37,6 @@ from rest_framework import views, permissions, status
 from rest_framework.response import Response
 from django.utils import timezone
 
-from .serializers import CalendarSyncSerializer, CalendarEventResponseSerializer
-from .sync import CalendarSyncManager, CalendarSyncError
-
 class BookingViewSet(viewsets.ModelViewSet):
     """
     ViewSet for bookings - allows listing, retrieving, creating, and managing bookings.
@@ -81,6 +93,10 @@ class BookingViewSet(viewsets.ModelViewSet):
         # List view is filtered by user role in get_queryset
         return [permissions.IsAuthenticated()]
     
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+    
     def perform_create(self, serializer):
         # Set the customer to the current user
         serializer.save(customer=self.request.user)
@@ -96,6 +112,7 @@ class BookingViewSet(viewsets.ModelViewSet):
         return self.update(request, *args, **kwargs)
     
     @action(detail=True, methods=['patch'])
+    @idempotent
     def update_status(self, request, pk=None):
         """
         Update the status of a booking.
@@ -104,6 +121,7 @@ class BookingViewSet(viewsets.ModelViewSet):
         return self._update_booking_status(request, pk)
         
     @action(detail=True, methods=['put', 'patch'], url_path='status')
+    @idempotent
     def status(self, request, pk=None):
         """
         Update the status of a booking (alias for update_status).
@@ -195,6 +213,7 @@ class BookingViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=True, methods=['post'])
+    @idempotent
     def cancel(self, request, pk=None):
         """
         Cancel a booking.
@@ -210,6 +229,11 @@ class BookingViewSet(viewsets.ModelViewSet):
             )
         
         with transaction.atomic():
+            # A duplicate request waits here and then finds the booking cancelled
+            booking = Booking.objects.select_for_update().get(pk=booking.pk)
+            if booking.status == 'cancelled':
+                return Response({"message": "Booking cancelled successfully."}, status=status.HTTP_200_OK)
+            
             # Get cancellation reason and reason type
             notes = request.data.get('notes', '')
             reason_type = request.data.get('cancellation_reason', 'other')
@@ -245,7 +269,69 @@ class BookingViewSet(viewsets.ModelViewSet):
             status=status.HTTP_200_OK
         )
         
+    @action(detail=False, methods=['get'])
+    def free_slots(self, request):
+        """
+        Free time in a service's availability, after the provider's existing bookings.
+        Query parameters: service (required), date (YYYY-MM-DD, default today),
+        days (default 1) and duration in minutes (optional).
+        """
+        service_id = request.query_params.get('service')
+        if not service_id:
+            return Response({"error": "service parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            service = Service.objects.get(id=service_id)
+        except (Service.DoesNotExist, DjangoValidationError):
+            return Response({"error": "Service not found."}, status=status.HTTP_404_NOT_FOUND)
+        
+        try:
+            start_date = date.fromisoformat(request.query_params['date']) if 'date' in request.query_params else timezone.localdate()
+            days = int(request.query_params.get('days', 1))
+            duration = request.query_params.get('duration')
+            duration = timedelta(minutes=int(duration)) if duration else None
+        except ValueError:
+            return Response(
+                {"error": "date must be YYYY-MM-DD; days and duration must be integers."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_days = getattr(settings, 'BOOKING_FREE_SLOTS_MAX_DAYS', 31)
+        if not 1 <= days <= max_days:
+            return Response({"error": f"days must be between 1 and {max_days}."}, status=status.HTTP_400_BAD_REQUEST)
+        
+        slots = free_slots(service, start_date, days=days, duration=duration)
+        return Response({
+            "service": service.id,
+            "provider": service.provider_id,
+            "days": [
+                {
+                    "date": day,
+                    "slots": [{"start_time": start, "end_time": end} for start, end in intervals]
+                }
+                for day, intervals in slots.items()
+            ]
+        }, status=status.HTTP_200_OK)
+        
+    @action(detail=False, methods=['get', 'post'])
+    def calendar_feed(self, request):
+        """
+        The current user's ICS subscription URL.
+        GET returns it (creating the feed on first use); POST replaces the
+        secret in the URL, e.g. after it was shared by mistake.
+        """
+        if request.method == 'POST':
+            feed = reset_feed_token(request.user)
+        else:
+            feed = get_or_create_feed(request.user)
+        
+        return Response({
+            "url": request.build_absolute_uri(reverse('calendar-feed-ics', args=[feed.token])),
+            "etag": feed.etag,
+            "last_modified": feed.last_modified,
+            "events": len(feed.events)
+        }, status=status.HTTP_200_OK)
+        
     @action(detail=True, methods=['patch'])
+    @idempotent
     def reschedule(self, request, pk=None):
         """
         Reschedule a booking to a new date.
@@ -277,9 +363,6 @@ class BookingViewSet(viewsets.ModelViewSet):
                     content_object=booking,
                     action_url=f'/bookings/{booking.id}/'
                 )
-                
-                # Optional: Sync with calendar if integrated
-                # self.sync_with_calendar(booking)
             
             return Response({
                 "message": "Booking rescheduled successfully.",
@@ -290,54 +373,39 @@ class BookingViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_200_OK)
             
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        
-    def sync_with_calendar(self, booking):
-        """
-        Sync booking with external calendar (e.g., Google Calendar).
-        This is a placeholder for calendar integration.
-        """
-        # If booking already has a calendar event ID, update that event
-        if booking.calendar_event_id:
-            # Update existing calendar event
-            # In a real implementation, you would call the calendar API
-            # Example pseudocode:
-            # calendar_service.events().update(
-            #     calendarId='primary',
-            #     eventId=booking.calendar_event_id,
-            #     body={
-            #         'summary': f'Booking: {booking.service.title}',
-            #         'start': {'dateTime': booking.booking_date.isoformat()},
-            #         'end': {'dateTime': (booking.booking_date + timedelta(hours=1)).isoformat()},
-            #         'description': booking.requirements
-            #     }
-            # ).execute()
-            pass
-        else:
-            # Create new calendar event
-            # Example pseudocode:
-            # event = calendar_service.events().insert(
-            #     calendarId='primary',
-            #     body={
-            #         'summary': f'Booking: {booking.service.title}',
-            #         'start': {'dateTime': booking.booking_date.isoformat()},
-            #         'end': {'dateTime': (booking.booking_date + timedelta(hours=1)).isoformat()},
-            #         'description': booking.requirements,
-            #         'attendees': [
-            #             {'email': booking.customer.email},
-            #             {'email': booking.provider.email}
-            #         ]
-            #     }
-            # ).execute()
-            # booking.calendar_event_id = event.get('id')
-            # booking.save(update_fields=['calendar_event_id'])
-            pass
+
+@require_safe
+def calendar_feed_ics(request, token):
+    """
+    A user's bookings as an ICS subscription feed.
+    
+    The token in the URL is the only credential, since calendar clients can't
+    send auth headers. Unchanged feeds are answered with 304 from the cached
+    ETag and Last-Modified without touching the database.
+    """
+    payload = get_feed_payload(token)
+    if payload is None:
+        raise Http404("Unknown calendar feed")
+    
+    etag = quote_etag(payload['etag'])
+    last_modified = int(payload['last_modified'].timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(payload['content'], content_type='text/calendar; charset=utf-8')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, max_age=getattr(settings, 'CALENDAR_FEED_MAX_AGE', 300))
+    return response
+
 
 class CalendarSyncView(views.APIView):
     """
     API endpoint for synchronizing bookings with external calendar services.
     
-    Accepts POST requests with booking details and calendar provider information,
-    then attempts to create or update events in the external calendar service.
+    Accepts POST requests with one or more bookings and calendar provider
+    information, stores the connection and queues the bookings for the
+    background sync worker. Later changes to those bookings are pushed
+    automatically; the request never waits on the calendar provider.
     """
     permission_classes = [permissions.IsAuthenticated]
     
@@ -348,30 +416,24 @@ class CalendarSyncView(views.APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            # Extract validated data
-            booking_id = serializer.validated_data['booking_id']
-            provider = serializer.validated_data['provider']
-            auth_token = serializer.validated_data['auth_token']
-            calendar_id = serializer.validated_data.get('calendar_id')
-            
-            # Prepare credentials
+            data = serializer.validated_data
+            provider = data['provider']
             credentials = {
-                'auth_token': auth_token,
-                'calendar_id': calendar_id,
-                'create_reminder': serializer.validated_data.get('create_reminder', True),
-                'reminder_minutes': serializer.validated_data.get('reminder_minutes', 30),
+                'auth_token': data['auth_token'],
+                'calendar_id': data.get('calendar_id'),
+                'create_reminder': data.get('create_reminder', True),
+                'reminder_minutes': data.get('reminder_minutes', 30),
             }
+            booking_ids = data.get('booking_ids') or [data['booking_id']]
             
-            # Sync booking to calendar
-            sync_manager = CalendarSyncManager(user_id=request.user.id)
-            result = sync_manager.sync_booking_to_calendar(booking_id, provider, credentials)
-            
-            # Serialize and return the response
-            response_serializer = CalendarEventResponseSerializer(data=result)
-            if response_serializer.is_valid():
-                return Response(response_serializer.data, status=status.HTTP_201_CREATED)
-            else:
-                return Response(response_serializer.errors, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            connection = connect_calendar(request.user, provider, credentials)
+            queued = queue_bookings(connection, booking_ids)
+            return Response({
+                'success': True,
+                'queued': queued,
+                'provider': provider,
+                'timestamp': timezone.now().isoformat()
+            }, status=status.HTTP_202_ACCEPTED)
                 
         except CalendarSyncError as e:
             return Response({
@@ -1,14 +1,27 @@
+import asyncio
 import json
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.utils import timezone
-from .models import MessageThread, Message, UserPresence
-from uuid import UUID
+from . import presence
+from .models import MessageThread, Message
+from .presence import get_presence_recorder
+from .utils import advance_read_watermarks
+from .writer import get_message_writer
+from uuid import UUID, uuid4
 from asgiref.sync import sync_to_async
 from django.core.cache import cache
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        self.ack_tasks = set()
+        self.pending_typing = None
+        self.pending_reads = set()
+        self.last_typing = False
+        self.last_typing_sent = 0.0
+        self.event_flush_task = None
         self.thread_id = self.scope['url_route']['kwargs']['thread_id']
         self.room_group_name = f'chat_{self.thread_id}'
         
@@ -29,8 +42,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        # Mark user as online in this thread
-        await self.update_user_presence(user, True)
+        # Count the connection; the database only hears about the first one
+        self.presence_connection = presence.PresenceConnection(user.id)
+        self.last_heartbeat = time.monotonic()
+        if await database_sync_to_async(self.presence_connection.open)():
+            get_presence_recorder().record(user.id, True)
         
         # Notify other participants about user's online status
         await self.channel_layer.group_send(
@@ -46,10 +62,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.accept()
     
     async def disconnect(self, close_code):
+        # Deliver coalesced events now rather than on a tick that may never come
+        if self.event_flush_task is not None and not self.event_flush_task.done():
+            self.event_flush_task.cancel()
+        if self.last_typing and self.pending_typing is None:
+            self.pending_typing = False
+        if getattr(self, 'presence_connection', None) is not None:
+            await self.flush_events()
+        
         # Update user's presence status when disconnecting
         user = self.scope['user']
-        if user.is_authenticated:
-            await self.update_user_presence(user, False)
+        went_offline = False
+        if getattr(self, 'presence_connection', None) is not None:
+            went_offline = await database_sync_to_async(self.presence_connection.close)()
+        if went_offline:
+            get_presence_recorder().record(user.id, False)
             
             # Notify other participants about user's offline status
             await self.channel_layer.group_send(
@@ -75,15 +102,33 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
         user = self.scope['user']
         
+        # Any frame counts as a heartbeat; refresh the TTL a few times per period
+        if time.monotonic() - self.last_heartbeat > presence.get_presence_ttl() / 3:
+            self.last_heartbeat = time.monotonic()
+            await database_sync_to_async(self.presence_connection.heartbeat)()
+        
         # Handle different types of WebSocket messages
+        if message_type == 'heartbeat':
+            # Sent by idle clients to stay online; nothing else to do
+            return
+        
         if message_type == 'message':
             message_content = data.get('message', '')
             
             if not message_content.strip():
                 return
                 
-            # Save message to database
-            message = await self.save_message(user, message_content)
+            # Broadcast first; the write-behind writer stores it on its next flush
+            message = Message(
+                id=uuid4(),
+                thread_id=UUID(self.thread_id),
+                sender=user,
+                content=message_content,
+                status='sent',
+                created_at=timezone.now()
+            )
+            persisted = get_message_writer().enqueue(message)
+            client_id = data.get('client_id')
             
             # Send message to room group
             await self.channel_layer.group_send(
@@ -94,14 +139,50 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'sender_id': str(user.id),
                     'sender_name': user.get_full_name() or user.username,
                     'message_id': str(message.id),
+                    'client_id': client_id,
                     'timestamp': message.created_at.isoformat(),
                     'status': 'sent'
                 }
             )
             
+            # Keep a reference so the acknowledgement task isn't garbage collected
+            ack_task = asyncio.ensure_future(self.acknowledge(persisted, message, client_id))
+            self.ack_tasks.add(ack_task)
+            ack_task.add_done_callback(self.ack_tasks.discard)
+            
         elif message_type == 'typing':
-            # Handle typing indicator
-            is_typing = data.get('is_typing', False)
+            # Coalesced: only the latest state is broadcast on the next tick
+            self.pending_typing = bool(data.get('is_typing', False))
+            self.schedule_event_flush()
+            
+        elif message_type == 'read_receipt':
+            # Coalesced: the newest message read in the window moves the watermark
+            message_id = data.get('message_id')
+            if message_id and isinstance(message_id, str):
+                self.pending_reads.add(message_id)
+                self.schedule_event_flush()
+    
+    def schedule_event_flush(self):
+        if self.event_flush_task is None or self.event_flush_task.done():
+            self.event_flush_task = asyncio.ensure_future(self.flush_events_later())
+    
+    async def flush_events_later(self):
+        await asyncio.sleep(getattr(settings, 'CHAT_EVENT_TICK', 0.25))
+        await self.flush_events()
+    
+    async def flush_events(self):
+        """Send whatever typing and read-receipt state built up since the last tick"""
+        user = self.scope['user']
+        
+        is_typing, self.pending_typing = self.pending_typing, None
+        now = time.monotonic()
+        if is_typing is not None and (
+            is_typing != self.last_typing
+            # Refresh "still typing" occasionally so the cached status doesn't expire
+            or (is_typing and now - self.last_typing_sent > getattr(settings, 'CHAT_TYPING_REFRESH', 3))
+        ):
+            self.last_typing = is_typing
+            self.last_typing_sent = now
             
             # Cache typing status with 5-second expiration
             cache_key = f"typing_{self.thread_id}_{user.id}"
@@ -116,20 +197,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'is_typing': is_typing
                 }
             )
+        
+        message_ids, self.pending_reads = self.pending_reads, set()
+        if message_ids:
+            for message_id in message_ids:
+                await self.wait_until_persisted(message_id)
+            newest_id = await self.mark_as_read(message_ids, user)
             
-        elif message_type == 'read_receipt':
-            # Handle read receipts
-            message_id = data.get('message_id')
-            if message_id:
-                await self.mark_as_read(message_id, user)
-                
+            if newest_id:
                 # Broadcast read receipt to the group
                 await self.channel_layer.group_send(
                     self.room_group_name,
                     {
                         'type': 'message_read',
                         'user_id': str(user.id),
-                        'message_id': message_id,
+                        'message_id': newest_id,
                         'timestamp': timezone.now().isoformat()
                     }
                 )
@@ -143,9 +225,30 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'sender_id': event['sender_id'],
             'sender_name': event['sender_name'],
             'message_id': event['message_id'],
+            'client_id': event.get('client_id'),
             'timestamp': event['timestamp'],
             'status': event.get('status', 'sent')
         }))
+    
+    async def acknowledge(self, persisted, message, client_id):
+        """Tell the sender once their message is durably stored"""
+        try:
+            await persisted
+            # created_at is the stored value, which can trail the broadcast by one flush
+            ack = {
+                'type': 'message_ack',
+                'status': 'persisted',
+                'seq': message.seq,
+                'timestamp': message.created_at.isoformat()
+            }
+        except Exception:
+            ack = {'type': 'message_ack', 'status': 'failed'}
+        ack.update({'message_id': str(message.id), 'client_id': client_id})
+        try:
+            await self.send(text_data=json.dumps(ack))
+        except Exception:
+            # The socket closed before the flush; the client resends on reconnect
+            pass
         
     # Handle typing indicator broadcasts
     async def typing_indicator(self, event):
@@ -184,39 +287,41 @@ class ChatConsumer(AsyncWebsocketConsumer):
         except (MessageThread.DoesNotExist, ValueError):
             return False
     
-    @database_sync_to_async
-    def save_message(self, user, message_content):
-        thread = MessageThread.objects.get(id=UUID(self.thread_id))
-        message = Message.objects.create(
-            thread=thread,
-            sender=user,
-            content=message_content,
-            status='sent'
-        )
-        # Update the thread's updated_at timestamp
-        thread.updated_at = timezone.now()
-        thread.save(update_fields=['updated_at'])
-        
-        return message
-        
-    @database_sync_to_async
-    def mark_as_read(self, message_id, user):
+    async def wait_until_persisted(self, message_id):
+        # A receipt can arrive before the writer has flushed the message
         try:
-            message = Message.objects.get(id=UUID(message_id))
-            if message.thread_id == UUID(self.thread_id) and message.sender_id != user.id:
-                message.read_by.add(user)
-                message.status = 'read'
-                message.save(update_fields=['status'])
-                return True
-        except (Message.DoesNotExist, ValueError):
+            await get_message_writer().wait_for(UUID(message_id))
+        except Exception:
+            # Bad id or failed write; mark_as_read will find nothing to mark
             pass
-        return False
-        
+    
     @database_sync_to_async
-    def update_user_presence(self, user, is_online):
-        # Update or create presence record
-        presence, _ = UserPresence.objects.update_or_create(
-            user=user,
-            defaults={'is_online': is_online, 'last_seen': timezone.now()}
+    def mark_as_read(self, message_ids, user):
+        """
+        Apply a window of read receipts.
+        
+        Returns:
+            str | None: The newest message marked, which is all the group needs
+        """
+        ids = []
+        for message_id in message_ids:
+            try:
+                ids.append(UUID(message_id))
+            except ValueError:
+                pass
+        newest = (
+            Message.objects.filter(id__in=ids, thread_id=UUID(self.thread_id))
+            .exclude(sender=user)
+            .order_by('-created_at')
+            .first()
         )
-        return presence
+        if newest is None:
+            return None
+        
+        advance_read_watermarks(user, [(newest.thread_id, newest.id, newest.created_at)])
+        Message.objects.filter(
+            thread_id=newest.thread_id,
+            created_at__lte=newest.created_at,
+            status__in=['sent', 'delivered']
+        ).exclude(sender=user).update(status='read')
+        return str(newest.id)
@@ -0,0 +1,95 @@
+import asyncio
+import multiprocessing
+import statistics
+import time
+
+from channels.layers import channel_layers
+from django.core.management.base import BaseCommand
+
+GROUP = 'benchmark.fanout'
+
+
+def subscriber(alias, sockets, messages, ready, results):
+    """One simulated daphne process holding ``sockets`` connections"""
+
+    async def run():
+        layer = channel_layers.make_backend(alias)
+        channels = [await layer.new_channel() for _ in range(sockets)]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+        ready.put(True)
+
+        async def drain(channel):
+            latencies = []
+            for _ in range(messages):
+                message = await layer.receive(channel)
+                latencies.append(time.time() - message['sent_at'])
+            return latencies
+
+        per_socket = await asyncio.gather(*(drain(channel) for channel in channels))
+        for channel in channels:
+            await layer.group_discard(GROUP, channel)
+        results.put([latency for latencies in per_socket for latency in latencies])
+
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = 'Measure group_send fan-out latency across processes for a channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layer', default='default', help='CHANNEL_LAYERS alias (default: default)')
+        parser.add_argument('--processes', type=int, default=4, help='Subscriber processes (default: 4)')
+        parser.add_argument('--sockets', type=int, default=25, help='Channels per process (default: 25)')
+        parser.add_argument('--messages', type=int, default=200, help='Group messages to send (default: 200)')
+        parser.add_argument('--interval', type=float, default=0.005, help='Seconds between sends (default: 0.005)')
+
+    def handle(self, *args, **options):
+        alias = options['layer']
+        processes = options['processes']
+        sockets = options['sockets']
+        messages = options['messages']
+
+        context = multiprocessing.get_context('spawn')
+        ready = context.Queue()
+        results = context.Queue()
+        workers = [
+            context.Process(target=subscriber, args=(alias, sockets, messages, ready, results))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        for _ in workers:
+            ready.get(timeout=60)
+
+        self.stdout.write(
+            f'Sending {messages} messages to {processes * sockets} channels in {processes} processes'
+        )
+
+        send_seconds = asyncio.run(self._publish(alias, messages, options['interval']))
+
+        latencies = []
+        for _ in workers:
+            latencies.extend(results.get(timeout=120))
+        for worker in workers:
+            worker.join()
+
+        latencies.sort()
+        expected = messages * processes * sockets
+        self.stdout.write(f'Delivered {len(latencies)}/{expected} messages; sending took {send_seconds:.2f}s')
+        if latencies:
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Latency ms: mean {statistics.mean(latencies) * 1000:.2f}, p50 {percentile(0.50):.2f}, '
+                f'p95 {percentile(0.95):.2f}, p99 {percentile(0.99):.2f}, max {latencies[-1] * 1000:.2f}'
+            ))
+
+    async def _publish(self, alias, messages, interval):
+        layer = channel_layers.make_backend(alias)
+        started = time.time()
+        for i in range(messages):
+            await layer.group_send(GROUP, {'type': 'benchmark', 'seq': i, 'sent_at': time.time()})
+            await asyncio.sleep(interval)
+        return time.time() - started
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from messagings.retention import get_retention_days, prune_messages
+
+
+class Command(BaseCommand):
+    help = 'Delete messages older than MESSAGE_RETENTION_DAYS, archiving them first when RETENTION_ARCHIVE_DIR is set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per batch (default: RETENTION_BATCH_SIZE)')
+        parser.add_argument('--no-archive', action='store_true', help='Delete without writing archive files')
+
+    def handle(self, *args, **options):
+        if not get_retention_days():
+            self.stdout.write('MESSAGE_RETENTION_DAYS is 0; messages are kept forever')
+            return
+
+        removed = prune_messages(archive=not options['no_archive'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} messages"))
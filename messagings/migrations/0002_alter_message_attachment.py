@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 22:57
+
+import uploads.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messagings', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='message',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=uploads.storage.get_blob_storage, upload_to='message_attachments/'),
+        ),
+    ]
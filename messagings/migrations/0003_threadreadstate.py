@@ -0,0 +1,79 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:06
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    """Seed each (thread, user) watermark from the newest message they had read"""
+    MessageReadReceipt = apps.get_model('messagings', 'MessageReadReceipt')
+    Message = apps.get_model('messagings', 'Message')
+    ThreadReadState = apps.get_model('messagings', 'ThreadReadState')
+
+    newest = (
+        MessageReadReceipt.objects.values('message__thread', 'user')
+        .annotate(last_read_at=Max('message__created_at'))
+        .order_by()
+    )
+    states = []
+    for row in newest.iterator():
+        message = Message.objects.filter(
+            thread_id=row['message__thread'], created_at=row['last_read_at']
+        ).only('id').first()
+        states.append(ThreadReadState(
+            thread_id=row['message__thread'],
+            user_id=row['user'],
+            last_read_message=message,
+            last_read_at=row['last_read_at'],
+        ))
+    ThreadReadState.objects.bulk_create(states, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messagings', '0002_alter_message_attachment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThreadReadState',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('last_read_at', models.DateTimeField(blank=True, help_text='created_at of the newest message read', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Thread Read State',
+                'verbose_name_plural': 'Thread Read States',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread', 'created_at'], name='messagings__thread__ece536_idx'),
+        ),
+        migrations.AddField(
+            model_name='threadreadstate',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messagings.message'),
+        ),
+        migrations.AddField(
+            model_name='threadreadstate',
+            name='thread',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='messagings.messagethread'),
+        ),
+        migrations.AddField(
+            model_name='threadreadstate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thread_read_states', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='threadreadstate',
+            constraint=models.UniqueConstraint(fields=('thread', 'user'), name='unique_thread_read_state'),
+        ),
+        migrations.RunPython(backfill_read_watermarks, migrations.RunPython.noop),
+    ]
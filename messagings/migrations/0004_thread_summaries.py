@@ -0,0 +1,75 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_thread_summaries(apps, schema_editor):
+    """Compute each thread's summary and every participant's unread counter"""
+    MessageThread = apps.get_model('messagings', 'MessageThread')
+    Message = apps.get_model('messagings', 'Message')
+    ThreadReadState = apps.get_model('messagings', 'ThreadReadState')
+
+    for thread in MessageThread.objects.prefetch_related('participants').iterator(chunk_size=500):
+        messages = Message.objects.filter(thread_id=thread.pk)
+        latest = messages.order_by('-created_at').first()
+        if latest is not None:
+            MessageThread.objects.filter(pk=thread.pk).update(
+                message_count=messages.count(),
+                last_message=latest,
+                last_message_sender_id=latest.sender_id,
+                last_message_at=latest.created_at,
+                last_message_preview=latest.content[:100],
+            )
+
+        states = {state.user_id: state for state in ThreadReadState.objects.filter(thread_id=thread.pk)}
+        for participant in thread.participants.all():
+            state = states.get(participant.pk) or ThreadReadState(thread_id=thread.pk, user_id=participant.pk)
+            unread = messages.exclude(sender_id=participant.pk)
+            if state.last_read_at is not None:
+                unread = unread.filter(created_at__gt=state.last_read_at)
+            state.unread_count = unread.count()
+            state.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messagings', '0003_threadreadstate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='messagings.message'),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='threadreadstate',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0, help_text='Messages from others above the watermark'),
+        ),
+        migrations.RunPython(backfill_thread_summaries, migrations.RunPython.noop),
+    ]
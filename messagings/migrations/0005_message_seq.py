@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_message_seqs(apps, schema_editor):
+    """Number existing messages per thread in created_at order"""
+    MessageThread = apps.get_model('messagings', 'MessageThread')
+    Message = apps.get_model('messagings', 'Message')
+
+    for thread_id in MessageThread.objects.values_list('id', flat=True).iterator():
+        seq = 0
+        updated = []
+        for message in Message.objects.filter(thread_id=thread_id).order_by('created_at', 'id').only('id'):
+            seq += 1
+            message.seq = seq
+            updated.append(message)
+        Message.objects.bulk_update(updated, ['seq'], batch_size=1000)
+        MessageThread.objects.filter(pk=thread_id).update(last_seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messagings', '0004_thread_summaries'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_message_seqs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('thread', 'seq'), name='unique_message_thread_seq'),
+        ),
+    ]
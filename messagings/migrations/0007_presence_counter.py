@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:41
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messagings', '0006_retention_indexes'),
+        ('users', '0006_verification_private_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PresenceCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='presence_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('generation', models.UUIDField(default=uuid.uuid4)),
+                ('connections', models.IntegerField(default=0)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Presence Counter',
+                'verbose_name_plural': 'Presence Counters',
+            },
+        ),
+    ]
@@ -1,9 +1,12 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 import uuid
 from django.utils import timezone
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 from bids.models import Bid
 from bookings.models import Booking
+from uploads.storage import get_blob_storage
 
 class MessageThread(models.Model):
     """
@@ -25,6 +28,16 @@ class MessageThread(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Denormalized summary of the newest message, maintained by
+    # messagings.utils.record_new_messages so the inbox needs no per-thread queries
+    last_message = models.ForeignKey('Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=100, blank=True, default='')
+    message_count = models.PositiveIntegerField(default=0)
+    # Highest Message.seq handed out in this thread; see messagings.utils.allocate_seqs
+    last_seq = models.PositiveBigIntegerField(default=0)
+    
     class Meta:
         ordering = ['-updated_at']
         verbose_name = 'Message Thread'
@@ -51,7 +64,7 @@ class Message(models.Model):
     thread = models.ForeignKey(MessageThread, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='messages_sent')
     content = models.TextField()
-    attachment = models.FileField(upload_to='message_attachments/', null=True, blank=True)
+    attachment = models.FileField(upload_to='message_attachments/', storage=get_blob_storage, null=True, blank=True)
     is_read = models.BooleanField(default=False)  # Legacy field, kept for backward compatibility
     read_by = models.ManyToManyField(
         settings.AUTH_USER_MODEL, 
@@ -60,6 +73,8 @@ class Message(models.Model):
         through='MessageReadReceipt'
     )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='sent')
+    # Monotonic position within the thread, used by the delta sync API
+    seq = models.PositiveBigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -67,14 +82,38 @@ class Message(models.Model):
         ordering = ['created_at']
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
+        indexes = [
+            # Thread history and unread counts above a read watermark
+            models.Index(fields=['thread', 'created_at']),
+            # Retention sweeps
+            models.Index(fields=['created_at'], name='message_retention_idx'),
+        ]
+        constraints = [
+            # Also the (thread, seq) index behind range reads for sync
+            models.UniqueConstraint(fields=['thread', 'seq'], name='unique_message_thread_seq'),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender} at {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+    
+    def save(self, *args, **kwargs):
+        if self._state.adding and not self.seq:
+            from .utils import allocate_seqs
+            
+            # Hold the thread's sequence lock until the row is committed
+            with transaction.atomic():
+                self.seq = allocate_seqs(self.thread_id)
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
 
 
 class MessageReadReceipt(models.Model):
     """
     Tracks when each user read a specific message.
+    
+    Read state is now kept per thread in ThreadReadState; these rows are
+    retained for history and are no longer written on every read.
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='read_receipts')
@@ -90,6 +129,33 @@ class MessageReadReceipt(models.Model):
         return f"{self.user} read message at {self.read_at.strftime('%Y-%m-%d %H:%M')}"
 
 
+class ThreadReadState(models.Model):
+    """
+    Read watermark of one participant in one thread.
+
+    Everything in the thread up to and including ``last_read_at`` counts as
+    read by ``user``. Marking messages read moves the watermark forward with
+    a single upsert instead of writing one receipt per message.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    thread = models.ForeignKey(MessageThread, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='thread_read_states')
+    last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_read_at = models.DateTimeField(null=True, blank=True, help_text="created_at of the newest message read")
+    unread_count = models.PositiveIntegerField(default=0, help_text="Messages from others above the watermark")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Thread Read State'
+        verbose_name_plural = 'Thread Read States'
+        constraints = [
+            models.UniqueConstraint(fields=['thread', 'user'], name='unique_thread_read_state'),
+        ]
+        
+    def __str__(self):
+        return f"{self.user} read {self.thread_id} up to {self.last_read_at}"
+
+
 class UserPresence(models.Model):
     """
     Tracks the online/offline status of users.
@@ -107,3 +173,29 @@ class UserPresence(models.Model):
     def __str__(self):
         status = "Online" if self.is_online else f"Last seen {self.last_seen.strftime('%Y-%m-%d %H:%M')}"
         return f"{self.user} - {status}"
+
+
+class PresenceCounter(models.Model):
+    """
+    Live WebSocket connections per user, maintained by messagings.presence.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='presence_counter')
+    generation = models.UUIDField(default=uuid.uuid4)
+    connections = models.IntegerField(default=0)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Presence Counter'
+        verbose_name_plural = 'Presence Counters'
+
+    def __str__(self):
+        return f"{self.user} - {self.connections} connections"
+
+
+@receiver(post_save, sender=Message)
+def update_thread_summary_on_message(sender, instance, created, raw=False, **kwargs):
+    # Covers the REST, WebSocket and sync paths; bulk inserts call
+    # record_new_messages themselves
+    if created and not raw:
+        from .utils import record_new_messages
+        record_new_messages([instance])
@@ -0,0 +1,187 @@
+"""
+Database-backed presence registry.
+
+Each user has a ``PresenceCounter`` row holding their open WebSocket
+connections. It carries an expiry that consumers push forward with
+heartbeats, so a process that dies without closing its connections can't
+leave anyone online for longer than ``PRESENCE_TTL`` seconds.
+``online_user_ids`` answers "who is online" for any number of users with one
+query. Every change is a single ``UPDATE ... RETURNING`` or upsert, so
+concurrent connects and disconnects in different processes never lose a count.
+
+An expired counter can't simply be restarted at 1, since the user may still
+have several sockets open in several processes. So each counter belongs to a
+generation, and every ``PresenceConnection`` remembers the generation it was
+counted in. Joining an expired row starts a new generation; a heartbeat that
+finds its generation gone joins the current one, so within one heartbeat
+interval the new counter holds every live socket.
+
+The database only learns about transitions (first connection, last
+disconnection) in ``UserPresence``, and even those are buffered by
+``PresenceRecorder`` and upserted in one statement per
+``PRESENCE_FLUSH_INTERVAL``.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import PresenceCounter, UserPresence
+from .utils import db_value
+
+logger = logging.getLogger(__name__)
+
+
+def get_presence_ttl():
+    return getattr(settings, 'PRESENCE_TTL', 60)
+
+
+def get_flush_interval():
+    return getattr(settings, 'PRESENCE_FLUSH_INTERVAL', 15)
+
+
+class PresenceConnection:
+    """One WebSocket connection's share of its user's counter"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.generation = None
+
+    def open(self):
+        """
+        Count this connection.
+
+        Returns:
+            bool: True when this was the user's first live connection
+        """
+        return self._join() == 1
+
+    def heartbeat(self):
+        """Keep the user's counter alive for another TTL"""
+        now = timezone.now()
+        table = connection.ops.quote_name(PresenceCounter._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET expires_at = %s "
+                f"WHERE user_id = %s AND generation = %s AND expires_at > %s",
+                [db_value(now + timedelta(seconds=get_presence_ttl())), db_value(self.user_id),
+                 db_value(self.generation), db_value(now)]
+            )
+            refreshed = cursor.rowcount
+        if not refreshed:
+            # Our generation expired while the socket was quiet; it is still open
+            self._join()
+
+    def close(self):
+        """
+        Count this connection as closed.
+
+        Returns:
+            bool: True when the user has no connections left
+        """
+        now = timezone.now()
+        table = connection.ops.quote_name(PresenceCounter._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET connections = connections - 1 "
+                f"WHERE user_id = %s AND generation = %s AND expires_at > %s RETURNING connections",
+                [db_value(self.user_id), db_value(self.generation), db_value(now)]
+            )
+            row = cursor.fetchone()
+        if row is not None:
+            return row[0] <= 0
+        # Never counted in the live generation; only report what's left
+        return self.user_id not in online_user_ids([self.user_id])
+
+    def _join(self):
+        now = timezone.now()
+        table = connection.ops.quote_name(PresenceCounter._meta.db_table)
+        # Both CASEs see the row as it was before the update
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (user_id, generation, connections, expires_at) "
+                f"VALUES (%s, %s, 1, %s) "
+                f"ON CONFLICT (user_id) DO UPDATE SET "
+                f"generation = CASE WHEN {table}.expires_at > %s THEN {table}.generation "
+                f"ELSE EXCLUDED.generation END, "
+                f"connections = CASE WHEN {table}.expires_at > %s THEN {table}.connections + 1 "
+                f"ELSE 1 END, "
+                f"expires_at = EXCLUDED.expires_at "
+                f"RETURNING connections, generation",
+                [db_value(self.user_id), db_value(uuid.uuid4()),
+                 db_value(now + timedelta(seconds=get_presence_ttl())), db_value(now), db_value(now)]
+            )
+            count, generation = cursor.fetchone()
+        self.generation = generation if isinstance(generation, uuid.UUID) else uuid.UUID(generation)
+        return count
+
+
+def online_user_ids(user_ids):
+    """The subset of ``user_ids`` with at least one live connection"""
+    if not user_ids:
+        return set()
+    return set(
+        PresenceCounter.objects.filter(
+            user_id__in=user_ids, connections__gt=0, expires_at__gt=timezone.now()
+        ).values_list('user_id', flat=True)
+    )
+
+
+class PresenceRecorder:
+    """Buffers online/offline transitions and upserts them in batches"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.pending = {}
+        self.wakeup = asyncio.Event()
+        self.task = loop.create_task(self.run())
+
+    def record(self, user_id, is_online):
+        # Later transitions for the same user replace earlier ones
+        self.pending[user_id] = (is_online, timezone.now())
+        self.wakeup.set()
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(get_flush_interval())
+            self.wakeup.clear()
+            batch, self.pending = self.pending, {}
+            try:
+                await database_sync_to_async(persist_presence)(batch)
+            except Exception as e:
+                logger.error(f"❌ Failed to persist presence for {len(batch)} users: {e}")
+
+
+def persist_presence(batch):
+    """Upsert ``{user_id: (is_online, last_seen)}`` in one statement"""
+    if not batch:
+        return
+    UserPresence.objects.bulk_create(
+        [
+            UserPresence(user_id=user_id, is_online=is_online, last_seen=last_seen)
+            for user_id, (is_online, last_seen) in batch.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['is_online', 'last_seen'],
+    )
+
+
+_recorders = {}
+
+
+def get_presence_recorder():
+    """The recorder for the running event loop, started on first use"""
+    loop = asyncio.get_running_loop()
+    recorder = _recorders.get(loop)
+    if recorder is None or recorder.task.done():
+        for stale in [key for key in _recorders if key.is_closed()]:
+            del _recorders[stale]
+        recorder = _recorders[loop] = PresenceRecorder(loop)
+    return recorder
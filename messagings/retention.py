@@ -0,0 +1,44 @@
+"""
+Retention for chat messages.
+
+Messages older than ``MESSAGE_RETENTION_DAYS`` are removed in batches
+(``0`` keeps them forever). Thread summaries and unread counters of the
+affected threads are rebuilt after every batch.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from prbal_project.retention import prune_queryset
+
+from .models import Message
+from .utils import refresh_thread_summaries
+
+
+def get_retention_days():
+    return getattr(settings, 'MESSAGE_RETENTION_DAYS', 0)
+
+
+def delete_messages(messages):
+    """Delete a message queryset and rebuild the summaries it fed"""
+    thread_ids = set(messages.values_list('thread_id', flat=True))
+    messages.delete()
+    refresh_thread_summaries(thread_ids)
+
+
+def prune_messages(archive=True, batch_size=None, now=None):
+    """
+    Delete (and optionally archive) messages past retention.
+
+    Returns:
+        int: Number of messages removed
+    """
+    days = get_retention_days()
+    if not days:
+        return 0
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    return prune_queryset(
+        Message.objects.filter(created_at__lt=cutoff), 'messages',
+        delete=delete_messages, archive=archive, batch_size=batch_size
+    )
@@ -1,6 +1,9 @@
 from rest_framework import serializers
 from .models import MessageThread, Message
+from .presence import online_user_ids
+from .utils import unread_counts_by_thread
 from users.serializers import PublicUserProfileSerializer
+from uploads.serializers import ResponsiveImageField, UploadTokenField
 from django.contrib.auth import get_user_model
 import base64
 from django.core.files.base import ContentFile
@@ -11,15 +14,15 @@ User = get_user_model()
 class MessageListSerializer(serializers.ModelSerializer):
     """Serializer for listing messages in a thread"""
     sender_name = serializers.CharField(source='sender.get_full_name', read_only=True)
-    sender_profile_picture = serializers.ImageField(source='sender.profile_picture', read_only=True)
+    sender_profile_picture = ResponsiveImageField(source='sender.profile_picture', read_only=True)
     
     class Meta:
         model = Message
         fields = [
             'id', 'sender', 'sender_name', 'sender_profile_picture', 
-            'content', 'attachment', 'is_read', 'created_at'
+            'content', 'attachment', 'is_read', 'seq', 'created_at'
         ]
-        read_only_fields = ['id', 'sender', 'is_read', 'created_at']
+        read_only_fields = ['id', 'sender', 'is_read', 'seq', 'created_at']
 
 class Base64FileField(serializers.FileField):
     """Custom field for handling base64 encoded files"""
@@ -39,10 +42,12 @@ class Base64FileField(serializers.FileField):
 class MessageCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating a new message"""
     attachment = Base64FileField(required=False)
+    # Token from a chunked upload (api/v1/uploads/), instead of inline base64
+    attachment_upload = UploadTokenField(source='attachment', max_size=None, required=False, write_only=True)
     
     class Meta:
         model = Message
-        fields = ['id', 'thread', 'content', 'attachment']
+        fields = ['id', 'thread', 'content', 'attachment', 'attachment_upload']
         read_only_fields = ['id']
     
     def validate_thread(self, value):
@@ -60,13 +65,32 @@ class MessageCreateSerializer(serializers.ModelSerializer):
 
 class ThreadParticipantSerializer(serializers.ModelSerializer):
     """Serializer for thread participants"""
+    profile_picture = ResponsiveImageField(read_only=True)
+    is_online = serializers.SerializerMethodField()
+    
     class Meta:
         model = User
         fields = [
             'id', 'username', 'first_name', 'last_name', 
-            'profile_picture', 'user_type'
+            'profile_picture', 'user_type', 'is_online'
         ]
         read_only_fields = fields
+    
+    def get_is_online(self, obj):
+        # Thread lists look everyone up at once; see MessageThreadListSerializer
+        online = self.context.get('online_user_ids')
+        if online is None:
+            online = online_user_ids([obj.id])
+        return obj.id in online
+
+class MessageThreadPageSerializer(serializers.ListSerializer):
+    """Resolves presence for every participant on the page with one query"""
+    
+    def to_representation(self, data):
+        threads = list(data.all() if hasattr(data, 'all') else data)
+        user_ids = {user.id for thread in threads for user in thread.participants.all()}
+        self.context['online_user_ids'] = online_user_ids(user_ids)
+        return super().to_representation(threads)
 
 class MessageThreadListSerializer(serializers.ModelSerializer):
     """Serializer for listing message threads"""
@@ -78,23 +102,33 @@ class MessageThreadListSerializer(serializers.ModelSerializer):
         model = MessageThread
         fields = [
             'id', 'participants', 'thread_type', 'bid', 'booking',
-            'last_message_preview', 'unread_count', 'updated_at'
+            'last_message_preview', 'last_message_at', 'message_count',
+            'unread_count', 'updated_at'
         ]
         read_only_fields = fields
+        list_serializer_class = MessageThreadPageSerializer
     
     def get_last_message_preview(self, obj):
-        last_message = obj.messages.order_by('-created_at').first()
-        if last_message:
-            return {
-                'sender_name': last_message.sender.get_full_name(),
-                'content': last_message.content[:50] + ('...' if len(last_message.content) > 50 else ''),
-                'created_at': last_message.created_at
-            }
-        return None
+        if not obj.last_message_at:
+            return None
+        # The sender is almost always a participant, which the list view prefetches
+        sender = next(
+            (user for user in obj.participants.all() if user.pk == obj.last_message_sender_id),
+            None
+        ) or obj.last_message_sender
+        content = obj.last_message_preview
+        return {
+            'sender_name': sender.get_full_name() if sender else '',
+            'content': content[:50] + ('...' if len(content) > 50 else ''),
+            'created_at': obj.last_message_at
+        }
     
     def get_unread_count(self, obj):
+        # Annotated by MessageThreadViewSet for list queries
+        if hasattr(obj, 'unread_count'):
+            return obj.unread_count
         user = self.context['request'].user
-        return obj.messages.exclude(sender=user).exclude(read_by=user).count()
+        return unread_counts_by_thread(user, obj.id).get(obj.id, 0)
 
 class MessageThreadCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating a new message thread"""
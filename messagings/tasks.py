@@ -0,0 +1,12 @@
+"""
+Background maintenance for chat messages.
+"""
+from celery import shared_task
+
+from .retention import prune_messages
+
+
+@shared_task(name='messagings.prune_messages', ignore_result=True)
+def prune_messages_task():
+    """Remove messages past their retention period"""
+    return prune_messages()
@@ -1,3 +1,415 @@
-from django.test import TestCase
+import asyncio
+import os
+import shutil
+import tempfile
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from prbal_project.channel_layers import SQLiteChannelLayer
+
+from . import presence
+from .routing import websocket_urlpatterns
+from .retention import prune_messages
+from .models import Message, MessageReadReceipt, MessageThread, PresenceCounter, ThreadReadState, UserPresence
+from .utils import advance_read_watermarks, refresh_thread_summaries, unread_counts_by_thread
+from .writer import get_message_writer
+
+User = get_user_model()
+
+
+class MessagingFixtureMixin:
+    """Shared fixtures: a two-person thread with a few messages"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='chatcustomer', email='chatcustomer@test.com', user_type='customer')
+        self.provider = User.objects.create_user(username='chatprovider', email='chatprovider@test.com', user_type='provider')
+        self.thread = MessageThread.objects.create(thread_type='general')
+        self.thread.participants.add(self.customer, self.provider)
+
+        base = timezone.now() - timedelta(minutes=10)
+        self.messages = []
+        for i in range(3):
+            message = Message.objects.create(thread=self.thread, sender=self.provider, content=f"Hello {i}")
+            # Spread timestamps so ordering is deterministic
+            Message.objects.filter(pk=message.pk).update(created_at=base + timedelta(minutes=i))
+            message.refresh_from_db()
+            self.messages.append(message)
+
+        self.client.force_authenticate(user=self.customer)
+
+
+class MessagingTestCase(MessagingFixtureMixin, APITestCase):
+    pass
+
+
+class ReadWatermarkTestCase(MessagingTestCase):
+    """Test cases for per-thread read watermarks"""
+
+    def test_mark_all_in_thread_is_one_watermark(self):
+        """Marking a thread read writes one watermark and no receipts"""
+        response = self.client.post(
+            reverse('message-mark-as-read'),
+            {'mark_all_in_thread': True, 'thread_id': str(self.thread.id)},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['marked_count'], 3)
+
+        state = ThreadReadState.objects.get(thread=self.thread, user=self.customer)
+        self.assertEqual(state.last_read_message_id, self.messages[-1].id)
+        self.assertFalse(MessageReadReceipt.objects.exists())
+        self.assertEqual(unread_counts_by_thread(self.customer), {})
+
+    def test_marking_a_message_reads_earlier_ones(self):
+        """Unread counts derive from the watermark"""
+        self.client.post(
+            reverse('message-mark-as-read'),
+            {'message_ids': [str(self.messages[1].id)]},
+            format='json'
+        )
+
+        response = self.client.get(reverse('message-unread-count'))
+        self.assertEqual(response.data['total_unread'], 1)
+        self.assertEqual(response.data['thread_counts'], {str(self.thread.id): 1})
+
+    def test_watermark_never_moves_backwards(self):
+        """Late receipts for older messages are ignored"""
+        newest, oldest = self.messages[-1], self.messages[0]
+        advance_read_watermarks(self.customer, [(self.thread.id, newest.id, newest.created_at)])
+        advance_read_watermarks(self.customer, [(self.thread.id, oldest.id, oldest.created_at)])
+
+        state = ThreadReadState.objects.get(thread=self.thread, user=self.customer)
+        self.assertEqual(state.last_read_message_id, newest.id)
+
+    def test_thread_list_unread_count(self):
+        """The inbox shows per-thread unread counts"""
+        response = self.client.get(reverse('message-thread-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        threads = response.data['results'] if 'results' in response.data else response.data
+        self.assertEqual(threads[0]['unread_count'], 3)
+
+        # The sender has nothing unread in their own thread
+        self.client.force_authenticate(user=self.provider)
+        response = self.client.get(reverse('message-thread-list'))
+        threads = response.data['results'] if 'results' in response.data else response.data
+        self.assertEqual(threads[0]['unread_count'], 0)
+
+
+class ThreadSummaryTestCase(MessagingTestCase):
+    """Test cases for denormalized thread summaries and unread counters"""
+
+    def test_summary_tracks_newest_message(self):
+        """Creating a message updates the thread's summary"""
+        message = Message.objects.create(thread=self.thread, sender=self.customer, content="Latest reply")
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.last_message_id, message.id)
+        self.assertEqual(self.thread.last_message_sender_id, self.customer.id)
+        self.assertEqual(self.thread.last_message_preview, "Latest reply")
+        self.assertEqual(self.thread.message_count, 4)
+
+    def test_unread_counter_increments_and_resets(self):
+        """Counters grow per recipient and drop when the watermark moves"""
+        state = ThreadReadState.objects.get(thread=self.thread, user=self.customer)
+        self.assertEqual(state.unread_count, 3)
+        self.assertEqual(unread_counts_by_thread(self.provider), {})
+
+        advance_read_watermarks(self.customer, [(self.thread.id, self.messages[1].id, self.messages[1].created_at)])
+        state.refresh_from_db()
+        self.assertEqual(state.unread_count, 1)
+
+    def test_refresh_after_delete(self):
+        """Deleting the newest message rolls the summary back"""
+        self.client.force_authenticate(user=self.provider)
+        response = self.client.delete(reverse('message-detail', args=[self.messages[-1].id]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.message_count, 2)
+        self.assertEqual(self.thread.last_message_id, self.messages[1].id)
+        self.assertEqual(unread_counts_by_thread(self.customer), {self.thread.id: 2})
+
+    def test_inbox_query_count_is_constant(self):
+        """The inbox doesn't query per thread"""
+        for i in range(3):
+            thread = MessageThread.objects.create(thread_type='general')
+            thread.participants.add(self.customer, self.provider)
+            Message.objects.create(thread=thread, sender=self.provider, content=f"Thread {i}")
+        refresh_thread_summaries(MessageThread.objects.values_list('id', flat=True))
+
+        # Pagination count, the page itself, the participants prefetch and presence
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('message-thread-list'))
+        threads = response.data['results'] if 'results' in response.data else response.data
+        self.assertEqual(len(threads), 4)
+
+
+class SQLiteChannelLayerTestCase(SimpleTestCase):
+    """Test cases for the cross-process SQLite channel layer"""
+
+    def setUp(self):
+        # Short directory so the wakeup socket path fits in sockaddr_un
+        self.directory = tempfile.mkdtemp(prefix='cl')
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        self.path = os.path.join(self.directory, 'layer.db')
+
+    def make_layer(self, **kwargs):
+        return SQLiteChannelLayer(path=self.path, **kwargs)
+
+    def test_group_send_reaches_other_process(self):
+        """Two layer instances stand in for two processes sharing the file"""
+        async def scenario():
+            daphne, worker = self.make_layer(), self.make_layer()
+            channel = await daphne.new_channel()
+            await daphne.group_add('chat_thread', channel)
+
+            await worker.group_send('chat_thread', {'type': 'chat.message', 'text': 'hi'})
+            return await asyncio.wait_for(daphne.receive(channel), 5)
+
+        self.assertEqual(asyncio.run(scenario()), {'type': 'chat.message', 'text': 'hi'})
+
+    def test_wakeup_beats_poll_interval(self):
+        """Receivers are woken by the sender rather than waiting for a poll"""
+        async def scenario():
+            daphne, worker = self.make_layer(poll_interval=30), self.make_layer(poll_interval=30)
+            channel = await daphne.new_channel()
+            pending = asyncio.ensure_future(daphne.receive(channel))
+            await asyncio.sleep(0.2)
+            await worker.send(channel, {'type': 'ping'})
+            return await asyncio.wait_for(pending, 5)
+
+        self.assertEqual(asyncio.run(scenario()), {'type': 'ping'})
+
+    def test_group_discard_and_capacity(self):
+        """Discarded channels stop receiving; full channels reject direct sends"""
+        async def scenario():
+            daphne, worker = self.make_layer(), self.make_layer(capacity=1)
+            kept, dropped = await daphne.new_channel(), await daphne.new_channel()
+            await daphne.group_add('notifications', kept)
+            await daphne.group_add('notifications', dropped)
+            await daphne.group_discard('notifications', dropped)
+
+            await worker.group_send('notifications', {'type': 'notify'})
+            self.assertEqual(await daphne._run(daphne._group_channels, 'notifications'), [kept])
+
+            await worker.send(dropped, {'type': 'first'})
+            with self.assertRaises(ChannelFull):
+                await worker.send(dropped, {'type': 'second'})
+            return await asyncio.wait_for(daphne.receive(kept), 5)
+
+        self.assertEqual(asyncio.run(scenario()), {'type': 'notify'})
+
+
+class DeltaSyncTestCase(MessagingTestCase):
+    """Test cases for sequence-numbered message sync"""
+
+    def sync(self, **params):
+        return self.client.get(reverse('message-thread-sync', args=[self.thread.id]), params)
+
+    def test_messages_are_numbered_per_thread(self):
+        """Each thread counts from one"""
+        self.assertEqual([message.seq for message in self.messages], [1, 2, 3])
+        other = MessageThread.objects.create(thread_type='general')
+        other.participants.add(self.customer, self.provider)
+        self.assertEqual(Message.objects.create(thread=other, sender=self.customer, content="Hi").seq, 1)
+
+    def test_after_seq_pages_forward(self):
+        """Reconnecting clients fetch only what they missed, in bounded pages"""
+        response = self.sync(after_seq=0, limit=2)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([message['seq'] for message in response.data['messages']], [1, 2])
+        self.assertTrue(response.data['has_more'])
+        self.assertEqual(response.data['latest_seq'], 3)
+
+        response = self.sync(after_seq=2, limit=2)
+        self.assertEqual([message['seq'] for message in response.data['messages']], [3])
+        self.assertFalse(response.data['has_more'])
+
+    def test_before_seq_backfills_history(self):
+        """Scrolling back returns the page just below the cursor in ascending order"""
+        response = self.sync(before_seq=3, limit=1)
+        self.assertEqual([message['seq'] for message in response.data['messages']], [2])
+        self.assertTrue(response.data['has_more'])
+
+    def test_invalid_cursor(self):
+        """Non-integer cursors are rejected"""
+        self.assertEqual(self.sync(after_seq='soon').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MessageRetentionTestCase(MessagingTestCase):
+    """Test cases for pruning messages past retention"""
+
+    @override_settings(MESSAGE_RETENTION_DAYS=30, RETENTION_ARCHIVE_DIR='')
+    def test_prune_removes_old_messages_and_refreshes_summary(self):
+        """Old messages go in batches and the thread summary follows"""
+        Message.objects.filter(pk__in=[m.pk for m in self.messages[:2]]).update(
+            created_at=timezone.now() - timedelta(days=40)
+        )
+
+        self.assertEqual(prune_messages(batch_size=1), 2)
+
+        self.thread.refresh_from_db()
+        self.assertEqual(list(Message.objects.values_list('pk', flat=True)), [self.messages[2].pk])
+        self.assertEqual(self.thread.message_count, 1)
+        self.assertEqual(self.thread.last_message_id, self.messages[2].pk)
+        self.assertEqual(unread_counts_by_thread(self.customer), {self.thread.id: 1})
+
+    def test_retention_disabled_by_default(self):
+        """MESSAGE_RETENTION_DAYS=0 keeps everything"""
+        with override_settings(MESSAGE_RETENTION_DAYS=0):
+            self.assertEqual(prune_messages(), 0)
+        self.assertEqual(Message.objects.count(), 3)
+
+
+class MessageWriterTestCase(MessagingFixtureMixin, APITransactionTestCase):
+    """Test cases for write-behind chat persistence; the writer uses its own connections"""
+
+    def test_batch_is_stored_with_one_summary_update(self):
+        """Queued messages are stored together and acknowledged"""
+        async def scenario():
+            writer = get_message_writer()
+            futures = [
+                writer.enqueue(Message(thread=self.thread, sender=self.customer, content=f"Batch {i}"))
+                for i in range(5)
+            ]
+            return await asyncio.gather(*futures)
+
+        stored = async_to_sync(scenario)()
+        self.assertEqual([message.seq for message in stored], [4, 5, 6, 7, 8])
+
+        self.assertEqual(Message.objects.filter(content__startswith='Batch').count(), 5)
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.message_count, 8)
+        self.assertEqual(self.thread.last_message_id, stored[-1].id)
+        self.assertEqual(unread_counts_by_thread(self.provider), {self.thread.id: 5})
+
+    def test_failed_flush_rejects_acknowledgements(self):
+        """A message that can't be stored fails only the senders in its thread"""
+        async def scenario():
+            writer = get_message_writer()
+            missing_thread = MessageThread(thread_type='general')
+            orphan = writer.enqueue(Message(thread=missing_thread, sender=self.customer, content="Orphan"))
+            stored = writer.enqueue(Message(thread=self.thread, sender=self.customer, content="Survivor"))
+            with self.assertRaises(Exception):
+                await orphan
+            return await stored
+
+        stored = async_to_sync(scenario)()
+        self.assertFalse(Message.objects.filter(content='Orphan').exists())
+        self.assertEqual(Message.objects.get(content='Survivor').seq, stored.seq)
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.last_message_id, stored.id)
+
+
+class PresenceTestCase(MessagingTestCase):
+    """Test cases for the database-backed presence registry"""
+
+    def test_connection_counting(self):
+        """Users stay online until their last connection closes"""
+        first, second = presence.PresenceConnection(self.customer.id), presence.PresenceConnection(self.customer.id)
+        self.assertTrue(first.open())
+        self.assertFalse(second.open())
+        self.assertEqual(presence.online_user_ids([self.customer.id, self.provider.id]), {self.customer.id})
+
+        self.assertFalse(first.close())
+        self.assertTrue(second.close())
+        self.assertEqual(presence.online_user_ids([self.customer.id]), set())
+
+    def test_expired_counter_rebuilt_by_heartbeats(self):
+        """After the counter expires, every open socket is counted again"""
+        connections = [presence.PresenceConnection(self.customer.id) for _ in range(3)]
+        for connection in connections:
+            connection.open()
+        PresenceCounter.objects.update(expires_at=timezone.now())  # every socket was quiet for a TTL
+
+        for connection in connections:
+            connection.heartbeat()
+        self.assertFalse(connections[0].close())
+        self.assertFalse(connections[1].close())
+        self.assertEqual(presence.online_user_ids([self.customer.id]), {self.customer.id})
+        self.assertTrue(connections[2].close())
+
+    def test_stale_close_keeps_new_generation(self):
+        """Closing a socket counted before expiry leaves the new counter alone"""
+        stale = presence.PresenceConnection(self.customer.id)
+        stale.open()
+        PresenceCounter.objects.update(expires_at=timezone.now())
+
+        fresh = presence.PresenceConnection(self.customer.id)
+        self.assertTrue(fresh.open())
+        self.assertFalse(stale.close())
+        self.assertEqual(PresenceCounter.objects.get(user=self.customer).connections, 1)
+        self.assertTrue(fresh.close())
+
+    def test_transitions_are_upserted_in_one_batch(self):
+        """Buffered transitions create or update presence rows"""
+        UserPresence.objects.create(user=self.customer, is_online=False)
+        presence.persist_presence({
+            self.customer.id: (True, timezone.now()),
+            self.provider.id: (False, timezone.now()),
+        })
+
+        self.assertTrue(UserPresence.objects.get(user=self.customer).is_online)
+        self.assertFalse(UserPresence.objects.get(user=self.provider).is_online)
+
+    def test_thread_list_embeds_presence(self):
+        """Participants in the inbox carry is_online"""
+        presence.PresenceConnection(self.provider.id).open()
+        response = self.client.get(reverse('message-thread-list'))
+        threads = response.data['results'] if 'results' in response.data else response.data
+        online = {participant['id']: participant['is_online'] for participant in threads[0]['participants']}
+        self.assertEqual(online, {str(self.provider.id): True, str(self.customer.id): False})
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CHAT_EVENT_TICK=0.1,
+)
+class CoalescedEventsTestCase(MessagingFixtureMixin, APITransactionTestCase):
+    """Test cases for typing and read-receipt coalescing in ChatConsumer"""
+
+    def connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/chat/{self.thread.id}/")
+        communicator.scope['user'] = user
+        return communicator
+
+    def test_bursts_collapse_to_one_event(self):
+        """Keystroke-rate typing frames and receipts produce one broadcast each"""
+        async def scenario():
+            customer, provider = self.connect(self.customer), self.connect(self.provider)
+            connected, _ = await customer.connect()
+            self.assertTrue(connected)
+            await provider.connect()
+            # Drain the presence broadcasts from both connections
+            while not await provider.receive_nothing(0.2):
+                await provider.receive_json_from()
+
+            for _ in range(20):
+                await customer.send_json_to({'type': 'typing', 'is_typing': True})
+            for message in self.messages:
+                await customer.send_json_to({'type': 'read_receipt', 'message_id': str(message.id)})
+
+            events = []
+            while not await provider.receive_nothing(0.5):
+                events.append(await provider.receive_json_from())
+            await customer.disconnect()
+            await provider.disconnect()
+            return events
+
+        events = async_to_sync(scenario)()
+
+        self.assertEqual([event['type'] for event in events], ['typing', 'read_receipt'])
+        self.assertEqual(events[1]['message_id'], str(self.messages[-1].id))
+        state = ThreadReadState.objects.get(thread=self.thread, user=self.customer)
+        self.assertEqual(state.last_read_message_id, self.messages[-1].id)
+        self.assertEqual(state.unread_count, 0)
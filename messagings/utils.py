@@ -0,0 +1,307 @@
+"""
+Read-state helpers for message threads.
+
+Read state is a per-(thread, participant) watermark (ThreadReadState). Moving
+it is one ``INSERT ... ON CONFLICT DO UPDATE`` for any number of threads, and
+unread counts are ``created_at > last_read_at`` range scans over the
+``(thread, created_at)`` index instead of anti-joins against receipts.
+
+Each watermark row also carries a denormalized ``unread_count`` and each
+thread a summary of its newest message. ``record_new_messages`` bumps both
+when messages arrive, moving a watermark recomputes the reader's count, and
+``refresh_thread_summaries`` rebuilds them from scratch after deletions.
+"""
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, UUIDField, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Message, MessageThread, ThreadReadState
+
+PREVIEW_LENGTH = 100
+
+_uuid_field = UUIDField()
+
+
+def db_value(value):
+    """Adapt UUIDs and datetimes for raw SQL the way the ORM would on this backend"""
+    if isinstance(value, uuid.UUID):
+        return _uuid_field.get_db_prep_value(value, connection)
+    if isinstance(value, datetime):
+        return connection.ops.adapt_datetimefield_value(value)
+    return value
+
+
+def allocate_seqs(thread_id, count=1):
+    """
+    Reserve ``count`` consecutive sequence numbers in a thread.
+
+    The thread row stays locked until the caller's transaction commits, so
+    messages in one thread become visible in ``seq`` order and a client that
+    synced up to N can never miss a later commit below N.
+
+    Returns:
+        int: The last reserved number; the block starts at ``last - count + 1``
+    """
+    table = connection.ops.quote_name(MessageThread._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET last_seq = last_seq + %s WHERE id = %s RETURNING last_seq",
+            [count, db_value(thread_id)]
+        )
+        row = cursor.fetchone()
+    if row is None:
+        raise MessageThread.DoesNotExist(f"Thread {thread_id} does not exist")
+    return row[0]
+
+
+def assign_seqs(messages):
+    """Number unsaved messages (e.g. before ``bulk_create``) in list order"""
+    by_thread = defaultdict(list)
+    for message in messages:
+        by_thread[message.thread_id].append(message)
+    for thread_id, thread_messages in by_thread.items():
+        last = allocate_seqs(thread_id, len(thread_messages))
+        for offset, message in enumerate(thread_messages, start=last - len(thread_messages) + 1):
+            message.seq = offset
+
+
+def advance_read_watermarks(user, marks):
+    """
+    Move ``user``'s watermarks forward in one statement.
+
+    Args:
+        user: The reader
+        marks: Iterable of ``(thread_id, message_id, created_at)``; at most one
+            per thread
+
+    A watermark never moves backwards: the conflict update only applies when
+    the new ``created_at`` is later than the stored one, so late or
+    out-of-order receipts are harmless. The stored ``unread_count`` is
+    recomputed in the same statement with a range scan above the new mark.
+
+    Returns:
+        int: Number of watermarks inserted or moved
+    """
+    marks = list(marks)
+    if not marks:
+        return 0
+
+    table = connection.ops.quote_name(ThreadReadState._meta.db_table)
+    now = timezone.now()
+    rows = []
+    params = []
+    messages_table = connection.ops.quote_name(Message._meta.db_table)
+    unread_sql = (
+        f"(SELECT COUNT(*) FROM {messages_table} "
+        f"WHERE thread_id = %s AND created_at > %s AND sender_id <> %s)"
+    )
+    for thread_id, message_id, created_at in marks:
+        rows.append(f'(%s, %s, %s, %s, %s, {unread_sql}, %s)')
+        params.extend(map(db_value, [
+            uuid.uuid4(), thread_id, user.pk, message_id, created_at,
+            thread_id, created_at, user.pk,
+            now,
+        ]))
+
+    sql = (
+        f"INSERT INTO {table} (id, thread_id, user_id, last_read_message_id, last_read_at, unread_count, updated_at) "
+        f"VALUES {', '.join(rows)} "
+        f"ON CONFLICT (thread_id, user_id) DO UPDATE SET "
+        f"last_read_message_id = EXCLUDED.last_read_message_id, "
+        f"last_read_at = EXCLUDED.last_read_at, "
+        f"unread_count = EXCLUDED.unread_count, "
+        f"updated_at = EXCLUDED.updated_at "
+        f"WHERE {table}.last_read_at IS NULL OR {table}.last_read_at < EXCLUDED.last_read_at"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def record_new_messages(messages):
+    """
+    Fold newly created messages into thread summaries and unread counters.
+
+    Args:
+        messages: Saved Message instances, possibly spanning several threads
+
+    Each thread gets one UPDATE (count, plus the summary when a message is
+    newer than the stored one) and all recipients' counters are bumped with a
+    single multi-row upsert, so a batch costs the same as one message.
+    """
+    by_thread = defaultdict(list)
+    for message in messages:
+        by_thread[message.thread_id].append(message)
+    if not by_thread:
+        return
+
+    now = timezone.now()
+    for thread_id, thread_messages in by_thread.items():
+        newest = max(thread_messages, key=lambda message: message.created_at)
+        is_newer = Q(last_message_at__isnull=True) | Q(last_message_at__lt=newest.created_at)
+        MessageThread.objects.filter(pk=thread_id).update(
+            message_count=F('message_count') + len(thread_messages),
+            updated_at=now,
+            last_message=Case(When(is_newer, then=Value(newest.pk)), default=F('last_message')),
+            last_message_sender=Case(When(is_newer, then=Value(newest.sender_id)), default=F('last_message_sender')),
+            last_message_at=Case(When(is_newer, then=Value(newest.created_at)), default=F('last_message_at')),
+            last_message_preview=Case(
+                When(is_newer, then=Value(newest.content[:PREVIEW_LENGTH])),
+                default=F('last_message_preview')
+            ),
+        )
+
+    participants = defaultdict(list)
+    through = MessageThread.participants.through
+    for thread_id, user_id in through.objects.filter(messagethread_id__in=by_thread).values_list(
+        'messagethread_id', 'user_id'
+    ):
+        participants[thread_id].append(user_id)
+
+    increments = defaultdict(int)
+    for thread_id, thread_messages in by_thread.items():
+        for message in thread_messages:
+            for user_id in participants[thread_id]:
+                if user_id != message.sender_id:
+                    increments[(thread_id, user_id)] += 1
+    if not increments:
+        return
+
+    table = connection.ops.quote_name(ThreadReadState._meta.db_table)
+    rows = []
+    params = []
+    for (thread_id, user_id), count in increments.items():
+        rows.append('(%s, %s, %s, %s, %s)')
+        params.extend(map(db_value, [uuid.uuid4(), thread_id, user_id, count, now]))
+
+    sql = (
+        f"INSERT INTO {table} (id, thread_id, user_id, unread_count, updated_at) "
+        f"VALUES {', '.join(rows)} "
+        f"ON CONFLICT (thread_id, user_id) DO UPDATE SET "
+        f"unread_count = {table}.unread_count + EXCLUDED.unread_count, "
+        f"updated_at = EXCLUDED.updated_at"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def refresh_thread_summaries(thread_ids):
+    """
+    Recompute summaries and every participant's unread counter from scratch.
+
+    Used after messages are deleted, where incremental maintenance can't tell
+    which counters the removed rows contributed to.
+    """
+    thread_ids = list(thread_ids)
+    if not thread_ids:
+        return
+
+    for thread_id in thread_ids:
+        latest = Message.objects.filter(thread_id=thread_id).order_by('-created_at').first()
+        MessageThread.objects.filter(pk=thread_id).update(
+            message_count=Message.objects.filter(thread_id=thread_id).count(),
+            last_message=latest,
+            last_message_sender_id=latest.sender_id if latest else None,
+            last_message_at=latest.created_at if latest else None,
+            last_message_preview=latest.content[:PREVIEW_LENGTH] if latest else '',
+        )
+
+    # Every participant gets a row so later increments have something to bump
+    through = MessageThread.participants.through
+    ThreadReadState.objects.bulk_create(
+        [
+            ThreadReadState(thread_id=thread_id, user_id=user_id)
+            for thread_id, user_id in through.objects.filter(messagethread_id__in=thread_ids).values_list(
+                'messagethread_id', 'user_id'
+            )
+        ],
+        ignore_conflicts=True,
+    )
+
+    def unread_for(**filters):
+        return Subquery(
+            Message.objects.filter(thread=OuterRef('thread'), **filters)
+            .exclude(sender=OuterRef('user'))
+            .order_by()
+            .values('thread')
+            .annotate(count=Count('id'))
+            .values('count'),
+            output_field=IntegerField(),
+        )
+
+    states = ThreadReadState.objects.filter(thread_id__in=thread_ids)
+    states.filter(last_read_at__isnull=True).update(
+        unread_count=Coalesce(unread_for(), Value(0))
+    )
+    states.filter(last_read_at__isnull=False).update(
+        unread_count=Coalesce(unread_for(created_at__gt=OuterRef('last_read_at')), Value(0))
+    )
+
+
+def mark_thread_read(thread_id, user):
+    """Mark everything currently in a thread as read by ``user``"""
+    latest = (
+        Message.objects.filter(thread_id=thread_id)
+        .order_by('-created_at')
+        .values_list('id', 'created_at')
+        .first()
+    )
+    if latest is None:
+        return 0
+    return advance_read_watermarks(user, [(thread_id, latest[0], latest[1])])
+
+
+def mark_messages_read(message_ids, user):
+    """
+    Mark specific messages read.
+
+    Reading a message implies reading everything before it in its thread, so
+    only the newest message per thread moves a watermark.
+    """
+    newest = {}
+    for message_id, thread_id, created_at in Message.objects.filter(id__in=message_ids).values_list(
+        'id', 'thread_id', 'created_at'
+    ):
+        if thread_id not in newest or created_at > newest[thread_id][1]:
+            newest[thread_id] = (message_id, created_at)
+
+    return advance_read_watermarks(
+        user,
+        [(thread_id, message_id, created_at) for thread_id, (message_id, created_at) in newest.items()]
+    )
+
+
+def unread_messages(user, thread_id=None):
+    """Messages from other participants above ``user``'s watermark"""
+    watermark = ThreadReadState.objects.filter(
+        thread=OuterRef('thread'), user=user
+    ).values('last_read_at')[:1]
+
+    messages = Message.objects.exclude(sender=user)
+    if thread_id:
+        messages = messages.filter(thread_id=thread_id)
+    else:
+        messages = messages.filter(thread__participants=user)
+
+    return messages.annotate(read_watermark=Subquery(watermark)).filter(
+        Q(read_watermark__isnull=True) | Q(created_at__gt=F('read_watermark'))
+    )
+
+
+def unread_counts_by_thread(user, thread_id=None):
+    """``{thread_id: unread count}`` for threads with unread messages"""
+    states = ThreadReadState.objects.filter(user=user, unread_count__gt=0)
+    if thread_id:
+        states = states.filter(thread_id=thread_id)
+    return dict(states.values_list('thread_id', 'unread_count'))
+
+
+def annotate_unread_counts(threads, user):
+    """Annotate a thread queryset with ``user``'s stored ``unread_count``"""
+    unread = ThreadReadState.objects.filter(thread=OuterRef('pk'), user=user).values('unread_count')[:1]
+    return threads.annotate(unread_count=Coalesce(Subquery(unread), Value(0)))
@@ -5,6 +5,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q, F, Count, Max
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
+from django.conf import settings
 
 from .models import MessageThread, Message
 from .serializers import (
@@ -16,6 +17,14 @@ from .serializers import (
     MessageReadStatusUpdateSerializer
 )
 from .permissions import IsThreadParticipant, IsMessageSender
+from .utils import (
+    annotate_unread_counts,
+    mark_messages_read,
+    mark_thread_read,
+    refresh_thread_summaries,
+    unread_counts_by_thread,
+    unread_messages,
+)
 
 class MessageThreadViewSet(viewsets.ModelViewSet):
     """
@@ -36,7 +45,11 @@ class MessageThreadViewSet(viewsets.ModelViewSet):
             return MessageThread.objects.none()
             
         # Users see only threads they're part of
-        return MessageThread.objects.filter(participants=user)
+        queryset = MessageThread.objects.filter(participants=user)
+        if self.action == 'list':
+            # Summary and counter are denormalized: one query plus the participants prefetch
+            queryset = annotate_unread_counts(queryset, user).prefetch_related('participants')
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -65,14 +78,14 @@ class MessageThreadViewSet(viewsets.ModelViewSet):
         if since_param:
             try:
                 since_date = timezone.datetime.fromtimestamp(float(since_param), tz=timezone.get_current_timezone())
-                messages = thread.messages.filter(created_at__gt=since_date).order_by('created_at')
+                messages = thread.messages.filter(created_at__gt=since_date).order_by('seq')
             except (ValueError, OverflowError):
                 return Response({
                     'error': 'Invalid timestamp format for "since" parameter'
                 }, status=status.HTTP_400_BAD_REQUEST)
         else:
             # Get all messages in the thread, ordered by creation time
-            messages = thread.messages.all().order_by('created_at')
+            messages = thread.messages.all().order_by('seq')
         
         page = self.paginate_queryset(messages)
         if page is not None:
@@ -82,6 +95,53 @@ class MessageThreadViewSet(viewsets.ModelViewSet):
         serializer = MessageListSerializer(messages, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def sync(self, request, pk=None):
+        """
+        Fetch messages by per-thread sequence number.
+        
+        ``after_seq=N`` returns the oldest messages with ``seq > N`` (catching
+        up after a reconnect); ``before_seq=N`` returns the newest messages with
+        ``seq < N`` (scrolling back). Both come back in ascending ``seq`` order,
+        at most ``limit`` at a time, with ``has_more`` when another page exists.
+        """
+        thread = self.get_object()
+        max_batch = getattr(settings, 'MESSAGE_SYNC_MAX_BATCH', 200)
+        
+        try:
+            limit = min(int(request.query_params.get('limit', 100)), max_batch)
+            after_seq = request.query_params.get('after_seq')
+            before_seq = request.query_params.get('before_seq')
+            after_seq = int(after_seq) if after_seq is not None else None
+            before_seq = int(before_seq) if before_seq is not None else None
+        except ValueError:
+            return Response({
+                'error': '"after_seq", "before_seq" and "limit" must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response({'error': '"limit" must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+        if after_seq is not None and before_seq is not None:
+            return Response({
+                'error': 'Pass either "after_seq" or "before_seq", not both'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        messages = thread.messages.select_related('sender')
+        if before_seq is not None:
+            # Newest first so the page ends right below before_seq
+            batch = list(messages.filter(seq__lt=before_seq).order_by('-seq')[:limit + 1])
+            has_more = len(batch) > limit
+            batch = batch[:limit][::-1]
+        else:
+            batch = list(messages.filter(seq__gt=after_seq or 0).order_by('seq')[:limit + 1])
+            has_more = len(batch) > limit
+            batch = batch[:limit]
+        
+        return Response({
+            'messages': MessageListSerializer(batch, many=True, context={'request': request}).data,
+            'has_more': has_more,
+            'latest_seq': thread.last_seq,
+        })
+
 class MessageViewSet(viewsets.ModelViewSet):
     """
     ViewSet for messages - allows creating, retrieving, and updating messages.
@@ -114,6 +174,11 @@ class MessageViewSet(viewsets.ModelViewSet):
         # Create is validated in the serializer
         return [permissions.IsAuthenticated()]
     
+    def perform_destroy(self, instance):
+        thread_id = instance.thread_id
+        instance.delete()
+        refresh_thread_summaries([thread_id])
+    
     @action(detail=False, methods=['post'])
     def mark_as_read(self, request):
         """
@@ -128,28 +193,22 @@ class MessageViewSet(viewsets.ModelViewSet):
             if serializer.validated_data.get('mark_all_in_thread'):
                 # Mark all messages in a thread as read
                 thread_id = serializer.validated_data.get('thread_id')
-                thread = MessageThread.objects.get(id=thread_id)
                 
-                # Only mark messages not sent by the user
-                messages_to_mark = thread.messages.exclude(sender=user)
-                
-                # Add user to read_by for all these messages
-                for message in messages_to_mark:
-                    message.read_by.add(user)
+                # Count what is being marked, then move the watermark in one upsert
+                marked_count = unread_messages(user, thread_id).count()
+                mark_thread_read(thread_id, user)
                 
                 return Response({
                     'status': 'success',
-                    'marked_count': messages_to_mark.count(),
+                    'marked_count': marked_count,
                     'message': "All messages in thread marked as read."
                 }, status=status.HTTP_200_OK)
             else:
                 # Mark specific messages as read
                 message_ids = serializer.validated_data.get('message_ids')
-                messages = Message.objects.filter(id__in=message_ids)
                 
-                # Add user to read_by for all these messages
-                for message in messages:
-                    message.read_by.add(user)
+                # Reading a message reads everything before it in its thread
+                mark_messages_read(message_ids, user)
                 
                 return Response({
                     'status': 'success',
@@ -168,23 +227,13 @@ class MessageViewSet(viewsets.ModelViewSet):
         user = request.user
         thread_id = request.query_params.get('thread_id')
         
-        # Base query: messages not sent by the user and not marked as read by the user
-        query = Message.objects.exclude(sender=user).exclude(read_by=user)
-        
-        # Filter by thread if specified
-        if thread_id:
-            query = query.filter(thread_id=thread_id)
-        else:
-            # Only include threads the user is a participant in
-            query = query.filter(thread__participants=user)
-        
-        # Get the count
-        unread_count = query.count()
+        # Messages from others above the user's read watermark in each thread
+        counts = unread_counts_by_thread(user, thread_id)
+        unread_count = sum(counts.values())
         
         # Get unread count by thread
         if not thread_id:
-            thread_counts = query.values('thread').annotate(count=Count('id'))
-            thread_data = {str(item['thread']): item['count'] for item in thread_counts}
+            thread_data = {str(thread): count for thread, count in counts.items()}
         else:
             thread_data = {thread_id: unread_count}
         
@@ -215,7 +264,7 @@ class ThreadMessagesViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixi
             return Message.objects.none()
         
         # Get all messages in the thread, ordered by creation time
-        return thread.messages.all().order_by('created_at')
+        return thread.messages.all().order_by('seq')
     
     def list(self, request, *args, **kwargs):
         """
@@ -230,14 +279,14 @@ class ThreadMessagesViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixi
         if since_param:
             try:
                 since_date = timezone.datetime.fromtimestamp(float(since_param), tz=timezone.get_current_timezone())
-                messages = thread.messages.filter(created_at__gt=since_date).order_by('created_at')
+                messages = thread.messages.filter(created_at__gt=since_date).order_by('seq')
             except (ValueError, OverflowError):
                 return Response({
                     'error': 'Invalid timestamp format for "since" parameter'
                 }, status=status.HTTP_400_BAD_REQUEST)
         else:
             # Get all messages in the thread, ordered by creation time
-            messages = thread.messages.all().order_by('created_at')
+            messages = thread.messages.all().order_by('seq')
         
         page = self.paginate_queryset(messages)
         if page is not None:
@@ -269,10 +318,8 @@ class ThreadMessagesViewSet(viewsets.GenericViewSet, mixins.ListModelMixin, mixi
         
         # Set the sender to the current user and save
         serializer.validated_data['sender'] = request.user
+        # Saving the message also bumps the thread's summary and updated_at
         self.perform_create(serializer)
         
-        # Update the thread's updated_at timestamp
-        thread.save(update_fields=['updated_at'])
-        
         headers = self.get_success_headers(serializer.data)
         return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
@@ -0,0 +1,143 @@
+"""
+Write-behind persistence for WebSocket chat messages.
+
+``ChatConsumer`` assigns the message id itself, broadcasts straight away and
+hands the unsaved Message to the process's ``MessageWriter``. The writer
+collects messages for ``CHAT_WRITE_BEHIND_INTERVAL`` seconds and stores each
+batch with one ``bulk_create`` plus ``record_new_messages``, so a thread's
+summary and ``updated_at`` move once per flush rather than once per message.
+
+``enqueue`` returns a future that resolves once the message has committed;
+the consumer turns it into a durability acknowledgement for the sender, who
+can resend anything left unacknowledged after a disconnect. A batch that
+fails is retried thread by thread, so only the senders in a failing thread
+are refused.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .models import Message
+from .utils import assign_seqs, record_new_messages
+
+logger = logging.getLogger(__name__)
+
+
+def get_flush_interval():
+    return getattr(settings, 'CHAT_WRITE_BEHIND_INTERVAL', 0.05)
+
+
+def get_batch_size():
+    return getattr(settings, 'CHAT_WRITE_BEHIND_BATCH_SIZE', 500)
+
+
+class MessageWriter:
+    """Batches unsaved messages for one event loop"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = []
+        self.pending = {}
+        self.wakeup = asyncio.Event()
+        self.task = loop.create_task(self.run())
+
+    def enqueue(self, message):
+        """Queue ``message`` for the next flush and return its durability future"""
+        future = self.loop.create_future()
+        self.queue.append((message, future))
+        self.pending[message.pk] = future
+        self.wakeup.set()
+        return future
+
+    async def wait_for(self, message_id):
+        """Wait until ``message_id`` is stored if it is still queued here"""
+        future = self.pending.get(message_id)
+        if future is not None:
+            await asyncio.shield(future)
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            # Let the batch fill up for one interval before writing it
+            await asyncio.sleep(get_flush_interval())
+            self.wakeup.clear()
+            while self.queue:
+                batch, self.queue = self.queue[:get_batch_size()], self.queue[get_batch_size():]
+                await self.flush(batch)
+
+    async def flush(self, batch):
+        messages = [message for message, _ in batch]
+        try:
+            failures = await database_sync_to_async(persist_messages)(messages)
+        except Exception as e:
+            logger.error(f"❌ Failed to persist {len(messages)} chat messages: {e}")
+            failures = {message.thread_id: e for message in messages}
+
+        for message, future in batch:
+            self.pending.pop(message.pk, None)
+            if future.done():
+                continue
+            error = failures.get(message.thread_id)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(message)
+
+
+def persist_messages(messages):
+    """
+    Store a batch and fold it into thread summaries.
+
+    The batch is written in one transaction. If that fails, each thread's
+    messages are retried in a transaction of their own, so one bad message
+    (e.g. for a thread deleted in the meantime) only fails its own thread.
+
+    Returns:
+        dict: Thread ID -> exception, for the threads whose messages were not stored
+    """
+    try:
+        _persist(messages)
+        return {}
+    except Exception as e:
+        by_thread = defaultdict(list)
+        for message in messages:
+            by_thread[message.thread_id].append(message)
+        if len(by_thread) == 1:
+            logger.error(f"❌ Failed to persist {len(messages)} chat messages: {e}")
+            return dict.fromkeys(by_thread, e)
+        logger.warning(f"⚠️ Chat batch of {len(messages)} messages failed, retrying per thread: {e}")
+
+    failures = {}
+    for thread_id, thread_messages in by_thread.items():
+        try:
+            _persist(thread_messages)
+        except Exception as e:
+            logger.error(f"❌ Failed to persist {len(thread_messages)} chat messages for thread {thread_id}: {e}")
+            failures[thread_id] = e
+    return failures
+
+
+def _persist(messages):
+    with transaction.atomic():
+        assign_seqs(messages)
+        Message.objects.bulk_create(messages)
+        record_new_messages(messages)
+
+
+_writers = {}
+
+
+def get_message_writer():
+    """The writer for the running event loop, started on first use"""
+    loop = asyncio.get_running_loop()
+    writer = _writers.get(loop)
+    if writer is None or writer.task.done():
+        # Drop writers whose loops have gone away
+        for stale in [key for key in _writers if key.is_closed()]:
+            del _writers[stale]
+        writer = _writers[loop] = MessageWriter(loop)
+    return writer
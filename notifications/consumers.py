@@ -2,6 +2,7 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.utils import timezone
+from .counters import archive_notifications, get_unread_counts, mark_notifications_read
 from .models import Notification, NotificationGroup
 from uuid import UUID
 
@@ -100,6 +101,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             'action_url': event.get('action_url'),
             'timestamp': event['timestamp'],
             'is_read': event['is_read'],
+            'event_count': event.get('event_count', 1),
             'group_id': event.get('group_id')
         }))
         
@@ -127,43 +129,26 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def mark_notification_read(self, notification_id):
         try:
-            notification = Notification.objects.get(
-                id=UUID(notification_id),
-                recipient=self.scope['user']
-            )
-            notification.is_read = True
-            notification.save(update_fields=['is_read'])
-            return True
-        except (Notification.DoesNotExist, ValueError):
+            notifications = Notification.objects.filter(id=UUID(notification_id), recipient=self.scope['user'])
+        except ValueError:
             return False
+        return mark_notifications_read(notifications) > 0
             
     @database_sync_to_async
     def mark_all_notifications_read(self):
-        Notification.objects.filter(
-            recipient=self.scope['user'],
-            is_read=False
-        ).update(is_read=True)
+        mark_notifications_read(Notification.objects.filter(recipient=self.scope['user']))
         
     @database_sync_to_async
     def archive_notification(self, notification_id):
         try:
-            notification = Notification.objects.get(
-                id=UUID(notification_id),
-                recipient=self.scope['user']
-            )
-            notification.is_archived = True
-            notification.save(update_fields=['is_archived'])
-            return True
-        except (Notification.DoesNotExist, ValueError):
+            notifications = Notification.objects.filter(id=UUID(notification_id), recipient=self.scope['user'])
+        except ValueError:
             return False
+        return archive_notifications(notifications) > 0
             
     @database_sync_to_async
     def get_unread_notification_count(self):
-        return Notification.objects.filter(
-            recipient=self.scope['user'],
-            is_read=False,
-            is_archived=False
-        ).count()
+        return get_unread_counts(self.scope['user'])['total']
         
     @database_sync_to_async
     def get_recent_notifications(self, limit=10):
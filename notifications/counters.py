@@ -0,0 +1,161 @@
+"""
+Unread notification counters.
+
+Each user has one UnreadNotificationCounter row per notification type they
+have received. Creating, reading, archiving and deleting notifications
+adjust those rows in the same transaction with a single multi-row upsert, so
+``get_unread_counts`` is one indexed lookup of at most a dozen rows instead
+of a COUNT plus a GROUP BY over the user's whole history.
+
+Only notifications that are neither read nor archived count as unread.
+"""
+import logging
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, UUIDField
+from django.utils import timezone
+
+from .models import Notification, UnreadNotificationCounter
+
+logger = logging.getLogger(__name__)
+
+_uuid_field = UUIDField()
+
+
+def adjust_unread_counters(deltas, replace=False):
+    """
+    Apply ``{(user_id, notification_type): delta}`` in one statement.
+
+    With ``replace`` the values are written as-is instead of added, which is
+    what reconciliation needs.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta or replace}
+    if not deltas:
+        return
+
+    table = connection.ops.quote_name(UnreadNotificationCounter._meta.db_table)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = []
+    params = []
+    for (user_id, notification_type), delta in deltas.items():
+        rows.append('(%s, %s, %s, %s)')
+        params.extend([_uuid_field.get_db_prep_value(user_id, connection), notification_type, delta, now])
+
+    new_value = 'EXCLUDED.unread_count' if replace else f'{table}.unread_count + EXCLUDED.unread_count'
+    sql = (
+        f"INSERT INTO {table} (user_id, notification_type, unread_count, updated_at) "
+        f"VALUES {', '.join(rows)} "
+        f"ON CONFLICT (user_id, notification_type) DO UPDATE SET "
+        f"unread_count = {new_value}, "
+        f"updated_at = EXCLUDED.updated_at"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def get_unread_counts(user):
+    """
+    Returns:
+        dict: ``{'total': int, 'by_type': {notification_type: count}}``
+    """
+    by_type = {
+        notification_type: count
+        for notification_type, count in UnreadNotificationCounter.objects.filter(
+            user=user, unread_count__gt=0
+        ).values_list('notification_type', 'unread_count')
+    }
+    return {'total': sum(by_type.values()), 'by_type': by_type}
+
+
+def _change_notifications(notifications, field):
+    """Set ``field`` to True on ``notifications`` and decrement what stopped being unread"""
+    with transaction.atomic():
+        rows = list(
+            notifications.filter(**{field: False})
+            .select_for_update()
+            .values_list('id', 'recipient_id', 'notification_type', 'is_read', 'is_archived')
+        )
+        if not rows:
+            return 0
+
+        Notification.objects.filter(id__in=[row[0] for row in rows]).update(**{field: True})
+        decrements = Counter(
+            (recipient_id, notification_type)
+            for _, recipient_id, notification_type, is_read, is_archived in rows
+            if not is_read and not is_archived
+        )
+        adjust_unread_counters({key: -count for key, count in decrements.items()})
+    return len(rows)
+
+
+def mark_notifications_read(notifications):
+    """
+    Mark a notification queryset read.
+
+    Returns:
+        int: Number of notifications that were unread
+    """
+    return _change_notifications(notifications, 'is_read')
+
+
+def archive_notifications(notifications):
+    """
+    Archive a notification queryset.
+
+    Returns:
+        int: Number of notifications archived
+    """
+    return _change_notifications(notifications, 'is_archived')
+
+
+def delete_notifications(notifications):
+    """Delete a notification queryset, releasing any unread counts it held"""
+    with transaction.atomic():
+        decrements = Counter(
+            notifications.filter(is_read=False, is_archived=False)
+            .select_for_update()
+            .values_list('recipient_id', 'notification_type')
+        )
+        deleted, _ = notifications.delete()
+        adjust_unread_counters({key: -count for key, count in decrements.items()})
+    return deleted
+
+
+def reconcile_unread_counters(user_ids=None):
+    """
+    Rebuild counters from the notifications themselves.
+
+    Args:
+        user_ids: Limit to these users; all users when omitted
+
+    Returns:
+        int: Number of counters whose stored value was wrong
+    """
+    unread = Notification.objects.filter(is_read=False, is_archived=False)
+    counters = UnreadNotificationCounter.objects.all()
+    if user_ids is not None:
+        unread = unread.filter(recipient_id__in=user_ids)
+        counters = counters.filter(user_id__in=user_ids)
+
+    with transaction.atomic():
+        stored = {
+            (user_id, notification_type): count
+            for user_id, notification_type, count in counters.select_for_update().values_list(
+                'user_id', 'notification_type', 'unread_count'
+            )
+        }
+        actual = {
+            (row['recipient_id'], row['notification_type']): row['count']
+            for row in unread.order_by().values('recipient_id', 'notification_type').annotate(count=Count('id'))
+        }
+
+        fixes = {}
+        for key in stored.keys() | actual.keys():
+            if stored.get(key, 0) != actual.get(key, 0):
+                fixes[key] = actual.get(key, 0)
+        adjust_unread_counters(fixes, replace=True)
+
+    if fixes:
+        logger.warning(f"Reconciled {len(fixes)} drifted unread notification counters")
+    return len(fixes)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from notifications.retention import expired_notifications, prune_notifications
+
+
+class Command(BaseCommand):
+    help = 'Delete notifications past their retention period, archiving them first when RETENTION_ARCHIVE_DIR is set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per batch (default: RETENTION_BATCH_SIZE)')
+        parser.add_argument('--no-archive', action='store_true', help='Delete without writing archive files')
+        parser.add_argument('--dry-run', action='store_true', help='Show how many notifications would be removed')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            for rule, queryset in expired_notifications():
+                count = queryset.count()
+                if count:
+                    self.stdout.write(f"{rule}: {count} notifications past retention")
+            return
+
+        removed = prune_notifications(archive=not options['no_archive'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} notifications"))
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_counters(apps, schema_editor):
+    """Count existing unread, unarchived notifications per user and type"""
+    Notification = apps.get_model('notifications', 'Notification')
+    UnreadNotificationCounter = apps.get_model('notifications', 'UnreadNotificationCounter')
+
+    counts = (
+        Notification.objects.filter(is_read=False, is_archived=False)
+        .order_by()
+        .values('recipient_id', 'notification_type')
+        .annotate(count=Count('id'))
+    )
+    UnreadNotificationCounter.objects.bulk_create(
+        [
+            UnreadNotificationCounter(
+                user_id=row['recipient_id'],
+                notification_type=row['notification_type'],
+                unread_count=row['count'],
+            )
+            for row in counts.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_notification_is_archived'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadNotificationCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(choices=[('bid_received', 'Bid Received'), ('bid_accepted', 'Bid Accepted'), ('bid_rejected', 'Bid Rejected'), ('booking_created', 'Booking Created'), ('booking_status_updated', 'Booking Status Updated'), ('payment_received', 'Payment Received'), ('payout_processed', 'Payout Processed'), ('message_received', 'Message Received'), ('review_received', 'Review Received'), ('verification_updated', 'Verification Status Updated'), ('system', 'System Notification')], max_length=30)),
+                ('unread_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_notification_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Unread Notification Counter',
+                'verbose_name_plural': 'Unread Notification Counters',
+                'constraints': [models.UniqueConstraint(fields=('user', 'notification_type'), name='unique_unread_notification_counter')],
+            },
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
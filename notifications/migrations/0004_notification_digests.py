@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 23:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0003_unreadnotificationcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='event_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notificationgroup',
+            name='digest_window',
+            field=models.PositiveIntegerField(blank=True, help_text="Seconds during which a recipient's unread notifications in this group are merged into one digest; empty disables digests", null=True),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', 'notification_type', '-created_at'], name='notification_digest_idx'),
+        ),
+    ]
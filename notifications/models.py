@@ -3,6 +3,8 @@ from django.conf import settings
 import uuid
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save
+from django.dispatch import receiver
 
 class NotificationGroup(models.Model):
     """
@@ -11,6 +13,10 @@ class NotificationGroup(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True, null=True)
+    digest_window = models.PositiveIntegerField(
+        null=True, blank=True,
+        help_text="Seconds during which a recipient's unread notifications in this group are merged into one digest; empty disables digests"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -59,6 +65,9 @@ class Notification(models.Model):
     # URL for redirecting when notification is clicked
     action_url = models.CharField(max_length=255, blank=True, null=True)
     
+    # Number of events merged into this notification when it is a digest
+    event_count = models.PositiveIntegerField(default=1)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -66,6 +75,46 @@ class Notification(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Notification'
         verbose_name_plural = 'Notifications'
+        indexes = [
+            # A user's feed, newest first
+            models.Index(fields=['recipient', '-created_at'], name='notification_recipient_idx'),
+            models.Index(fields=['recipient', 'notification_type', '-created_at'], name='notification_digest_idx'),
+            # Retention sweeps
+            models.Index(fields=['notification_type', 'created_at'], name='notification_retention_idx'),
+            models.Index(fields=['created_at'], condition=models.Q(is_archived=True), name='notification_archived_idx'),
+        ]
     
     def __str__(self):
         return f"{self.notification_type} for {self.recipient} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
+
+
+class UnreadNotificationCounter(models.Model):
+    """
+    Per-user, per-type count of unread, unarchived notifications.
+    
+    Maintained by notifications.counters whenever notifications are created,
+    read, archived or deleted, so badge counts are a single small lookup.
+    reconcile_unread_counters periodically rebuilds them from the rows.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='unread_notification_counters')
+    notification_type = models.CharField(max_length=30, choices=Notification.NOTIFICATION_TYPE_CHOICES)
+    unread_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Unread Notification Counter'
+        verbose_name_plural = 'Unread Notification Counters'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'notification_type'], name='unique_unread_notification_counter'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} - {self.notification_type}: {self.unread_count}"
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, raw=False, **kwargs):
+    # Single creates (admin, API); notify_many counts its bulk inserts itself
+    if created and not raw and not instance.is_read and not instance.is_archived:
+        from .counters import adjust_unread_counters
+        adjust_unread_counters({(instance.recipient_id, instance.notification_type): 1})
@@ -0,0 +1,68 @@
+"""
+Retention for notifications.
+
+Each notification type is kept for ``NOTIFICATION_RETENTION_DAYS[type]``
+days (falling back to the ``'default'`` entry; ``None`` keeps that type
+forever), and archived notifications only for
+``NOTIFICATION_ARCHIVED_RETENTION_DAYS``. Rows are removed through
+``delete_notifications`` so unread counters stay exact.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from prbal_project.retention import prune_queryset
+
+from .counters import delete_notifications
+from .models import Notification
+
+
+def get_retention_days(notification_type):
+    days = getattr(settings, 'NOTIFICATION_RETENTION_DAYS', {})
+    return days.get(notification_type, days.get('default'))
+
+
+def get_archived_retention_days():
+    return getattr(settings, 'NOTIFICATION_ARCHIVED_RETENTION_DAYS', None)
+
+
+def expired_notifications(now=None):
+    """
+    Querysets of notifications past retention, one per rule.
+
+    Returns:
+        list: ``(description, queryset)`` pairs
+    """
+    now = now or timezone.now()
+    rules = []
+    archived_days = get_archived_retention_days()
+    if archived_days is not None:
+        rules.append((
+            'archived',
+            Notification.objects.filter(is_archived=True, created_at__lt=now - timedelta(days=archived_days)),
+        ))
+    for notification_type, _ in Notification.NOTIFICATION_TYPE_CHOICES:
+        days = get_retention_days(notification_type)
+        if days is None:
+            continue
+        rules.append((
+            notification_type,
+            Notification.objects.filter(
+                notification_type=notification_type, created_at__lt=now - timedelta(days=days)
+            ),
+        ))
+    return rules
+
+
+def prune_notifications(archive=True, batch_size=None, now=None):
+    """
+    Delete (and optionally archive) notifications past retention.
+
+    Returns:
+        int: Number of notifications removed
+    """
+    return sum(
+        prune_queryset(queryset, 'notifications', delete=delete_notifications, archive=archive, batch_size=batch_size)
+        for _, queryset in expired_notifications(now)
+    )
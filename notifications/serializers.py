@@ -11,7 +11,7 @@ class NotificationListSerializer(serializers.ModelSerializer):
         model = Notification
         fields = [
             'id', 'notification_type', 'title', 'message', 'is_read',
-            'action_url', 'created_at'
+            'event_count', 'action_url', 'created_at', 'updated_at'
         ]
         read_only_fields = fields
 
@@ -21,8 +21,8 @@ class NotificationDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = [
-            'id', 'notification_type', 'title', 'message', 'is_read',
-            'content_type', 'object_id', 'action_url', 'created_at', 'updated_at'
+            'id', 'notification_type', 'title', 'message', 'is_read', 'event_count',
+            'group', 'content_type', 'object_id', 'action_url', 'created_at', 'updated_at'
         ]
         read_only_fields = fields
 
@@ -0,0 +1,46 @@
+"""
+Background delivery of notifications and counter upkeep.
+"""
+import logging
+
+from celery import shared_task
+
+from .counters import reconcile_unread_counters
+from .models import Notification
+from .retention import prune_notifications
+from .utils import dispatch_to_channels
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='notifications.dispatch_notifications', ignore_result=True)
+def dispatch_notifications(notification_ids):
+    """Push one batch of stored notifications to their recipients"""
+    notifications = list(
+        Notification.objects.filter(id__in=notification_ids).select_related('content_type')
+    )
+    dispatch_to_channels(notifications)
+    logger.debug(f"Dispatched {len(notifications)} notifications")
+
+
+@shared_task(name='notifications.push_digests', ignore_result=True)
+def push_digests(notification_ids):
+    """Push digests whose window has closed with their final event counts"""
+    notifications = list(
+        Notification.objects.filter(id__in=notification_ids, is_read=False, is_archived=False)
+        .select_related('content_type')
+    )
+    dispatch_to_channels(notifications)
+    logger.debug(f"Pushed {len(notifications)} notification digests")
+
+
+@shared_task(name='notifications.reconcile_unread_counters', ignore_result=True)
+def reconcile_unread_counters_task():
+    """Correct any unread counters that drifted from the notifications"""
+    return reconcile_unread_counters()
+
+
+@shared_task(name='notifications.prune_notifications', ignore_result=True)
+def prune_notifications_task():
+    """Remove notifications past their retention period"""
+    return prune_notifications()
@@ -1,3 +1,226 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from .counters import archive_notifications, get_unread_counts, mark_notifications_read, reconcile_unread_counters
+from .retention import prune_notifications
+from .models import Notification, NotificationGroup, UnreadNotificationCounter
+from .utils import build_notification_event, notify_many, send_notification
+
+User = get_user_model()
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    NOTIFICATION_DISPATCH_BATCH_SIZE=2,
+)
+class NotificationFanOutTestCase(TestCase):
+    """Test cases for bulk notification fan-out"""
+
+    def setUp(self):
+        self.providers = [
+            User.objects.create_user(username=f'fanout{i}', email=f'fanout{i}@test.com', user_type='provider')
+            for i in range(3)
+        ]
+        ContentType.objects.get_for_model(User)
+
+    def test_one_insert_for_many_recipients(self):
+        """Rows for every recipient are written in a single query"""
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            # Savepoint, notification insert, counter upsert, release
+            with self.assertNumQueries(4):
+                notifications = notify_many(
+                    self.providers, 'system', 'New request', 'A customer posted a request',
+                    content_object=self.providers[0]
+                )
+
+        self.assertEqual(len(notifications), 3)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            Notification.objects.filter(object_id=str(self.providers[0].pk), content_type__model='user').count(), 3
+        )
+
+    def test_dispatch_after_commit_in_batches(self):
+        """Recipients' groups receive the notification once the transaction commits"""
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f'notifications_{self.providers[2].id}', channel)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notifications = notify_many(self.providers, 'system', 'Hello', 'Broadcast')
+
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(event['type'], 'send_notification_to_consumer')
+        self.assertEqual(event['id'], str(notifications[2].id))
+        self.assertFalse(event['is_read'])
+
+    def test_send_notification_is_single_recipient_fan_out(self):
+        """The legacy helper still returns the created notification"""
+        notification = send_notification(self.providers[0], 'system', 'Hi', 'There', action_url='/x/')
+        self.assertEqual(notification.recipient, self.providers[0])
+        self.assertEqual(notification.action_url, '/x/')
+
+
+class UnreadCounterTestCase(APITestCase):
+    """Test cases for maintained unread notification counters"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='badgeuser', email='badgeuser@test.com', user_type='customer')
+        notify_many([self.user], 'system', 'One', 'First')
+        notify_many([self.user], 'system', 'Two', 'Second')
+        Notification.objects.create(recipient=self.user, notification_type='bid_received', title='Bid', message='New bid')
+        self.client.force_authenticate(user=self.user)
+
+    def test_counts_follow_create_read_and_archive(self):
+        """Counters track bulk and single creates, reads and archives"""
+        self.assertEqual(get_unread_counts(self.user), {'total': 3, 'by_type': {'system': 2, 'bid_received': 1}})
+
+        system = Notification.objects.filter(recipient=self.user, notification_type='system')
+        self.assertEqual(mark_notifications_read(system.filter(title='One')), 1)
+        self.assertEqual(archive_notifications(Notification.objects.filter(notification_type='bid_received')), 1)
+        # Archiving something already read doesn't count twice
+        archive_notifications(system.filter(title='One'))
+
+        self.assertEqual(get_unread_counts(self.user), {'total': 1, 'by_type': {'system': 1}})
+
+    def test_unread_count_endpoint_is_one_query(self):
+        """Badge counts read the counters only"""
+        url = reverse('notification-unread-count')
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data['total_unread'], 3)
+        self.assertEqual(response.data['type_counts'], {'system': 2, 'bid_received': 1})
+
+    def test_mark_all_reports_marked_count(self):
+        """mark_all returns how many were unread and zeroes the badge"""
+        response = self.client.post(reverse('notification-mark-read'), {'mark_all': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['marked_count'], 3)
+        self.assertEqual(get_unread_counts(self.user)['total'], 0)
+
+    def test_reconcile_repairs_drift(self):
+        """Periodic reconciliation rewrites wrong counters"""
+        UnreadNotificationCounter.objects.filter(user=self.user, notification_type='system').update(unread_count=7)
+        self.assertEqual(reconcile_unread_counters(), 1)
+        self.assertEqual(get_unread_counts(self.user)['by_type']['system'], 2)
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    NOTIFICATION_DIGEST_WINDOWS={'bid_received': 300},
+)
+class NotificationDigestTestCase(TestCase):
+    """Test cases for coalescing bursts into digest notifications"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='digestuser', email='digestuser@test.com', user_type='customer')
+        self.other = User.objects.create_user(username='digestother', email='digestother@test.com', user_type='customer')
+
+    def test_burst_merges_into_one_digest(self):
+        """Repeated events about one object bump a single row"""
+        with mock.patch('notifications.tasks.push_digests.apply_async') as push:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                first = notify_many([self.customer], 'bid_received', 'New bid', 'Bid 1', content_object=self.other)[0]
+            self.assertEqual(len(callbacks), 1)
+            for i in range(2, 5):
+                with self.captureOnCommitCallbacks(execute=True):
+                    digest = notify_many([self.customer], 'bid_received', 'New bid', f'Bid {i}', content_object=self.other)[0]
+
+        self.assertEqual(digest.id, first.id)
+        first.refresh_from_db()
+        self.assertEqual(first.event_count, 4)
+        self.assertEqual(first.message, 'Bid 4')
+        self.assertEqual(Notification.objects.filter(recipient=self.customer).count(), 1)
+        self.assertEqual(get_unread_counts(self.customer)['total'], 1)
+        # One follow-up push for the whole burst, after the window
+        push.assert_called_once_with(args=[[str(first.id)]], countdown=300)
+
+    def test_read_or_other_objects_start_new_digests(self):
+        """Only unread notifications about the same object are merged"""
+        first = notify_many([self.customer], 'bid_received', 'New bid', 'Bid', content_object=self.other)[0]
+        notify_many([self.customer], 'bid_received', 'New bid', 'Bid', content_object=self.customer)
+        mark_notifications_read(Notification.objects.filter(id=first.id))
+        notify_many([self.customer], 'bid_received', 'New bid', 'Bid', content_object=self.other)
+        # Types without a window are never merged
+        notify_many([self.customer], 'system', 'Hi', 'Hi', content_object=self.other)
+        notify_many([self.customer], 'system', 'Hi', 'Hi', content_object=self.other)
+
+        self.assertEqual(Notification.objects.filter(recipient=self.customer).count(), 5)
+        self.assertFalse(Notification.objects.filter(event_count__gt=1).exists())
+
+    def test_notification_group_as_digest_key(self):
+        """A group with a digest window coalesces whatever it holds"""
+        group = NotificationGroup.objects.create(name='Payouts', digest_window=60)
+        notify_many([self.customer, self.other], 'system', 'Payout', 'One', group=group)
+        notifications = notify_many([self.customer, str(self.other.pk)], 'system', 'Payout', 'Two', group=group)
+
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual([n.recipient_id for n in notifications], [self.customer.pk, self.other.pk])
+        self.assertEqual({n.event_count for n in notifications}, {2})
+        self.assertEqual(build_notification_event(notifications[0])['group_id'], str(group.id))
+
+
+@override_settings(
+    NOTIFICATION_RETENTION_DAYS={'default': None, 'system': 30},
+    NOTIFICATION_ARCHIVED_RETENTION_DAYS=7,
+)
+class NotificationRetentionTestCase(TestCase):
+    """Test cases for pruning notifications past retention"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='retentionuser', email='retentionuser@test.com', user_type='customer')
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir, ignore_errors=True)
+
+    def age(self, notifications, days):
+        Notification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+            created_at=timezone.now() - timedelta(days=days)
+        )
+
+    def test_prune_applies_per_type_and_archived_ttls(self):
+        """Old rows of types with a TTL and old archived rows go; counters follow"""
+        old_system = notify_many([self.user] * 3, 'system', 'Old', 'Old')
+        old_bid = notify_many([self.user], 'bid_received', 'Bid', 'Kept forever')
+        old_archived = notify_many([self.user], 'payment_received', 'Paid', 'Archived')
+        fresh = notify_many([self.user], 'system', 'New', 'New')
+        archive_notifications(Notification.objects.filter(pk=old_archived[0].pk))
+        self.age(old_system + old_bid, 40)
+        self.age(old_archived, 10)
+
+        with override_settings(RETENTION_ARCHIVE_DIR=self.archive_dir):
+            self.assertEqual(prune_notifications(batch_size=2), 4)
+
+        self.assertEqual(
+            set(Notification.objects.values_list('pk', flat=True)), {old_bid[0].pk, fresh[0].pk}
+        )
+        self.assertEqual(get_unread_counts(self.user), {'total': 2, 'by_type': {'system': 1, 'bid_received': 1}})
+
+        archive_dir = os.path.join(self.archive_dir, 'notifications')
+        rows = []
+        for name in os.listdir(archive_dir):
+            with gzip.open(os.path.join(archive_dir, name), 'rt') as archive:
+                rows.extend(json.loads(line) for line in archive)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({row['title'] for row in rows}, {'Old', 'Paid'})
+
+    def test_prune_without_archive_dir_only_deletes(self):
+        """No archive directory means plain batched deletes"""
+        self.age(notify_many([self.user], 'system', 'Old', 'Old'), 40)
+        with override_settings(RETENTION_ARCHIVE_DIR=''):
+            self.assertEqual(prune_notifications(), 1)
+        self.assertEqual(os.listdir(self.archive_dir), [])
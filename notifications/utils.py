@@ -1,13 +1,225 @@
+"""
+Notification fan-out.
+
+``notify_many`` writes every recipient's row with one ``bulk_create`` (and
+their unread counters with one upsert) and,
+once the surrounding transaction commits, queues
+``notifications.dispatch_notifications`` tasks that push the rows to the
+recipients' WebSocket groups in batches. Requests never wait on the channel
+layer, and a rolled-back transaction sends nothing.
+
+Bursty types are coalesced into digests: when a recipient still has an
+unread notification of the same type about the same object (or in the same
+digest ``NotificationGroup``) from within the digest window, the new event
+bumps that row's ``event_count`` instead of adding a row. Only the first
+event of a digest is pushed immediately; the first merge schedules one more
+push for when the window closes, carrying the final count.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
-from .models import Notification
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
+from .counters import adjust_unread_counters
+from .models import Notification
+
+
+def get_dispatch_batch_size():
+    return getattr(settings, 'NOTIFICATION_DISPATCH_BATCH_SIZE', 500)
+
+
+def get_digest_window(notification_type, group=None):
+    """Seconds to coalesce ``notification_type`` over; 0 when it is not coalesced"""
+    if group is not None and group.digest_window is not None:
+        return group.digest_window
+    return getattr(settings, 'NOTIFICATION_DIGEST_WINDOWS', {}).get(notification_type, 0)
+
+
+def notify_many(recipients, notification_type, title, message, content_object=None, action_url=None, group=None):
+    """
+    Create the same notification for many users and dispatch it after commit.
+
+    Recipients who already hold an open digest for this event get it updated
+    instead of a new row.
+
+    Args:
+        recipients: Users, user ids, or a User queryset
+        notification_type: Type of notification (from Notification.NOTIFICATION_TYPE_CHOICES)
+        title: Notification title
+        message: Notification message
+        content_object: Related object (optional)
+        action_url: URL to redirect to when the notification is clicked (optional)
+        group: NotificationGroup to file the notification under; a group with a
+            digest_window is also the digest key (optional)
+
+    Returns:
+        list: The created or updated Notification instances, one per recipient
+    """
+    if hasattr(recipients, 'values_list'):
+        recipient_ids = list(recipients.values_list('pk', flat=True))
+    else:
+        # Normalised so ids passed as strings match the recipient_id of stored digests
+        to_pk = get_user_model()._meta.pk.to_python
+        recipient_ids = [to_pk(getattr(recipient, 'pk', recipient)) for recipient in recipients]
+    if not recipient_ids:
+        return []
+
+    # Resolved once per call (and cached by ContentType's manager across calls)
+    content_type = ContentType.objects.get_for_model(content_object) if content_object else None
+    object_id = str(content_object.pk) if content_object else None
+
+    if group is not None and group.digest_window is not None:
+        digest_filter = {'group': group}
+    elif content_object is not None:
+        digest_filter = {'content_type': content_type, 'object_id': object_id}
+    else:
+        digest_filter = None
+    window = get_digest_window(notification_type, group) if digest_filter else 0
+
+    events = Counter(recipient_ids)
+    digests = {}
+    with transaction.atomic():
+        if window:
+            # Newest open digest per recipient; locked so concurrent events merge serially
+            candidates = Notification.objects.filter(
+                recipient_id__in=list(events),
+                notification_type=notification_type,
+                is_read=False,
+                is_archived=False,
+                created_at__gte=timezone.now() - timedelta(seconds=window),
+                **digest_filter
+            ).order_by('-created_at').select_for_update()
+            for notification in candidates:
+                digests.setdefault(notification.recipient_id, notification)
+
+        created = Notification.objects.bulk_create([
+            Notification(
+                recipient_id=recipient_id,
+                notification_type=notification_type,
+                title=title,
+                message=message,
+                content_type=content_type,
+                object_id=object_id,
+                action_url=action_url,
+                group=group,
+                event_count=count if window else 1,
+            )
+            for recipient_id, count in (events.items() if window else ((pk, 1) for pk in recipient_ids))
+            if recipient_id not in digests
+        ])
+        # bulk_create skips post_save, so count the new rows here
+        adjust_unread_counters(Counter(
+            (notification.recipient_id, notification_type) for notification in created
+        ))
+
+        # Digests stay a single unread notification; only their content moves on
+        first_merges = []
+        merges = defaultdict(list)
+        now = timezone.now()
+        for recipient_id, notification in digests.items():
+            count = events[recipient_id]
+            if notification.event_count == 1:
+                first_merges.append(str(notification.id))
+            merges[count].append(notification.id)
+            notification.event_count += count
+            notification.title = title
+            notification.message = message
+            notification.action_url = action_url
+            notification.updated_at = now
+        # One UPDATE per distinct burst size, which is nearly always just one
+        for count, ids in merges.items():
+            Notification.objects.filter(id__in=ids).update(
+                event_count=F('event_count') + count,
+                title=title,
+                message=message,
+                action_url=action_url,
+                updated_at=now,
+            )
+
+    notification_ids = [str(notification.id) for notification in created]
+    if notification_ids:
+        transaction.on_commit(lambda: queue_dispatch(notification_ids))
+    if first_merges:
+        transaction.on_commit(lambda: queue_digest_push(first_merges, window))
+
+    by_recipient = {notification.recipient_id: notification for notification in created}
+    by_recipient.update(digests)
+    if window:
+        return [by_recipient[recipient_id] for recipient_id in events]
+    return created
+
+
+def queue_dispatch(notification_ids):
+    """Split ``notification_ids`` into dispatch tasks on the notifications queue"""
+    from .tasks import dispatch_notifications
+
+    batch_size = get_dispatch_batch_size()
+    for start in range(0, len(notification_ids), batch_size):
+        dispatch_notifications.delay(notification_ids[start:start + batch_size])
+
+
+def queue_digest_push(notification_ids, window):
+    """Push ``notification_ids`` again once their digest window has closed"""
+    from .tasks import push_digests
+
+    batch_size = get_dispatch_batch_size()
+    for start in range(0, len(notification_ids), batch_size):
+        push_digests.apply_async(args=[notification_ids[start:start + batch_size]], countdown=window)
+
+
+def build_notification_event(notification):
+    """Channel layer event for ``NotificationConsumer.send_notification_to_consumer``"""
+    event = {
+        'type': 'send_notification_to_consumer',
+        'id': str(notification.id),
+        'notification_type': notification.notification_type,
+        'title': notification.title,
+        'message': notification.message,
+        'timestamp': notification.created_at.isoformat(),
+        'is_read': notification.is_read,
+        'event_count': notification.event_count,
+    }
+    if notification.content_type_id:
+        event['content_type'] = notification.content_type.model
+        event['object_id'] = notification.object_id
+    if notification.action_url:
+        event['action_url'] = notification.action_url
+    if notification.group_id:
+        event['group_id'] = str(notification.group_id)
+    return event
+
+
+def dispatch_to_channels(notifications):
+    """Send each notification to its recipient's group in one event loop"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    events = [
+        (f'notifications_{notification.recipient_id}', build_notification_event(notification))
+        for notification in notifications
+    ]
+
+    async def send_all():
+        for group, event in events:
+            await channel_layer.group_send(group, event)
+
+    async_to_sync(send_all)()
+
 
 def send_notification(recipient, notification_type, title, message, content_object=None, action_url=None):
     """
     Create a notification in the database and send it via the channel layer.
-    
+
+    A single-recipient ``notify_many``; the WebSocket push happens after the
+    current transaction commits.
+
     Args:
         recipient: User instance to receive the notification
         notification_type: Type of notification (from Notification.NOTIFICATION_TYPE_CHOICES)
@@ -15,51 +227,11 @@ def send_notification(recipient, notification_type, title, message, content_obje
         message: Notification message
         content_object: Related object (optional)
         action_url: URL to redirect to when the notification is clicked (optional)
-    
+
     Returns:
         Notification instance
     """
-    # Create notification in database
-    notification = Notification.objects.create(
-        recipient=recipient,
-        notification_type=notification_type,
-        title=title,
-        message=message,
-        action_url=action_url,
-    )
-    
-    # Link to content object if provided
-    if content_object:
-        content_type = ContentType.objects.get_for_model(content_object)
-        notification.content_type = content_type
-        notification.object_id = str(content_object.id)
-        notification.save(update_fields=['content_type', 'object_id'])
-    
-    # Get channel layer and send to notification group
-    channel_layer = get_channel_layer()
-    
-    # Construct notification data
-    notification_data = {
-        'type': 'notification_message',  # This matches the method name in NotificationConsumer
-        'id': str(notification.id),
-        'notification_type': notification_type,
-        'title': title,
-        'message': message,
-        'timestamp': timezone.now().isoformat(),
-    }
-    
-    # Add optional fields if present
-    if content_object:
-        notification_data['content_type'] = content_type.model
-        notification_data['object_id'] = str(content_object.id)
-    
-    if action_url:
-        notification_data['action_url'] = action_url
-    
-    # Send to the user's notification group
-    async_to_sync(channel_layer.group_send)(
-        f'notifications_{recipient.id}',
-        notification_data
-    )
-    
-    return notification
+    return notify_many(
+        [recipient], notification_type, title, message,
+        content_object=content_object, action_url=action_url
+    )[0]
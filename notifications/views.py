@@ -11,6 +11,7 @@ from .serializers import (
     NotificationCreateSerializer
 )
 from .permissions import IsNotificationRecipient
+from .counters import delete_notifications, get_unread_counts, mark_notifications_read
 
 class NotificationViewSet(viewsets.ModelViewSet):
     """
@@ -20,7 +21,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     queryset = Notification.objects.all()
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['notification_type', 'is_read']
-    ordering_fields = ['created_at']
+    ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']  # Most recent first by default
     
     def get_queryset(self):
@@ -54,6 +55,9 @@ class NotificationViewSet(viewsets.ModelViewSet):
         # List is filtered by user in get_queryset
         return [permissions.IsAuthenticated()]
     
+    def perform_destroy(self, instance):
+        delete_notifications(Notification.objects.filter(pk=instance.pk))
+    
     @action(detail=False, methods=['post'])
     def mark_read(self, request):
         """
@@ -67,27 +71,23 @@ class NotificationViewSet(viewsets.ModelViewSet):
             
             if serializer.validated_data.get('mark_all'):
                 # Mark all user's notifications as read
-                notifications = Notification.objects.filter(recipient=user, is_read=False)
-                notifications.update(is_read=True)
+                marked_count = mark_notifications_read(Notification.objects.filter(recipient=user))
                 
                 return Response({
                     'status': 'success',
-                    'marked_count': notifications.count(),
+                    'marked_count': marked_count,
                     'message': "All notifications marked as read."
                 }, status=status.HTTP_200_OK)
             else:
                 # Mark specific notifications as read
                 notification_ids = serializer.validated_data.get('notification_ids')
-                notifications = Notification.objects.filter(
-                    id__in=notification_ids,
-                    recipient=user,
-                    is_read=False
+                marked_count = mark_notifications_read(
+                    Notification.objects.filter(id__in=notification_ids, recipient=user)
                 )
-                notifications.update(is_read=True)
                 
                 return Response({
                     'status': 'success',
-                    'marked_count': notifications.count(),
+                    'marked_count': marked_count,
                     'message': "Notifications marked as read."
                 }, status=status.HTTP_200_OK)
                 
@@ -110,8 +110,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
                 )
                 
             # Mark as read
-            instance.is_read = True
-            instance.save(update_fields=['is_read'])
+            mark_notifications_read(Notification.objects.filter(pk=instance.pk))
             
             return Response({
                 'status': 'success',
@@ -132,19 +131,10 @@ class NotificationViewSet(viewsets.ModelViewSet):
         """
         Get count of unread notifications for the current user.
         """
-        user = request.user
-        
-        # Count unread notifications
-        unread_count = Notification.objects.filter(recipient=user, is_read=False).count()
-        
-        # Get counts by notification type
-        type_counts = Notification.objects.filter(recipient=user, is_read=False)\
-            .values('notification_type')\
-            .annotate(count=filters.Count('id'))
-        
-        type_data = {item['notification_type']: item['count'] for item in type_counts}
+        # Maintained counters; no COUNT over the user's notifications
+        counts = get_unread_counts(request.user)
         
         return Response({
-            'total_unread': unread_count,
-            'type_counts': type_data
+            'total_unread': counts['total'],
+            'type_counts': counts['by_type']
         }, status=status.HTTP_200_OK)
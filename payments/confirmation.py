@@ -0,0 +1,51 @@
+"""
+Completing a payment, shared by the ``confirm`` endpoint and gateway webhooks.
+"""
+from notifications.utils import send_notification
+
+# Statuses a payment can still be completed from; completed, refunded and
+# cancelled payments are final
+CONFIRMABLE_STATUSES = ('pending', 'processing', 'failed')
+
+
+def confirm_payment(payment, transaction_id):
+    """
+    Complete ``payment``, confirm its pending booking and notify both sides.
+
+    The caller holds a lock on the payment row. Returns False without doing
+    anything if the payment is not in ``CONFIRMABLE_STATUSES``, e.g. it was
+    already completed or has been refunded since.
+    """
+    if payment.status not in CONFIRMABLE_STATUSES:
+        return False
+    booking = payment.booking
+
+    payment.status = 'completed'
+    payment.transaction_id = transaction_id
+    payment.save()
+
+    # Update booking status to 'confirmed' if it's pending
+    if booking.status == 'pending':
+        booking.status = 'confirmed'
+        booking.save()
+
+    # Create a notification for the provider about the payment
+    send_notification(
+        recipient=booking.provider,
+        notification_type='payment_received',
+        title='Payment Received',
+        message=f'You received a payment of {payment.amount} for booking {booking.service.title}',
+        content_object=payment,
+        action_url=f'/provider/bookings/{booking.id}/'
+    )
+
+    # Also notify the customer about the confirmed booking
+    send_notification(
+        recipient=booking.customer,
+        notification_type='booking_status_updated',
+        title='Booking Confirmed',
+        message=f'Your booking for {booking.service.title} has been confirmed',
+        content_object=booking,
+        action_url=f'/bookings/{booking.id}/'
+    )
+    return True
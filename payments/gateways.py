@@ -0,0 +1,71 @@
+"""
+Payout gateway clients.
+
+The batch processor talks to whichever class ``PAYOUT_GATEWAY_BACKEND``
+names. A client receives the payouts for one ``PaymentGatewayAccount`` at a
+time and reports an outcome per payout. Gateways must treat the payout ID as
+an idempotency key: a batch whose outcome was lost is submitted again.
+"""
+import logging
+import uuid
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def get_gateway():
+    """An instance of the configured gateway client, or None when payouts aren't set up"""
+    path = getattr(settings, 'PAYOUT_GATEWAY_BACKEND', None)
+    return import_string(path)() if path else None
+
+
+class PayoutGatewayError(Exception):
+    """Raised when a batch could not be submitted; its payouts are retried later."""
+    pass
+
+
+class PayoutGateway:
+    """Base class for payout gateway clients."""
+
+    def submit_batch(self, account, payouts):
+        """
+        Send ``payouts`` to ``account``.
+
+        Returns:
+            dict: ``{payout.id: {'status': 'completed' | 'failed',
+            'transaction_id': str, 'reference': str, 'error': str}}``
+            for every payout in the batch
+
+        Raises:
+            PayoutGatewayError: If the batch as a whole could not be sent
+        """
+        raise NotImplementedError
+
+
+class FakePayoutGateway(PayoutGateway):
+    """
+    Completes payouts locally without moving money, for development and tests.
+
+    Accounts with ``account_details['fail_payouts']`` set have their payouts
+    rejected. Every batch an instance submits is recorded in its ``batches``.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def submit_batch(self, account, payouts):
+        reference = f"fake_batch_{uuid.uuid4().hex[:12]}"
+        self.batches.append((account.id, [payout.id for payout in payouts]))
+        failing = (account.account_details or {}).get('fail_payouts')
+        logger.debug(f"💸 Fake gateway received {len(payouts)} payouts for account {account.id}")
+        return {
+            payout.id: {
+                'status': 'failed' if failing else 'completed',
+                'transaction_id': '' if failing else f"fake_txn_{payout.id}",
+                'reference': reference,
+                'error': 'Rejected by fake gateway' if failing else '',
+            }
+            for payout in payouts
+        }
@@ -0,0 +1,118 @@
+"""
+``Idempotency-Key`` support for mutating API endpoints.
+
+A view wrapped with ``idempotent`` stores the response to a keyed request in
+``IdempotencyKey``. Retrying with the same key replays the stored response
+without running the view again, so a client that lost the first answer can
+retry safely. The key row is inserted before the view runs and is unique per
+user, so a concurrent duplicate gets a 409 instead of doing the work twice.
+
+Keys are scoped to the user and bound to the method, path and body they were
+first used with. Responses with 5xx status codes are not kept, so those
+requests can be retried with the same key.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+
+
+def get_key_ttl():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+def get_lock_timeout():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60))
+
+
+def request_hash(request):
+    """What a key is bound to: method, path and the parsed body"""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method}\n{request.path}\n{body}".encode('utf-8')).hexdigest()
+
+
+def replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """Make a DRF view method safe to retry with an ``Idempotency-Key`` header"""
+
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response({"error": f"{HEADER} must be at most 255 characters."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_hash(request)
+        now = timezone.now()
+        record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+        if record is not None and (
+            record.created_at < now - get_key_ttl()
+            # The first attempt died without answering
+            or (record.status_code is None and record.created_at < now - get_lock_timeout())
+        ):
+            record.delete()
+            record = None
+        if record is None:
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(user=request.user, key=key, request_hash=fingerprint)
+            except IntegrityError:
+                record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            else:
+                return _run(record, view_method, self, request, *args, **kwargs)
+
+        if record is None or record.status_code is None:
+            return Response(
+                {"error": f"A request with this {HEADER} is still being processed."},
+                status=status.HTTP_409_CONFLICT
+            )
+        if record.request_hash != fingerprint:
+            return Response(
+                {"error": f"This {HEADER} was already used for a different request."},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        logger.debug(f"🔁 Replaying response for {HEADER} {key} of user {request.user.pk}")
+        return replay(record)
+
+    return wrapper
+
+
+def _run(record, view_method, view, request, *args, **kwargs):
+    try:
+        response = view_method(view, request, *args, **kwargs)
+    except Exception:
+        record.delete()
+        raise
+    if response.status_code >= 500:
+        record.delete()
+        return response
+    record.status_code = response.status_code
+    record.response_body = response.data
+    record.save(update_fields=['status_code', 'response_body'])
+    return response
+
+
+def prune_idempotency_keys(now=None):
+    """Delete keys past ``IDEMPOTENCY_KEY_TTL_HOURS``; returns how many were removed"""
+    now = now or timezone.now()
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=now - get_key_ttl()).delete()
+    return deleted
@@ -0,0 +1,232 @@
+"""
+Double-entry earnings ledger.
+
+Money movements that concern a provider are posted as ``LedgerEntry`` legs
+that sum to zero:
+
+- payment completed: customer_funds -> provider_available, then the platform
+  fee provider_available -> platform_revenue
+- refund: the reverse of both
+- payout requested: provider_available -> provider_payout_pending
+- payout completed: provider_payout_pending -> paid_out
+- payout failed or cancelled: provider_payout_pending -> provider_available
+
+Postings are made from the ``Payment`` and ``Payout`` post_save receivers,
+inside the saving transaction, while holding a lock on the provider's
+``ProviderBalance`` row; the row's running totals are updated in the same
+transaction. Which events a payment or payout already posted is read from
+the ledger itself, so saving an object twice never posts twice.
+"""
+import logging
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from bookings.models import Booking
+
+from .models import LedgerEntry, Payout, ProviderBalance
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+
+# Accounts that belong to the provider; the others are platform accounts
+PROVIDER_ACCOUNTS = ('provider_available', 'provider_payout_pending')
+
+# Bookings whose value counts as pending earnings
+PENDING_BOOKING_STATUSES = ('confirmed', 'in_progress')
+
+
+def get_default_currency():
+    return getattr(settings, 'LEDGER_DEFAULT_CURRENCY', 'INR')
+
+
+class InsufficientBalance(Exception):
+    """Raised when a payout asks for more than the provider's available balance."""
+
+    def __init__(self, available, requested):
+        self.available = available
+        self.requested = requested
+        super().__init__(f"Requested {requested} but only {available} is available for payout")
+
+
+def to_money(value):
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def lock_balance(provider_id):
+    """The provider's balance row, locked until the transaction ends"""
+    balance, _ = ProviderBalance.objects.select_for_update().get_or_create(provider_id=provider_id)
+    return balance
+
+
+def _post(balance, kind, legs, currency, **related):
+    """Unsaved entries for one posting, applied to ``balance``'s account totals"""
+    assert sum(amount for _, amount in legs) == 0, f"Unbalanced {kind} posting"
+    posting_id = uuid.uuid4()
+    entries = []
+    for account, amount in legs:
+        balance_after = None
+        if account == 'provider_available':
+            balance.available += amount
+            balance_after = balance.available
+        elif account == 'provider_payout_pending':
+            balance.pending_payouts += amount
+        entries.append(LedgerEntry(
+            posting_id=posting_id,
+            provider_id=balance.provider_id,
+            account=account,
+            kind=kind,
+            amount=amount,
+            currency=currency,
+            balance_after=balance_after,
+            **related,
+        ))
+    return entries
+
+
+def _save(balance, entries):
+    if entries:
+        LedgerEntry.objects.bulk_create(entries)
+        balance.save()
+
+
+def record_payment(payment):
+    """Post whatever part of a completed or refunded payment isn't in the ledger yet"""
+    if payment.status not in ('completed', 'refunded'):
+        return []
+    amount, fee = to_money(payment.amount), to_money(payment.platform_fee)
+    with transaction.atomic():
+        balance = lock_balance(payment.payee_id)
+        posted = set(LedgerEntry.objects.filter(payment=payment).values_list('kind', flat=True))
+        entries = []
+        if 'payment' not in posted:
+            entries += _post(balance, 'payment', [('customer_funds', -amount), ('provider_available', amount)],
+                             payment.currency, payment=payment)
+            balance.total_earnings += amount
+            if fee:
+                entries += _post(balance, 'platform_fee', [('provider_available', -fee), ('platform_revenue', fee)],
+                                 payment.currency, payment=payment)
+                balance.platform_fees += fee
+        if payment.status == 'refunded' and 'refund' not in posted:
+            entries += _post(balance, 'refund', [('provider_available', -amount), ('customer_funds', amount)],
+                             payment.currency, payment=payment)
+            balance.total_earnings -= amount
+            if fee:
+                entries += _post(balance, 'fee_refund', [('platform_revenue', -fee), ('provider_available', fee)],
+                                 payment.currency, payment=payment)
+                balance.platform_fees -= fee
+        _save(balance, entries)
+    if entries:
+        logger.debug(f"📒 Posted {len(entries)} ledger entries for payment {payment.id}")
+    return entries
+
+
+def lock_balances(provider_ids):
+    """``{provider_id: balance}`` for many providers, locked in a stable order"""
+    provider_ids = sorted(set(provider_ids))
+    ProviderBalance.objects.bulk_create(
+        [ProviderBalance(provider_id=provider_id) for provider_id in provider_ids], ignore_conflicts=True
+    )
+    return {
+        balance.provider_id: balance
+        for balance in ProviderBalance.objects.select_for_update().filter(provider_id__in=provider_ids).order_by('pk')
+    }
+
+
+def _payout_entries(balance, payout, posted, currency):
+    amount = to_money(payout.amount)
+    entries = []
+    if 'payout_requested' not in posted:
+        entries += _post(balance, 'payout_requested',
+                         [('provider_available', -amount), ('provider_payout_pending', amount)],
+                         currency, payout=payout)
+    settled = posted & {'payout_completed', 'payout_reversed'}
+    if payout.status == 'completed' and not settled:
+        entries += _post(balance, 'payout_completed', [('provider_payout_pending', -amount), ('paid_out', amount)],
+                         currency, payout=payout)
+        balance.paid_out += amount
+    elif payout.status in ('failed', 'cancelled') and not settled:
+        entries += _post(balance, 'payout_reversed',
+                         [('provider_payout_pending', -amount), ('provider_available', amount)],
+                         currency, payout=payout)
+    return entries
+
+
+def record_payout(payout):
+    """Post the reservation of a payout and, once it settles, its outcome"""
+    with transaction.atomic():
+        balance = lock_balance(payout.provider_id)
+        posted = set(LedgerEntry.objects.filter(payout=payout).values_list('kind', flat=True))
+        entries = _payout_entries(balance, payout, posted, get_default_currency())
+        _save(balance, entries)
+    if entries:
+        logger.debug(f"📒 Posted {len(entries)} ledger entries for payout {payout.id}")
+    return entries
+
+
+def record_payouts(payouts):
+    """
+    ``record_payout`` for many payouts with a fixed number of queries, for
+    callers that change payout statuses with ``bulk_update``.
+    """
+    if not payouts:
+        return []
+    with transaction.atomic():
+        balances = lock_balances(payout.provider_id for payout in payouts)
+        posted = defaultdict(set)
+        for payout_id, kind in LedgerEntry.objects.filter(payout__in=payouts).values_list('payout_id', 'kind'):
+            posted[payout_id].add(kind)
+        currency = get_default_currency()
+        entries = []
+        for payout in payouts:
+            entries += _payout_entries(balances[payout.provider_id], payout, posted[payout.pk], currency)
+        if entries:
+            now = timezone.now()
+            for balance in balances.values():
+                balance.updated_at = now
+            LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+            ProviderBalance.objects.bulk_update(
+                list(balances.values()), ['available', 'pending_payouts', 'paid_out', 'updated_at'], batch_size=1000
+            )
+    logger.debug(f"📒 Posted {len(entries)} ledger entries for {len(payouts)} payouts")
+    return entries
+
+
+def reserve_payout(provider_id, amount, **fields):
+    """
+    Create a pending payout if the provider's available balance covers it.
+
+    The balance row stays locked from the check until the payout's
+    reservation is posted, so concurrent requests can't overdraw it.
+
+    Raises:
+        InsufficientBalance: If ``amount`` exceeds the available balance
+    """
+    with transaction.atomic():
+        balance = lock_balance(provider_id)
+        if amount > balance.available:
+            raise InsufficientBalance(balance.available, amount)
+        return Payout.objects.create(provider_id=provider_id, amount=amount, status='pending', **fields)
+
+
+def refresh_pending_earnings(provider_id):
+    """Recompute the value of a provider's confirmed and in-progress bookings"""
+    with transaction.atomic():
+        balance = lock_balance(provider_id)
+        pending = Booking.objects.filter(
+            provider_id=provider_id, status__in=PENDING_BOOKING_STATUSES
+        ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        if balance.pending_earnings != pending:
+            balance.pending_earnings = pending
+            balance.save(update_fields=['pending_earnings', 'updated_at'])
+
+
+def provider_statement(provider_id):
+    """The provider's own ledger legs, newest first"""
+    return LedgerEntry.objects.filter(provider_id=provider_id, account__in=PROVIDER_ACCOUNTS)
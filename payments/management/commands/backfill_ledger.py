@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from bookings.models import Booking
+from payments.ledger import record_payment, record_payout, refresh_pending_earnings
+from payments.models import Payment, Payout
+
+
+class Command(BaseCommand):
+    help = 'Post existing payments and payouts to the earnings ledger; events already posted are skipped'
+
+    def handle(self, *args, **options):
+        entries = 0
+        payments = Payment.objects.filter(status__in=['completed', 'refunded']).order_by('created_at')
+        for payment in payments.iterator():
+            entries += len(record_payment(payment))
+        for payout in Payout.objects.order_by('created_at').iterator():
+            entries += len(record_payout(payout))
+
+        provider_ids = Booking.objects.values_list('provider_id', flat=True).distinct()
+        for provider_id in provider_ids.iterator():
+            refresh_pending_earnings(provider_id)
+
+        self.stdout.write(self.style.SUCCESS(f"Posted {entries} ledger entries"))
@@ -0,0 +1,49 @@
+import json
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.models import Payment
+from payments.webhooks import (
+    HANDLERS, InvalidWebhook, WebhookNotConfigured, build_fake_event, receive_stripe_event, sign_payload
+)
+
+
+class Command(BaseCommand):
+    help = 'Generate signed Stripe-style webhook events for payments, for local testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('payment_ids', nargs='+', help='Payments the events are about')
+        parser.add_argument('--type', default='payment_intent.succeeded', choices=sorted(HANDLERS),
+                            help='Event type (default: payment_intent.succeeded)')
+        parser.add_argument('--repeat', type=int, default=1, help='Deliver each event this many times')
+        parser.add_argument('--secret', default=None, help='Signing secret (default: STRIPE_WEBHOOK_SECRET)')
+        parser.add_argument('--url', default=None,
+                            help='POST the events to this webhook URL instead of storing them directly')
+
+    def handle(self, *args, **options):
+        payments = list(Payment.objects.filter(id__in=options['payment_ids']))
+        if len(payments) != len(set(options['payment_ids'])):
+            raise CommandError("Some of the payments do not exist")
+
+        delivered = 0
+        for payment in payments:
+            payload = json.dumps(build_fake_event(options['type'], payment))
+            for _ in range(options['repeat']):
+                signature = sign_payload(payload, options['secret'], timestamp=int(time.time()))
+                if options['url']:
+                    response = requests.post(
+                        options['url'], data=payload, timeout=10,
+                        headers={'Content-Type': 'application/json', 'Stripe-Signature': signature},
+                    )
+                    if response.status_code != 200:
+                        raise CommandError(f"Webhook answered {response.status_code}: {response.text}")
+                else:
+                    try:
+                        receive_stripe_event(payload.encode('utf-8'), signature)
+                    except (WebhookNotConfigured, InvalidWebhook) as e:
+                        raise CommandError(str(e))
+                delivered += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Delivered {delivered} {options['type']} events"))
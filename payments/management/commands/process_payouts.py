@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from payments.payouts import eligible_payouts, process_payouts
+
+
+class Command(BaseCommand):
+    help = 'Send eligible payouts to the configured payout gateway in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many payouts')
+        parser.add_argument('--dry-run', action='store_true', help='Show how many payouts are eligible')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f"{eligible_payouts().count()} payouts eligible for processing")
+            return
+
+        totals = process_payouts(limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['completed']} completed, {totals['failed']} failed, {totals['retrying']} left for retry"
+        ))
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments.models import WebhookEvent
+from payments.webhooks import process_webhook_events, replay_events
+
+
+class Command(BaseCommand):
+    help = 'Put stored gateway webhook events back in the queue and apply them again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', action='append', default=[], help='Gateway event ID to replay (repeatable)')
+        parser.add_argument('--payment', action='append', default=[], help='Replay all events of this payment (repeatable)')
+        parser.add_argument('--status', default='failed', help='Replay events in this status (default: failed)')
+        parser.add_argument('--hours', type=int, default=None, help='Only events received in the last N hours')
+        parser.add_argument('--no-process', action='store_true', help='Only queue the events, leave them for the worker')
+
+    def handle(self, *args, **options):
+        events = WebhookEvent.objects.all()
+        if options['event']:
+            events = events.filter(event_id__in=options['event'])
+        elif options['payment']:
+            events = events.filter(payment_ref__in=options['payment'])
+        else:
+            events = events.filter(status=options['status'])
+        if options['hours'] is not None:
+            events = events.filter(received_at__gte=timezone.now() - timedelta(hours=options['hours']))
+
+        count = replay_events(events)
+        self.stdout.write(f"{count} events queued for replay")
+        if options['no_process'] or not count:
+            return
+
+        totals = process_webhook_events()
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['processed']} applied, {totals['ignored']} ignored, {totals['failed']} failed, "
+            f"{totals['retrying']} left for retry"
+        ))
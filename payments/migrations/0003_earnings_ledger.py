@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:17
+
+import django.db.models.deletion
+import uuid
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_remove_paymentgatewayaccount_payments_paymentgatewayaccount_user_account_type_uniq_and_more'),
+        ('users', '0004_alter_user_profile_picture_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderBalance',
+            fields=[
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='earnings_balance', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('available', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('pending_payouts', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_earnings', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('platform_fees', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('paid_out', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('pending_earnings', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Provider Balance',
+                'verbose_name_plural': 'Provider Balances',
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posting_id', models.UUIDField(db_index=True, default=uuid.uuid4)),
+                ('account', models.CharField(choices=[('provider_available', 'Provider Available Balance'), ('provider_payout_pending', 'Provider Payouts In Progress'), ('customer_funds', 'Customer Funds'), ('platform_revenue', 'Platform Fee Revenue'), ('paid_out', 'Paid Out')], max_length=30)),
+                ('kind', models.CharField(choices=[('payment', 'Payment Completed'), ('platform_fee', 'Platform Fee'), ('refund', 'Payment Refunded'), ('fee_refund', 'Platform Fee Refunded'), ('payout_requested', 'Payout Requested'), ('payout_completed', 'Payout Completed'), ('payout_reversed', 'Payout Failed or Cancelled')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, help_text='Signed amount; the legs of a posting sum to zero', max_digits=12)),
+                ('currency', models.CharField(default='INR', max_length=3)),
+                ('balance_after', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='payments.payment')),
+                ('payout', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='payments.payout')),
+                ('provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Ledger Entry',
+                'verbose_name_plural': 'Ledger Entries',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['provider', '-id'], name='ledger_provider_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('payment__isnull', False)), fields=('payment', 'kind', 'account'), name='ledger_payment_event_unique'), models.UniqueConstraint(condition=models.Q(('payout__isnull', False)), fields=('payout', 'kind', 'account'), name='ledger_payout_event_unique')],
+            },
+        ),
+    ]
@@ -1,8 +1,13 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 import uuid
 from bookings.models import Booking
 from decimal import Decimal
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 
 # Create your models here.
 class Payment(models.Model):
@@ -75,7 +80,9 @@ class Payment(models.Model):
             self.status = 'completed'
             if transaction_id:
                 self.transaction_id = transaction_id
-            self.save(update_fields=['status', 'transaction_id' if transaction_id else 'status', 'updated_at'])
+            # The ledger posting commits or rolls back with the status change
+            with transaction.atomic():
+                self.save(update_fields=['status', 'transaction_id' if transaction_id else 'status', 'updated_at'])
             return True
         return False
     
@@ -100,7 +107,7 @@ class Payment(models.Model):
                 self.metadata = {}
                 
             refund_data = {
-                'refund_date': models.functions.Now().isoformat(),
+                'refund_date': timezone.now().isoformat(),
                 'reason': reason,
             }
             
@@ -108,7 +115,8 @@ class Payment(models.Model):
                 refund_data['refund_transaction_id'] = refund_transaction_id
                 
             self.metadata['refund'] = refund_data
-            self.save()
+            with transaction.atomic():
+                self.save()
             return True
         return False
 
@@ -173,6 +181,14 @@ class Payout(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Payout'
         verbose_name_plural = 'Payouts'
+        indexes = [
+            # Batch processing queue
+            models.Index(
+                fields=['created_at'],
+                condition=models.Q(status__in=['pending', 'processing']),
+                name='payout_queue_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Payout #{self.id} - {self.amount} to {self.provider.username}"
@@ -182,3 +198,186 @@ class Payout(models.Model):
         if not self.net_amount:
             self.net_amount = self.amount - self.transaction_fee
         super().save(*args, **kwargs)
+
+
+class LedgerEntry(models.Model):
+    """
+    One leg of a double-entry posting in the earnings ledger.
+    
+    Entries are append-only. The legs of one posting share ``posting_id`` and
+    sum to zero; ``provider`` is the provider the money movement concerns.
+    ``balance_after`` is the provider's available balance after a
+    ``provider_available`` leg, so statements read straight off the ledger.
+    """
+    ACCOUNT_CHOICES = (
+        ('provider_available', 'Provider Available Balance'),
+        ('provider_payout_pending', 'Provider Payouts In Progress'),
+        ('customer_funds', 'Customer Funds'),
+        ('platform_revenue', 'Platform Fee Revenue'),
+        ('paid_out', 'Paid Out'),
+    )
+    
+    KIND_CHOICES = (
+        ('payment', 'Payment Completed'),
+        ('platform_fee', 'Platform Fee'),
+        ('refund', 'Payment Refunded'),
+        ('fee_refund', 'Platform Fee Refunded'),
+        ('payout_requested', 'Payout Requested'),
+        ('payout_completed', 'Payout Completed'),
+        ('payout_reversed', 'Payout Failed or Cancelled'),
+    )
+    
+    posting_id = models.UUIDField(default=uuid.uuid4, db_index=True)
+    provider = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ledger_entries')
+    account = models.CharField(max_length=30, choices=ACCOUNT_CHOICES)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, help_text="Signed amount; the legs of a posting sum to zero")
+    currency = models.CharField(max_length=3, default='INR')
+    balance_after = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    payout = models.ForeignKey('Payout', on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-id']
+        verbose_name = 'Ledger Entry'
+        verbose_name_plural = 'Ledger Entries'
+        indexes = [
+            # Provider statements, newest first
+            models.Index(fields=['provider', '-id'], name='ledger_provider_idx'),
+        ]
+        constraints = [
+            # Each payment or payout event is posted once
+            models.UniqueConstraint(
+                fields=['payment', 'kind', 'account'],
+                condition=models.Q(payment__isnull=False),
+                name='ledger_payment_event_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['payout', 'kind', 'account'],
+                condition=models.Q(payout__isnull=False),
+                name='ledger_payout_event_unique',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.amount} {self.currency} to {self.account}"
+
+
+class ProviderBalance(models.Model):
+    """
+    Running totals of a provider's ledger, updated in the same transaction as
+    every posting so earnings are a single-row read. ``pending_earnings`` is
+    the value of confirmed and in-progress bookings not yet paid.
+    """
+    provider = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='earnings_balance')
+    available = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    pending_payouts = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    total_earnings = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    platform_fees = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    paid_out = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    pending_earnings = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Provider Balance'
+        verbose_name_plural = 'Provider Balances'
+    
+    def __str__(self):
+        return f"Balance of {self.provider}: {self.available}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied ``Idempotency-Key`` and the response it produced.
+    
+    ``status_code`` stays empty while the first request is being handled;
+    ``request_hash`` ties the key to one method, path and body.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        verbose_name = 'Idempotency Key'
+        verbose_name_plural = 'Idempotency Keys'
+        unique_together = ('user', 'key')
+    
+    def __str__(self):
+        return f"{self.key} for {self.user}"
+
+
+
+class WebhookEvent(models.Model):
+    """
+    A payment gateway webhook event as it was received.
+    
+    The inbox is append-only: ``payload`` is never changed, and a redelivered
+    event hits the unique ``(provider, event_id)`` constraint instead of being
+    stored twice. ``payment_ref`` is the payment the event names; it is not a
+    foreign key so events for unknown payments are still recorded.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    )
+    
+    provider = models.CharField(max_length=20, default='stripe')
+    event_id = models.CharField(max_length=255)
+    event_type = models.CharField(max_length=100)
+    payment_ref = models.UUIDField(null=True, blank=True)
+    occurred_at = models.DateTimeField(help_text="When the gateway created the event")
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'Webhook Event'
+        verbose_name_plural = 'Webhook Events'
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='webhook_event_unique'),
+        ]
+        indexes = [
+            # The processing queue: pending events per payment in gateway order
+            models.Index(
+                fields=['payment_ref', 'occurred_at', 'id'],
+                name='webhook_inbox_pending_idx',
+                condition=models.Q(status='pending'),
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.provider} {self.event_type} {self.event_id}"
+
+@receiver(post_save, sender=Payment)
+def post_payment_to_ledger(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .ledger import record_payment
+    record_payment(instance)
+
+
+@receiver(post_save, sender=Payout)
+def post_payout_to_ledger(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .ledger import record_payout
+    record_payout(instance)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def refresh_pending_earnings_on_booking_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .ledger import refresh_pending_earnings
+    provider_id = instance.provider_id
+    transaction.on_commit(lambda: refresh_pending_earnings(provider_id))
@@ -0,0 +1,164 @@
+"""
+Batch payout processing.
+
+``process_payouts`` (the nightly ``payments.process_payouts`` task) claims
+pending payouts to verified, active accounts with ``SKIP LOCKED``, marks them
+``processing`` and commits, so the gateway is never called while rows are
+locked and concurrent runs take disjoint work. Claimed payouts are grouped
+per ``PaymentGatewayAccount`` and sent in chunks of
+``PAYOUT_GATEWAY_BATCH_SIZE``. Outcomes are written back with one
+``bulk_update`` per chunk, and the ledger is posted in the same transaction.
+
+A batch the gateway could not take goes back to ``pending`` at the end of
+the run, so it is retried by the next one rather than in a loop. Payouts left
+``processing`` longer than ``PAYOUT_PROCESSING_TIMEOUT_MINUTES`` by a crashed
+run are claimed again; gateways deduplicate on the payout ID.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .gateways import PayoutGatewayError, get_gateway
+from .ledger import record_payouts
+from .models import Payout
+
+logger = logging.getLogger(__name__)
+
+
+def get_claim_size():
+    return getattr(settings, 'PAYOUT_CLAIM_SIZE', 2000)
+
+
+def get_gateway_batch_size():
+    return getattr(settings, 'PAYOUT_GATEWAY_BATCH_SIZE', 500)
+
+
+def get_processing_timeout():
+    return timedelta(minutes=getattr(settings, 'PAYOUT_PROCESSING_TIMEOUT_MINUTES', 60))
+
+
+def eligible_payouts(now=None):
+    """Pending payouts to usable accounts, plus ones abandoned mid-processing"""
+    now = now or timezone.now()
+    return Payout.objects.filter(
+        Q(status='pending') | Q(status='processing', updated_at__lt=now - get_processing_timeout()),
+        payment_account__is_active=True,
+        payment_account__is_verified=True,
+    )
+
+
+def claim_payouts(limit):
+    """Mark up to ``limit`` eligible payouts as processing and return them"""
+    now = timezone.now()
+    with transaction.atomic():
+        payouts = list(
+            eligible_payouts(now)
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('payment_account')
+            .order_by('created_at')[:limit]
+        )
+        Payout.objects.filter(pk__in=[payout.pk for payout in payouts]).update(status='processing', updated_at=now)
+    return payouts
+
+
+def submit_chunk(gateway, account, payouts):
+    """
+    Send one chunk and store the outcomes.
+
+    Returns:
+        dict: Number of payouts completed, failed and left for retry
+
+    Raises:
+        PayoutGatewayError: If the gateway didn't take the chunk
+    """
+    results = gateway.submit_batch(account, payouts)
+
+    now = timezone.now()
+    counts = {'completed': 0, 'failed': 0, 'retrying': 0}
+    settled = []
+    for payout in payouts:
+        result = results.get(payout.id)
+        if result is None:
+            # Not acknowledged: leave it processing to be picked up after the timeout
+            counts['retrying'] += 1
+            continue
+        payout.status = 'completed' if result['status'] == 'completed' else 'failed'
+        payout.transaction_id = result.get('transaction_id') or payout.transaction_id
+        payout.external_reference = result.get('reference') or payout.external_reference
+        if result.get('error'):
+            payout.notes = result['error']
+        payout.processed_at = now
+        payout.updated_at = now
+        counts[payout.status] += 1
+        settled.append(payout)
+
+    with transaction.atomic():
+        Payout.objects.bulk_update(
+            settled,
+            ['status', 'transaction_id', 'external_reference', 'notes', 'processed_at', 'updated_at'],
+            batch_size=1000,
+        )
+        # bulk_update skips post_save, so the ledger is posted here
+        record_payouts(settled)
+    return counts
+
+
+def process_payouts(limit=None, gateway=None):
+    """
+    Process eligible payouts until none are left or ``limit`` were claimed.
+
+    Args:
+        limit: Most payouts to claim, or None for all eligible ones
+        gateway: Client to submit through; the configured one by default
+
+    Returns:
+        dict: Number of payouts completed, failed and left for a later run
+    """
+    gateway = gateway or get_gateway()
+    if gateway is None:
+        logger.warning("💸 PAYOUT_GATEWAY_BACKEND is not configured, skipping payout processing")
+        return {'completed': 0, 'failed': 0, 'retrying': 0}
+
+    totals = {'completed': 0, 'failed': 0, 'retrying': 0}
+    claimed_total = 0
+    released = []
+    chunk_size = get_gateway_batch_size()
+    while limit is None or claimed_total < limit:
+        claim_size = get_claim_size() if limit is None else min(get_claim_size(), limit - claimed_total)
+        payouts = claim_payouts(claim_size)
+        if not payouts:
+            break
+        claimed_total += len(payouts)
+
+        by_account = defaultdict(list)
+        for payout in payouts:
+            by_account[payout.payment_account_id].append(payout)
+        for account_payouts in by_account.values():
+            account = account_payouts[0].payment_account
+            for start in range(0, len(account_payouts), chunk_size):
+                chunk = account_payouts[start:start + chunk_size]
+                try:
+                    counts = submit_chunk(gateway, account, chunk)
+                except PayoutGatewayError as e:
+                    logger.warning(f"💸 Payout batch for account {account.id} not accepted, retrying later: {e}")
+                    released += [payout.pk for payout in chunk]
+                    counts = {'retrying': len(chunk)}
+                for key, value in counts.items():
+                    totals[key] += value
+
+        if len(payouts) < claim_size:
+            break
+
+    if released:
+        Payout.objects.filter(pk__in=released, status='processing').update(status='pending', updated_at=timezone.now())
+
+    logger.info(
+        f"💸 Processed payouts: {totals['completed']} completed, {totals['failed']} failed, "
+        f"{totals['retrying']} left for retry"
+    )
+    return totals
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Payment, PaymentGatewayAccount, Payout
+from .models import LedgerEntry, Payment, PaymentGatewayAccount, Payout, ProviderBalance
 from bookings.models import Booking
 from users.serializers import PublicUserProfileSerializer
 from django.utils import timezone
@@ -167,8 +167,14 @@ class PayoutRequestSerializer(serializers.Serializer):
                 "Payout amount must be greater than zero."
             )
             
-        # In a real implementation, you would check if the user has enough balance
-        # For this implementation, we'll just validate that it's positive
+        # Early answer from the balance snapshot; the payout itself is
+        # checked again under the balance lock
+        balance = ProviderBalance.objects.filter(provider=self.context['request'].user).first()
+        available = balance.available if balance else 0
+        if value > available:
+            raise serializers.ValidationError(
+                f"Payout amount exceeds your available balance of {available}."
+            )
         return value
 
 class EarningsSummarySerializer(serializers.Serializer):
@@ -178,3 +184,15 @@ class EarningsSummarySerializer(serializers.Serializer):
     available_for_payout = serializers.DecimalField(max_digits=10, decimal_places=2)
     completed_payouts = serializers.DecimalField(max_digits=10, decimal_places=2)
     pending_payouts = serializers.DecimalField(max_digits=10, decimal_places=2)
+    platform_fees = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+class LedgerEntrySerializer(serializers.ModelSerializer):
+    """Serializer for a provider's ledger statement lines"""
+    
+    class Meta:
+        model = LedgerEntry
+        fields = [
+            'id', 'posting_id', 'account', 'kind', 'amount', 'currency',
+            'balance_after', 'payment', 'payout', 'created_at'
+        ]
+        read_only_fields = fields
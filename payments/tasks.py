@@ -0,0 +1,26 @@
+"""
+Background jobs for payments.
+"""
+from celery import shared_task
+
+from .idempotency import prune_idempotency_keys
+from .payouts import process_payouts
+from .webhooks import process_webhook_events
+
+
+@shared_task(name='payments.process_payouts', ignore_result=True)
+def process_pending_payouts():
+    """Send eligible payouts to the payout gateway in batches"""
+    return process_payouts()
+
+
+@shared_task(name='payments.prune_idempotency_keys', ignore_result=True)
+def prune_expired_idempotency_keys():
+    """Forget stored responses past IDEMPOTENCY_KEY_TTL_HOURS"""
+    return prune_idempotency_keys()
+
+
+@shared_task(name='payments.process_webhook_events', ignore_result=True)
+def process_webhook_events_task():
+    """Apply pending gateway webhook events from the inbox"""
+    return process_webhook_events()
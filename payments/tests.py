@@ -1,3 +1,338 @@
-from django.test import TestCase
+import json
+from datetime import time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db.models import Sum
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from bookings.models import Booking
+from notifications.models import Notification
+from services.models import Service, ServiceCategory
+
+from .confirmation import confirm_payment
+from .gateways import FakePayoutGateway, PayoutGateway, PayoutGatewayError
+from .ledger import reserve_payout
+from .models import (
+    IdempotencyKey, LedgerEntry, Payment, PaymentGatewayAccount, Payout, ProviderBalance, WebhookEvent
+)
+from .payouts import process_payouts
+from .webhooks import build_fake_event, process_webhook_events, sign_payload
+
+User = get_user_model()
+
+
+class UnavailablePayoutGateway(PayoutGateway):
+    """Gateway that never accepts a batch"""
+
+    def submit_batch(self, account, payouts):
+        raise PayoutGatewayError("Service unavailable")
+
+
+class LedgerFixtureMixin:
+    """Shared fixtures: a provider with a 1000 payment (100 fee) and a verified payout account"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='ledgercustomer', email='ledgercustomer@test.com', user_type='customer')
+        self.provider = User.objects.create_user(username='ledgerprovider', email='ledgerprovider@test.com', user_type='provider')
+        category = ServiceCategory.objects.create(name='Gardening', description='Gardens')
+        service = Service.objects.create(
+            provider=self.provider, name='Lawn care', description='Mowing', category=category,
+            hourly_rate=Decimal('1000'), location='Pune', status='active',
+        )
+        self.booking = Booking.objects.create(
+            service=service, customer=self.customer, provider=self.provider,
+            booking_date=timezone.localdate() + timedelta(days=3), start_time=time(10), end_time=time(11),
+            amount=Decimal('1000'),
+        )
+        self.payment = Payment.objects.create(
+            user=self.customer, booking=self.booking, payer=self.customer, payee=self.provider,
+            amount=Decimal('1000'), payment_method='upi', platform_fee=Decimal('100'),
+        )
+        self.account = PaymentGatewayAccount.objects.create(
+            user=self.provider, account_type='bank', account_id='acct-1', is_verified=True,
+        )
+        self.client.force_authenticate(user=self.provider)
+
+    def balance(self):
+        return ProviderBalance.objects.get(provider=self.provider)
+
+
+class EarningsLedgerTestCase(LedgerFixtureMixin, APITestCase):
+    """Test cases for the double-entry earnings ledger and provider balances"""
+
+    def test_completed_payment_posts_balanced_entries_once(self):
+        """Completion posts the payment and fee; saving again posts nothing"""
+        self.assertFalse(LedgerEntry.objects.exists())
+        self.payment.mark_as_completed('txn-1')
+        self.payment.save()
+
+        self.assertEqual(LedgerEntry.objects.count(), 4)
+        for posting in LedgerEntry.objects.values('posting_id').annotate(total=Sum('amount')):
+            self.assertEqual(posting['total'], 0)
+        balance = self.balance()
+        self.assertEqual(
+            (balance.total_earnings, balance.platform_fees, balance.available),
+            (Decimal('1000'), Decimal('100'), Decimal('900')),
+        )
+
+    def test_refund_reverses_payment_and_fee(self):
+        """A refund takes the payment back out and returns the fee"""
+        self.payment.mark_as_completed()
+        self.payment.refund(reason='Cancelled')
+        balance = self.balance()
+        self.assertEqual((balance.total_earnings, balance.platform_fees, balance.available), (0, 0, 0))
+        self.assertEqual(LedgerEntry.objects.filter(payment=self.payment).count(), 8)
+
+    def test_payout_reserves_balance(self):
+        """Payout requests are checked against the balance and move it to pending payouts"""
+        self.payment.mark_as_completed()
+        url = reverse('payout-request-payout')
+        response = self.client.post(url, {'payment_account_id': str(self.account.id), 'amount': '901.00'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(url, {'payment_account_id': str(self.account.id), 'amount': '600.00'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        balance = self.balance()
+        self.assertEqual((balance.available, balance.pending_payouts), (Decimal('300'), Decimal('600')))
+
+        payout = self.provider.payouts.get()
+        payout.status = 'completed'
+        payout.save()
+        balance = self.balance()
+        self.assertEqual((balance.pending_payouts, balance.paid_out), (0, Decimal('600')))
+
+    def test_failed_payout_returns_funds(self):
+        """A failed payout puts its amount back into the available balance"""
+        self.payment.mark_as_completed()
+        response = self.client.post(
+            reverse('payout-request-payout'), {'payment_account_id': str(self.account.id), 'amount': '900.00'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        payout = self.provider.payouts.get()
+        payout.status = 'failed'
+        payout.save()
+        self.assertEqual(self.balance().available, Decimal('900'))
+
+    def test_earnings_is_a_single_row_read(self):
+        """The earnings summary reads only the balance row"""
+        self.payment.mark_as_completed()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.booking.confirm()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('payout-earnings'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_earnings'], '1000.00')
+        self.assertEqual(response.data['available_for_payout'], '900.00')
+        self.assertEqual(response.data['pending_earnings'], '1000.00')
+        self.assertEqual(response.data['platform_fees'], '100.00')
+
+    def test_ledger_statement_is_cursor_paginated(self):
+        """The statement lists the provider's own legs newest first with running balances"""
+        self.payment.mark_as_completed()
+        response = self.client.get(reverse('payout-ledger'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(entry['kind'], entry['balance_after']) for entry in response.data['results']],
+            [('platform_fee', '900.00'), ('payment', '1000.00')],
+        )
+        self.assertIsNone(response.data['next'])
+
+
+@override_settings(PAYOUT_GATEWAY_BACKEND='payments.gateways.FakePayoutGateway', PAYOUT_GATEWAY_BATCH_SIZE=2)
+class PayoutBatchTestCase(LedgerFixtureMixin, APITestCase):
+    """Test cases for nightly batch payout processing"""
+
+    def setUp(self):
+        super().setUp()
+        self.payment.mark_as_completed()
+        self.payouts = [
+            reserve_payout(self.provider.id, Decimal('100'), payment_account=self.account, transaction_fee=0)
+            for _ in range(5)
+        ]
+        unverified = PaymentGatewayAccount.objects.create(user=self.provider, account_type='paypal', account_id='pp-1')
+        self.held = reserve_payout(self.provider.id, Decimal('50'), payment_account=unverified, transaction_fee=0)
+
+    def test_payouts_sent_in_batches_per_account(self):
+        """Eligible payouts go out in gateway-sized chunks and settle in the ledger"""
+        gateway = FakePayoutGateway()
+        self.assertEqual(process_payouts(gateway=gateway), {'completed': 5, 'failed': 0, 'retrying': 0})
+        self.assertEqual([len(ids) for _, ids in gateway.batches], [2, 2, 1])
+
+        payout = Payout.objects.get(pk=self.payouts[0].pk)
+        self.assertEqual((payout.status, payout.transaction_id), ('completed', f"fake_txn_{payout.id}"))
+        self.assertIsNotNone(payout.processed_at)
+        self.assertEqual(Payout.objects.get(pk=self.held.pk).status, 'pending')
+
+        balance = self.balance()
+        self.assertEqual(
+            (balance.available, balance.pending_payouts, balance.paid_out),
+            (Decimal('350'), Decimal('50'), Decimal('500')),
+        )
+        self.assertEqual(LedgerEntry.objects.filter(kind='payout_completed').count(), 10)
+        # Nothing left to do
+        self.assertEqual(process_payouts()['completed'], 0)
+
+    def test_rejected_payouts_return_funds(self):
+        """Payouts the gateway rejects fail and go back to the available balance"""
+        self.account.account_details = {'fail_payouts': True}
+        self.account.save()
+        self.assertEqual(process_payouts()['failed'], 5)
+        self.assertEqual(self.balance().available, Decimal('850'))
+        self.assertEqual(Payout.objects.filter(status='failed').count(), 5)
+
+    @override_settings(PAYOUT_GATEWAY_BACKEND='payments.tests.UnavailablePayoutGateway')
+    def test_unaccepted_batches_are_retried_later(self):
+        """Batches the gateway can't take are released back to pending once, not looped on"""
+        self.assertEqual(process_payouts(), {'completed': 0, 'failed': 0, 'retrying': 5})
+        self.assertEqual(Payout.objects.filter(status='pending').count(), 6)
+        self.assertEqual(self.balance().pending_payouts, Decimal('550'))
+
+
+class IdempotencyKeyTestCase(LedgerFixtureMixin, APITestCase):
+    """Test cases for Idempotency-Key replay on mutating endpoints"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=self.customer)
+        self.url = reverse('payment-confirm')
+        self.data = {'payment_id': str(self.payment.id), 'transaction_id': 'txn-1'}
+
+    def test_retried_confirmation_is_replayed(self):
+        """A retry gets the first response back without notifying or posting again"""
+        first = self.client.post(self.url, self.data, HTTP_IDEMPOTENCY_KEY='confirm-1')
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        notifications = Notification.objects.count()
+        entries = LedgerEntry.objects.count()
+
+        with self.assertNumQueries(1):
+            retry = self.client.post(self.url, self.data, HTTP_IDEMPOTENCY_KEY='confirm-1')
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['message'], first.data['message'])
+        self.assertEqual(Notification.objects.count(), notifications)
+        self.assertEqual(LedgerEntry.objects.count(), entries)
+
+    def test_key_bound_to_request(self):
+        """Reusing a key for a different body is refused"""
+        self.client.post(self.url, self.data, HTTP_IDEMPOTENCY_KEY='confirm-1')
+        response = self.client.post(
+            self.url, {**self.data, 'transaction_id': 'txn-2'}, HTTP_IDEMPOTENCY_KEY='confirm-1'
+        )
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_concurrent_duplicate_conflicts(self):
+        """A key whose first request hasn't answered yet gets a 409"""
+        IdempotencyKey.objects.create(user=self.customer, key='confirm-1', request_hash='pending')
+        response = self.client.post(self.url, self.data, HTTP_IDEMPOTENCY_KEY='confirm-1')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+
+    def test_booking_cancel_is_replayed(self):
+        """Booking endpoints replay too"""
+        url = reverse('booking-cancel', args=[self.booking.id])
+        self.assertEqual(self.client.post(url, HTTP_IDEMPOTENCY_KEY='cancel-1').status_code, status.HTTP_200_OK)
+        notifications = Notification.objects.count()
+        retry = self.client.post(url, HTTP_IDEMPOTENCY_KEY='cancel-1')
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Notification.objects.count(), notifications)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test', PAYMENT_WEBHOOK_SCHEDULE_DELAY=0, PAYMENT_WEBHOOK_MAX_ATTEMPTS=2)
+class WebhookInboxTestCase(LedgerFixtureMixin, APITestCase):
+    """Test cases for gateway webhook ingestion and background processing"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(user=None)
+        self.url = reverse('stripe-webhook')
+
+    def deliver(self, event, secret='whsec_test'):
+        payload = json.dumps(event)
+        return self.client.generic(
+            'POST', self.url, payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=sign_payload(payload, secret),
+        )
+
+    def test_event_is_stored_once_and_applied_later(self):
+        """Delivery only stores the event; redeliveries are dropped; the worker completes the payment"""
+        event = build_fake_event('payment_intent.succeeded', self.payment)
+        for _ in range(2):
+            response = self.deliver(event)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(WebhookEvent.objects.filter(status='pending').count(), 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+
+        self.assertEqual(process_webhook_events(), {'processed': 1, 'ignored': 0, 'failed': 0, 'retrying': 0})
+        self.payment.refresh_from_db()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.payment.transaction_id, event['data']['object']['latest_charge'])
+        self.assertEqual(self.booking.status, 'confirmed')
+        self.assertEqual(self.balance().available, Decimal('900'))
+
+    def test_bad_signature_is_refused(self):
+        """Events not signed with our secret are not stored"""
+        response = self.deliver(build_fake_event('payment_intent.succeeded', self.payment), secret='whsec_other')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_delivery_queues_processing(self):
+        """Once the event is stored a processing run is queued"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deliver(build_fake_event('payment_intent.succeeded', self.payment))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+
+    def test_events_applied_in_gateway_order(self):
+        """A refund delivered before its payment's success is still applied after it"""
+        created = timezone.now().timestamp()
+        self.deliver(build_fake_event('charge.refunded', self.payment, created=created + 10))
+        self.deliver(build_fake_event('payment_intent.succeeded', self.payment, created=created))
+        self.deliver(build_fake_event('customer.created', self.payment))
+
+        self.assertEqual(process_webhook_events()['processed'], 2)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'refunded')
+        self.assertEqual(WebhookEvent.objects.get(event_type='customer.created').status, 'ignored')
+
+    def test_success_after_refund_keeps_refund(self):
+        """A late success event or confirmation doesn't complete a refunded payment again"""
+        self.payment.mark_as_completed()
+        self.payment.refund(reason='Customer cancelled')
+        self.deliver(build_fake_event('payment_intent.succeeded', self.payment))
+        self.assertEqual(process_webhook_events()['ignored'], 1)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'refunded')
+
+        # What the confirm endpoint runs once it holds the row lock
+        self.assertFalse(confirm_payment(self.payment, 'txn-late'))
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.transaction_id == 'txn-late'), ('refunded', False))
+
+    def test_failed_batches_are_retried_and_replayable(self):
+        """A failing event holds back its payment's batch until it gives up; replay applies it again"""
+        self.deliver(build_fake_event('payment_intent.succeeded', self.payment))
+        failing = mock.Mock(side_effect=RuntimeError('boom'))
+        with mock.patch.dict('payments.webhooks.HANDLERS', {'payment_intent.succeeded': failing}):
+            self.assertEqual(process_webhook_events()['retrying'], 1)
+            self.assertEqual(process_webhook_events()['failed'], 1)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts, event.last_error), ('failed', 2, 'boom'))
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+
+        call_command('replay_webhook_events', stdout=mock.Mock())
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(WebhookEvent.objects.get().status, 'processed')
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PaymentViewSet, PaymentGatewayAccountViewSet, PayoutViewSet
+from .views import PaymentViewSet, PaymentGatewayAccountViewSet, PayoutViewSet, StripeWebhookView
 
 router = DefaultRouter()
 router.register(r'payments', PaymentViewSet, basename='payment')
@@ -8,5 +8,6 @@ router.register(r'accounts', PaymentGatewayAccountViewSet, basename='payment-acc
 router.register(r'payouts', PayoutViewSet, basename='payout')
 
 urlpatterns = [
+    path('webhooks/stripe/', StripeWebhookView.as_view(), name='stripe-webhook'),
     path('', include(router.urls)),
 ]
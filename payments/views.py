@@ -1,12 +1,14 @@
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.pagination import CursorPagination
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Sum
+from django.db.models import Q
 from django.utils import timezone
 from django.db import transaction
 
-from .models import Payment, PaymentGatewayAccount, Payout
+from .models import Payment, PaymentGatewayAccount, Payout, ProviderBalance
 from .serializers import (
     PaymentListSerializer,
     PaymentDetailSerializer,
@@ -16,12 +18,22 @@ from .serializers import (
     PayoutListSerializer,
     PayoutDetailSerializer,
     PayoutRequestSerializer,
-    EarningsSummarySerializer
+    EarningsSummarySerializer,
+    LedgerEntrySerializer
 )
+from .confirmation import confirm_payment
+from .idempotency import idempotent
+from .ledger import InsufficientBalance, provider_statement, reserve_payout
 from .permissions import IsPaymentParticipant, IsPaymentPayer, IsPayoutProvider
+from .webhooks import InvalidWebhook, WebhookNotConfigured, receive_stripe_event
 from bookings.models import Booking
 from decimal import Decimal
 
+class LedgerPagination(CursorPagination):
+    """Stable pages over the append-only ledger without counting it"""
+    ordering = '-id'
+    page_size = 50
+
 class PaymentViewSet(viewsets.ModelViewSet):
     """
     ViewSet for payments - allows listing, retrieving, and managing payments.
@@ -67,6 +79,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
         return [permissions.IsAuthenticated()]
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def initiate(self, request):
         """
         Initiate a payment for a booking.
@@ -100,7 +113,9 @@ class PaymentViewSet(viewsets.ModelViewSet):
                 'client_secret': f"pi_mock_{payment.id}_secret",
                 'amount': float(payment.amount),
                 'currency': 'usd',
-                'status': 'requires_payment_method'
+                'status': 'requires_payment_method',
+                # Gateway webhooks find the payment through this
+                'metadata': {'payment_id': str(payment.id)}
             }
             
             return Response({
@@ -112,54 +127,40 @@ class PaymentViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['post'])
+    @idempotent
     def confirm(self, request):
         """
         Confirm a payment after the user completes the action on the frontend.
         This will update the Payment status and the associated Booking status.
+        
+        The payment row is locked while confirming, so a duplicate request
+        waits for the first one and then answers without repeating the
+        booking update or the notifications.
         """
         serializer = self.get_serializer(data=request.data)
         
         if serializer.is_valid():
             payment_id = serializer.validated_data['payment_id']
-            payment = Payment.objects.get(id=payment_id)
             
             # In a real implementation, you would verify the payment with the payment gateway
             # and update the payment status accordingly
             
             # For this example, we'll just update the payment status to 'completed'
             with transaction.atomic():
-                # Update payment status
-                payment.status = 'completed'
-                payment.transaction_id = serializer.validated_data.get('transaction_id', f"txn_mock_{payment.id}")
-                payment.save()
-                
-                # Update booking status to 'confirmed' if it's pending
+                payment = Payment.objects.select_for_update().get(id=payment_id)
                 booking = payment.booking
-                if booking.status == 'pending':
-                    booking.status = 'confirmed'
-                    booking.save()
-                
-                # Create a notification for the provider about the payment
-                from notifications.utils import send_notification
-                provider = booking.provider
-                send_notification(
-                    recipient=provider,
-                    notification_type='payment_received',
-                    title='Payment Received',
-                    message=f'You received a payment of {payment.amount} for booking {booking.service.title}',
-                    content_object=payment,
-                    action_url=f'/provider/bookings/{booking.id}/'
-                )
-                
-                # Also notify the customer about the confirmed booking
-                send_notification(
-                    recipient=booking.customer,
-                    notification_type='booking_status_updated',
-                    title='Booking Confirmed',
-                    message=f'Your booking for {booking.service.title} has been confirmed',
-                    content_object=booking,
-                    action_url=f'/bookings/{booking.id}/'
+                confirmed = confirm_payment(
+                    payment, serializer.validated_data.get('transaction_id', f"txn_mock_{payment.id}")
                 )
+                if not confirmed:
+                    already = payment.status == 'completed'
+                    return Response({
+                        'payment_id': payment.id,
+                        'status': payment.status,
+                        'booking_id': booking.id,
+                        'booking_status': booking.status,
+                        'message': "Payment already confirmed." if already else f"Payment is {payment.status} and can't be confirmed."
+                    }, status=status.HTTP_200_OK if already else status.HTTP_409_CONFLICT)
             
             return Response({
                 'payment_id': payment.id,
@@ -241,6 +242,7 @@ class PayoutViewSet(viewsets.ModelViewSet):
         return [permissions.IsAuthenticated()]
     
     @action(detail=False, methods=['post'], url_path='request')
+    @idempotent
     def request_payout(self, request):
         """
         Request a payout of available earnings.
@@ -259,15 +261,17 @@ class PayoutViewSet(viewsets.ModelViewSet):
             transaction_fee = Decimal(amount) * Decimal('0.02')
             net_amount = amount - transaction_fee
             
-            # Create a pending payout
-            payout = Payout.objects.create(
-                provider=request.user,
-                payment_account=account,
-                amount=amount,
-                transaction_fee=transaction_fee,
-                net_amount=net_amount,
-                status='pending'
-            )
+            # Create a pending payout, reserving the amount in the ledger
+            try:
+                payout = reserve_payout(
+                    request.user.id,
+                    amount,
+                    payment_account=account,
+                    transaction_fee=transaction_fee,
+                    net_amount=net_amount
+                )
+            except InsufficientBalance as e:
+                return Response({"amount": [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
             
             # In a real implementation, you would now communicate with a payment gateway
             # to initiate the payout process
@@ -310,50 +314,56 @@ class PayoutViewSet(viewsets.ModelViewSet):
     def earnings(self, request):
         """
         Get a summary of the provider's earnings and payout history.
-        """
-        user = request.user
-        
-        # Get completed payments where user is the payee
-        completed_payments = Payment.objects.filter(
-            payee=user,
-            status='completed'
-        )
-        
-        # Calculate total earnings
-        total_earnings = completed_payments.aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-        
-        # Calculate pending earnings (from bookings that are not yet completed)
-        pending_bookings = Booking.objects.filter(
-            provider=user,
-            status__in=['confirmed', 'in_progress']
-        )
-        pending_earnings = pending_bookings.aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-        
-        # Calculate completed payouts
-        completed_payouts = Payout.objects.filter(
-            provider=user,
-            status='completed'
-        )
-        completed_payout_amount = completed_payouts.aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
         
-        # Calculate pending payouts
-        pending_payouts = Payout.objects.filter(
-            provider=user,
-            status__in=['pending', 'processing']
-        )
-        pending_payout_amount = pending_payouts.aggregate(Sum('amount'))['amount__sum'] or Decimal('0.00')
-        
-        # Calculate available for payout
-        available_for_payout = total_earnings - completed_payout_amount - pending_payout_amount
+        Read from the provider's running balance, which the ledger keeps up
+        to date as payments and payouts change.
+        """
+        balance = ProviderBalance.objects.filter(provider=request.user).first() or ProviderBalance()
         
         # Serialize the data
-        serializer = EarningsSummarySerializer(data={
-            'total_earnings': total_earnings,
-            'pending_earnings': pending_earnings,
-            'available_for_payout': available_for_payout,
-            'completed_payouts': completed_payout_amount,
-            'pending_payouts': pending_payout_amount
+        serializer = EarningsSummarySerializer({
+            'total_earnings': balance.total_earnings,
+            'pending_earnings': balance.pending_earnings,
+            'available_for_payout': balance.available,
+            'completed_payouts': balance.paid_out,
+            'pending_payouts': balance.pending_payouts,
+            'platform_fees': balance.platform_fees
         })
-        serializer.is_valid()
         
         return Response(serializer.data, status=status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'])
+    def ledger(self, request):
+        """
+        Get the provider's ledger statement, newest first, with cursor pagination.
+        """
+        queryset = provider_statement(request.user.id)
+        kind = request.query_params.get('kind')
+        if kind:
+            queryset = queryset.filter(kind=kind)
+        
+        paginator = LedgerPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = LedgerEntrySerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+class StripeWebhookView(APIView):
+    """
+    Receives Stripe webhook events.
+    
+    Events are only verified and stored here; they are applied to payments in
+    the background, so the gateway gets its answer straight away. Not
+    throttled, since the gateway delivers in bursts and retries what we refuse.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    throttle_classes = []
+    
+    def post(self, request):
+        try:
+            receive_stripe_event(request.body, request.headers.get('Stripe-Signature'))
+        except WebhookNotConfigured as e:
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except InvalidWebhook as e:
+            return Response({"error": f"Invalid webhook: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"received": True}, status=status.HTTP_200_OK)
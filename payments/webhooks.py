@@ -0,0 +1,282 @@
+"""
+Payment gateway webhook ingestion.
+
+The webhook endpoint only verifies the ``Stripe-Signature`` header and
+inserts the event into the ``WebhookEvent`` inbox (``ON CONFLICT DO
+NOTHING`` on the event ID, so redeliveries are no-ops), then answers. A burst
+from the gateway costs each web worker one insert per event.
+
+Events are applied by the ``payments.process_webhook_events`` task. It takes
+the pending events of one payment at a time, locks the payment row so the
+``confirm`` endpoint and other workers wait, and applies them in the order the
+gateway created them. If one event of a payment fails, none of that payment's
+batch is applied and the whole batch is retried later, so a payment never
+sees its events out of order. Handlers check the payment's status first, so
+applying an event again is harmless.
+
+Scheduling is debounced: at most one run is queued per
+``PAYMENT_WEBHOOK_SCHEDULE_DELAY`` seconds, and it runs once that window has
+closed, so it picks up every event received in it. A periodic run catches
+anything a lost task left behind.
+"""
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .confirmation import confirm_payment
+from .models import Payment, WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_CACHE_KEY = 'payments:webhook_processing_scheduled'
+
+
+def get_stripe_webhook_secret():
+    return getattr(settings, 'STRIPE_WEBHOOK_SECRET', '')
+
+
+def get_signature_tolerance():
+    return getattr(settings, 'STRIPE_WEBHOOK_TOLERANCE', 300)
+
+
+def get_batch_size():
+    return getattr(settings, 'PAYMENT_WEBHOOK_BATCH_SIZE', 200)
+
+
+def get_max_attempts():
+    return getattr(settings, 'PAYMENT_WEBHOOK_MAX_ATTEMPTS', 5)
+
+
+def get_schedule_delay():
+    return getattr(settings, 'PAYMENT_WEBHOOK_SCHEDULE_DELAY', 2)
+
+
+class WebhookNotConfigured(Exception):
+    """Raised when no webhook signing secret is set."""
+    pass
+
+
+class InvalidWebhook(Exception):
+    """Raised for webhook requests with a bad signature or body."""
+    pass
+
+
+def _payment_succeeded(payment, event_object):
+    return confirm_payment(payment, event_object.get('latest_charge') or event_object.get('id'))
+
+
+def _payment_failed(payment, event_object):
+    error = (event_object.get('last_payment_error') or {}).get('message')
+    return payment.mark_as_failed(error or 'Payment failed at the payment gateway')
+
+
+def _charge_refunded(payment, event_object):
+    return payment.refund(reason='Refunded at the payment gateway', refund_transaction_id=event_object.get('id'))
+
+
+# Event type -> handler(payment, event object); a handler returns False if
+# the event no longer applies to the payment's status
+HANDLERS = {
+    'payment_intent.succeeded': _payment_succeeded,
+    'payment_intent.payment_failed': _payment_failed,
+    'charge.refunded': _charge_refunded,
+}
+
+
+def payment_ref(event):
+    """The ``Payment`` ID an event carries in its object's metadata, if any"""
+    event_object = (event.get('data') or {}).get('object') or {}
+    try:
+        return uuid.UUID(str((event_object.get('metadata') or {}).get('payment_id')))
+    except ValueError:
+        return None
+
+
+def receive_stripe_event(payload, signature):
+    """
+    Verify a Stripe webhook request and add its event to the inbox.
+
+    Raises:
+        WebhookNotConfigured: If ``STRIPE_WEBHOOK_SECRET`` is not set
+        InvalidWebhook: If the signature or the body is not valid
+    """
+    secret = get_stripe_webhook_secret()
+    if not secret:
+        raise WebhookNotConfigured("STRIPE_WEBHOOK_SECRET is not configured")
+    try:
+        payload = payload.decode('utf-8')
+        stripe.WebhookSignature.verify_header(payload, signature, secret, get_signature_tolerance())
+        event = json.loads(payload)
+        return store_event(event, provider='stripe')
+    except (UnicodeDecodeError, ValueError, KeyError, TypeError, stripe.SignatureVerificationError) as e:
+        raise InvalidWebhook(str(e)) from e
+
+
+def store_event(event, provider='stripe'):
+    """
+    Insert ``event`` into the inbox unless it is already there.
+
+    Events no handler applies to are stored as ``ignored``. Returns the
+    unsaved ``WebhookEvent`` that was offered to the inbox.
+    """
+    ref = payment_ref(event)
+    record = WebhookEvent(
+        provider=provider,
+        event_id=event['id'],
+        event_type=event['type'],
+        payment_ref=ref,
+        occurred_at=datetime.fromtimestamp(int(event['created']), tz=dt_timezone.utc),
+        payload=event,
+    )
+    if ref is None or record.event_type not in HANDLERS:
+        record.status = 'ignored'
+        record.processed_at = timezone.now()
+    WebhookEvent.objects.bulk_create([record], ignore_conflicts=True)
+    if record.status == 'pending':
+        schedule_processing()
+    return record
+
+
+def schedule_processing():
+    """Queue a processing run for the end of the current scheduling window"""
+    from .tasks import process_webhook_events_task
+
+    delay = get_schedule_delay()
+    if delay and not cache.add(SCHEDULE_CACHE_KEY, True, timeout=delay):
+        return
+    transaction.on_commit(lambda: process_webhook_events_task.apply_async(countdown=delay))
+
+
+def pending_payment_refs(limit, exclude=()):
+    """Payments with pending events, those waiting longest first"""
+    return list(
+        WebhookEvent.objects.filter(status='pending')
+        .exclude(payment_ref__in=exclude)
+        .values('payment_ref')
+        .annotate(first_id=Min('id'))
+        .order_by('first_id')
+        .values_list('payment_ref', flat=True)[:limit]
+    )
+
+
+def process_payment_events(ref):
+    """
+    Apply the pending events of one payment in gateway order.
+
+    Returns:
+        dict: Number of events processed, ignored, failed and left for retry
+    """
+    counts = {'processed': 0, 'ignored': 0, 'failed': 0, 'retrying': 0}
+    with transaction.atomic():
+        payment = Payment.objects.select_for_update().filter(pk=ref).first()
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(payment_ref=ref, status='pending')
+            .order_by('occurred_at', 'id')
+        )
+        if not events:
+            return counts
+
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                for event in events:
+                    if payment is None:
+                        event.status, event.last_error = 'ignored', 'Unknown payment'
+                    else:
+                        applied = HANDLERS[event.event_type](payment, event.payload['data']['object'])
+                        event.status = 'processed' if applied else 'ignored'
+                    event.processed_at = now
+        except Exception as e:
+            logger.warning(f"🪝 Webhook events for payment {ref} failed, retrying later: {e}")
+            for event in events:
+                event.attempts += 1
+                event.last_error = str(e)
+                event.processed_at = None
+                event.status = 'failed' if event.attempts >= get_max_attempts() else 'pending'
+        else:
+            for event in events:
+                event.attempts += 1
+
+        WebhookEvent.objects.bulk_update(events, ['status', 'attempts', 'last_error', 'processed_at'])
+
+    for event in events:
+        counts['retrying' if event.status == 'pending' else event.status] += 1
+    return counts
+
+
+def process_webhook_events(limit=None):
+    """
+    Apply pending events until none are left or ``limit`` payments were handled.
+
+    Payments whose batch failed are not retried within the same run.
+
+    Returns:
+        dict: Number of events processed, ignored, failed and left for retry
+    """
+    totals = {'processed': 0, 'ignored': 0, 'failed': 0, 'retrying': 0}
+    attempted = []
+    while limit is None or len(attempted) < limit:
+        batch_size = get_batch_size() if limit is None else min(get_batch_size(), limit - len(attempted))
+        refs = pending_payment_refs(batch_size, exclude=attempted)
+        if not refs:
+            break
+        for ref in refs:
+            counts = process_payment_events(ref)
+            for key, value in counts.items():
+                totals[key] += value
+        attempted += refs
+
+    if any(totals.values()):
+        logger.info(
+            f"🪝 Processed webhook events: {totals['processed']} applied, {totals['ignored']} ignored, "
+            f"{totals['failed']} failed, {totals['retrying']} left for retry"
+        )
+    return totals
+
+
+def replay_events(queryset):
+    """Put already handled events back in the queue; returns how many were reset"""
+    return queryset.exclude(payment_ref=None).update(status='pending', attempts=0, last_error='', processed_at=None)
+
+
+def build_fake_event(event_type, payment, created=None, **fields):
+    """A Stripe-shaped event about ``payment``, for local testing"""
+    event_object = {
+        'id': f"pi_fake_{payment.id.hex[:16]}",
+        'object': 'payment_intent',
+        'amount': int(payment.amount * 100),
+        'currency': payment.currency.lower(),
+        'metadata': {'payment_id': str(payment.id)},
+    }
+    if event_type == 'payment_intent.succeeded':
+        event_object['latest_charge'] = f"ch_fake_{uuid.uuid4().hex[:16]}"
+    elif event_type == 'payment_intent.payment_failed':
+        event_object['last_payment_error'] = {'message': 'Your card was declined.'}
+    elif event_type == 'charge.refunded':
+        event_object.update(id=f"ch_fake_{uuid.uuid4().hex[:16]}", object='charge', refunded=True)
+    event_object.update(fields)
+    return {
+        'id': f"evt_fake_{uuid.uuid4().hex}",
+        'object': 'event',
+        'type': event_type,
+        'created': int(created if created is not None else time.time()),
+        'livemode': False,
+        'data': {'object': event_object},
+    }
+
+
+def sign_payload(payload, secret=None, timestamp=None):
+    """The ``Stripe-Signature`` header value for ``payload``"""
+    return stripe.WebhookSignature.generate_signature_header(
+        payload, secret or get_stripe_webhook_secret(), timestamp=timestamp
+    )
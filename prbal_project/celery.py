@@ -5,6 +5,7 @@ payment processing, email notifications, and AI suggestions.
 """
 import os
 from celery import Celery
+from celery.schedules import crontab
 from celery.signals import task_failure
 import logging
 
@@ -38,6 +39,7 @@ app.conf.task_queues = {
     'notifications': {},
     'ai_suggestions': {},
     'verification': {},
+    'media': {},
 }
 
 # Route tasks to specific queues based on their name
@@ -46,6 +48,53 @@ app.conf.task_routes = {
     'notifications.*': {'queue': 'notifications'},
     'ai_suggestions.*': {'queue': 'ai_suggestions'},
     'verification.*': {'queue': 'verification'},
+    'uploads.*': {'queue': 'media'},
+}
+
+# Periodic maintenance (run by celery beat)
+app.conf.beat_schedule = {
+    'purge-unreferenced-blobs': {
+        'task': 'uploads.purge_unreferenced_blobs',
+        'schedule': 60 * 60,  # hourly
+    },
+    'cleanup-expired-uploads': {
+        'task': 'uploads.cleanup_expired_uploads',
+        'schedule': 60 * 60,  # hourly
+    },
+    'reconcile-unread-notification-counters': {
+        'task': 'notifications.reconcile_unread_counters',
+        'schedule': 60 * 60 * 24,  # daily
+    },
+    'prune-notifications': {
+        'task': 'notifications.prune_notifications',
+        'schedule': 60 * 60 * 6,  # every 6 hours
+    },
+    'prune-messages': {
+        'task': 'messagings.prune_messages',
+        'schedule': 60 * 60 * 24,  # daily
+    },
+    'rebuild-price-distributions': {
+        'task': 'ai_suggestions.rebuild_price_distributions',
+        'schedule': 60 * 60,  # hourly
+    },
+    'process-payouts': {
+        'task': 'payments.process_payouts',
+        'schedule': crontab(hour=2, minute=0),  # nightly
+    },
+    'process-webhook-events': {
+        # Picks up events whose scheduled run was lost or that are due a retry
+        'task': 'payments.process_webhook_events',
+        'schedule': 60,  # every minute
+    },
+    'prune-idempotency-keys': {
+        'task': 'payments.prune_idempotency_keys',
+        'schedule': 60 * 60 * 6,  # every 6 hours
+    },
+    'sync-calendars': {
+        # Picks up retries and expired leases if a scheduled run was lost
+        'task': 'bookings.sync_calendars',
+        'schedule': 60 * 5,  # every 5 minutes
+    },
 }
 
 # Serialization
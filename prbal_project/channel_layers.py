@@ -0,0 +1,372 @@
+"""
+Cross-process channel layer for single-host deployments.
+
+``InMemoryChannelLayer`` only delivers to sockets owned by the same process,
+so a notification sent from a gunicorn worker or Celery task never reaches
+the daphne process holding the WebSocket. ``SQLiteChannelLayer`` keeps
+messages and group memberships in a shared SQLite file (WAL mode) instead,
+which every process on the host can open without running another service.
+
+Delivery follows channels_redis: each process owns one ``specific.<id>!``
+prefix, a single poller per process drains every message addressed to that
+prefix in one query and fans them out to local queues. Senders nudge the
+receiving process through a Unix datagram socket next to the database, so
+delivery doesn't wait for the next poll; without Unix sockets (Windows) the
+poll interval bounds latency. Messages for the sender's own process skip the
+database entirely.
+
+Messages must be JSON-serializable. Use channels_redis (``CHANNEL_REDIS_URL``)
+once chat spans more than one host.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    prefix TEXT NOT NULL,
+    body TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channel_messages_prefix ON channel_messages (prefix, id);
+CREATE INDEX IF NOT EXISTS channel_messages_channel ON channel_messages (channel, id);
+CREATE TABLE IF NOT EXISTS channel_groups (
+    name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (name, channel)
+);
+"""
+
+# sockaddr_un paths are limited to 108 bytes on Linux (104 on macOS)
+MAX_SOCKET_PATH = 100
+
+
+class _WakeupProtocol(asyncio.DatagramProtocol):
+    def __init__(self, event):
+        self.event = event
+
+    def datagram_received(self, data, addr):
+        self.event.set()
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    """
+    Channel layer shared by all processes that open the same SQLite file.
+
+    Args:
+        path: Database file; every process must use the same path
+        expiry: Seconds an undelivered message is kept
+        group_expiry: Seconds a group membership lasts without being renewed
+        capacity: Default per-channel backlog before sends are rejected
+        channel_capacity: Per-channel overrides, as in the built-in layers
+        poll_interval: Fallback poll period when no wakeup arrives
+        wakeup: Use Unix datagram sockets to wake receivers immediately
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path='channel_layer.sqlite3', expiry=60, group_expiry=86400, capacity=100,
+                 channel_capacity=None, poll_interval=0.5, wakeup=True, **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.path = os.path.abspath(str(path))
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+
+        self.client_id = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(12))
+        self.client_prefix = f"specific.{self.client_id}!"
+        self.socket_dir = f"{self.path}.sockets"
+        self.wakeup = (
+            wakeup
+            and hasattr(socket, 'AF_UNIX')
+            and len(self._socket_path(self.client_prefix)) <= MAX_SOCKET_PATH
+        )
+
+        # One thread owns the connection, which also serialises writers in this process
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='channel-layer')
+        self._connection = None
+        self._last_cleanup = 0.0
+
+        self._loop = None
+        self._queues = {}
+        self._poller = None
+        self._wakeup_event = None
+
+    # Channel layer API
+
+    async def new_channel(self, prefix='specific.'):
+        suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        return f"{self.client_prefix}{prefix}{suffix}"
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert '__asgi_channel__' not in message
+
+        if self._is_local(channel):
+            queue = self._queue(channel)
+            if queue.qsize() >= self.get_capacity(channel):
+                raise ChannelFull(channel)
+            queue.put_nowait(message)
+            return
+
+        delivered = await self._run(self._store, [(channel, message)], True)
+        self._wake(delivered)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+
+        if channel.startswith(self.client_prefix):
+            self._ensure_poller()
+            return await self._queue(channel).get()
+
+        # Named channels have no owning process; claim rows one at a time
+        while True:
+            message = await self._run(self._claim, channel)
+            if message is not None:
+                return message
+            await asyncio.sleep(self.poll_interval)
+
+    async def flush(self):
+        await self._run(self._flush)
+        for queue in self._queues.values():
+            while not queue.empty():
+                queue.get_nowait()
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._run(self._execute, [(
+            "INSERT OR REPLACE INTO channel_groups (name, channel, expires) VALUES (?, ?, ?)",
+            (group, channel, time.time() + self.group_expiry),
+        )])
+
+    async def group_discard(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._run(self._execute, [(
+            "DELETE FROM channel_groups WHERE name = ? AND channel = ?",
+            (group, channel),
+        )])
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_group_name(group)
+
+        channels = await self._run(self._group_channels, group)
+        remote = []
+        for channel in channels:
+            if self._is_local(channel):
+                queue = self._queue(channel)
+                # Group sends drop silently on full channels, like the other layers
+                if queue.qsize() < self.get_capacity(channel):
+                    queue.put_nowait(message)
+            else:
+                remote.append((channel, message))
+
+        if remote:
+            delivered = await self._run(self._store, remote, False)
+            self._wake(delivered)
+
+    # Local delivery
+
+    def _is_local(self, channel):
+        # Only short-circuit when this loop is the one draining our queues
+        if not channel.startswith(self.client_prefix) or self._poller is None:
+            return False
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _queue(self, channel):
+        if channel not in self._queues:
+            self._queues[channel] = asyncio.Queue()
+        return self._queues[channel]
+
+    def _ensure_poller(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._poller is None or self._poller.done():
+            # Queues are bound to the loop that created them
+            self._loop = loop
+            self._queues = {}
+            self._wakeup_event = asyncio.Event()
+            self._poller = loop.create_task(self._poll())
+
+    async def _poll(self):
+        transport = None
+        socket_path = self._socket_path(self.client_prefix)
+        if self.wakeup:
+            try:
+                os.makedirs(self.socket_dir, exist_ok=True)
+                if os.path.exists(socket_path):
+                    os.unlink(socket_path)
+                transport, _ = await self._loop.create_datagram_endpoint(
+                    lambda: _WakeupProtocol(self._wakeup_event),
+                    local_addr=socket_path,
+                    family=socket.AF_UNIX,
+                )
+            except OSError as e:
+                logger.warning(f"Channel layer wakeup socket unavailable, polling only: {e}")
+
+        try:
+            while True:
+                # Clear before fetching so a wakeup during the fetch isn't lost
+                self._wakeup_event.clear()
+                for channel, message in await self._run(self._fetch, self.client_prefix):
+                    self._queue(channel).put_nowait(message)
+                try:
+                    await asyncio.wait_for(self._wakeup_event.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if transport is not None:
+                transport.close()
+                try:
+                    os.unlink(socket_path)
+                except OSError:
+                    pass
+
+    def _socket_path(self, prefix):
+        client_id = prefix[len('specific.'):].rstrip('!')
+        return os.path.join(self.socket_dir, f"{client_id}.sock")
+
+    def _wake(self, prefixes):
+        if not self.wakeup:
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for prefix in prefixes:
+                try:
+                    sock.sendto(b'1', self._socket_path(prefix))
+                except OSError:
+                    # Receiver gone or its buffer is full; its poll picks the message up
+                    pass
+
+    # Database access, always on the executor thread
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _db(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, statements):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in statements:
+                db.execute(sql, params)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _store(self, items, raise_when_full):
+        """
+        Insert messages in one transaction.
+
+        Returns:
+            set: Process prefixes that received a message and should be woken
+        """
+        db = self._db()
+        now = time.time()
+        delivered = set()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for channel, message in items:
+                backlog = db.execute(
+                    "SELECT COUNT(*) FROM channel_messages WHERE channel = ? AND expires > ?",
+                    (channel, now),
+                ).fetchone()[0]
+                if backlog >= self.get_capacity(channel):
+                    if raise_when_full:
+                        raise ChannelFull(channel)
+                    continue
+
+                prefix = self.non_local_name(channel)
+                db.execute(
+                    "INSERT INTO channel_messages (channel, prefix, body, expires) VALUES (?, ?, ?, ?)",
+                    (channel, prefix, json.dumps(message), now + self.expiry),
+                )
+                if prefix.endswith('!'):
+                    delivered.add(prefix)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return delivered
+
+    def _fetch(self, prefix):
+        """Take every pending message for this process's channels"""
+        db = self._db()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute(
+                "SELECT id, channel, body, expires FROM channel_messages WHERE prefix = ? ORDER BY id",
+                (prefix,),
+            ).fetchall()
+            if rows:
+                db.execute("DELETE FROM channel_messages WHERE prefix = ? AND id <= ?", (prefix, rows[-1][0]))
+            if now - self._last_cleanup > self.expiry:
+                self._last_cleanup = now
+                db.execute("DELETE FROM channel_messages WHERE expires <= ?", (now,))
+                db.execute("DELETE FROM channel_groups WHERE expires <= ?", (now,))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return [(channel, json.loads(body)) for _, channel, body, expires in rows if expires > now]
+
+    def _claim(self, channel):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT id, body FROM channel_messages WHERE channel = ? AND expires > ? ORDER BY id LIMIT 1",
+                (channel, time.time()),
+            ).fetchone()
+            if row:
+                db.execute("DELETE FROM channel_messages WHERE id = ?", (row[0],))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return json.loads(row[1]) if row else None
+
+    def _group_channels(self, group):
+        return [
+            channel for (channel,) in self._db().execute(
+                "SELECT channel FROM channel_groups WHERE name = ? AND expires > ?",
+                (group, time.time()),
+            )
+        ]
+
+    def _flush(self):
+        self._execute([
+            ("DELETE FROM channel_messages", ()),
+            ("DELETE FROM channel_groups", ()),
+        ])
@@ -0,0 +1,84 @@
+"""
+Batched pruning of old rows, optionally archived to NDJSON.gz files first.
+
+``prune_queryset`` removes matching rows in primary-key batches of
+``RETENTION_BATCH_SIZE``, each in its own short transaction, so a large
+backlog never holds locks or bloats one transaction. When
+``RETENTION_ARCHIVE_DIR`` is set every batch is appended to a gzip member of
+``<dir>/<label>/<YYYY-MM-DD>.ndjson.gz`` (one JSON object per line) before it
+is deleted. Archiving happens ahead of the commit, so a batch whose delete
+fails may appear in the archive twice but is never lost.
+"""
+import gzip
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def get_archive_dir():
+    return getattr(settings, 'RETENTION_ARCHIVE_DIR', '')
+
+
+def get_batch_size():
+    return getattr(settings, 'RETENTION_BATCH_SIZE', 1000)
+
+
+def archive_rows(label, rows):
+    """Append ``rows`` (dicts) to today's archive file for ``label``"""
+    directory = os.path.join(get_archive_dir(), label)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{timezone.now():%Y-%m-%d}.ndjson.gz")
+    # Each append is a complete gzip member; gzip readers concatenate them
+    with gzip.open(path, 'at', encoding='utf-8') as archive:
+        for row in rows:
+            archive.write(json.dumps(row, cls=DjangoJSONEncoder))
+            archive.write('\n')
+
+
+def prune_queryset(queryset, label, delete=None, archive=True, batch_size=None):
+    """
+    Delete every row of ``queryset`` in batches, oldest first.
+
+    Args:
+        queryset: Rows to remove; must have a ``created_at`` field
+        label: Archive subdirectory and log name
+        delete: Callable taking a batch queryset and deleting it, for models
+            whose deletes have bookkeeping; defaults to ``QuerySet.delete``
+        archive: Archive batches when ``RETENTION_ARCHIVE_DIR`` is set
+        batch_size: Rows per batch (default ``RETENTION_BATCH_SIZE``)
+
+    Returns:
+        int: Number of rows removed
+    """
+    model = queryset.model
+    batch_size = batch_size or get_batch_size()
+    archive = archive and bool(get_archive_dir())
+    removed = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                queryset.order_by('created_at')
+                .select_for_update(skip_locked=True)
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            batch = model._default_manager.filter(pk__in=ids)
+            if archive:
+                archive_rows(label, batch.values())
+            if delete is not None:
+                delete(batch)
+            else:
+                batch.delete()
+        removed += len(ids)
+
+    if removed:
+        logger.info(f"🗑️ Pruned {removed} {label} rows")
+    return removed
@@ -74,7 +74,8 @@ INSTALLED_APPS = [
     'products',
     'messagings',
     'notifications',
-    'sync'
+    'sync',
+    'uploads',
 ]
 
 MIDDLEWARE = [
@@ -116,11 +117,28 @@ WSGI_APPLICATION = 'prbal_project.wsgi.application'
 ASGI_APPLICATION = 'prbal_project.asgi.application'
 
 # Channel layers configuration (using in-memory for development)
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+# Channel layers: Redis when configured, otherwise a SQLite file shared by every
+# process on this host so workers and Celery can reach daphne's sockets
+CHANNEL_REDIS_URL = config('CHANNEL_REDIS_URL', default='')
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_REDIS_URL],
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'prbal_project.channel_layers.SQLiteChannelLayer',
+            'CONFIG': {
+                'path': config('CHANNEL_LAYER_PATH', default=str(BASE_DIR / 'channel_layer.sqlite3')),
+                'poll_interval': config('CHANNEL_LAYER_POLL_INTERVAL', default=0.5, cast=float),
+            },
+        },
+    }
 
 # Cache configuration using local memory
 CACHES = {
@@ -133,6 +151,13 @@ CACHES = {
 # Cache time to live in seconds
 CACHE_TTL = 60 * 15  # 15 minutes
 
+# Celery configuration
+# Deployments set CELERY_BROKER_URL and run workers. Eager mode (tasks run
+# inline in the request, countdown/eta ignored) is for development only: it
+# follows DEBUG unless CELERY_TASK_ALWAYS_EAGER is set explicitly.
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='memory://')
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=DEBUG, cast=bool)
+
 # Use database for session storage
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 
@@ -314,6 +339,127 @@ CORS_ALLOW_HEADERS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Responsive image derivatives (longest side in pixels), rendered as WebP in the background
+IMAGE_DERIVATIVE_SIZES = {
+    'thumbnail': 150,
+    'medium': 600,
+    'full': 1920,
+}
+IMAGE_DERIVATIVE_QUALITY = config('IMAGE_DERIVATIVE_QUALITY', default=80, cast=int)
+
+# On-demand resizing (media/resize/) with a sharded LRU disk cache
+IMAGE_RESIZE_CACHE_DIR = config('IMAGE_RESIZE_CACHE_DIR', default=os.path.join(BASE_DIR, 'media_cache'))
+IMAGE_RESIZE_CACHE_MAX_BYTES = config('IMAGE_RESIZE_CACHE_MAX_BYTES', default=1024 * 1024 * 1024, cast=int)
+IMAGE_RESIZE_CACHE_SWEEP_INTERVAL = 300  # seconds between eviction passes
+IMAGE_RESIZE_MAX_DIMENSION = 2560
+IMAGE_RESIZE_WIDTH_STEP = 50
+IMAGE_RESIZE_UNVERSIONED_MAX_AGE = 300  # seconds to cache renders whose URL predates the current source
+
+# Internal nginx locations for X-Accel-Redirect; leave empty when Django serves files itself
+MEDIA_ACCEL_REDIRECT_PREFIX = config('MEDIA_ACCEL_REDIRECT_PREFIX', default='')
+MEDIA_ACCEL_REDIRECT_CACHE_PREFIX = config('MEDIA_ACCEL_REDIRECT_CACHE_PREFIX', default='')
+
+# Resumable chunked uploads (api/v1/uploads/); part files live outside MEDIA_ROOT
+CHUNKED_UPLOAD_DIR = config('CHUNKED_UPLOAD_DIR', default=os.path.join(BASE_DIR, 'upload_sessions'))
+CHUNKED_UPLOAD_MAX_SIZE = config('CHUNKED_UPLOAD_MAX_SIZE', default=100 * 1024 * 1024, cast=int)
+CHUNKED_UPLOAD_CHUNK_SIZE = 1024 * 1024  # suggested to clients
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024
+CHUNKED_UPLOAD_EXPIRY_HOURS = 24
+
+# Write-behind persistence for WebSocket chat messages
+CHAT_WRITE_BEHIND_INTERVAL = config('CHAT_WRITE_BEHIND_INTERVAL', default=0.05, cast=float)
+CHAT_WRITE_BEHIND_BATCH_SIZE = 500
+
+# Notifications per channel-layer dispatch task
+NOTIFICATION_DISPATCH_BATCH_SIZE = 500
+
+# Seconds during which repeated notifications of a type about the same object are
+# merged into one digest per recipient; NotificationGroup.digest_window overrides
+NOTIFICATION_DIGEST_WINDOWS = {
+    'bid_received': 300,
+    'message_received': 120,
+}
+
+# Retention: rows past these ages are pruned in batches by celery beat (or the
+# prune_notifications / prune_messages commands), archived first to NDJSON.gz
+# files under RETENTION_ARCHIVE_DIR when it is set. None keeps a type forever.
+NOTIFICATION_RETENTION_DAYS = {
+    'default': 180,
+    'system': 30,
+    'message_received': 30,
+    'bid_received': 90,
+}
+NOTIFICATION_ARCHIVED_RETENTION_DAYS = 30
+MESSAGE_RETENTION_DAYS = config('MESSAGE_RETENTION_DAYS', default=0, cast=int)  # 0 keeps messages forever
+RETENTION_ARCHIVE_DIR = config('RETENTION_ARCHIVE_DIR', default='')
+RETENTION_BATCH_SIZE = 1000
+
+# Market price quantiles behind smart_price and suggest_bid_amount
+PRICING_LOOKBACK_DAYS = 365
+PRICING_MIN_SAMPLES = 5  # smaller buckets fall back to broader ones
+PRICING_REGION_CELL_DEGREES = 0.5  # roughly 55 km grid cells
+PRICING_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Provider schedules: used when a service has no availability, a bid has no
+# explicit end time, and as the longest free_slots range
+BOOKING_DEFAULT_AVAILABILITY = '09:00-18:00'
+BOOKING_DEFAULT_DURATION_MINUTES = 60
+BOOKING_FREE_SLOTS_MAX_DAYS = 31
+
+# ICS subscription feeds of bookings (bookings/calendar/<token>.ics)
+CALENDAR_FEED_PAST_DAYS = 90
+CALENDAR_FEED_CACHE_TIMEOUT = 60 * 60 * 24
+CALENDAR_FEED_MAX_AGE = 300  # seconds calendar clients may reuse a copy
+
+# Background push of bookings to connected Google/Microsoft/Apple calendars.
+# CALENDAR_SYNC_API_URLS overrides a provider's API base URL.
+CALENDAR_SYNC_CONCURRENCY = 4  # requests in flight per worker run
+CALENDAR_SYNC_BATCH_SIZE = 200
+CALENDAR_SYNC_TIMEOUT = 10
+CALENDAR_SYNC_MAX_ATTEMPTS = 6
+CALENDAR_SYNC_RETRY_BASE_SECONDS = 30  # doubled after every failed attempt
+CALENDAR_SYNC_RETRY_MAX_SECONDS = 60 * 60
+CALENDAR_SYNC_LEASE_SECONDS = 300
+
+# Fernet keys (comma separated, newest first) encrypting stored calendar OAuth
+# tokens; derived from SECRET_KEY when unset
+FIELD_ENCRYPTION_KEYS = config('FIELD_ENCRYPTION_KEYS', default='', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])
+
+# Nightly batch payouts. PAYOUT_GATEWAY_BACKEND is the dotted path of a
+# payments.gateways.PayoutGateway subclass; payouts aren't processed without one.
+PAYOUT_GATEWAY_BACKEND = config('PAYOUT_GATEWAY_BACKEND', default='') or None
+PAYOUT_CLAIM_SIZE = 2000  # payouts claimed per round
+PAYOUT_GATEWAY_BATCH_SIZE = 500  # payouts per gateway request
+PAYOUT_PROCESSING_TIMEOUT_MINUTES = 60  # after which a processing payout is claimed again
+
+# Idempotency-Key handling on mutating payment and booking endpoints
+IDEMPOTENCY_KEY_TTL_HOURS = 24  # how long responses are replayed
+IDEMPOTENCY_LOCK_TIMEOUT = 60  # seconds before an unanswered key can be reused
+
+# Payment gateway webhooks. Events are verified with STRIPE_WEBHOOK_SECRET,
+# stored in the WebhookEvent inbox and applied by a background task.
+STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET', default='')
+STRIPE_WEBHOOK_TOLERANCE = 300  # seconds a signature timestamp may be off
+PAYMENT_WEBHOOK_BATCH_SIZE = 200  # payments handled per inbox query
+PAYMENT_WEBHOOK_MAX_ATTEMPTS = 5  # after which an event is marked failed
+PAYMENT_WEBHOOK_SCHEDULE_DELAY = 2  # seconds; at most one processing run is queued per window
+
+# Rating summaries rank by (C * m + sum of ratings) / (C + number of reviews):
+# every provider and service starts as if it had C reviews of m stars
+REVIEW_RATING_PRIOR_WEIGHT = 10  # C
+REVIEW_RATING_PRIOR_MEAN = '3.5'  # m
+
+# Upper bound on messages per delta sync request
+MESSAGE_SYNC_MAX_BATCH = 200
+
+# Typing indicators and read receipts are coalesced per connection and sent on a tick
+CHAT_EVENT_TICK = 0.25
+CHAT_TYPING_REFRESH = 3
+
+# Presence: connection counters in the database, last_seen written in batches
+PRESENCE_TTL = 60
+PRESENCE_FLUSH_INTERVAL = 15
+
 # Static files configuration for production
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
@@ -15,13 +15,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.http import JsonResponse
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from uploads.views import serve_media
 
 # Import drf-spectacular schema
 from .schema import urlpatterns as schema_urls
@@ -77,6 +78,10 @@ urlpatterns = [
     path('api/v1/ai-suggestions/', include('ai_suggestions.urls')),
     path('api/v1/reviews/', include('reviews.urls')),
     path('api/v1/services/', include('services.urls')),
+    path('api/v1/uploads/', include('uploads.urls')),
+    
+    # Signed, cached image resizing
+    path('media/', include('uploads.media_urls')),
     
     # Sync APIs for offline functionality
     path('api/v1/sync/', include('sync.urls')),
@@ -96,6 +101,8 @@ urlpatterns += schema_urls
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 else:
-    # In production, you would configure your web server (nginx, etc.) to serve these
-    # This is a fallback for development/testing in non-DEBUG mode
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # In production nginx serves media; requests that still reach Django are
+    # handed back to it with X-Accel-Redirect instead of streaming the bytes
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media),
+    ]
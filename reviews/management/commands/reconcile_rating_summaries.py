@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from reviews.ratings import reconcile_rating_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild provider and service rating summaries from the reviews, fixing any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', action='append', default=None, help='Only this provider (repeatable)')
+        parser.add_argument('--service', action='append', default=None, help='Only this service (repeatable)')
+
+    def handle(self, *args, **options):
+        corrected = reconcile_rating_summaries(provider_ids=options['provider'], service_ids=options['service'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Corrected {corrected['providers']} provider and {corrected['services']} service summaries"
+        ))
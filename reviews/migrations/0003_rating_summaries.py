@@ -0,0 +1,57 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0002_reviewimage_image_variants'),
+        ('services', '0006_alter_serviceimage_image'),
+        ('users', '0004_alter_user_profile_picture_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderRatingSummary',
+            fields=[
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.DecimalField(decimal_places=1, default=0, max_digits=12)),
+                ('count_1', models.PositiveIntegerField(default=0)),
+                ('count_2', models.PositiveIntegerField(default=0)),
+                ('count_3', models.PositiveIntegerField(default=0)),
+                ('count_4', models.PositiveIntegerField(default=0)),
+                ('count_5', models.PositiveIntegerField(default=0)),
+                ('bayesian_mean', models.DecimalField(decimal_places=3, default=0, help_text='Average rating pulled towards REVIEW_RATING_PRIOR_MEAN, so few reviews rank below many', max_digits=4)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('provider', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Provider Rating Summary',
+                'verbose_name_plural': 'Provider Rating Summaries',
+                'indexes': [models.Index(fields=['-bayesian_mean'], name='provider_rating_rank_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ServiceRatingSummary',
+            fields=[
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.DecimalField(decimal_places=1, default=0, max_digits=12)),
+                ('count_1', models.PositiveIntegerField(default=0)),
+                ('count_2', models.PositiveIntegerField(default=0)),
+                ('count_3', models.PositiveIntegerField(default=0)),
+                ('count_4', models.PositiveIntegerField(default=0)),
+                ('count_5', models.PositiveIntegerField(default=0)),
+                ('bayesian_mean', models.DecimalField(decimal_places=3, default=0, help_text='Average rating pulled towards REVIEW_RATING_PRIOR_MEAN, so few reviews rank below many', max_digits=4)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('service', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='services.service')),
+            ],
+            options={
+                'verbose_name': 'Service Rating Summary',
+                'verbose_name_plural': 'Service Rating Summaries',
+                'indexes': [models.Index(fields=['-bayesian_mean'], name='service_rating_rank_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:46
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0003_rating_summaries'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='providerratingsummary',
+            name='provider_rating_rank_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='serviceratingsummary',
+            name='service_rating_rank_idx',
+        ),
+    ]
@@ -3,6 +3,8 @@ from django.conf import settings
 import uuid
 from services.models import Service
 from bookings.models import Booking
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
 def review_image_path(instance, filename):
@@ -49,6 +51,21 @@ class Review(models.Model):
     def __str__(self):
         return f"{self.client.username}'s review for {self.service.title}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the stored row contributes to the rating summaries, so a save
+        # can apply the difference; unknown when those fields were deferred
+        if all(name in field_names for name in ('provider_id', 'service_id', 'rating', 'is_public')):
+            instance._summarized = instance.rating_contribution()
+        return instance
+    
+    def rating_contribution(self):
+        """``(provider_id, service_id, rating)`` counted in the rating summaries, or None if not public"""
+        if not self.is_public or self.rating is None:
+            return None
+        return (self.provider_id, self.service_id, self.rating)
+    
     def add_provider_response(self, response_text):
         """Add or update provider response to this review"""
         self.provider_response = response_text
@@ -75,6 +92,7 @@ class ReviewImage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to=review_image_path, help_text='Image uploaded with the review')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text='Resized WebP variants of the image, generated in the background')
     caption = models.CharField(max_length=100, blank=True, help_text='Optional caption for the image')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
@@ -83,3 +101,86 @@ class ReviewImage(models.Model):
     
     def __str__(self):
         return f"Image for {self.review}"
+
+
+class RatingSummary(models.Model):
+    """
+    Running totals of the public reviews of a provider or a service.
+    
+    Kept current with ``F()`` deltas as reviews change, see ``reviews.ratings``.
+    ``count_1`` to ``count_5`` hold ratings rounded half up to whole stars.
+    """
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0)
+    count_1 = models.PositiveIntegerField(default=0)
+    count_2 = models.PositiveIntegerField(default=0)
+    count_3 = models.PositiveIntegerField(default=0)
+    count_4 = models.PositiveIntegerField(default=0)
+    count_5 = models.PositiveIntegerField(default=0)
+    bayesian_mean = models.DecimalField(
+        max_digits=4, decimal_places=3, default=0,
+        help_text='Average rating pulled towards REVIEW_RATING_PRIOR_MEAN, so few reviews rank below many'
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        abstract = True
+    
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.review_count if self.review_count else 0
+    
+    @property
+    def rating_counts(self):
+        return {str(stars): getattr(self, f'count_{stars}') for stars in range(1, 6)}
+
+
+class ProviderRatingSummary(RatingSummary):
+    """Rating totals over the public reviews a provider received"""
+    provider = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary'
+    )
+    
+    class Meta:
+        verbose_name = 'Provider Rating Summary'
+        verbose_name_plural = 'Provider Rating Summaries'
+    
+    def __str__(self):
+        return f"Ratings of {self.provider}: {self.review_count}"
+
+
+class ServiceRatingSummary(RatingSummary):
+    """Rating totals over the public reviews of a service"""
+    service = models.OneToOneField(Service, on_delete=models.CASCADE, primary_key=True, related_name='rating_summary')
+    
+    class Meta:
+        verbose_name = 'Service Rating Summary'
+        verbose_name_plural = 'Service Rating Summaries'
+    
+    def __str__(self):
+        return f"Ratings of {self.service}: {self.review_count}"
+
+
+@receiver(post_save, sender=Review)
+def update_rating_summaries_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    from .ratings import apply_review_change, reconcile_rating_summaries
+    current = instance.rating_contribution()
+    if created:
+        apply_review_change(None, current)
+    elif hasattr(instance, '_summarized'):
+        apply_review_change(instance._summarized, current)
+    else:
+        # Loaded without the rating fields; the old contribution is unknown
+        reconcile_rating_summaries(provider_ids=[instance.provider_id], service_ids=[instance.service_id])
+    instance._summarized = current
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_summaries_on_delete(sender, instance, **kwargs):
+    from .ratings import apply_review_change, reconcile_rating_summaries
+    if hasattr(instance, '_summarized'):
+        apply_review_change(instance._summarized, None)
+    else:
+        reconcile_rating_summaries(provider_ids=[instance.provider_id], service_ids=[instance.service_id])
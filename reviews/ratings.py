@@ -0,0 +1,251 @@
+"""
+Rating summaries per provider and per service.
+
+Every public review contributes its rating to the ``ProviderRatingSummary``
+of its provider and the ``ServiceRatingSummary`` of its service. The Review
+receivers pass what a review contributed before and after a change (create,
+rating edit, visibility change, delete) to ``apply_review_change``. That
+function applies the difference with a single ``UPDATE ... SET x = x + d`` per
+summary. The database serialises concurrent deltas on the row, so no
+re-aggregation or explicit lock is needed. ``bayesian_mean`` is recomputed in
+the same statement from the old values plus the delta, and copied to the
+indexed ``User.rating_score`` and ``Service.rating_score`` columns that
+provider search and service listings sort on.
+
+``bayesian_mean`` is ``(C * m + sum) / (C + count)``: the average as if every
+provider also had ``C`` reviews of ``m`` stars (``REVIEW_RATING_PRIOR_WEIGHT``
+and ``REVIEW_RATING_PRIOR_MEAN``). A handful of reviews can't outrank a long
+track record.
+
+Queryset ``update()`` and ``bulk_create`` bypass the receivers. After those,
+or to pick up a changed prior, run ``reconcile_rating_summaries`` (the
+``reconcile_rating_summaries`` management command), which rebuilds the rows
+from the reviews.
+"""
+import logging
+from collections import Counter, defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (
+    Case, Count, DecimalField, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from services.models import Service
+
+from .models import ProviderRatingSummary, Review, ServiceRatingSummary
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+STARS = range(1, 6)
+
+SUMMARY_FIELDS = ['review_count', 'rating_sum'] + [f'count_{stars}' for stars in STARS] + ['bayesian_mean']
+
+
+def get_prior_weight():
+    return Decimal(str(getattr(settings, 'REVIEW_RATING_PRIOR_WEIGHT', 10)))
+
+
+def get_prior_mean():
+    return Decimal(str(getattr(settings, 'REVIEW_RATING_PRIOR_MEAN', '3.5')))
+
+
+def star_bucket(rating):
+    """The whole-star histogram bucket of ``rating``: rounded half up, clamped to 1-5"""
+    return min(max(int(Decimal(rating).quantize(Decimal('1'), rounding=ROUND_HALF_UP)), 1), 5)
+
+
+def bucket_filter(stars):
+    """``Q`` matching the reviews that ``star_bucket`` puts in ``stars``"""
+    q = Q()
+    if stars > 1:
+        q &= Q(rating__gte=Decimal(stars) - Decimal('0.5'))
+    if stars < 5:
+        q &= Q(rating__lt=Decimal(stars) + Decimal('0.5'))
+    return q
+
+
+def bayesian_mean(review_count, rating_sum):
+    weight, prior = get_prior_weight(), get_prior_mean()
+    return ((weight * prior + Decimal(rating_sum)) / (weight + review_count)).quantize(Decimal('0.001'))
+
+
+def _divide(numerator, denominator):
+    """``numerator / denominator`` in floating point; SQLite would divide whole numbers as integers"""
+    return Cast(numerator, FloatField()) / Cast(denominator, FloatField())
+
+
+def _bayesian_expression(count_delta, sum_delta):
+    """``bayesian_mean`` after adding the deltas, in terms of the row's current values"""
+    weight, prior = get_prior_weight(), get_prior_mean()
+    decimal = DecimalField(max_digits=14, decimal_places=4)
+    return ExpressionWrapper(
+        _divide(
+            Value(weight * prior + sum_delta, output_field=decimal) + F('rating_sum'),
+            Value(weight + count_delta, output_field=decimal) + F('review_count'),
+        ),
+        output_field=decimal,
+    )
+
+
+class _Delta:
+    def __init__(self):
+        self.count = 0
+        self.total = Decimal('0')
+        self.buckets = Counter()
+
+    def add(self, rating, sign):
+        self.count += sign
+        self.total += sign * Decimal(rating)
+        self.buckets[star_bucket(rating)] += sign
+
+    def __bool__(self):
+        return bool(self.count or self.total or any(self.buckets.values()))
+
+
+def _apply_delta(model, pk, delta):
+    now = timezone.now()
+    changes = {
+        'review_count': F('review_count') + delta.count,
+        'rating_sum': F('rating_sum') + delta.total,
+        'bayesian_mean': _bayesian_expression(delta.count, delta.total),
+        'updated_at': now,
+    }
+    for stars, change in delta.buckets.items():
+        if change:
+            changes[f'count_{stars}'] = F(f'count_{stars}') + change
+    if model.objects.filter(pk=pk).update(**changes):
+        return
+    if delta.count > 0:
+        # First review; a missing row is never created for removals, which
+        # also keeps cascade deletes of the provider or service from reviving it
+        model.objects.bulk_create([model(pk=pk)], ignore_conflicts=True)
+        model.objects.filter(pk=pk).update(**changes)
+
+
+def apply_review_change(before, after):
+    """
+    Move a review's contribution to the summaries from ``before`` to ``after``.
+
+    Both are ``Review.rating_contribution()`` values, None when the review
+    wasn't or isn't counted.
+    """
+    if before == after:
+        return
+    deltas = defaultdict(_Delta)
+    for contribution, sign in ((before, -1), (after, 1)):
+        if contribution is None:
+            continue
+        provider_id, service_id, rating = contribution
+        if provider_id is not None:
+            deltas[(ProviderRatingSummary, provider_id)].add(rating, sign)
+        deltas[(ServiceRatingSummary, service_id)].add(rating, sign)
+
+    changed = defaultdict(set)
+    with transaction.atomic():
+        # A stable order, so two reviews moving between the same rows can't deadlock
+        for (model, pk), delta in sorted(deltas.items(), key=lambda item: (item[0][0].__name__, str(item[0][1]))):
+            if delta:
+                _apply_delta(model, pk, delta)
+                changed[model].add(pk)
+        sync_rating_columns(changed.get(ProviderRatingSummary), changed.get(ServiceRatingSummary))
+
+
+def _summary_value(model, expression):
+    """Subquery reading ``expression`` from the outer row's summary, 0 if it has no reviews"""
+    decimal = DecimalField(max_digits=14, decimal_places=4)
+    value = Subquery(
+        model.objects.filter(pk=OuterRef('pk')).annotate(
+            value=Case(
+                When(review_count=0, then=Value(Decimal('0'))),
+                default=ExpressionWrapper(expression, output_field=decimal),
+                output_field=decimal,
+            )
+        ).values('value')[:1]
+    )
+    return Coalesce(value, Value(Decimal('0')), output_field=decimal)
+
+
+def sync_rating_columns(provider_ids=None, service_ids=None):
+    """
+    Copy the summaries to the columns lists sort on: ``User.rating`` (the
+    plain average), ``User.rating_score`` and ``Service.rating_score`` (the
+    Bayesian mean). The IDs may be given as a ``values('pk')`` queryset.
+    """
+    if provider_ids is not None:
+        User.objects.filter(pk__in=provider_ids).update(
+            rating=_summary_value(ProviderRatingSummary, _divide(F('rating_sum'), F('review_count'))),
+            rating_score=_summary_value(ProviderRatingSummary, F('bayesian_mean')),
+        )
+    if service_ids is not None:
+        Service.objects.filter(pk__in=service_ids).update(
+            rating_score=_summary_value(ServiceRatingSummary, F('bayesian_mean')),
+        )
+
+
+def _aggregate(group_field, ids):
+    reviews = Review.objects.filter(is_public=True, **{f'{group_field}__isnull': False})
+    if ids is not None:
+        reviews = reviews.filter(**{f'{group_field}__in': ids})
+    rows = reviews.values(group_field).annotate(
+        review_count=Count('id'),
+        rating_sum=Sum('rating'),
+        **{f'count_{stars}': Count('id', filter=bucket_filter(stars)) for stars in STARS},
+    ).order_by()
+    totals = {}
+    for row in rows:
+        pk = row.pop(group_field)
+        row['bayesian_mean'] = bayesian_mean(row['review_count'], row['rating_sum'])
+        totals[pk] = row
+    return totals
+
+
+def _reconcile(model, group_field, ids):
+    """Fix the summaries that differ from the reviews; returns the corrected keys and all checked ones"""
+    expected = _aggregate(group_field, ids)
+    existing = model.objects.all() if ids is None else model.objects.filter(pk__in=ids)
+    current = {row.pop('pk'): row for row in existing.values('pk', *SUMMARY_FIELDS)}
+
+    empty = {field: 0 for field in SUMMARY_FIELDS}
+    empty['bayesian_mean'] = bayesian_mean(0, 0)
+    changed = []
+    for pk in set(expected) | set(current):
+        values = expected.get(pk, empty)
+        if current.get(pk) != values:
+            changed.append(model(pk=pk, **values))
+    if changed:
+        model.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=[model._meta.pk.name],
+            update_fields=SUMMARY_FIELDS,
+            batch_size=1000,
+        )
+    return [summary.pk for summary in changed], existing.values('pk')
+
+
+def reconcile_rating_summaries(provider_ids=None, service_ids=None):
+    """
+    Rebuild summaries from the reviews: all of them, or only those of the
+    given providers and services.
+
+    Returns:
+        dict: Number of provider and service summaries that were corrected
+    """
+    everything = provider_ids is None and service_ids is None
+    provider_ids = None if everything else [pk for pk in provider_ids or () if pk is not None]
+    service_ids = None if everything else [pk for pk in service_ids or () if pk is not None]
+    with transaction.atomic():
+        providers, checked_providers = _reconcile(ProviderRatingSummary, 'provider_id', provider_ids)
+        services, checked_services = _reconcile(ServiceRatingSummary, 'service_id', service_ids)
+        # Rewritten even where the summary was right, in case only the column drifted
+        sync_rating_columns(checked_providers, checked_services)
+    if providers or services:
+        logger.info(f"⭐ Reconciled rating summaries: {len(providers)} providers, {len(services)} services")
+    return {'providers': len(providers), 'services': len(services)}
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Review, ReviewImage
 from users.serializers import PublicUserProfileSerializer
+from uploads.serializers import ResponsiveImageField
 from services.serializers import ServiceDetailSerializer as ServiceSerializer
 from bookings.models import Booking
 from django.utils import timezone
@@ -8,7 +9,7 @@ import base64
 import uuid
 from django.core.files.base import ContentFile
 
-class Base64ImageField(serializers.ImageField):
+class Base64ImageField(ResponsiveImageField):
     """Custom field for handling base64 encoded images"""
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:'):
@@ -35,7 +36,7 @@ class ReviewImageSerializer(serializers.ModelSerializer):
 class ReviewListSerializer(serializers.ModelSerializer):
     """Serializer for listing reviews"""
     reviewer_name = serializers.CharField(source='client.get_full_name', read_only=True)
-    reviewer_profile_pic = serializers.ImageField(source='client.profile_picture', read_only=True)
+    reviewer_profile_pic = ResponsiveImageField(source='client.profile_picture', read_only=True)
     service_title = serializers.CharField(source='service.title', read_only=True)
     has_provider_response = serializers.SerializerMethodField()
     images_count = serializers.SerializerMethodField()
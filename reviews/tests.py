@@ -1,3 +1,163 @@
-from django.test import TestCase
+from datetime import time, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from bookings.models import Booking
+from services.models import Service, ServiceCategory
+
+from .models import ProviderRatingSummary, Review, ServiceRatingSummary
+from .ratings import reconcile_rating_summaries
+
+User = get_user_model()
+
+
+class ReviewFixtureMixin:
+    """Shared fixtures: a provider with one service and completed bookings to review"""
+
+    def setUp(self):
+        self.customer = User.objects.create_user(username='ratingcustomer', email='ratingcustomer@test.com', user_type='customer')
+        self.provider = User.objects.create_user(username='ratingprovider', email='ratingprovider@test.com', user_type='provider')
+        self.category = ServiceCategory.objects.create(name='Plumbing', description='Pipes')
+        self.service = self.create_service(self.provider, 'Leak repair')
+        self.client.force_authenticate(user=self.customer)
+
+    def create_service(self, provider, name):
+        return Service.objects.create(
+            provider=provider, name=name, description=name, category=self.category,
+            hourly_rate=Decimal('400'), location='Pune', status='active',
+        )
+
+    def review(self, rating, service=None, **fields):
+        service = service or self.service
+        days = Booking.objects.count() + 1
+        booking = Booking.objects.create(
+            service=service, customer=self.customer, provider=service.provider, status='completed',
+            booking_date=timezone.localdate() - timedelta(days=days), start_time=time(10), end_time=time(11),
+            amount=Decimal('400'),
+        )
+        return Review.objects.create(
+            booking=booking, service=service, client=self.customer, provider=service.provider,
+            rating=Decimal(str(rating)), comment='Fine', **fields
+        )
+
+
+class RatingSummaryTestCase(ReviewFixtureMixin, APITestCase):
+    """Test cases for incrementally maintained rating summaries"""
+
+    def summary(self):
+        return ProviderRatingSummary.objects.get(provider=self.provider)
+
+    def test_deltas_follow_review_changes(self):
+        """Create, edit, hide and delete keep the totals equal to a full recount"""
+        first = self.review(5)
+        second = self.review('3.5')
+        self.review(2, is_public=False)
+        summary = self.summary()
+        self.assertEqual((summary.review_count, summary.rating_sum), (2, Decimal('8.5')))
+        self.assertEqual(summary.rating_counts, {'1': 0, '2': 0, '3': 0, '4': 1, '5': 1})
+        self.assertEqual(summary.bayesian_mean, Decimal('3.625'))
+
+        second = Review.objects.get(pk=second.pk)
+        second.update_rating(Decimal('1.0'))
+        first = Review.objects.get(pk=first.pk)
+        first.is_public = False
+        first.save()
+        self.assertEqual(self.summary().rating_counts, {'1': 1, '2': 0, '3': 0, '4': 0, '5': 0})
+        self.assertEqual(reconcile_rating_summaries(), {'providers': 0, 'services': 0})
+
+        Review.objects.get(pk=second.pk).delete()
+        summary = self.summary()
+        self.assertEqual((summary.review_count, summary.rating_sum, summary.bayesian_mean), (0, 0, Decimal('3.5')))
+        self.provider.refresh_from_db()
+        self.assertEqual(self.provider.rating, 0)
+
+    def test_provider_rating_kept_current(self):
+        """User.rating stays the plain average of public reviews"""
+        self.review(5)
+        self.review(4)
+        self.provider.refresh_from_db()
+        self.assertEqual(self.provider.rating, Decimal('4.5'))
+
+    def test_summaries_are_single_row_reads(self):
+        """Both summary endpoints read one row"""
+        self.review(5)
+        self.review(4)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('review-provider-summary'), {'provider_id': str(self.provider.id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_reviews'], 2)
+        self.assertEqual(response.data['average_rating'], Decimal('4.5'))
+        self.assertEqual(response.data['rating_counts']['4'], 1)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('review-service-summary'), {'service_id': str(self.service.id)})
+        self.assertEqual(response.data['total_reviews'], 2)
+
+        other = self.create_service(self.provider, 'Boiler service')
+        response = self.client.get(reverse('review-service-summary'), {'service_id': str(other.id)})
+        self.assertEqual(response.data['total_reviews'], 0)
+
+    def test_reconcile_fixes_drift(self):
+        """Changes made behind the receivers' back are repaired by a reconcile"""
+        self.review(5)
+        Review.objects.filter(provider=self.provider).update(rating=Decimal('2.0'))
+        self.assertEqual(reconcile_rating_summaries(), {'providers': 1, 'services': 1})
+        self.assertEqual(self.summary().rating_sum, Decimal('2.0'))
+        self.assertEqual(ServiceRatingSummary.objects.get(service=self.service).count_2, 1)
+        self.provider.refresh_from_db()
+        self.assertEqual(self.provider.rating, Decimal('2.0'))
+
+
+class RatingRankTestCase(ReviewFixtureMixin, APITestCase):
+    """Test cases for Bayesian rating columns and ranked ordering"""
+
+    def setUp(self):
+        super().setUp()
+        # One perfect review against a long record just short of it
+        self.review(5)
+        self.veteran = User.objects.create_user(username='veteran', email='veteran@test.com', user_type='provider')
+        self.veteran_service = self.create_service(self.veteran, 'Pipe fitting')
+        for _ in range(20):
+            self.review('4.9', service=self.veteran_service)
+
+    def test_score_columns_follow_summaries(self):
+        """The ranking columns hold the Bayesian mean, and drop back to 0 with no reviews"""
+        self.provider.refresh_from_db()
+        self.veteran.refresh_from_db()
+        self.assertEqual((self.provider.rating, self.provider.rating_score), (Decimal('5'), Decimal('3.636')))
+        self.assertEqual(self.veteran.rating_score, Decimal('4.433'))
+        self.veteran_service.refresh_from_db()
+        self.assertEqual(self.veteran_service.rating_score, Decimal('4.433'))
+
+        Review.objects.get(provider=self.provider).delete()
+        self.service.refresh_from_db()
+        self.assertEqual(self.service.rating_score, 0)
+
+    def test_reconcile_repairs_score_columns(self):
+        """Columns that drifted on their own are rewritten by a reconcile"""
+        User.objects.filter(pk=self.veteran.pk).update(rating_score=0)
+        reconcile_rating_summaries()
+        self.veteran.refresh_from_db()
+        self.assertEqual(self.veteran.rating_score, Decimal('4.433'))
+
+    def test_search_sorts_by_score(self):
+        """Provider search ranks the long record first"""
+        response = self.client.post(
+            reverse('user-search'), {'user_type': 'provider', 'sort_by': 'rating_score', 'sort_order': 'desc'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        providers = response.data['data']['providers']
+        self.assertEqual([provider['username'] for provider in providers], ['veteran', 'ratingprovider'])
+        self.assertEqual(providers[0]['rating_score'], '4.433')
+
+        response = self.client.post(
+            reverse('user-search'), {'user_type': 'provider', 'sort_by': 'rating', 'sort_order': 'desc'},
+            format='json',
+        )
+        self.assertEqual(response.data['data']['providers'][0]['username'], 'ratingprovider')
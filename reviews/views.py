@@ -2,11 +2,11 @@ from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Avg, Count, F
+from django.db.models import Q
 from django.db import transaction
 from notifications.utils import send_notification
 
-from .models import Review, ReviewImage
+from .models import ProviderRatingSummary, Review, ReviewImage, ServiceRatingSummary
 from .serializers import (
     ReviewListSerializer,
     ReviewDetailSerializer,
@@ -72,14 +72,11 @@ class ReviewViewSet(viewsets.ModelViewSet):
         return [permissions.AllowAny()]
     
     def perform_create(self, serializer):
-        """Create a review and update the provider's average rating"""
+        """Create a review; the rating summaries and provider rating follow from its post_save"""
         with transaction.atomic():
             # Save the review
             review = serializer.save()
-            
-            # Update the provider's average rating
             provider = review.provider
-            self.update_provider_rating(provider)
             
             # Increment the provider's total bookings count if needed
             # This might be redundant if already done in booking completion
@@ -136,46 +133,13 @@ class ReviewViewSet(viewsets.ModelViewSet):
             return Response({
                 'detail': "provider_id query parameter is required."
             }, status=status.HTTP_400_BAD_REQUEST)
-            
-        # Get public reviews for this provider
-        reviews = Review.objects.filter(provider_id=provider_id, is_public=True)
-        
-        # Calculate average rating
-        avg_rating = reviews.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0
-        
-        # Count reviews by rating
-        rating_counts = {}
-        for i in range(1, 6):
-            rating_counts[str(i)] = reviews.filter(rating=i).count()
         
+        summary = ProviderRatingSummary.objects.filter(provider_id=provider_id).first()
         return Response({
             'provider_id': provider_id,
-            'total_reviews': reviews.count(),
-            'average_rating': round(avg_rating, 1),
-            'rating_counts': rating_counts
+            **rating_summary_data(summary)
         }, status=status.HTTP_200_OK)
     
-    def update_provider_rating(self, provider):
-        """
-        Calculate and update the provider's average rating based on all reviews.
-        This should be called whenever a review is created, updated, or deleted.
-        
-        Args:
-            provider: The User instance for the service provider
-        """
-        # Get all public reviews for this provider
-        reviews = Review.objects.filter(provider=provider, is_public=True)
-        
-        # Calculate average rating
-        avg = reviews.aggregate(avg_rating=Avg('rating'))
-        avg_rating = avg['avg_rating'] or 0
-        
-        # Update the provider's rating (assumes User model has a rating field)
-        provider.rating = round(avg_rating, 2)
-        provider.save(update_fields=['rating'])
-        
-        return provider.rating
-    
     @action(detail=False, methods=['get'])
     def service_summary(self, request):
         """
@@ -187,21 +151,25 @@ class ReviewViewSet(viewsets.ModelViewSet):
             return Response({
                 'detail': "service_id query parameter is required."
             }, status=status.HTTP_400_BAD_REQUEST)
-            
-        # Get public reviews for this service
-        reviews = Review.objects.filter(service_id=service_id, is_public=True)
-        
-        # Calculate average rating
-        avg_rating = reviews.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0
-        
-        # Count reviews by rating
-        rating_counts = {}
-        for i in range(1, 6):
-            rating_counts[str(i)] = reviews.filter(rating=i).count()
         
+        summary = ServiceRatingSummary.objects.filter(service_id=service_id).first()
         return Response({
             'service_id': service_id,
-            'total_reviews': reviews.count(),
-            'average_rating': round(avg_rating, 1),
-            'rating_counts': rating_counts
+            **rating_summary_data(summary)
         }, status=status.HTTP_200_OK)
+
+def rating_summary_data(summary):
+    """Response fields for a provider or service summary; a missing summary means no reviews"""
+    if summary is None:
+        return {
+            'total_reviews': 0,
+            'average_rating': 0,
+            'bayesian_rating': None,
+            'rating_counts': {str(stars): 0 for stars in range(1, 6)}
+        }
+    return {
+        'total_reviews': summary.review_count,
+        'average_rating': round(summary.average_rating, 1),
+        'bayesian_rating': round(summary.bayesian_mean, 2),
+        'rating_counts': summary.rating_counts
+    }
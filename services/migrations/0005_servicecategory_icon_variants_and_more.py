@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0004_change_icon_url_to_icon_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicecategory',
+            name='icon_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized WebP variants of the icon, generated in the background'),
+        ),
+        migrations.AddField(
+            model_name='serviceimage',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized WebP variants of the image, generated in the background'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 22:57
+
+import uploads.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0005_servicecategory_icon_variants_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='serviceimage',
+            name='image',
+            field=models.ImageField(storage=uploads.storage.get_blob_storage, upload_to='service_images/'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0006_alter_serviceimage_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='rating_score',
+            field=models.DecimalField(decimal_places=3, default=0, editable=False, help_text="Bayesian rating kept in step with the service's rating summary, for ranking; 0 until reviewed", max_digits=4),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['status', '-rating_score'], name='service_rating_score_idx'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 import uuid
+from uploads.storage import get_blob_storage
 # For future GeoDjango implementation:
 # from django.contrib.gis.db import models as gis_models
 
@@ -39,6 +40,7 @@ class ServiceCategory(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     icon = models.ImageField(upload_to='category_icons/', blank=True, null=True)
+    icon_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized WebP variants of the icon, generated in the background")
     icon_name = models.CharField(max_length=50, default="home", help_text="Icon name identifier")
     sort_order = models.PositiveIntegerField(default=0, help_text="Order for displaying categories")
     is_active = models.BooleanField(default=True)
@@ -343,7 +345,8 @@ class ServiceSubCategory(models.Model):
 class ServiceImage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     service = models.ForeignKey('Service', on_delete=models.CASCADE, related_name='service_images')
-    image = models.ImageField(upload_to='service_images/')
+    image = models.ImageField(upload_to='service_images/', storage=get_blob_storage)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized WebP variants of the image, generated in the background")
     description = models.CharField(max_length=255, blank=True, null=True)
     order = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -406,12 +409,19 @@ class Service(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     is_featured = models.BooleanField(default=False)
     
+    # Ranking
+    rating_score = models.DecimalField(max_digits=4, decimal_places=3, default=0, editable=False, help_text="Bayesian rating kept in step with the service's rating summary, for ranking; 0 until reviewed")
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Listings ranked by rating
+            models.Index(fields=['status', '-rating_score'], name='service_rating_score_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import ServiceCategory, ServiceSubCategory, Service, ServiceImage, ServiceRequest
 from users.serializers import PublicUserProfileSerializer
+from uploads.serializers import ResponsiveImageField, UploadTokenField
 import base64
 import uuid
 from django.core.files.base import ContentFile
@@ -42,6 +43,7 @@ class ServiceCategorySerializer(serializers.ModelSerializer):
     - 📈 Serialization performance tracking
     - 🔄 CRUD operation logging
     """
+    icon = ResponsiveImageField(required=False, allow_null=True)
     
     class Meta:
         model = ServiceCategory
@@ -757,7 +759,7 @@ class ServiceListSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'provider', 'category', 'category_name', 'subcategories', 'title', 
             'description', 'price', 'location', 'image', 'status', 
-            'is_featured', 'created_at', 'updated_at'
+            'is_featured', 'rating_score', 'created_at', 'updated_at'
         ]
         read_only_fields = ['id', 'provider', 'status', 'is_featured', 'created_at', 'updated_at']
     
@@ -875,7 +877,7 @@ class ServiceListSerializer(serializers.ModelSerializer):
                     'error': 'Representation error occurred'
                 }
 
-class Base64ImageField(serializers.ImageField):
+class Base64ImageField(ResponsiveImageField):
     """
     🖼️ BASE64 IMAGE FIELD - ENHANCED WITH COMPREHENSIVE DEBUG TRACKING
     ==================================================================
@@ -1008,10 +1010,12 @@ class ServiceImageSerializer(serializers.ModelSerializer):
     - 🔄 Image processing operation logging
     """
     image = Base64ImageField(required=False)
+    # Token from a chunked upload (api/v1/uploads/), instead of inline base64
+    image_upload = UploadTokenField(source='image', file_type='image', required=False, write_only=True)
     
     class Meta:
         model = ServiceImage
-        fields = ['id', 'image', 'description', 'order']
+        fields = ['id', 'image', 'image_upload', 'description', 'order']
         read_only_fields = ['id']
     
     def __init__(self, *args, **kwargs):
@@ -79,7 +79,7 @@ class ServiceViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'subcategories', 'status', 'is_featured', 'provider', 'currency']
     search_fields = ['name', 'description', 'location', 'tags']
-    ordering_fields = ['created_at', 'hourly_rate', 'min_hours', 'max_hours']
+    ordering_fields = ['created_at', 'hourly_rate', 'min_hours', 'max_hours', 'rating_score']
     throttle_classes = [ServiceCreationRateThrottle]
     
     def get_queryset(self):
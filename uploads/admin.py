@@ -0,0 +1,17 @@
+from django.contrib import admin
+from .models import StoredBlob, UploadSession
+
+
+@admin.register(StoredBlob)
+class StoredBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'ref_count', 'last_referenced_at', 'created_at')
+    search_fields = ('sha256', 'name')
+    readonly_fields = ('sha256', 'name', 'size', 'ref_count', 'last_referenced_at', 'created_at')
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'user', 'status', 'received_bytes', 'total_size', 'created_at', 'expires_at')
+    list_filter = ('status',)
+    search_fields = ('filename', 'user__username')
+    readonly_fields = ('received_bytes', 'completed_at')
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+
+
+class UploadsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'uploads'
+
+    def ready(self):
+        # Hook image fields up to the background derivative pipeline
+        from .derivatives import connect_derivative_signals
+        connect_derivative_signals()
+
+        # Reference counting for content-addressed uploads
+        from .blobs import connect_blob_signals
+        connect_blob_signals()
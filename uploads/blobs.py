@@ -0,0 +1,177 @@
+"""
+Reference counting for content-addressed blobs.
+
+Each FileField listed in ``BLOB_FILE_FIELDS`` uses ``ContentAddressedStorage``.
+Signal handlers track the blob a row pointed at when it was loaded and adjust
+``StoredBlob.ref_count`` with F() updates when the row is saved with a
+different file or deleted. Blobs that drop to zero references are removed by
+``purge_unreferenced_blobs`` after a grace period, so an upload that is
+re-saved moments later can still reuse the bytes.
+"""
+import logging
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from .derivatives import derivative_name, get_derivative_sizes
+from .storage import blob_storage, is_blob_name
+
+logger = logging.getLogger(__name__)
+
+# (model label, file field) pairs stored as shared blobs
+BLOB_FILE_FIELDS = (
+    ('users.User', 'profile_picture'),
+    ('messagings.Message', 'attachment'),
+    ('services.ServiceImage', 'image'),
+)
+
+DEFAULT_PURGE_GRACE = timedelta(hours=1)
+
+
+def lock_blob(sha256, name, size):
+    """
+    Lock (creating if needed) the row for a blob being saved.
+
+    Must run inside a transaction. Holding the lock while the file is checked
+    and written means a purge can never delete the file in between. Rows are
+    keyed by ``name``, which is what the reference counting looks up.
+    """
+    from .models import StoredBlob
+
+    blob, created = StoredBlob.objects.select_for_update().get_or_create(
+        name=name, defaults={'sha256': sha256, 'size': size}
+    )
+    if not created:
+        StoredBlob.objects.filter(pk=blob.pk).update(last_referenced_at=timezone.now())
+    return blob
+
+
+def add_reference(name):
+    from .models import StoredBlob
+    StoredBlob.objects.filter(name=name).update(
+        ref_count=F('ref_count') + 1, last_referenced_at=timezone.now()
+    )
+
+
+def remove_reference(name):
+    from .models import StoredBlob
+    StoredBlob.objects.filter(name=name, ref_count__gt=0).update(
+        ref_count=F('ref_count') - 1, last_referenced_at=timezone.now()
+    )
+
+
+def _field_name_value(instance, attname):
+    # Read the raw attribute so loading a row never builds FieldFile objects
+    value = instance.__dict__.get(attname)
+    return getattr(value, 'name', value) or ''
+
+
+def _blob_fields(sender):
+    return [field for label, field in BLOB_FILE_FIELDS if label == sender._meta.label]
+
+
+def _remember_blobs(sender, instance, **kwargs):
+    instance._blob_names = {
+        field: _field_name_value(instance, field) for field in _blob_fields(sender)
+    }
+
+
+def _update_blob_references(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_blob_names', {})
+    for field in _blob_fields(sender):
+        old_name = previous.get(field, '')
+        new_name = _field_name_value(instance, field)
+        if old_name == new_name:
+            continue
+        if is_blob_name(new_name):
+            add_reference(new_name)
+        if is_blob_name(old_name):
+            remove_reference(old_name)
+        previous[field] = new_name
+    instance._blob_names = previous
+
+
+def _release_blob_references(sender, instance, **kwargs):
+    for field in _blob_fields(sender):
+        name = _field_name_value(instance, field)
+        if is_blob_name(name):
+            remove_reference(name)
+
+
+def connect_blob_signals():
+    """Connect reference tracking for every field in BLOB_FILE_FIELDS"""
+    for model_label in dict.fromkeys(label for label, _ in BLOB_FILE_FIELDS):
+        model = apps.get_model(model_label)
+        uid = f"blob_refs_{model_label}"
+        post_init.connect(_remember_blobs, sender=model, dispatch_uid=f"{uid}_init")
+        post_save.connect(_update_blob_references, sender=model, dispatch_uid=f"{uid}_save")
+        post_delete.connect(_release_blob_references, sender=model, dispatch_uid=f"{uid}_delete")
+
+
+def is_referenced(name):
+    """Check the registered fields directly, independent of the counters"""
+    for model_label, field in BLOB_FILE_FIELDS:
+        if apps.get_model(model_label)._default_manager.filter(**{field: name}).exists():
+            return True
+    return False
+
+
+def _delete_blob_files(name):
+    blob_storage.delete_blob(name)
+    for size_label in get_derivative_sizes():
+        default_storage.delete(derivative_name(name, size_label))
+
+
+def purge_unreferenced_blobs(grace=DEFAULT_PURGE_GRACE, batch_size=500):
+    """
+    Delete blobs nobody has referenced for longer than ``grace``.
+
+    Each candidate is re-checked against the model tables before deletion, so
+    a counter that drifted (e.g. a crash between the row save and the counter
+    update) can never remove a file that is still in use; such blobs have
+    their count repaired instead.
+
+    Returns:
+        int: Number of blobs removed
+    """
+    from .models import StoredBlob
+
+    cutoff = timezone.now() - grace
+    removed = 0
+    with transaction.atomic():
+        candidates = list(
+            StoredBlob.objects.select_for_update(skip_locked=True)
+            .filter(ref_count=0, last_referenced_at__lt=cutoff)
+            .order_by('last_referenced_at')[:batch_size]
+        )
+        for blob in candidates:
+            if is_referenced(blob.name):
+                logger.warning(f"Blob {blob.name} had a zero count but is referenced; repairing")
+                repair_reference_count(blob)
+                continue
+            # Files go while the row is still locked; a save of the same bytes
+            # waiting on the lock will then write a fresh copy
+            _delete_blob_files(blob.name)
+            blob.delete()
+            removed += 1
+
+    if removed:
+        logger.info(f"Purged {removed} unreferenced blobs")
+    return removed
+
+
+def repair_reference_count(blob):
+    """Recount references to ``blob`` from the registered fields"""
+    count = sum(
+        apps.get_model(model_label)._default_manager.filter(**{field: blob.name}).count()
+        for model_label, field in BLOB_FILE_FIELDS
+    )
+    type(blob).objects.filter(pk=blob.pk).update(ref_count=count, last_referenced_at=timezone.now())
+    return count
@@ -0,0 +1,296 @@
+"""
+Resumable chunked uploads.
+
+A client initiates a session with the file's name and size, PUTs byte ranges
+(``Content-Range: bytes <start>-<end>/<total>``) and then completes it. Every
+chunk is streamed to disk and then copied into its position in one ``.part``
+file, so the file is assembled on disk as it arrives and never held in memory. After a
+dropped connection the client asks for the session's ``received_bytes`` and
+continues from there.
+
+A completed session's id is an upload token: serializers accept it through
+``UploadTokenField`` and hand the part file to the model's FileField, which
+streams it into (deduplicated) storage.
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UploadSession
+
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(Exception):
+    """Raised when an upload request cannot be accepted"""
+
+
+class ChunkOffsetError(UploadError):
+    """A chunk does not continue from the bytes already received"""
+
+    def __init__(self, message, received_bytes):
+        super().__init__(message)
+        self.received_bytes = received_bytes
+
+
+def get_upload_dir():
+    return getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'upload_sessions'))
+
+
+def get_max_upload_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+
+
+def get_max_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def get_session_ttl():
+    return timedelta(hours=getattr(settings, 'CHUNKED_UPLOAD_EXPIRY_HOURS', 24))
+
+
+def part_path(session):
+    session_id = str(session.pk)
+    return os.path.join(get_upload_dir(), session_id[:2], f"{session_id}.part")
+
+
+def parse_content_range(header):
+    """
+    Parse ``bytes <start>-<end>/<total>``.
+
+    Returns:
+        tuple: (start, end, total) with ``end`` inclusive
+    """
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError("Content-Range header must look like 'bytes <start>-<end>/<total>'")
+    start, end, total = (int(value) for value in match.groups())
+    if end < start:
+        raise UploadError("Content-Range end must not be before its start")
+    return start, end, total
+
+
+def initiate_upload(user, filename, total_size, content_type='', sha256=''):
+    """Create a session and an empty part file of the declared size"""
+    if total_size <= 0:
+        raise UploadError("File size must be greater than zero")
+    if total_size > get_max_upload_size():
+        raise UploadError(f"File size exceeds the {get_max_upload_size()} byte limit")
+
+    session = UploadSession.objects.create(
+        user=user,
+        filename=os.path.basename(filename)[:255],
+        content_type=content_type,
+        total_size=total_size,
+        sha256=sha256.lower(),
+        expires_at=timezone.now() + get_session_ttl(),
+    )
+
+    path = part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Sparse on most filesystems; chunks fill it in place
+    with open(path, 'wb') as part:
+        part.truncate(total_size)
+
+    logger.debug(f"Upload session {session.pk} started for {session.filename} ({total_size} bytes)")
+    return session
+
+
+def write_chunk(session_id, user, content_range, stream):
+    """
+    Stream one chunk from ``stream`` into the session's part file.
+
+    The body is first read into a temporary file next to the part file, with
+    no lock held, so a slow client never blocks other requests for the
+    session. Only then is the session row locked to re-check the offset, copy
+    the chunk into place and advance ``received_bytes``, so concurrent chunks
+    for the same upload are applied one at a time. A chunk may overlap bytes
+    already received (a retried request) but must not leave a gap.
+
+    Returns:
+        UploadSession: The updated session
+    """
+    start, end, total = parse_content_range(content_range)
+    length = end - start + 1
+    if length > get_max_chunk_size():
+        raise UploadError(f"Chunks may not exceed {get_max_chunk_size()} bytes")
+
+    # Refuse bad chunks before reading their body
+    session = _get_session(session_id, user)
+    _check_chunk(session, start, end, total)
+
+    fd, chunk_path = tempfile.mkstemp(dir=os.path.dirname(part_path(session)), suffix='.chunk')
+    try:
+        written = 0
+        with os.fdopen(fd, 'wb') as chunk:
+            while written < length:
+                data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                if not data:
+                    break
+                chunk.write(data)
+                written += len(data)
+
+        if written != length:
+            # Connection dropped mid-chunk; keep the old offset so the client retries
+            raise ChunkOffsetError(
+                f"Chunk body ended after {written} of {length} bytes",
+                session.received_bytes,
+            )
+
+        with transaction.atomic():
+            session = _get_session(session_id, user, lock=True)
+            _check_chunk(session, start, end, total)
+            with open(chunk_path, 'rb') as chunk, open(part_path(session), 'r+b') as part:
+                part.seek(start)
+                shutil.copyfileobj(chunk, part, COPY_BUFFER_SIZE)
+
+            session.received_bytes = max(session.received_bytes, end + 1)
+            session.save(update_fields=['received_bytes', 'updated_at'])
+    finally:
+        try:
+            os.remove(chunk_path)
+        except FileNotFoundError:
+            pass
+    return session
+
+
+def _check_chunk(session, start, end, total):
+    if session.status != 'pending':
+        raise UploadError(f"Upload is already {session.status}")
+    if total != session.total_size or end >= session.total_size:
+        raise UploadError("Chunk lies outside the declared file size")
+    if start > session.received_bytes:
+        raise ChunkOffsetError(
+            f"Expected a chunk starting at byte {session.received_bytes}",
+            session.received_bytes,
+        )
+
+
+def complete_upload(session_id, user):
+    """Verify a fully received upload and turn it into a usable token"""
+    with transaction.atomic():
+        session = _get_session(session_id, user, lock=True)
+        if session.status == 'completed':
+            return session
+        if session.status != 'pending':
+            raise UploadError(f"Upload is already {session.status}")
+        if session.received_bytes != session.total_size:
+            raise ChunkOffsetError(
+                f"Only {session.received_bytes} of {session.total_size} bytes received",
+                session.received_bytes,
+            )
+
+        if session.sha256:
+            digest = hashlib.sha256()
+            with open(part_path(session), 'rb') as part:
+                for data in iter(lambda: part.read(COPY_BUFFER_SIZE), b''):
+                    digest.update(data)
+            if digest.hexdigest() != session.sha256:
+                raise UploadError("Checksum mismatch; the upload is corrupted")
+
+        now = timezone.now()
+        session.status = 'completed'
+        session.completed_at = now
+        session.expires_at = now + get_session_ttl()
+        session.save(update_fields=['status', 'completed_at', 'expires_at', 'updated_at'])
+
+    logger.info(f"Upload session {session.pk} completed ({session.total_size} bytes)")
+    return session
+
+
+def _get_session(session_id, user, lock=False):
+    sessions = UploadSession.objects.select_for_update() if lock else UploadSession.objects
+    try:
+        session = sessions.get(pk=session_id, user=user)
+    except UploadSession.DoesNotExist:
+        raise UploadError("Upload session not found")
+    if session.is_expired:
+        raise UploadError("Upload session has expired")
+    return session
+
+
+def resolve_upload_token(token, user):
+    """Return the completed, unexpired session ``token`` refers to for ``user``"""
+    session = UploadSession.objects.filter(pk=token, user=user).first()
+    if session is None:
+        raise UploadError("Unknown upload token")
+    if session.status != 'completed':
+        raise UploadError("Upload has not been completed")
+    if session.is_expired:
+        raise UploadError("Upload token has expired")
+    return session
+
+
+class AssembledUpload(File):
+    """
+    The part file of a completed upload.
+
+    The file is only open while it is read: inside a ``with`` block, or while
+    storage consumes ``chunks()``. Handing one to a FileField therefore never
+    leaves a descriptor open after the model is saved.
+    """
+
+    def __init__(self, session):
+        super().__init__(None, name=session.filename)
+        self.path = part_path(session)
+        self.size = session.total_size
+
+    def open(self, mode='rb'):
+        if self.closed:
+            self.file = open(self.path, mode)
+        else:
+            self.seek(0)
+        return self
+
+    def __enter__(self):
+        return self.open()
+
+    def chunks(self, chunk_size=None):
+        opened_here = self.closed
+        self.open()
+        try:
+            yield from super().chunks(chunk_size)
+        finally:
+            if opened_here:
+                self.close()
+
+
+def open_upload(session):
+    """The assembled file, for a FileField to stream into storage"""
+    return AssembledUpload(session)
+
+
+def cleanup_expired_uploads(batch_size=500):
+    """
+    Delete expired sessions and their part files.
+
+    Returns:
+        int: Number of sessions removed
+    """
+    expired = list(
+        UploadSession.objects.filter(expires_at__lt=timezone.now())
+        .order_by('expires_at')[:batch_size]
+    )
+    for session in expired:
+        try:
+            os.remove(part_path(session))
+        except FileNotFoundError:
+            pass
+
+    UploadSession.objects.filter(pk__in=[session.pk for session in expired]).delete()
+    if expired:
+        logger.info(f"Removed {len(expired)} expired upload sessions")
+    return len(expired)
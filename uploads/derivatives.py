@@ -0,0 +1,200 @@
+"""
+Responsive image derivatives for uploaded pictures.
+
+Uploads are stored exactly as received so the request can return
+immediately. A background task then renders bounded WebP variants
+(thumbnail, medium, full) with EXIF metadata removed and records their URLs
+in a ``<field>_variants`` JSON field on the owning model.
+"""
+import io
+import logging
+import os
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DERIVATIVE_SIZES = {
+    'thumbnail': 150,
+    'medium': 600,
+    'full': 1920,
+}
+
+DEFAULT_DERIVATIVE_QUALITY = 80
+
+# (model label, image field, JSON field holding the variant URLs)
+IMAGE_DERIVATIVE_FIELDS = (
+    ('users.User', 'profile_picture', 'profile_picture_variants'),
+    ('services.ServiceCategory', 'icon', 'icon_variants'),
+    ('services.ServiceImage', 'image', 'image_variants'),
+    ('reviews.ReviewImage', 'image', 'image_variants'),
+)
+
+
+def get_derivative_sizes():
+    """Return the configured ``{label: max_dimension}`` mapping"""
+    return getattr(settings, 'IMAGE_DERIVATIVE_SIZES', DEFAULT_DERIVATIVE_SIZES)
+
+
+def get_variants_field(model_label, field_name):
+    """Look up the JSON field that stores variants for ``model_label.field_name``"""
+    for label, image_field, variants_field in IMAGE_DERIVATIVE_FIELDS:
+        if label.lower() == model_label.lower() and image_field == field_name:
+            return variants_field
+    return None
+
+
+def derivative_name(source_name, size_label):
+    """Storage name of a derivative, kept next to the original's path"""
+    stem, _ = os.path.splitext(source_name)
+    return f"derivatives/{stem}_{size_label}.webp"
+
+
+def load_normalized_image(file_obj):
+    """
+    Open an image and bake in its EXIF orientation.
+
+    The derivatives are written without metadata, so rotation has to be
+    applied to the pixels before the EXIF block is discarded.
+    """
+    image = Image.open(file_obj)
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def render_derivative(image, max_dimension, quality=DEFAULT_DERIVATIVE_QUALITY):
+    """
+    Render ``image`` as WebP bounded by ``max_dimension`` on its longest side.
+
+    Images smaller than the bound are re-encoded but never upscaled. No
+    ``exif`` or ``icc_profile`` is passed to the encoder, which strips them.
+
+    Returns:
+        tuple: (webp bytes, (width, height))
+    """
+    variant = image.copy()
+    variant.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+    output = io.BytesIO()
+    variant.save(output, format='WEBP', quality=quality, method=4)
+    return output.getvalue(), variant.size
+
+
+def generate_image_variants(instance, field_name, variants_field):
+    """
+    Render and store every configured derivative for ``instance.field_name``.
+
+    The variants are written with a conditional UPDATE so a newer upload that
+    replaced the file while this ran is never overwritten with stale URLs.
+
+    Returns:
+        dict: The variants document that was stored (empty if no image)
+    """
+    field_file = getattr(instance, field_name)
+    if not field_file:
+        return {}
+
+    # Derivatives are regenerated in place, so they never go through the
+    # content-addressed storage the source may be using
+    storage = default_storage
+    source_name = field_file.name
+    quality = getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', DEFAULT_DERIVATIVE_QUALITY)
+
+    variants = {'source': source_name, 'format': 'webp'}
+    with field_file.open('rb') as source:
+        image = load_normalized_image(source)
+
+        for size_label, max_dimension in get_derivative_sizes().items():
+            data, (width, height) = render_derivative(image, max_dimension, quality)
+
+            name = derivative_name(source_name, size_label)
+            if storage.exists(name):
+                storage.delete(name)
+            saved_name = storage.save(name, ContentFile(data))
+
+            variants[size_label] = {
+                'url': storage.url(saved_name),
+                'width': width,
+                'height': height,
+                'bytes': len(data),
+            }
+
+    variants['generated_at'] = timezone.now().isoformat()
+
+    updated = type(instance).objects.filter(
+        pk=instance.pk, **{field_name: source_name}
+    ).update(**{variants_field: variants})
+
+    if updated:
+        logger.info(f"Generated {len(get_derivative_sizes())} derivatives for {source_name}")
+    else:
+        logger.debug(f"Skipped stale derivatives for {source_name}; source changed during processing")
+    return variants
+
+
+def schedule_image_derivatives(instance, field_name, variants_field):
+    """
+    Queue derivative generation if the stored variants don't match the file.
+
+    Runs after the surrounding transaction commits so the worker always sees
+    the saved row. Clearing the image also clears its variants.
+    """
+    field_file = getattr(instance, field_name)
+    current_variants = getattr(instance, variants_field) or {}
+
+    if not field_file:
+        if current_variants:
+            type(instance).objects.filter(pk=instance.pk).update(**{variants_field: {}})
+        return False
+
+    if current_variants.get('source') == field_file.name:
+        return False
+
+    from .tasks import generate_image_derivatives
+
+    model_label = instance._meta.label
+    pk = str(instance.pk)
+    transaction.on_commit(
+        lambda: generate_image_derivatives.delay(model_label, pk, field_name)
+    )
+    return True
+
+
+def _derivative_post_save(field_name, variants_field):
+    def handler(sender, instance, raw=False, **kwargs):
+        if raw:
+            return
+        try:
+            schedule_image_derivatives(instance, field_name, variants_field)
+        except Exception as e:
+            # Never fail the upload itself because derivatives couldn't be queued
+            logger.error(f"Failed to schedule derivatives for {sender.__name__}.{field_name}: {e}")
+    return handler
+
+
+_connected_handlers = []
+
+
+def connect_derivative_signals():
+    """Connect a post_save handler for every registered image field"""
+    for model_label, field_name, variants_field in IMAGE_DERIVATIVE_FIELDS:
+        model = apps.get_model(model_label)
+        handler = _derivative_post_save(field_name, variants_field)
+        # Keep a strong reference; signals only hold weak references by default
+        _connected_handlers.append(handler)
+        post_save.connect(
+            handler,
+            sender=model,
+            dispatch_uid=f"image_derivatives_{model_label}_{field_name}",
+        )
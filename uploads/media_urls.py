@@ -0,0 +1,6 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('resize/', views.resize_image, name='media-resize'),
+]
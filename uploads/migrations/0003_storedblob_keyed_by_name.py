@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0002_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='storedblob',
+            name='sha256',
+            field=models.CharField(db_index=True, help_text='Content hash; the same bytes saved with another extension get their own blob', max_length=64),
+        ),
+    ]
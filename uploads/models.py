@@ -0,0 +1,71 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class StoredBlob(models.Model):
+    """
+    A single stored copy of some file content, shared by every FileField
+    that uploaded the same bytes.
+    """
+    sha256 = models.CharField(max_length=64, db_index=True, help_text="Content hash; the same bytes saved with another extension get their own blob")
+    name = models.CharField(max_length=255, unique=True, help_text="Storage name of the blob")
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0, help_text="Number of model fields pointing at this blob")
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_referenced_at = models.DateTimeField(default=timezone.now, help_text="Last time the blob was saved or referenced")
+
+    class Meta:
+        verbose_name = 'Stored Blob'
+        verbose_name_plural = 'Stored Blobs'
+        indexes = [
+            # Purge scans unreferenced blobs by age
+            models.Index(fields=['ref_count', 'last_referenced_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable, chunked upload.
+
+    Chunks are written in place into a single part file on disk, so the
+    upload is assembled as it arrives. Once completed, the session id is the
+    upload token other endpoints accept in place of an inline file.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Receiving Chunks'),
+        ('completed', 'Completed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    total_size = models.BigIntegerField(help_text="Declared size of the whole file in bytes")
+    received_bytes = models.BigIntegerField(default=0, help_text="Contiguous bytes received from the start of the file")
+    sha256 = models.CharField(max_length=64, blank=True, help_text="Optional checksum verified on completion")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Upload Session'
+        verbose_name_plural = 'Upload Sessions'
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size}) - {self.status}"
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
@@ -0,0 +1,298 @@
+"""
+On-demand image resizing with a sharded on-disk cache.
+
+Resize URLs carry their parameters, the version of the source they were
+built for and an HMAC signature, so only URLs the API handed out can make the
+server render anything, and a replaced original gets new URLs. Rendered images are kept
+under ``IMAGE_RESIZE_CACHE_DIR`` in two levels of hex shards
+(``ab/cd/abcd....webp``). A hit refreshes the file's mtime, and the sweeper
+evicts the least recently used entries once the cache outgrows its budget.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils._os import safe_join
+from PIL import Image, UnidentifiedImageError
+
+from .derivatives import DEFAULT_DERIVATIVE_QUALITY, load_normalized_image
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_SALT = 'uploads.resize'
+
+RESIZE_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+# Hits only refresh the mtime when it is older than this, to keep the
+# per-request cost at a stat() instead of a metadata write
+LRU_TOUCH_INTERVAL = 60 * 60
+
+_SWEEP_STAMP = '.last-sweep'
+
+
+class ResizeError(Exception):
+    """Raised when a resize request is invalid or the source is unusable"""
+
+
+def get_cache_dir():
+    return getattr(settings, 'IMAGE_RESIZE_CACHE_DIR', os.path.join(settings.BASE_DIR, 'media_cache'))
+
+
+def get_max_dimension():
+    return getattr(settings, 'IMAGE_RESIZE_MAX_DIMENSION', 2560)
+
+
+def get_width_step():
+    return getattr(settings, 'IMAGE_RESIZE_WIDTH_STEP', 50)
+
+
+def canonical_params(path, width, height=None, fmt='webp', quality=None, version=None):
+    """Normalized, ordered parameters; the signature is computed over these"""
+    params = [('path', path), ('w', str(int(width)))]
+    if height:
+        params.append(('h', str(int(height))))
+    params.append(('fmt', fmt))
+    if quality:
+        params.append(('q', str(int(quality))))
+    if version:
+        params.append(('v', version))
+    return params
+
+
+def source_version(source_stat):
+    """Short tag that changes whenever the source file is replaced"""
+    value = f"{source_stat.st_mtime_ns}:{source_stat.st_size}"
+    return hashlib.sha256(value.encode('ascii')).hexdigest()[:12]
+
+
+def sign_params(params):
+    value = urlencode(params)
+    return salted_hmac(SIGNATURE_SALT, value, algorithm='sha256').hexdigest()[:32]
+
+
+def round_width(width):
+    """
+    Snap a requested width up to the configured step and clamp it.
+
+    Bucketing keeps the number of distinct renders (and cache entries) per
+    image small even when clients ask for every pixel width.
+    """
+    step = get_width_step()
+    width = max(16, min(int(width), get_max_dimension()))
+    if step > 1:
+        width = min(-(-width // step) * step, get_max_dimension())
+    return width
+
+
+def build_resize_url(path, width, height=None, fmt='webp', quality=None):
+    """Return a signed ``media/resize/`` URL for the current version of a file under MEDIA_ROOT"""
+    try:
+        version = source_version(os.stat(safe_join(settings.MEDIA_ROOT, path)))
+    except (OSError, SuspiciousFileOperation):
+        version = None
+    params = canonical_params(path, round_width(width), height, fmt, quality, version)
+    params.append(('sig', sign_params(params)))
+    return f"{reverse('media-resize')}?{urlencode(params)}"
+
+
+def parse_resize_params(query):
+    """
+    Validate the query of a resize request.
+
+    Returns:
+        dict: path, width, height, fmt, quality and the source version the URL was signed for
+
+    Raises:
+        ResizeError: On a bad signature or out-of-range values
+    """
+    path = query.get('path', '')
+    fmt = query.get('fmt', 'webp')
+    try:
+        width = int(query.get('w', ''))
+        height = int(query['h']) if query.get('h') else None
+        quality = int(query['q']) if query.get('q') else None
+    except ValueError:
+        raise ResizeError("Width, height and quality must be integers")
+
+    version = query.get('v') or None
+    params = canonical_params(path, width, height, fmt, quality, version)
+    if not constant_time_compare(sign_params(params), query.get('sig', '')):
+        raise ResizeError("Invalid signature")
+
+    max_dimension = get_max_dimension()
+    if not 0 < width <= max_dimension or (height is not None and not 0 < height <= max_dimension):
+        raise ResizeError(f"Dimensions must be between 1 and {max_dimension}")
+    if fmt not in RESIZE_FORMATS:
+        raise ResizeError(f"Unsupported format '{fmt}'")
+    if quality is not None and not 1 <= quality <= 100:
+        raise ResizeError("Quality must be between 1 and 100")
+
+    return {'path': path, 'width': width, 'height': height, 'fmt': fmt, 'quality': quality, 'version': version}
+
+
+def source_path(path):
+    """Absolute path of a file under MEDIA_ROOT, refusing traversal"""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise ResizeError("Invalid path")
+    if not path or not os.path.isfile(full_path):
+        raise ResizeError("Source image not found")
+    return full_path
+
+
+def cache_key(params, source_stat):
+    """
+    Cache key for a render.
+
+    The source's size and mtime are part of the key, so replacing an original
+    makes its old renders unreachable; the sweeper reclaims them later.
+    """
+    value = urlencode(canonical_params(
+        params['path'], params['width'], params['height'], params['fmt'], params['quality']
+    ) + [('mtime', str(source_stat.st_mtime_ns)), ('size', str(source_stat.st_size))])
+    return salted_hmac(SIGNATURE_SALT, value, algorithm='sha256').hexdigest()
+
+
+def cache_relative_path(key, fmt):
+    return os.path.join(key[:2], key[2:4], f"{key}.{fmt}")
+
+
+def render_resized(source, params):
+    """Render ``source`` to fit within width x height without upscaling"""
+    pil_format, _ = RESIZE_FORMATS[params['fmt']]
+    image = load_normalized_image(source)
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    bound = (params['width'], params['height'] or get_max_dimension())
+    image.thumbnail(bound, Image.Resampling.LANCZOS)
+
+    quality = params['quality'] or getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', DEFAULT_DERIVATIVE_QUALITY)
+    save_kwargs = {'optimize': True} if pil_format == 'PNG' else {'quality': quality}
+    return image, pil_format, save_kwargs
+
+
+def get_or_create_resized(params):
+    """
+    Return ``(absolute cache path, relative cache path, source stat)``.
+
+    Renders on a miss. The write goes to a temp file in the shard followed by
+    ``os.replace``, so concurrent workers never serve a half-written file; if
+    two of them race on the same key the last rename simply wins.
+    """
+    full_source = source_path(params['path'])
+    source_stat = os.stat(full_source)
+
+    cache_dir = get_cache_dir()
+    relative = cache_relative_path(cache_key(params, source_stat), params['fmt'])
+    cached = os.path.join(cache_dir, relative)
+
+    try:
+        cached_stat = os.stat(cached)
+    except FileNotFoundError:
+        cached_stat = None
+
+    if cached_stat is not None:
+        if time.time() - cached_stat.st_mtime > LRU_TOUCH_INTERVAL:
+            os.utime(cached)
+        return cached, relative, source_stat
+
+    try:
+        with open(full_source, 'rb') as source:
+            image, pil_format, save_kwargs = render_resized(source, params)
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        raise ResizeError("Source is not a supported image")
+
+    shard = os.path.dirname(cached)
+    os.makedirs(shard, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=shard, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            image.save(output, format=pil_format, **save_kwargs)
+        os.replace(tmp_path, cached)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    logger.debug(f"Rendered {params['path']} at {params['width']}px into resize cache")
+    schedule_sweep_if_due(cache_dir)
+    return cached, relative, source_stat
+
+
+def schedule_sweep_if_due(cache_dir):
+    """Queue an eviction pass at most once per sweep interval"""
+    interval = getattr(settings, 'IMAGE_RESIZE_CACHE_SWEEP_INTERVAL', 300)
+    stamp = os.path.join(cache_dir, _SWEEP_STAMP)
+    try:
+        if time.time() - os.stat(stamp).st_mtime < interval:
+            return False
+    except FileNotFoundError:
+        pass
+
+    # Claim the sweep before queueing so concurrent misses don't all enqueue one
+    with open(stamp, 'a'):
+        os.utime(stamp)
+
+    from .tasks import evict_resize_cache
+    evict_resize_cache.delay()
+    return True
+
+
+def evict_lru(cache_dir=None, max_bytes=None, low_water=0.9):
+    """
+    Delete least recently used renders until the cache is under budget.
+
+    Eviction stops at ``low_water * max_bytes`` so the next few misses don't
+    immediately trigger another sweep.
+
+    Returns:
+        tuple: (files removed, bytes freed)
+    """
+    cache_dir = cache_dir or get_cache_dir()
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'IMAGE_RESIZE_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+
+    entries = []
+    total = 0
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if name == _SWEEP_STAMP:
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    if total <= max_bytes:
+        return 0, 0
+
+    target = max_bytes * low_water
+    removed = freed = 0
+    for _, size, path in sorted(entries):
+        if total - freed <= target:
+            break
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+        freed += size
+
+    logger.info(f"Resize cache sweep removed {removed} files ({freed} bytes)")
+    return removed, freed
@@ -0,0 +1,169 @@
+import os
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+
+from .chunked import UploadError, open_upload, resolve_upload_token
+from .models import UploadSession
+from .resize import build_resize_url
+
+IMAGE_SIZE_QUERY_PARAM = 'image_size'
+IMAGE_WIDTH_QUERY_PARAM = 'image_width'
+
+
+class ResponsiveImageField(serializers.ImageField):
+    """
+    Image field that returns a pre-rendered variant when the client asks for one.
+
+    Clients pass ``?image_size=thumbnail|medium|full``, or ``?image_width=<px>``
+    for a signed on-demand resize URL. Without either parameter, or before the
+    background derivatives exist, the original upload URL is returned so
+    existing clients see no change.
+    """
+
+    def get_query_param(self, name):
+        request = self.context.get('request')
+        if request is None:
+            return None
+        params = getattr(request, 'query_params', request.GET)
+        return params.get(name)
+
+    def get_requested_size(self):
+        return self.get_query_param(IMAGE_SIZE_QUERY_PARAM)
+
+    def get_resize_url(self, value):
+        width = self.get_query_param(IMAGE_WIDTH_QUERY_PARAM)
+        if not width or not value or not getattr(value, 'name', None):
+            return None
+        try:
+            return build_resize_url(value.name, int(width))
+        except ValueError:
+            return None
+
+    def get_variant_url(self, value):
+        size = self.get_requested_size()
+        if not size or not value:
+            return None
+
+        instance = getattr(value, 'instance', None)
+        field = getattr(value, 'field', None)
+        if instance is None or field is None:
+            return None
+
+        variants = getattr(instance, f'{field.name}_variants', None) or {}
+        # Variants from a previous upload must not be served for a new one
+        if variants.get('source') != value.name:
+            return None
+
+        variant = variants.get(size)
+        return variant.get('url') if variant else None
+
+    def to_representation(self, value):
+        variant_url = self.get_resize_url(value) or self.get_variant_url(value)
+        if variant_url is None:
+            return super().to_representation(value)
+
+        request = self.context.get('request')
+        if request is not None and getattr(self, 'use_url', True):
+            return request.build_absolute_uri(variant_url)
+        return variant_url
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+
+# Leading bytes every file of a type starts with; types without a fixed
+# signature (plain text, CSV) are only checked by extension
+OLE_SIGNATURE = b'\xd0\xcf\x11\xe0'
+ZIP_SIGNATURE = b'PK\x03\x04'
+DOCUMENT_SIGNATURES = {
+    '.pdf': b'%PDF-',
+    '.doc': OLE_SIGNATURE,
+    '.xls': OLE_SIGNATURE,
+    '.docx': ZIP_SIGNATURE,
+    '.xlsx': ZIP_SIGNATURE,
+    '.txt': b'',
+    '.csv': b'',
+}
+DOCUMENT_EXTENSIONS = IMAGE_EXTENSIONS + tuple(DOCUMENT_SIGNATURES)
+
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024
+
+
+class UploadTokenField(serializers.UUIDField):
+    """
+    Accepts the token of a completed chunked upload in place of file data.
+
+    Validates that the upload belongs to the requesting user and that its
+    content is what ``file_type`` allows, then returns a ``File`` over the
+    assembled part file, ready to assign to a FileField. Tokens stay valid
+    until the session expires, so a retried request can reuse the same upload.
+
+    Args:
+        file_type: ``'image'`` for pictures Pillow can open, or ``'document'``
+            for images and the office documents ``DocumentImageProcessor``
+            accepts. Anything a browser would render as a page (HTML, SVG)
+            is refused either way.
+        max_size: Largest accepted file in bytes, or None for the upload limit
+    """
+
+    def __init__(self, file_type='document', max_size=DEFAULT_MAX_SIZE, **kwargs):
+        self.file_type = file_type
+        self.max_size = max_size
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        token = super().to_internal_value(data)
+        request = self.context.get('request')
+        if request is None or not request.user.is_authenticated:
+            raise serializers.ValidationError("Upload tokens require an authenticated request.")
+        try:
+            session = resolve_upload_token(token, request.user)
+        except UploadError as e:
+            raise serializers.ValidationError(str(e))
+
+        upload = open_upload(session)
+        with upload:
+            self.validate_content(upload)
+        return upload
+
+    def validate_content(self, upload):
+        if self.max_size is not None and upload.size > self.max_size:
+            raise serializers.ValidationError(f"File too large. Maximum size: {self.max_size / 1024 / 1024:.1f}MB")
+
+        extension = os.path.splitext(upload.name)[1].lower()
+        allowed = IMAGE_EXTENSIONS if self.file_type == 'image' else DOCUMENT_EXTENSIONS
+        if extension not in allowed:
+            raise serializers.ValidationError(
+                f"Unsupported file type: {extension or 'none'}. Allowed types: {', '.join(allowed)}"
+            )
+
+        if extension in IMAGE_EXTENSIONS:
+            # Pillow has to recognise the content, whatever the name says
+            try:
+                serializers.ImageField().run_validation(upload)
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.messages)
+        elif not upload.read(len(DOCUMENT_SIGNATURES[extension])).startswith(DOCUMENT_SIGNATURES[extension]):
+            raise serializers.ValidationError(f"File content does not match its {extension} extension.")
+        upload.seek(0)
+
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    """Serializer for starting a chunked upload"""
+    filename = serializers.CharField(max_length=255)
+    total_size = serializers.IntegerField(min_value=1)
+    content_type = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True, default='')
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for the state of a chunked upload"""
+    upload_token = serializers.UUIDField(source='id', read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'upload_token', 'filename', 'content_type', 'total_size',
+            'received_bytes', 'status', 'created_at', 'completed_at', 'expires_at'
+        ]
+        read_only_fields = fields
@@ -0,0 +1,98 @@
+"""
+Content-addressed file storage.
+
+Uploads are hashed while they are streamed to disk and stored once under
+``blobs/<aa>/<bb>/<sha256><ext>``. Saving bytes that already exist skips the
+write and returns the existing name, so retried uploads cost a hash pass and
+nothing else. The name (hash plus extension) is the blob's identity, so the
+same bytes uploaded as ``.jpg`` and ``.png`` are two blobs, each counted and
+purged on its own. Only public files belong here: anything in ``blobs/`` can
+be reached by whoever learns its hash. Blob bookkeeping (reference counts, purging) lives in
+``uploads.blobs``.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+
+
+def blob_name_for(sha256, extension):
+    return f"{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(f"{BLOB_PREFIX}/")
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by the SHA-256 of their content"""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        extension = os.path.splitext(name)[1].lower()
+        tmp_dir = self.path(os.path.join(BLOB_PREFIX, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as output:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    output.write(chunk)
+                    size += len(chunk)
+
+            sha256 = digest.hexdigest()
+            blob_name = blob_name_for(sha256, extension)
+            full_path = self.path(blob_name)
+
+            from .blobs import lock_blob
+
+            # The blob row lock serialises this check against a concurrent purge
+            with transaction.atomic():
+                lock_blob(sha256, blob_name, size)
+                if os.path.exists(full_path):
+                    # Same bytes already stored; keep the existing blob
+                    os.unlink(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(tmp_path, self.file_permissions_mode)
+                    # Atomic, so concurrent uploads of the same bytes can't tear the file
+                    os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        return blob_name
+
+    def delete(self, name):
+        # Blobs are shared; they are only removed by purge_unreferenced_blobs
+        if is_blob_name(name):
+            return
+        super().delete(name)
+
+    def delete_blob(self, name):
+        """Remove a blob's file; only called once it has no references"""
+        super().delete(name)
+
+
+def get_blob_storage():
+    """Storage callable for FileFields that should be deduplicated"""
+    return blob_storage
+
+
+blob_storage = ContentAddressedStorage()
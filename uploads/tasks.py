@@ -0,0 +1,64 @@
+"""
+Background tasks for uploaded media.
+"""
+import logging
+
+from celery import shared_task
+from django.apps import apps
+from PIL import UnidentifiedImageError
+
+from .derivatives import generate_image_variants, get_variants_field
+from .blobs import purge_unreferenced_blobs
+from .chunked import cleanup_expired_uploads
+from .resize import evict_lru
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(
+    name='uploads.generate_image_derivatives',
+    bind=True,
+    max_retries=3,
+    default_retry_delay=30,
+    ignore_result=True,
+)
+def generate_image_derivatives(self, model_label, pk, field_name):
+    """Render the responsive variants for one stored image."""
+    model = apps.get_model(model_label)
+    variants_field = get_variants_field(model_label, field_name)
+    if not variants_field:
+        logger.warning(f"No derivative configuration for {model_label}.{field_name}")
+        return
+
+    try:
+        instance = model.objects.get(pk=pk)
+    except model.DoesNotExist:
+        logger.debug(f"{model_label} {pk} was deleted before derivatives were generated")
+        return
+
+    try:
+        generate_image_variants(instance, field_name, variants_field)
+    except UnidentifiedImageError:
+        # Not an image Pillow can read; the original stays as the only version
+        logger.warning(f"Cannot generate derivatives for {model_label} {pk}: unreadable image")
+    except OSError as exc:
+        # Storage hiccups are worth another attempt
+        raise self.retry(exc=exc)
+
+
+@shared_task(name='uploads.evict_resize_cache', ignore_result=True)
+def evict_resize_cache():
+    """Trim the on-demand resize cache back under its size budget."""
+    evict_lru()
+
+
+@shared_task(name='uploads.purge_unreferenced_blobs', ignore_result=True)
+def purge_unreferenced_blobs_task():
+    """Remove deduplicated blobs that nothing has referenced for a while."""
+    purge_unreferenced_blobs()
+
+
+@shared_task(name='uploads.cleanup_expired_uploads', ignore_result=True)
+def cleanup_expired_uploads_task():
+    """Delete chunked upload sessions past their expiry, with their part files."""
+    cleanup_expired_uploads()
@@ -0,0 +1,458 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from messagings.models import MessageThread
+from messagings.serializers import MessageCreateSerializer
+from uploads.blobs import purge_unreferenced_blobs
+from uploads.chunked import open_upload
+from uploads.models import StoredBlob, UploadSession
+from uploads.resize import build_resize_url, evict_lru
+from uploads.serializers import UploadTokenField
+from users.models import Verification
+from users.serializers import PublicUserProfileSerializer
+
+User = get_user_model()
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_jpeg(size=(1200, 800), orientation=None):
+    """Build an in-memory JPEG, optionally tagged with an EXIF orientation"""
+    image = Image.new('RGB', size, color=(200, 40, 40))
+    exif = Image.Exif()
+    exif[0x010F] = 'TestCamera'  # Make
+    if orientation:
+        exif[0x0112] = orientation
+    output = io.BytesIO()
+    image.save(output, format='JPEG', exif=exif.tobytes())
+    return output.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, CELERY_TASK_ALWAYS_EAGER=True)
+class ImageDerivativeTestCase(TestCase):
+    """Test cases for background image derivative generation"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='pictureuser',
+            email='picture@test.com',
+            user_type='customer'
+        )
+
+    def upload_picture(self, data, name='avatar.jpg'):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile_picture.save(name, ContentFile(data))
+        self.user.refresh_from_db()
+
+    def test_variants_generated_on_upload(self):
+        """Saving a picture renders bounded WebP variants without EXIF"""
+        self.upload_picture(make_jpeg())
+
+        variants = self.user.profile_picture_variants
+        self.assertEqual(variants['source'], self.user.profile_picture.name)
+        self.assertEqual(variants['format'], 'webp')
+        self.assertEqual((variants['thumbnail']['width'], variants['thumbnail']['height']), (150, 100))
+        self.assertEqual((variants['medium']['width'], variants['medium']['height']), (600, 400))
+        # Never upscaled past the original
+        self.assertEqual((variants['full']['width'], variants['full']['height']), (1200, 800))
+
+        storage = self.user.profile_picture.storage
+        stored_name = variants['thumbnail']['url'].split(storage.base_url, 1)[-1]
+        with storage.open(stored_name, 'rb') as stored:
+            rendered = Image.open(stored)
+            self.assertEqual(rendered.format, 'WEBP')
+            self.assertNotIn('exif', rendered.info)
+
+    def test_exif_orientation_applied(self):
+        """Rotated photos are turned upright before metadata is dropped"""
+        # Orientation 6 means the camera was rotated 90 degrees clockwise
+        self.upload_picture(make_jpeg(size=(400, 200), orientation=6))
+
+        thumbnail = self.user.profile_picture_variants['thumbnail']
+        self.assertEqual((thumbnail['width'], thumbnail['height']), (75, 150))
+
+    def test_clearing_picture_clears_variants(self):
+        """Removing the picture removes its variant URLs"""
+        self.upload_picture(make_jpeg())
+        self.assertTrue(self.user.profile_picture_variants)
+
+        self.user.profile_picture = None
+        self.user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture_variants, {})
+
+    def test_serializer_returns_requested_size(self):
+        """?image_size= selects a variant; without it the original is returned"""
+        self.upload_picture(make_jpeg())
+        factory = APIRequestFactory()
+
+        request = factory.get('/', {'image_size': 'thumbnail'})
+        data = PublicUserProfileSerializer(self.user, context={'request': request}).data
+        self.assertTrue(data['profile_picture'].endswith('_thumbnail.webp'))
+
+        request = factory.get('/')
+        data = PublicUserProfileSerializer(self.user, context={'request': request}).data
+        self.assertTrue(data['profile_picture'].endswith(self.user.profile_picture.name))
+
+    def test_stale_variants_not_served(self):
+        """Variants of a previous upload are ignored until regenerated"""
+        self.upload_picture(make_jpeg())
+        self.user.profile_picture_variants = dict(self.user.profile_picture_variants, source='old.jpg')
+        request = APIRequestFactory().get('/', {'image_size': 'medium'})
+
+        data = PublicUserProfileSerializer(self.user, context={'request': request}).data
+        self.assertFalse(data['profile_picture'].endswith('.webp'))
+
+
+TEST_RESIZE_CACHE_DIR = tempfile.mkdtemp()
+
+
+@override_settings(
+    MEDIA_ROOT=TEST_MEDIA_ROOT,
+    IMAGE_RESIZE_CACHE_DIR=TEST_RESIZE_CACHE_DIR,
+    MEDIA_ACCEL_REDIRECT_CACHE_PREFIX='',
+    CELERY_TASK_ALWAYS_EAGER=True,
+)
+class ImageResizeViewTestCase(TestCase):
+    """Test cases for the signed media/resize/ endpoint"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(TEST_MEDIA_ROOT, exist_ok=True)
+        with open(os.path.join(TEST_MEDIA_ROOT, 'resize-source.jpg'), 'wb') as f:
+            f.write(make_jpeg())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_RESIZE_CACHE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        # Every test starts from an empty cache
+        shutil.rmtree(TEST_RESIZE_CACHE_DIR, ignore_errors=True)
+
+    def test_signed_resize_renders_and_caches(self):
+        """A signed URL renders once; the second request is served from disk"""
+        url = build_resize_url('resize-source.jpg', 320)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        body = b''.join(response.streaming_content)
+        self.assertEqual(Image.open(io.BytesIO(body)).size, (350, 233))
+
+        self.assertEqual(len(self.cached_files()), 1)
+
+        with mock.patch('uploads.resize.render_resized') as render:
+            self.assertEqual(self.client.get(url).status_code, 200)
+            render.assert_not_called()
+
+    def test_replaced_source_gets_new_url(self):
+        """URLs name the source version; only a current one is cached forever"""
+        source = os.path.join(TEST_MEDIA_ROOT, 'resize-source.jpg')
+        url = build_resize_url('resize-source.jpg', 320)
+        self.assertIn('immutable', self.client.get(url)['Cache-Control'])
+
+        stat = os.stat(source)
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        try:
+            self.assertNotEqual(build_resize_url('resize-source.jpg', 320), url)
+            stale = self.client.get(url)
+            self.assertEqual(stale.status_code, 200)
+            self.assertNotIn('immutable', stale['Cache-Control'])
+        finally:
+            os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    def test_tampered_parameters_rejected(self):
+        """Changing a signed parameter invalidates the URL"""
+        url = build_resize_url('resize-source.jpg', 320).replace('w=350', 'w=2000')
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_conditional_get_and_range(self):
+        """ETags give 304s and byte ranges give 206s"""
+        url = build_resize_url('resize-source.jpg', 200)
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        partial = self.client.get(url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(len(partial.content), 10)
+        self.assertTrue(partial['Content-Range'].startswith('bytes 0-9/'))
+
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=999999-').status_code, 416)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_CACHE_PREFIX='/_media_cache/')
+    def test_accel_redirect_handoff(self):
+        """Behind nginx the worker returns headers only"""
+        response = self.client.get(build_resize_url('resize-source.jpg', 100))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertTrue(response['X-Accel-Redirect'].startswith('/_media_cache/'))
+
+    def cached_files(self):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(TEST_RESIZE_CACHE_DIR)
+            for name in names if name.endswith('.webp')
+        )
+
+    def test_lru_eviction(self):
+        """The sweeper drops the least recently used renders first"""
+        self.client.get(build_resize_url('resize-source.jpg', 400))
+        old_file, = self.cached_files()
+        os.utime(old_file, (0, 0))
+
+        self.client.get(build_resize_url('resize-source.jpg', 500))
+        new_file, = [path for path in self.cached_files() if path != old_file]
+
+        evict_lru(TEST_RESIZE_CACHE_DIR, max_bytes=os.path.getsize(new_file), low_water=1.0)
+        self.assertEqual(self.cached_files(), [new_file])
+
+    def test_serializer_builds_resize_url(self):
+        """?image_width= returns a signed resize URL for the original"""
+        user = User.objects.create_user(username='widthuser', email='width@test.com')
+        User.objects.filter(pk=user.pk).update(profile_picture='resize-source.jpg')
+        user.refresh_from_db()
+
+        request = APIRequestFactory().get('/', {'image_width': '333'})
+        data = PublicUserProfileSerializer(user, context={'request': request}).data
+        self.assertIn('/media/resize/?path=resize-source.jpg&w=350', data['profile_picture'])
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT, CELERY_TASK_ALWAYS_EAGER=True)
+class ContentAddressedStorageTestCase(TestCase):
+    """Test cases for deduplicated blob storage and reference counting"""
+
+    def setUp(self):
+        self.first = User.objects.create_user(username='blobone', email='blobone@test.com')
+        self.second = User.objects.create_user(username='blobtwo', email='blobtwo@test.com')
+        self.picture = make_jpeg(size=(64, 64))
+
+    def test_same_bytes_stored_once(self):
+        """Identical uploads share one blob with a reference per field"""
+        self.first.profile_picture.save('retry-1.jpg', ContentFile(self.picture))
+        self.second.profile_picture.save('retry-2.jpg', ContentFile(self.picture))
+
+        self.assertEqual(self.first.profile_picture.name, self.second.profile_picture.name)
+        self.assertTrue(self.first.profile_picture.name.startswith('blobs/'))
+
+        blob = StoredBlob.objects.get()
+        self.assertEqual(blob.name, self.first.profile_picture.name)
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(blob.size, len(self.picture))
+
+    def test_same_bytes_other_extension_counted_separately(self):
+        """Each extension gets its own blob row, so neither is left uncounted"""
+        self.first.profile_picture.save('a.jpg', ContentFile(self.picture))
+        self.second.profile_picture.save('b.png', ContentFile(self.picture))
+
+        self.assertNotEqual(self.first.profile_picture.name, self.second.profile_picture.name)
+        self.assertEqual(
+            dict(StoredBlob.objects.values_list('name', 'ref_count')),
+            {self.first.profile_picture.name: 1, self.second.profile_picture.name: 1},
+        )
+
+    def test_verification_documents_stay_private(self):
+        """Verification documents are not deduplicated into the shared blobs"""
+        verification = Verification.objects.create(user=self.first, verification_type='identity')
+        verification.document_url.save('id.jpg', ContentFile(self.picture))
+        self.assertTrue(verification.document_url.name.startswith('verification_documents/'))
+        self.assertFalse(StoredBlob.objects.exists())
+
+    def test_replace_and_delete_release_references(self):
+        """Replacing or deleting a row drops its reference"""
+        self.first.profile_picture.save('a.jpg', ContentFile(self.picture))
+        self.second.profile_picture.save('b.jpg', ContentFile(self.picture))
+        shared = self.first.profile_picture.name
+
+        self.first.profile_picture.save('c.jpg', ContentFile(make_jpeg(size=(32, 32))))
+        self.assertEqual(StoredBlob.objects.get(name=shared).ref_count, 1)
+
+        User.objects.get(pk=self.second.pk).delete()
+        self.assertEqual(StoredBlob.objects.get(name=shared).ref_count, 0)
+        # Shared files are never removed through the field
+        self.assertTrue(os.path.exists(os.path.join(TEST_MEDIA_ROOT, shared)))
+
+    def test_purge_respects_grace_and_real_references(self):
+        """Purge removes only stale blobs that no row points at"""
+        self.first.profile_picture.save('a.jpg', ContentFile(self.picture))
+        name = self.first.profile_picture.name
+        # Simulate a counter that drifted from the table
+        StoredBlob.objects.filter(name=name).update(ref_count=0)
+
+        self.assertEqual(purge_unreferenced_blobs(), 0)  # inside the grace period
+        self.assertEqual(purge_unreferenced_blobs(grace=timedelta(0)), 0)
+        self.assertEqual(StoredBlob.objects.get(name=name).ref_count, 1)
+
+        User.objects.filter(pk=self.first.pk).update(profile_picture='')
+        StoredBlob.objects.filter(name=name).update(ref_count=0)
+        self.assertEqual(purge_unreferenced_blobs(grace=timedelta(0)), 1)
+        self.assertFalse(StoredBlob.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(os.path.join(TEST_MEDIA_ROOT, name)))
+
+
+TEST_UPLOAD_DIR = tempfile.mkdtemp()
+
+
+@override_settings(
+    MEDIA_ROOT=TEST_MEDIA_ROOT,
+    CHUNKED_UPLOAD_DIR=TEST_UPLOAD_DIR,
+    CHUNKED_UPLOAD_MAX_CHUNK_SIZE=1024,
+    CELERY_TASK_ALWAYS_EAGER=True,
+)
+class ChunkedUploadTestCase(APITestCase):
+    """Test cases for the resumable chunked upload API"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_UPLOAD_DIR, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='uploader', email='uploader@test.com')
+        self.client.force_authenticate(user=self.user)
+        self.payload = b'%PDF-1.4\n' + os.urandom(2491)
+
+    def start_upload(self, **extra):
+        data = {'filename': 'report.pdf', 'total_size': len(self.payload), **extra}
+        response = self.client.post(reverse('upload-session-create'), data, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['data']['upload_token']
+
+    def put_chunk(self, token, start, end):
+        return self.client.put(
+            reverse('upload-session-detail', args=[token]),
+            data=self.payload[start:end + 1],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f"bytes {start}-{end}/{len(self.payload)}",
+        )
+
+    def test_chunked_upload_round_trip(self):
+        """Chunks are assembled in place and the token resolves to the file"""
+        token = self.start_upload(sha256=hashlib.sha256(self.payload).hexdigest())
+        for start in range(0, len(self.payload), 1000):
+            end = min(start + 999, len(self.payload) - 1)
+            self.assertEqual(self.put_chunk(token, start, end).status_code, 200)
+
+        response = self.client.post(reverse('upload-session-complete', args=[token]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['status'], 'completed')
+
+        session = UploadSession.objects.get(pk=token)
+        assembled = open_upload(session)
+        with assembled:
+            self.assertEqual(assembled.read(), self.payload)
+        self.assertTrue(assembled.closed)
+
+    def test_resume_after_gap(self):
+        """A chunk past the received offset is refused with the offset to resume from"""
+        token = self.start_upload()
+        self.put_chunk(token, 0, 999)
+
+        response = self.put_chunk(token, 2000, 2499)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['data']['received_bytes'], 1000)
+
+        status_response = self.client.get(reverse('upload-session-detail', args=[token]))
+        self.assertEqual(status_response.data['data']['received_bytes'], 1000)
+
+        # Completing early is refused too
+        self.assertEqual(self.client.post(reverse('upload-session-complete', args=[token])).status_code, 409)
+
+    def test_oversized_chunk_and_checksum_mismatch(self):
+        """Chunk size limits and checksums are enforced"""
+        token = self.start_upload(sha256='0' * 64)
+        self.assertEqual(self.put_chunk(token, 0, 1499).status_code, 400)
+
+        for start in range(0, len(self.payload), 1000):
+            self.put_chunk(token, start, min(start + 999, len(self.payload) - 1))
+        response = self.client.post(reverse('upload-session-complete', args=[token]))
+        self.assertEqual(response.status_code, 400)
+
+    def test_token_used_by_message(self):
+        """A completed upload can be attached to a message by token"""
+        token = self.start_upload()
+        for start in range(0, len(self.payload), 1000):
+            self.put_chunk(token, start, min(start + 999, len(self.payload) - 1))
+        self.client.post(reverse('upload-session-complete', args=[token]))
+
+        thread = MessageThread.objects.create(thread_type='general')
+        thread.participants.add(self.user)
+        request = APIRequestFactory().post('/')
+        request.user = self.user
+        serializer = MessageCreateSerializer(
+            data={'thread': str(thread.id), 'content': 'See attached', 'attachment_upload': token},
+            context={'request': request},
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        message = serializer.save()
+
+        self.assertTrue(message.attachment.name.startswith('blobs/'))
+        with message.attachment.open('rb') as stored:
+            self.assertEqual(stored.read(), self.payload)
+
+    def upload(self, payload, filename):
+        self.payload = payload
+        token = self.start_upload(filename=filename)
+        for start in range(0, len(payload), 1000):
+            self.put_chunk(token, start, min(start + 999, len(payload) - 1))
+        self.client.post(reverse('upload-session-complete', args=[token]))
+        return token
+
+    def token_field(self, **kwargs):
+        request = APIRequestFactory().post('/')
+        request.user = self.user
+        field = UploadTokenField(**kwargs)
+        field.bind('upload', MessageCreateSerializer(context={'request': request}))
+        return field
+
+    def test_content_checked_against_file_type(self):
+        """Pages, mislabelled files and non-images are refused"""
+        page = self.upload(b'<html><script>alert(1)</script></html>', 'page.html')
+        fake_pdf = self.upload(b'<svg onload="alert(1)"/>', 'fake.pdf')
+        fake_jpeg = self.upload(b'not an image at all', 'photo.jpg')
+        for token, field in (
+            (page, self.token_field()),
+            (fake_pdf, self.token_field()),
+            (fake_jpeg, self.token_field(file_type='image')),
+        ):
+            with self.assertRaises(ValidationError):
+                field.run_validation(token)
+
+        picture = self.upload(make_jpeg(size=(64, 64)), 'photo.jpg')
+        upload = self.token_field(file_type='image').run_validation(picture)
+        self.assertTrue(upload.closed)
+        self.assertEqual(b''.join(upload.chunks()), self.payload)
+        self.assertTrue(upload.closed)
+
+    def test_token_of_another_user_rejected(self):
+        """Upload tokens only work for the user who uploaded"""
+        other = User.objects.create_user(username='intruder', email='intruder@test.com')
+        token = self.start_upload()
+        request = APIRequestFactory().post('/')
+        request.user = other
+
+        field = UploadTokenField()
+        field.bind('attachment_upload', MessageCreateSerializer(context={'request': request}))
+        with self.assertRaises(ValidationError):
+            field.run_validation(token)
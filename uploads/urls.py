@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('', views.UploadSessionCreateView.as_view(), name='upload-session-create'),
+    path('<uuid:upload_id>/', views.UploadSessionDetailView.as_view(), name='upload-session-detail'),
+    path('<uuid:upload_id>/complete/', views.UploadSessionCompleteView.as_view(), name='upload-session-complete'),
+]
@@ -0,0 +1,288 @@
+import logging
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+from django.views.static import serve
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from users.utils import StandardizedResponseHelper
+from .chunked import ChunkOffsetError, UploadError, complete_upload, initiate_upload, write_chunk
+from .models import UploadSession
+from .resize import RESIZE_FORMATS, ResizeError, get_or_create_resized, parse_resize_params, source_version
+from .serializers import UploadSessionCreateSerializer, UploadSessionSerializer
+
+logger = logging.getLogger(__name__)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_accel_prefix(setting_name):
+    """Internal nginx location for X-Accel-Redirect, or '' when not behind nginx"""
+    prefix = getattr(settings, setting_name, '')
+    if prefix and not prefix.endswith('/'):
+        prefix += '/'
+    return prefix
+
+
+def parse_range(header, size):
+    """
+    Parse a single ``bytes=`` range.
+
+    Returns:
+        tuple | None: Inclusive (start, end), or None when the header should be
+        ignored (absent, malformed or multi-range) and the full body sent
+
+    Raises:
+        ValueError: When the range cannot be satisfied
+    """
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def file_response(request, path, content_type, etag, last_modified):
+    """Serve a local file honouring Range and If-Range"""
+    size = os.path.getsize(path)
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and if_range and if_range != etag and if_range != http_date(last_modified):
+        # The client's partial copy is stale; send the whole file
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        with open(path, 'rb') as f:
+            f.seek(start)
+            response = HttpResponse(f.read(end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def resize_image(request):
+    """
+    Serve a signed, resized rendition of an image under MEDIA_ROOT.
+
+    Query parameters: ``path`` (relative to MEDIA_ROOT), ``w``, optional ``h``,
+    ``fmt`` (webp|jpeg|png), optional ``q``, the source version ``v`` and the
+    ``sig`` from ``uploads.resize.build_resize_url``. Only a URL whose ``v``
+    matches the current source is cached as immutable.
+
+    With ``MEDIA_ACCEL_REDIRECT_CACHE_PREFIX`` set, the bytes are handed to
+    nginx via ``X-Accel-Redirect`` and the worker only returns headers.
+    """
+    try:
+        params = parse_resize_params(request.GET)
+    except ResizeError as e:
+        return HttpResponseBadRequest(str(e))
+
+    try:
+        cached, relative, source_stat = get_or_create_resized(params)
+    except ResizeError as e:
+        logger.warning(f"Resize of {params['path']} refused: {e}")
+        raise Http404(str(e))
+
+    # The cache path already encodes the parameters and source version
+    etag = quote_etag(os.path.splitext(os.path.basename(relative))[0][:32])
+    last_modified = int(source_stat.st_mtime)
+    content_type = RESIZE_FORMATS[params['fmt']][1]
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        response = not_modified
+    else:
+        accel_prefix = get_accel_prefix('MEDIA_ACCEL_REDIRECT_CACHE_PREFIX')
+        if accel_prefix:
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = accel_prefix + relative.replace(os.sep, '/')
+        else:
+            response = file_response(request, cached, content_type, etag, last_modified)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if params['version'] == source_version(source_stat):
+        # The signed URL names this exact source version, so it can never change
+        patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+    else:
+        # Built before the source was replaced, or without a version: revalidate soon
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'IMAGE_RESIZE_UNVERSIONED_MAX_AGE', 300))
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve an original upload without streaming it through the worker.
+
+    Behind nginx (``MEDIA_ACCEL_REDIRECT_PREFIX`` set) only an
+    ``X-Accel-Redirect`` header is returned. Otherwise this falls back to
+    Django's static file view, which is only meant for deployments with no
+    web server in front.
+    """
+    accel_prefix = get_accel_prefix('MEDIA_ACCEL_REDIRECT_PREFIX')
+    if not accel_prefix:
+        return serve(request, path, document_root=settings.MEDIA_ROOT)
+
+    if '..' in path.split('/') or path.startswith('/'):
+        raise Http404("Invalid path")
+    response = HttpResponse()
+    # Let nginx pick the content type from the file extension
+    del response['Content-Type']
+    response['X-Accel-Redirect'] = accel_prefix + path
+    return response
+
+
+class UploadSessionCreateView(APIView):
+    """
+    Start a resumable chunked upload.
+
+    POST {filename, total_size, content_type?, sha256?} returns the session,
+    whose ``upload_token`` addresses the chunk and complete endpoints.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = UploadSessionCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                StandardizedResponseHelper.error_response(
+                    message="Invalid upload request",
+                    errors=serializer.errors,
+                    status_code=400
+                ),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            session = initiate_upload(request.user, **serializer.validated_data)
+        except UploadError as e:
+            return Response(
+                StandardizedResponseHelper.error_response(message=str(e), status_code=400),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data = UploadSessionSerializer(session).data
+        data['chunk_size'] = getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 1024 * 1024)
+        return Response(
+            StandardizedResponseHelper.success_response(
+                message="Upload started",
+                data=data,
+                status_code=201
+            ),
+            status=status.HTTP_201_CREATED
+        )
+
+
+class UploadSessionDetailView(APIView):
+    """
+    GET the session's progress (to resume), or PUT one chunk of raw bytes
+    with ``Content-Range: bytes <start>-<end>/<total>``.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, upload_id, *args, **kwargs):
+        session = get_object_or_404(UploadSession, pk=upload_id, user=request.user)
+        return Response(
+            StandardizedResponseHelper.success_response(
+                message="Upload status retrieved",
+                data=UploadSessionSerializer(session).data
+            )
+        )
+
+    def put(self, request, upload_id, *args, **kwargs):
+        # The body is read straight from the socket; DRF's parsers never see it
+        stream = request.stream
+        if stream is None:
+            return Response(
+                StandardizedResponseHelper.error_response(message="Chunk body is empty", status_code=400),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            session = write_chunk(upload_id, request.user, request.META.get('HTTP_CONTENT_RANGE'), stream)
+        except ChunkOffsetError as e:
+            return Response(
+                StandardizedResponseHelper.error_response(
+                    message=str(e),
+                    data={'received_bytes': e.received_bytes},
+                    status_code=409
+                ),
+                status=status.HTTP_409_CONFLICT
+            )
+        except UploadError as e:
+            return Response(
+                StandardizedResponseHelper.error_response(message=str(e), status_code=400),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(
+            StandardizedResponseHelper.success_response(
+                message="Chunk stored",
+                data=UploadSessionSerializer(session).data
+            )
+        )
+
+
+class UploadSessionCompleteView(APIView):
+    """Finalize an upload once every byte has been received"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, upload_id, *args, **kwargs):
+        try:
+            session = complete_upload(upload_id, request.user)
+        except ChunkOffsetError as e:
+            return Response(
+                StandardizedResponseHelper.error_response(
+                    message=str(e),
+                    data={'received_bytes': e.received_bytes},
+                    status_code=409
+                ),
+                status=status.HTTP_409_CONFLICT
+            )
+        except UploadError as e:
+            return Response(
+                StandardizedResponseHelper.error_response(message=str(e), status_code=400),
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(
+            StandardizedResponseHelper.success_response(
+                message="Upload completed",
+                data=UploadSessionSerializer(session).data
+            )
+        )
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-18 22:57
+
+import uploads.storage
+import users.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_profile_picture_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=uploads.storage.get_blob_storage, upload_to='profile_pictures/'),
+        ),
+        migrations.AlterField(
+            model_name='verification',
+            name='document_back_url',
+            field=models.FileField(blank=True, help_text='Back side of document if applicable', null=True, storage=uploads.storage.get_blob_storage, upload_to=users.models.verification_document_path),
+        ),
+        migrations.AlterField(
+            model_name='verification',
+            name='document_url',
+            field=models.FileField(blank=True, help_text='Uploaded verification document', null=True, storage=uploads.storage.get_blob_storage, upload_to=users.models.verification_document_path),
+        ),
+    ]
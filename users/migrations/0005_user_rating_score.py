@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0004_alter_user_profile_picture_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='rating_score',
+            field=models.DecimalField(decimal_places=3, default=0, editable=False, help_text="Bayesian rating kept in step with the provider's rating summary, for ranking; 0 until reviewed", max_digits=4),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['user_type', '-rating_score'], name='user_rating_score_idx'),
+        ),
+    ]
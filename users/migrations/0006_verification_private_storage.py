@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:03
+
+import os
+import uuid
+
+import users.models
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from django.db.models import F
+
+
+def move_documents_out_of_blobs(apps, schema_editor):
+    # Copy documents saved to the shared blob storage into private paths and
+    # drop the blob references they held; unreferenced blobs are purged later
+    Verification = apps.get_model('users', 'Verification')
+    StoredBlob = apps.get_model('uploads', 'StoredBlob')
+    for field in ('document_url', 'document_back_url'):
+        for verification in Verification.objects.filter(**{f'{field}__startswith': 'blobs/'}).iterator():
+            blob_name = getattr(verification, field).name
+            extension = os.path.splitext(blob_name)[1]
+            path = f"verification_documents/{verification.user_id}/{verification.verification_type}/{uuid.uuid4()}{extension}"
+            if default_storage.exists(blob_name):
+                with default_storage.open(blob_name, 'rb') as source:
+                    path = default_storage.save(path, source)
+            else:
+                path = ''
+            Verification.objects.filter(pk=verification.pk).update(**{field: path})
+            StoredBlob.objects.filter(name=blob_name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_rating_score'),
+        ('uploads', '0003_storedblob_keyed_by_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='verification',
+            name='document_back_url',
+            field=models.FileField(blank=True, help_text='Back side of document if applicable', null=True, upload_to=users.models.verification_document_path),
+        ),
+        migrations.AlterField(
+            model_name='verification',
+            name='document_url',
+            field=models.FileField(blank=True, help_text='Uploaded verification document', null=True, upload_to=users.models.verification_document_path),
+        ),
+        migrations.RunPython(move_documents_out_of_blobs, migrations.RunPython.noop),
+    ]
@@ -17,6 +17,7 @@ import uuid
 import os
 from django.utils import timezone
 import logging
+from uploads.storage import get_blob_storage
 
 class UserManager(BaseUserManager):
     def create_user(self, username, email, **extra_fields):
@@ -77,12 +78,14 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_email_verified = models.BooleanField(default=False)
     is_phone_verified = models.BooleanField(default=False)
     # Profile fields
-    profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    profile_picture = models.ImageField(upload_to='profile_pictures/', storage=get_blob_storage, blank=True, null=True)
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized WebP variants of the profile picture, generated in the background")
     bio = models.TextField(blank=True, null=True)
     location = models.CharField(max_length=100, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     # Provider specific fields
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.0, null=True, blank=True)
+    rating_score = models.DecimalField(max_digits=4, decimal_places=3, default=0, editable=False, help_text="Bayesian rating kept in step with the provider's rating summary, for ranking; 0 until reviewed")
     total_bookings = models.IntegerField(default=0)
     skills = models.JSONField(default=dict, blank=True, null=True)
     # User preferences and financial info
@@ -103,6 +106,8 @@ class User(AbstractBaseUser, PermissionsMixin):
         verbose_name_plural = _('users')
         indexes = [
             GinIndex(fields=['search_vector'], name='user_search_vector_idx'),
+            # Providers ranked by rating
+            models.Index(fields=['user_type', '-rating_score'], name='user_rating_score_idx'),
         ]
         
     def __str__(self):
@@ -360,6 +365,7 @@ class Verification(models.Model):
     # Verification details
     verification_type = models.CharField(max_length=30, choices=VERIFICATION_TYPE_CHOICES, help_text="Type of verification")
     document_type = models.CharField(max_length=30, choices=DOCUMENT_TYPE_CHOICES, default='other', help_text="Type of document submitted")
+    # Private documents; kept out of the shared, deduplicated blob storage
     document_url = models.FileField(upload_to=verification_document_path, null=True, blank=True, help_text="Uploaded verification document")
     document_back_url = models.FileField(upload_to=verification_document_path, blank=True, null=True, help_text="Back side of document if applicable")
     document_link = models.URLField(max_length=255, blank=True, null=True, help_text="External link to verification document")
@@ -5,6 +5,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from .models import AccessToken, Verification
 from .utils import validate_pin, validate_phone_number, authenticate_user_with_pin, is_pin_strong
+from uploads.serializers import ResponsiveImageField, UploadTokenField
 # from rest_framework import serializers
 # from users.serializers import PublicUserProfileSerializer
 import base64
@@ -147,6 +148,7 @@ class AdminRegistrationSerializer(UserRegistrationSerializer):
 
 class UserProfileSerializer(serializers.ModelSerializer):
     """Serializer for the user's own profile with all fields"""
+    profile_picture = ResponsiveImageField(required=False, allow_null=True)
     # Enhanced profile picture field that can handle URLs, base64, etc.
     profile_picture_file = EnhancedFileField(file_type="image", required=False, write_only=True, help_text="Profile picture file (any format)")
     profile_picture_link = serializers.URLField(required=False, write_only=True, help_text="URL to profile picture")
@@ -190,6 +192,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
 
 class PublicUserProfileSerializer(serializers.ModelSerializer):
     """Serializer for the public view of a user profile"""
+    profile_picture = ResponsiveImageField(read_only=True)
+    
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'profile_picture', 
@@ -199,6 +203,8 @@ class PublicUserProfileSerializer(serializers.ModelSerializer):
 
 class CustomerSearchResultSerializer(serializers.ModelSerializer):
     """Serializer for customer search results"""
+    profile_picture = ResponsiveImageField(read_only=True)
+    
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'profile_picture',
@@ -208,12 +214,13 @@ class CustomerSearchResultSerializer(serializers.ModelSerializer):
 
 class ProviderSearchResultSerializer(serializers.ModelSerializer):
     """Serializer for service provider search results"""
+    profile_picture = ResponsiveImageField(read_only=True)
     services_count = serializers.SerializerMethodField()
     
     class Meta:
         model = User
         fields = ['id', 'username', 'first_name', 'last_name', 'profile_picture',
-                 'bio', 'location', 'user_type', 'is_verified', 'rating', 
+                 'bio', 'location', 'user_type', 'is_verified', 'rating', 'rating_score',
                  'skills', 'total_bookings', 'services_count', 'created_at']
         read_only_fields = fields
     
@@ -679,6 +686,8 @@ class VerificationCreateSerializer(serializers.ModelSerializer):
     document_back_link = serializers.URLField(required=False, write_only=True, help_text="URL to document back")
     document_base64 = serializers.CharField(required=False, write_only=True, help_text="Base64 encoded document")
     document_back_base64 = serializers.CharField(required=False, write_only=True, help_text="Base64 encoded document back")
+    document_upload = UploadTokenField(required=False, write_only=True, help_text="Token of a completed chunked upload")
+    document_back_upload = UploadTokenField(required=False, write_only=True, help_text="Token of a completed chunked upload for the document back")
     
     class Meta:
         model = Verification
@@ -686,7 +695,8 @@ class VerificationCreateSerializer(serializers.ModelSerializer):
             'verification_type', 'document_type', 'document_number',
             'document_file', 'document_back_file',
             'document_link', 'document_back_link', 
-            'document_base64', 'document_back_base64'
+            'document_base64', 'document_back_base64',
+            'document_upload', 'document_back_upload'
         ]
     
     def validate(self, data):
@@ -713,7 +723,8 @@ class VerificationCreateSerializer(serializers.ModelSerializer):
         document_sources = [
             data.get('document_file'),
             data.get('document_link'),
-            data.get('document_base64')
+            data.get('document_base64'),
+            data.get('document_upload')
         ]
         
         if not any(document_sources):
@@ -733,6 +744,8 @@ class VerificationCreateSerializer(serializers.ModelSerializer):
         document_back_link = validated_data.pop('document_back_link', None)
         document_base64 = validated_data.pop('document_base64', None)
         document_back_base64 = validated_data.pop('document_back_base64', None)
+        document_upload = validated_data.pop('document_upload', None)
+        document_back_upload = validated_data.pop('document_back_upload', None)
         
         # Determine primary document source
         primary_document_data = document_file or document_link or document_base64
@@ -745,6 +758,11 @@ class VerificationCreateSerializer(serializers.ModelSerializer):
             field_prefix="verification_doc"
         )
         
+        # Chunked uploads are already assembled on disk; store them as-is
+        # rather than converting them in memory
+        primary_file = document_upload or primary_file
+        back_file = document_back_upload or back_file
+        
         if not primary_file:
             raise serializers.ValidationError(
                 "Failed to process the primary document. Please check the format and try again."
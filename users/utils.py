@@ -1063,11 +1063,13 @@ class DocumentImageProcessor:
         if not profile_image:
             return None
             
+        # Stored as uploaded; resized WebP variants are rendered in the background
+        # by uploads.tasks.generate_image_derivatives
         return cls.process_document_field(
             profile_image,
             "profile_image",
             max_size=5*1024*1024,  # 5MB for profile images
-            optimize_images=True,
+            optimize_images=False,
             allowed_types=cls.SUPPORTED_IMAGE_TYPES
         )
 
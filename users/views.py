@@ -1221,7 +1221,8 @@ class UserSearchView(APIView):
         sort_by = data.get('sort_by', 'created_at')
         sort_order = data.get('sort_order', 'desc')
         
-        valid_sort_fields = ['username', 'first_name', 'last_name', 'created_at', 'rating', 'total_bookings']
+        # 'rating_score' ranks by the Bayesian rating, so a few reviews don't beat a long record
+        valid_sort_fields = ['username', 'first_name', 'last_name', 'created_at', 'rating', 'rating_score', 'total_bookings']
         if sort_by not in valid_sort_fields:
             sort_by = 'created_at'
             